@@ -0,0 +1,682 @@
+"""
+历史回放 / 回测引擎
+用本地 K 线缓存（OHLCVStore）回放交易决策流程，不访问交易所和 AI 接口、不等待真实时间：
+- 每个回放时刻只使用当时已收盘的 K 线；15m / 1h / 4h 的未收盘 K 线由已收盘的 3 分钟 K 线合成
+- 指标经 MarketData._build_complete_data 计算，prompt 由 prompts_trading.build_user_prompt 构建，与实盘一致
+- 决策来源可替换：RecordedDecisions（分析日志中录制的 AI 响应）、RuleModel（本地规则模型），
+  或任何实现 DecisionSource.respond() 的对象；响应按实盘相同的方式解析
+- 开仓决策按之后的 3 分钟 K 线判断先触发止损还是止盈（都未触发则在观察期结束时按收盘价平仓）
+- 回放区间按时间切分后在多个进程中并行执行，报告每秒周期数和按动作汇总的决策结果
+
+命令行：
+    python backtest.py fetch --start 2025-08-01 --end 2025-11-01
+    python backtest.py run --start 2025-08-01 --end 2025-11-01 --workers 4
+    python backtest.py run --start 2025-10-01 --end 2025-11-01 --source recorded --log-dir analysis_logs
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from multiprocessing import get_context
+from typing import Dict, List, Optional
+
+import ccxt
+import numpy as np
+import pandas as pd
+
+from btc_trading_monitor import BTCTradingMonitor
+from log_sink import open_log
+from indicators import SERIES_POINTS, batch_matrix, compute_batch
+from market_data import KLINE_LIMITS, MAX_FETCH_LIMIT, MarketData
+from ohlcv_store import OHLCVStore
+from prompts_trading import build_system_prompt, build_user_prompt
+
+
+# 合成未收盘 K 线、评估决策结果所用的基础时间框架
+BASE_TIMEFRAME = '3m'
+
+# 回放时使用的默认账户（与 build_user_prompt 的默认模拟账户一致）
+DEFAULT_ACCOUNT = {
+    'total_equity': 1000.0,
+    'available_balance': 1000.0,
+    'total_pnl_pct': 0.0,
+    'margin_used_pct': 0.0,
+    'position_count': 0
+}
+
+# 持仓量和资金费率没有历史缓存，回放时取与实盘获取失败时相同的中性值
+NO_OPEN_INTEREST = {'latest': 0.0, 'average': 0.0}
+NO_FUNDING_RATE = 0.0
+
+OPEN_ACTIONS = ('open_long', 'open_short')
+
+# 非增量模式下每批一起计算指标的周期数（各时间框架的窗口堆叠为 (K 线数, 周期数) 二维数组）
+BATCH_CYCLES = 512
+
+# 各阶段耗时统计的名称（按流程顺序）
+STAGES = ('indicators', 'prompt', 'decide', 'parse', 'evaluate')
+
+
+def timeframe_ms(timeframe: str) -> int:
+    return ccxt.Exchange.parse_timeframe(timeframe) * 1000
+
+
+def to_ms(value) -> int:
+    """datetime / ISO 日期字符串 / 毫秒时间戳 → 毫秒时间戳（字符串按本地时间解析）"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return int(value.timestamp() * 1000)
+
+
+# ========== 决策来源 ==========
+
+class DecisionSource:
+    """
+    决策来源基类
+
+    respond() 返回与 AI 相同格式的响应文本（思维链 + JSON 决策数组），返回 None 表示该周期没有响应。
+    对象会被复制到各工作进程中，需要可 pickle；加载数据等准备工作放在 prepare() 中。
+    """
+
+    name = 'source'
+
+    def prepare(self, start_ms: int, end_ms: int):
+        """在工作进程中回放 [start_ms, end_ms) 之前调用"""
+
+    def respond(self, cycle: Dict) -> Optional[str]:
+        """
+        Args:
+            cycle: {'time': datetime, 'market_data', 'system_prompt', 'user_prompt'}
+        """
+        raise NotImplementedError
+
+
+class RuleModel(DecisionSource):
+    """
+    本地规则模型（代替 AI 的桩模型）：1 小时趋势 + 15 分钟 RSI 回调入场，止损 / 止盈按 1 小时 ATR 设置
+    """
+
+    name = 'rule'
+
+    def __init__(self, rsi_low: float = 35, rsi_high: float = 65, stop_atr: float = 1.5, target_atr: float = 4.5,
+                 leverage: int = 5, position_size_usd: float = 5000):
+        """
+        Args:
+            rsi_low: 上升趋势中 15 分钟 RSI(14) 低于该值时做多
+            rsi_high: 下降趋势中 15 分钟 RSI(14) 高于该值时做空
+            stop_atr: 止损距离（1 小时 ATR 的倍数）
+            target_atr: 止盈距离（1 小时 ATR 的倍数，默认风险回报比 1:3）
+            leverage: 杠杆倍数
+            position_size_usd: 仓位价值（美元）
+        """
+        self.rsi_low = rsi_low
+        self.rsi_high = rsi_high
+        self.stop_atr = stop_atr
+        self.target_atr = target_atr
+        self.leverage = leverage
+        self.position_size_usd = position_size_usd
+
+    def respond(self, cycle: Dict) -> Optional[str]:
+        market_data = cycle['market_data']
+        price = market_data['current_price']
+        trend = market_data['timeframe_1h']['current']
+        rsi = market_data['timeframe_15m']['current']['rsi14']
+        atr = trend['atr14']
+
+        decision = {'symbol': 'BTCUSDT', 'action': 'wait', 'reasoning': '没有满足条件的入场信号'}
+        if trend['ema20'] > trend['ema50'] and rsi < self.rsi_low:
+            decision = self._open('open_long', price - atr * self.stop_atr, price + atr * self.target_atr,
+                                  f"1小时上升趋势，15分钟 RSI {rsi:.1f} 回调")
+        elif trend['ema20'] < trend['ema50'] and rsi > self.rsi_high:
+            decision = self._open('open_short', price + atr * self.stop_atr, price - atr * self.target_atr,
+                                  f"1小时下降趋势，15分钟 RSI {rsi:.1f} 反弹")
+
+        cot_trace = (f"规则模型：价格 {price:.2f}，1小时 EMA20 {trend['ema20']:.2f} / EMA50 {trend['ema50']:.2f}，"
+                     f"15分钟 RSI(14) {rsi:.1f}，1小时 ATR {atr:.2f}。")
+        return cot_trace + "\n\n" + json.dumps([decision], ensure_ascii=False)
+
+    def _open(self, action: str, stop_loss: float, take_profit: float, reasoning: str) -> Dict:
+        return {
+            'symbol': 'BTCUSDT',
+            'action': action,
+            'leverage': self.leverage,
+            'position_size_usd': self.position_size_usd,
+            'stop_loss': round(stop_loss, 2),
+            'take_profit': round(take_profit, 2),
+            'confidence': 70,
+            'reasoning': reasoning
+        }
+
+
+class RecordedDecisions(DecisionSource):
+    """
+    录制的 AI 响应：从分析日志（LogSink 写入的 JSONL，含压缩分段）中取回放时刻之后最近一次交易分析的
+    思维链和决策，重新拼成响应文本
+    """
+
+    name = 'recorded'
+
+    def __init__(self, log_dir: str = 'analysis_logs', tolerance_seconds: float = 300):
+        """
+        Args:
+            log_dir: 分析日志目录
+            tolerance_seconds: 日志时间最多晚于回放时刻多少秒（实盘周期在 K 线收盘后开始，结束时写日志）
+        """
+        self.log_dir = log_dir
+        self.tolerance_seconds = tolerance_seconds
+        self._epochs = np.empty(0)
+        self._responses: List[str] = []
+
+    def prepare(self, start_ms: int, end_ms: int):
+        """只读取日期在回放区间内（前后各放宽一天）的日志文件"""
+        first = (datetime.fromtimestamp(start_ms / 1000) - timedelta(days=1)).strftime('%Y-%m-%d')
+        last = (datetime.fromtimestamp(end_ms / 1000) + timedelta(days=1)).strftime('%Y-%m-%d')
+
+        recorded = {}
+        for name in sorted(os.listdir(self.log_dir)):
+            if '.jsonl' not in name or not first <= name[:10] <= last:
+                continue
+            with open_log(os.path.join(self.log_dir, name)) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if not record.get('success') or 'decisions' not in record:
+                        continue
+                    epoch = datetime.fromisoformat(record['timestamp']).timestamp()
+                    recorded[epoch] = (record.get('cot_trace') or '') + "\n\n" + \
+                        json.dumps(record['decisions'], ensure_ascii=False)
+
+        epochs = sorted(recorded)
+        self._epochs = np.array(epochs)
+        self._responses = [recorded[epoch] for epoch in epochs]
+
+    def respond(self, cycle: Dict) -> Optional[str]:
+        epoch = cycle['time'].timestamp()
+        i = int(np.searchsorted(self._epochs, epoch))
+        if i < len(self._epochs) and self._epochs[i] - epoch <= self.tolerance_seconds:
+            return self._responses[i]
+        return None
+
+
+def parse_response(response: str) -> tuple:
+    """按实盘相同的方式解析响应文本，返回 (cot_trace, decisions)"""
+    return BTCTradingMonitor._parse_ai_decisions(response)
+
+
+# ========== K 线历史 ==========
+
+class CandleHistory:
+    """
+    一段时间内各时间框架的 K 线（numpy 数组），按回放时刻截取当时可见的窗口
+    """
+
+    def __init__(self, store: OHLCVStore, symbol: str, start_ms: int, end_ms: int,
+                 timeframes: Optional[Dict[str, int]] = None, forward_ms: int = 0):
+        """
+        Args:
+            store: K 线缓存
+            symbol: 交易对符号，如 'BTC/USDT'
+            start_ms: 第一个回放时刻
+            end_ms: 最后一个回放时刻（不含）
+            timeframes: {时间框架: 窗口 K 线数量}，默认 KLINE_LIMITS
+            forward_ms: 最后一个回放时刻之后还需要的 3 分钟 K 线时长（评估决策结果）
+        """
+        self.timeframes = timeframes or KLINE_LIMITS
+        self.periods = {timeframe: timeframe_ms(timeframe) for timeframe in self.timeframes}
+        self.periods.setdefault(BASE_TIMEFRAME, timeframe_ms(BASE_TIMEFRAME))
+
+        # 预热：最长的窗口，加上合成未收盘 K 线需要的一个最长周期
+        warmup = max(limit * self.periods[timeframe] for timeframe, limit in self.timeframes.items())
+        warmup += max(self.periods.values())
+
+        self.candles = {}
+        for timeframe in self.periods:
+            end = end_ms + (forward_ms if timeframe == BASE_TIMEFRAME else 0)
+            rows = store.load_range(symbol, timeframe, start_ms - warmup, end)
+            self.candles[timeframe] = np.array(rows, dtype=np.float64).reshape(-1, 6)
+        self.timestamps = {timeframe: candles[:, 0].astype(np.int64) for timeframe, candles in self.candles.items()}
+
+    def window(self, timeframe: str, t: int) -> Optional[np.ndarray]:
+        """
+        回放时刻 t 可见的最近 KLINE_LIMITS[timeframe] 根 K 线（最后一根可能是由 3 分钟 K 线合成的未收盘 K 线）
+
+        Returns:
+            (n, 6) 数组；历史不足或中间有断档时返回 None
+        """
+        limit = self.timeframes[timeframe]
+        period = self.periods[timeframe]
+        closed = int(np.searchsorted(self.timestamps[timeframe], t - period, side='right'))
+        rows = self.candles[timeframe][:closed]
+
+        if timeframe != BASE_TIMEFRAME:
+            forming = self._forming(timeframe, t)
+            if forming is not None:
+                rows = np.vstack([rows[-(limit - 1):] if limit > 1 else rows[:0], forming])
+        rows = rows[-limit:]
+
+        if len(rows) < limit or rows[-1, 0] - rows[0, 0] != (limit - 1) * period:
+            return None
+        return rows
+
+    def _forming(self, timeframe: str, t: int) -> Optional[np.ndarray]:
+        """用 t 之前已收盘的 3 分钟 K 线合成当前未收盘的 K 线"""
+        period = self.periods[timeframe]
+        period_start = t // period * period
+        base = self.timestamps[BASE_TIMEFRAME]
+        first = int(np.searchsorted(base, period_start, side='left'))
+        last = int(np.searchsorted(base, t - self.periods[BASE_TIMEFRAME], side='right'))
+        if last <= first:
+            return None
+        rows = self.candles[BASE_TIMEFRAME][first:last]
+        return np.array([[period_start, rows[0, 1], rows[:, 2].max(), rows[:, 3].min(), rows[-1, 4], rows[:, 5].sum()]])
+
+    def forward(self, t: int, count: int) -> np.ndarray:
+        """回放时刻 t 之后（从 t 时未收盘的那根开始）的 count 根 3 分钟 K 线"""
+        base = self.timestamps[BASE_TIMEFRAME]
+        start = int(np.searchsorted(base, t - self.periods[BASE_TIMEFRAME], side='right'))
+        return self.candles[BASE_TIMEFRAME][start:start + count]
+
+
+def to_dataframe(rows: np.ndarray) -> pd.DataFrame:
+    """(n, 6) 数组转为与 MarketData._to_dataframe 相同结构的 DataFrame"""
+    df = pd.DataFrame(rows, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+    df['timestamp'] = pd.to_datetime(rows[:, 0].astype(np.int64), unit='ms')
+    return df
+
+
+# ========== 决策结果评估 ==========
+
+def evaluate_decision(decision: Dict, entry: float, forward: np.ndarray) -> Dict:
+    """
+    评估一条决策
+
+    开仓决策：依次检查之后每根 3 分钟 K 线是否触及止损 / 止盈（同一根 K 线都触及时按止损计），
+    都未触及时按观察期最后一根 K 线的收盘价平仓。其他动作只记录观察期内的价格变化。
+
+    Returns:
+        {'forward_pct': 观察期价格变化 %, 开仓决策另有 'exit'（stop_loss / take_profit / timeout）、
+         'return_pct'（不含杠杆的价格收益 %）、'pnl_usd'、'bars'（持有的 3 分钟 K 线数）}
+    """
+    outcome = {'forward_pct': (forward[-1, 4] / entry - 1) * 100 if len(forward) else None}
+    action = decision.get('action')
+    if action not in OPEN_ACTIONS or not len(forward):
+        return outcome
+
+    direction = 1 if action == 'open_long' else -1
+    highs, lows = forward[:, 2], forward[:, 3]
+    stop_loss = _number(decision.get('stop_loss'))
+    take_profit = _number(decision.get('take_profit'))
+
+    no_hit = len(forward)
+    stop_hit = target_hit = no_hit
+    if stop_loss:
+        hits = lows <= stop_loss if direction == 1 else highs >= stop_loss
+        stop_hit = int(np.argmax(hits)) if hits.any() else no_hit
+    if take_profit:
+        hits = highs >= take_profit if direction == 1 else lows <= take_profit
+        target_hit = int(np.argmax(hits)) if hits.any() else no_hit
+
+    if stop_hit < no_hit and stop_hit <= target_hit:
+        exit_reason, exit_price, bars = 'stop_loss', stop_loss, stop_hit + 1
+    elif target_hit < no_hit:
+        exit_reason, exit_price, bars = 'take_profit', take_profit, target_hit + 1
+    else:
+        exit_reason, exit_price, bars = 'timeout', forward[-1, 4], no_hit
+
+    return_pct = (exit_price / entry - 1) * 100 * direction
+    size = _number(decision.get('position_size_usd')) or 0.0
+    outcome.update(exit=exit_reason, return_pct=return_pct, pnl_usd=size * return_pct / 100, bars=bars)
+    return outcome
+
+
+def _number(value) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+# ========== 回放 ==========
+
+class ReplayEngine:
+    """在单个进程中按时间顺序回放一段区间"""
+
+    def __init__(self, store_path: str, source: DecisionSource, symbol: str = 'BTC/USDT',
+                 interval_minutes: int = 5, horizon_minutes: int = 240, cache_friendly: bool = True,
+                 incremental: bool = False, origin_ms: Optional[int] = None):
+        """
+        Args:
+            store_path: K 线缓存（SQLite）路径
+            source: 决策来源
+            symbol: 交易对符号
+            interval_minutes: 回放周期间隔（分钟），与实盘分析间隔一致
+            horizon_minutes: 决策结果的观察期（分钟）
+            cache_friendly: prompt 是否使用前缀缓存友好的布局（与配置 prompt_cache_layout 一致）
+            incremental: 是否使用增量指标引擎。默认 False：每 BATCH_CYCLES 个周期的窗口一起批量计算
+                         （compute_batch），回放结果与区间如何切分无关；为 True 时逐周期更新引擎，
+                         每个分段开头的引擎重新预热（与实盘重启相同）
+            origin_ms: 整个回测的起始时刻（计算周期编号和运行时长），默认为本区间的起点
+        """
+        self.store_path = store_path
+        self.source = source
+        self.symbol = symbol
+        self.interval_ms = interval_minutes * 60 * 1000
+        self.horizon_bars = max(horizon_minutes * 60 * 1000 // timeframe_ms(BASE_TIMEFRAME), 1)
+        self.cache_friendly = cache_friendly
+        self.origin_ms = origin_ms
+        self.market_data = MarketData(concurrent=False, incremental=incremental, snapshot=True)
+
+    def run(self, start_ms: int, end_ms: int) -> Dict:
+        """
+        回放 [start_ms, end_ms) 内的每个周期
+
+        Returns:
+            {'records': [每周期结果], 'skipped': 历史不足或断档跳过的周期数, 'stage_ms': {阶段: 累计毫秒}}
+        """
+        origin = self.origin_ms if self.origin_ms is not None else start_ms
+        store = OHLCVStore(self.store_path)
+        try:
+            history = CandleHistory(store, self.symbol, start_ms, end_ms,
+                                    forward_ms=self.horizon_bars * timeframe_ms(BASE_TIMEFRAME))
+        finally:
+            store.close()
+        self.source.prepare(start_ms, end_ms)
+
+        system_prompt = build_system_prompt(account_equity=DEFAULT_ACCOUNT['total_equity'],
+                                            cache_friendly=self.cache_friendly)
+        stage_ms = dict.fromkeys(STAGES, 0.0)
+        records = []
+        skipped = 0
+
+        times = range(start_ms, end_ms, self.interval_ms)
+        for block in range(0, len(times), BATCH_CYCLES):
+            clock = time.perf_counter()
+            cycles = []
+            for t in times[block:block + BATCH_CYCLES]:
+                windows = {timeframe: history.window(timeframe, t) for timeframe in history.timeframes}
+                if any(rows is None for rows in windows.values()):
+                    skipped += 1
+                else:
+                    cycles.append((t, windows))
+            series = self._batch_series(cycles) if not self.market_data.incremental else [None] * len(cycles)
+            clock = _lap(stage_ms, 'indicators', clock)
+
+            for (t, windows), cycle_series in zip(cycles, series):
+                records.append(self._replay_cycle(t, windows, cycle_series, history, origin,
+                                                  system_prompt, stage_ms))
+
+        return {'records': records, 'skipped': skipped, 'stage_ms': stage_ms}
+
+    def _batch_series(self, cycles: List[tuple]) -> List[Dict]:
+        """一批周期的各时间框架窗口堆叠后用 compute_batch 向量化计算（与多币种扫描相同的批量指标路径）"""
+        series = [{} for _ in cycles]
+        if not cycles:
+            return series
+        for timeframe in cycles[0][1]:
+            stacked = np.stack([windows[timeframe] for _, windows in cycles], axis=1)   # (K 线数, 周期数, 6)
+            columns = compute_batch(stacked[:, :, 2], stacked[:, :, 3], stacked[:, :, 4], stacked[:, :, 5])
+            data_points = SERIES_POINTS.get(timeframe, 20)
+            for cycle_series, matrix in zip(series, batch_matrix(columns, data_points)):
+                cycle_series[timeframe] = self.market_data._make_series(timeframe, data_points, matrix)
+        return series
+
+    def _replay_cycle(self, t: int, windows: Dict[str, np.ndarray], series: Optional[Dict],
+                      history: CandleHistory, origin: int, system_prompt: str, stage_ms: Dict[str, float]) -> Dict:
+        """回放单个周期：组装市场数据 → 构建 prompt → 决策 → 解析 → 评估"""
+        clock = time.perf_counter()
+        if series is None:
+            klines = {timeframe: to_dataframe(rows) for timeframe, rows in windows.items()}
+        else:
+            # 已批量算好指标时 _build_complete_data 只读取收盘价（涨跌幅、当前价），不必构建完整的 DataFrame
+            klines = {timeframe: {'close': pd.Series(rows[:, 4])} for timeframe, rows in windows.items()}
+        market_data = self.market_data._build_complete_data(self.symbol, klines, NO_OPEN_INTEREST,
+                                                            NO_FUNDING_RATE, verbose=False, series=series)
+        now = datetime.fromtimestamp(t / 1000)
+        clock = _lap(stage_ms, 'indicators', clock)
+
+        user_prompt = build_user_prompt(
+            market_data=market_data,
+            runtime_minutes=(t - origin) // 60000,
+            call_count=(t - origin) // self.interval_ms + 1,
+            account_info=DEFAULT_ACCOUNT,
+            positions=[],
+            cache_friendly=self.cache_friendly,
+            now=now
+        )
+        clock = _lap(stage_ms, 'prompt', clock)
+
+        response = self.source.respond({'time': now, 'market_data': market_data,
+                                        'system_prompt': system_prompt, 'user_prompt': user_prompt})
+        clock = _lap(stage_ms, 'decide', clock)
+
+        decisions = parse_response(response)[1] if response is not None else []
+        decisions = [d for d in decisions if isinstance(d, dict)] if isinstance(decisions, list) else []
+        clock = _lap(stage_ms, 'parse', clock)
+
+        # 其他币种没有 K 线，只计数不评估
+        price = float(market_data['current_price'])
+        forward = history.forward(t, self.horizon_bars)
+        outcomes = [{'action': d.get('action'), 'symbol': d.get('symbol'),
+                     **(evaluate_decision(d, price, forward) if d.get('symbol', 'BTCUSDT') == 'BTCUSDT' else {})}
+                    for d in decisions]
+        _lap(stage_ms, 'evaluate', clock)
+
+        return {'time': now.isoformat(), 'price': price, 'responded': response is not None, 'decisions': outcomes}
+
+
+def _lap(stage_ms: Dict[str, float], stage: str, clock: float) -> float:
+    now = time.perf_counter()
+    stage_ms[stage] += (now - clock) * 1000
+    return now
+
+
+def _run_chunk(options: Dict, source: DecisionSource, start_ms: int, end_ms: int) -> Dict:
+    """工作进程入口：回放一个分段"""
+    return ReplayEngine(source=source, **options).run(start_ms, end_ms)
+
+
+def run_backtest(store_path: str, start, end, source: Optional[DecisionSource] = None,
+                 symbol: str = 'BTC/USDT', interval_minutes: int = 5, horizon_minutes: int = 240,
+                 workers: int = 1, cache_friendly: bool = True, incremental: bool = False) -> Dict:
+    """
+    回放 [start, end) 的交易决策流程并汇总结果
+
+    Args:
+        store_path: K 线缓存（SQLite）路径，需已包含回放区间及之前约 10 天（预热）的 3m / 15m / 1h / 4h K 线
+        start, end: 回放区间（datetime、ISO 日期字符串或毫秒时间戳）
+        source: 决策来源，默认 RuleModel()
+        symbol: 交易对符号
+        interval_minutes: 回放周期间隔（分钟）
+        horizon_minutes: 决策结果观察期（分钟）
+        workers: 并行进程数（按时间平均切分区间；1 时在当前进程中执行）
+        cache_friendly: prompt 布局（见 ReplayEngine）
+        incremental: 是否使用增量指标引擎（见 ReplayEngine）
+
+    Returns:
+        summarize() 的汇总结果，另含每周期明细 'records'
+    """
+    source = source or RuleModel()
+    interval_ms = interval_minutes * 60 * 1000
+    start_ms = to_ms(start) // interval_ms * interval_ms
+    end_ms = to_ms(end)
+    options = dict(store_path=store_path, symbol=symbol, interval_minutes=interval_minutes,
+                   horizon_minutes=horizon_minutes, cache_friendly=cache_friendly,
+                   incremental=incremental, origin_ms=start_ms)
+
+    # 按周期数平均切分（分段边界对齐到周期间隔）
+    cycles = max((end_ms - start_ms + interval_ms - 1) // interval_ms, 0)
+    workers = max(min(workers, cycles), 1)
+    bounds = [start_ms + cycles * i // workers * interval_ms for i in range(workers)] + [end_ms]
+
+    began = time.perf_counter()
+    if workers == 1:
+        parts = [_run_chunk(options, source, start_ms, end_ms)]
+    else:
+        # spawn：工作进程不继承父进程的线程和连接
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as pool:
+            futures = [pool.submit(_run_chunk, options, source, bounds[i], bounds[i + 1]) for i in range(workers)]
+            parts = [future.result() for future in futures]
+    elapsed = time.perf_counter() - began
+
+    records = [record for part in parts for record in part['records']]
+    stage_ms = {stage: sum(part['stage_ms'][stage] for part in parts) for stage in STAGES}
+    report = summarize(records, elapsed)
+    report.update(source=source.name, workers=workers, skipped=sum(part['skipped'] for part in parts),
+                  stage_ms={stage: total / max(len(records), 1) for stage, total in stage_ms.items()},
+                  records=records)
+    return report
+
+
+def summarize(records: List[Dict], elapsed: float) -> Dict:
+    """
+    按动作汇总决策结果
+
+    Returns:
+        {'cycles', 'elapsed_s', 'cycles_per_second', 'replayed_hours', 'speedup', 'responded',
+         'actions': {动作: {'count', 'avg_forward_pct', 开仓动作另有 'wins', 'win_rate', 'avg_return_pct',
+                          'total_pnl_usd', 'exits': {stop_loss / take_profit / timeout: 次数}}}}
+    """
+    actions = {}
+    for record in records:
+        for decision in record['decisions']:
+            stats = actions.setdefault(decision.get('action') or 'unknown', {'count': 0, '_forward': []})
+            stats['count'] += 1
+            if decision.get('forward_pct') is not None:
+                stats['_forward'].append(decision['forward_pct'])
+            if 'exit' in decision:
+                stats.setdefault('_returns', []).append(decision['return_pct'])
+                stats['total_pnl_usd'] = stats.get('total_pnl_usd', 0.0) + decision['pnl_usd']
+                exits = stats.setdefault('exits', {})
+                exits[decision['exit']] = exits.get(decision['exit'], 0) + 1
+
+    for stats in actions.values():
+        forward = stats.pop('_forward')
+        stats['avg_forward_pct'] = float(np.mean(forward)) if forward else None
+        returns = stats.pop('_returns', None)
+        if returns:
+            returns = np.array(returns)
+            stats['wins'] = int((returns > 0).sum())
+            stats['win_rate'] = stats['wins'] / len(returns)
+            stats['avg_return_pct'] = float(returns.mean())
+
+    span_hours = 0.0
+    if len(records) > 1:
+        span_hours = (datetime.fromisoformat(records[-1]['time']) -
+                      datetime.fromisoformat(records[0]['time'])).total_seconds() / 3600
+    return {
+        'cycles': len(records),
+        'elapsed_s': elapsed,
+        'cycles_per_second': len(records) / elapsed if elapsed > 0 else 0.0,
+        'replayed_hours': span_hours,
+        'speedup': span_hours * 3600 / elapsed if elapsed > 0 else 0.0,
+        'responded': sum(record['responded'] for record in records),
+        'actions': actions
+    }
+
+
+def format_report(report: Dict) -> str:
+    """回测报告的文本形式"""
+    lines = [
+        f"📼 回放 {report['cycles']} 个周期（{report['replayed_hours'] / 24:.1f} 天，跳过 {report.get('skipped', 0)} 个），"
+        f"决策来源 {report.get('source', '-')}，{report.get('workers', 1)} 个进程",
+        f"⏱ {report['elapsed_s']:.1f}s | {report['cycles_per_second']:.0f} 周期/秒 | 相当于实时的 {report['speedup']:,.0f} 倍",
+    ]
+    if report.get('stage_ms'):
+        lines.append("  每周期: " + " | ".join(f"{stage} {ms:.2f}ms" for stage, ms in report['stage_ms'].items()))
+    lines.append(f"  有响应的周期: {report['responded']}/{report['cycles']}")
+    for action, stats in sorted(report['actions'].items(), key=lambda item: -item[1]['count']):
+        line = f"  • {action}: {stats['count']} 次"
+        if stats.get('avg_forward_pct') is not None:
+            line += f" | 观察期价格变化 {stats['avg_forward_pct']:+.2f}%"
+        if 'win_rate' in stats:
+            exits = ', '.join(f"{name} {count}" for name, count in sorted(stats['exits'].items()))
+            line += (f" | 胜率 {stats['win_rate'] * 100:.0f}% | 平均收益 {stats['avg_return_pct']:+.2f}% | "
+                     f"盈亏 ${stats['total_pnl_usd']:+,.0f} | 平仓 {exits}")
+        lines.append(line)
+    return "\n".join(lines)
+
+
+# ========== 历史数据下载 ==========
+
+def backfill(store_path: str, start, end, symbol: str = 'BTC/USDT',
+             timeframes: Optional[List[str]] = None, market_data: Optional[MarketData] = None) -> Dict[str, int]:
+    """
+    从交易所分页下载 [start, end) 及之前预热所需的已收盘 K 线，写入 K 线缓存
+
+    Returns:
+        {时间框架: 写入的 K 线数量}
+    """
+    market_data = market_data or MarketData(concurrent=False)
+    exchange = market_data.exchange
+    timeframes = timeframes or list(KLINE_LIMITS)
+    warmup = max(limit * timeframe_ms(timeframe) for timeframe, limit in KLINE_LIMITS.items()) + timeframe_ms('4h')
+    end_ms = min(to_ms(end), exchange.milliseconds())
+
+    store = OHLCVStore(store_path)
+    written = {}
+    try:
+        for timeframe in timeframes:
+            period = timeframe_ms(timeframe)
+            since = to_ms(start) - warmup
+            written[timeframe] = 0
+            while since < end_ms:
+                rows = exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=MAX_FETCH_LIMIT)
+                closed = [row for row in rows if row[0] + period <= end_ms]
+                store.upsert(symbol, timeframe, closed)
+                written[timeframe] += len(closed)
+                if not rows or rows[-1][0] + period >= end_ms:
+                    break
+                since = rows[-1][0] + period
+            print(f"  {timeframe}: {written[timeframe]} 根")
+    finally:
+        store.close()
+    return written
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="历史回放 / 回测：用本地 K 线缓存回放交易决策流程")
+    parser.add_argument('--store', default='market_cache/ohlcv.sqlite3', help="K 线缓存路径")
+    parser.add_argument('--symbol', default='BTC/USDT')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    fetch_parser = commands.add_parser('fetch', help="从交易所下载历史 K 线到缓存")
+    fetch_parser.add_argument('--start', required=True, help="起始日期，如 2025-08-01")
+    fetch_parser.add_argument('--end', default=datetime.now().isoformat(), help="结束日期（不含）")
+
+    run_parser = commands.add_parser('run', help="回放")
+    run_parser.add_argument('--start', required=True, help="起始日期，如 2025-08-01")
+    run_parser.add_argument('--end', required=True, help="结束日期（不含）")
+    run_parser.add_argument('--source', choices=['rule', 'recorded'], default='rule', help="决策来源")
+    run_parser.add_argument('--log-dir', default='analysis_logs', help="录制响应所在的分析日志目录")
+    run_parser.add_argument('--interval', type=int, default=5, help="周期间隔（分钟）")
+    run_parser.add_argument('--horizon', type=int, default=240, help="决策结果观察期（分钟）")
+    run_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="并行进程数")
+    run_parser.add_argument('--incremental', action='store_true', help="使用增量指标引擎")
+    run_parser.add_argument('--json', help="把汇总结果和每周期明细写入该 JSON 文件")
+
+    args = parser.parse_args(argv)
+    if args.command == 'fetch':
+        print(f"📥 下载 {args.symbol} K 线 {args.start} → {args.end}")
+        backfill(args.store, args.start, args.end, symbol=args.symbol)
+        return
+
+    source = RecordedDecisions(args.log_dir) if args.source == 'recorded' else RuleModel()
+    report = run_backtest(args.store, args.start, args.end, source=source, symbol=args.symbol,
+                          interval_minutes=args.interval, horizon_minutes=args.horizon,
+                          workers=args.workers, incremental=args.incremental)
+    print(format_report(report))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已保存: {args.json}")
+
+
+if __name__ == '__main__':
+    main()
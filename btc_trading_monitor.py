@@ -1,17 +1,32 @@
 """
 BTC 交易决策监控机器人
 整合市场数据获取、DeepSeek AI 交易决策分析、图表生成和 Telegram 推送
-支持完整的开单、止盈、止损决策（文本输出，不对接交易所）
+支持完整的开单、止盈、止损决策（在模拟账户中执行，不对接交易所）
 """
 
 import os
 import json
 import time
-import requests
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, Optional, List
 
+import numpy as np
+
 from market_data import MarketData
+from http_transport import HTTPTransport
+from metrics import get_registry
+from response_cache import ResponseCache
+from triggers import TriggerEngine
+from pipeline import StageTimer
+from scheduler import CandleScheduler
+from chart_renderer import ChartRenderer
+from telegram_outbox import TelegramOutbox
+from log_sink import LogSink
+from log_index import LogIndex
+from json_extract import extract_last_json
+from paper_trading import PaperAccount
+from running_stats import PerformanceStats, format_performance
 from prompts_trading import build_system_prompt, build_user_prompt, format_trading_result
 from deepseek_client import DeepSeekClient
 
@@ -30,48 +45,120 @@ class BTCTradingMonitor:
         self.config = self._load_config(config_path)
 
         # 初始化市场数据获取器
-        self.market_data = MarketData()
+        self.market_data = MarketData(
+            concurrent=self.config.get('concurrent_fetch', True),
+            store_path=self.config.get('ohlcv_store_path', 'market_cache/ohlcv.sqlite3'),
+            incremental=self.config.get('incremental_indicators', True),
+            snapshot=self.config.get('market_snapshot', True)
+        )
+
+        # WebSocket 行情推送（可选）：启用后市场数据直接读取本地缓冲区
+        if self.config.get('market_stream', False):
+            self.market_data.start_stream()
+
+        # 共享 HTTP 传输层：DeepSeek、Telegram、Chart API 复用 keep-alive 连接
+        self.http = HTTPTransport(
+            pool_maxsize=self.config.get('http_pool_maxsize', 8),
+            connect_timeout=self.config.get('http_connect_timeout', 10),
+            http2=self.config.get('http2', False)
+        )
+
+        # AI 响应缓存：行情平稳时相同（归一化后）的 prompt 直接复用上次的响应
+        self.response_cache = None
+        if self.config.get('response_cache', True):
+            self.response_cache = ResponseCache(
+                ttl_seconds=self.config.get('response_cache_ttl_seconds', 600),
+                db_path=self.config.get('response_cache_path', 'market_cache/responses.sqlite3')
+            )
 
         # 初始化 DeepSeek 客户端
         self.deepseek_client = DeepSeekClient(
             api_key=self.config['deepseek_api_key'],
             base_url=self.config.get('deepseek_base_url', 'https://api.deepseek.com/v1'),
-            model=self.config.get('deepseek_model', 'deepseek-chat')
+            model=self.config.get('deepseek_model', 'deepseek-chat'),
+            transport=self.http,
+            cache=self.response_cache
         )
 
+        # 事件触发（可选）：两次 AI 分析之间只评估本地触发条件，条件满足或超过最长间隔时才分析
+        self.trigger_engine = TriggerEngine.from_config(self.config) if self.config.get('event_triggers', False) else None
+
         # Telegram Bot 配置
         self.telegram_bot_token = self.config.get('telegram_bot_token')
         self.telegram_chat_id = self.config.get('telegram_chat_id')
 
+        # Telegram 发送队列：后台线程按入队顺序发送（限速、429 重试、超长消息拆分），不阻塞分析流程
+        self.telegram = None
+        if self.telegram_bot_token and self.telegram_chat_id:
+            self.telegram = TelegramOutbox(
+                self.telegram_bot_token, self.telegram_chat_id, http=self.http,
+                api_base=self.config.get('telegram_api_base', 'https://api.telegram.org'),
+                global_rate=self.config.get('telegram_global_rate', 30),
+                chat_rate=self.config.get('telegram_chat_rate', 1)
+            )
+
         # Chart API 配置
         self.chart_api_key = self.config.get('chart_api_key')
         self.chart_api_url = self.config.get('chart_api_url', 'https://api.chart-img.com/v2/tradingview/advanced-chart')
 
+        # 图表渲染：'local' 用已获取的 K 线在本地工作进程中绘制（失败时回退到 Chart API），'api' 只用 Chart API
+        self.chart_renderer = None
+        if self.config.get('chart_renderer', 'local') == 'local':
+            self.chart_renderer = ChartRenderer(
+                timeframe=self.config.get('chart_interval', '1h'),
+                backend=self.config.get('chart_backend', 'auto')
+            )
+
         # 模拟账户配置
         self.initial_balance = self.config.get('initial_balance', 1000.0)
         self.btc_eth_leverage = self.config.get('btc_eth_leverage', 5)
         self.altcoin_leverage = self.config.get('altcoin_leverage', 5)
 
+        # 后台线程池：图表生成、Telegram 图片上传、日志写入不占用分析主流程
+        self._background = ThreadPoolExecutor(max_workers=4, thread_name_prefix='pipeline')
+
+        # 分析日志：缓冲后由后台线程批量写入，按日期 / 大小轮转并压缩旧文件；
+        # 日志索引（可选）在每批写入后同步导入 SQLite，用 python log_index.py query 查询历史周期
+        self.log_index = None
+        if self.config.get('log_index', True):
+            self.log_index = LogIndex(self.config.get(
+                'log_index_path', os.path.join(self.config.get('log_dir', 'analysis_logs'), 'index.sqlite3')))
+        self.log_sink = LogSink.from_config(
+            self.config, listeners=[self.log_index.add_records] if self.log_index is not None else None)
+
         # 运行统计
         self.start_time = datetime.now()
         self.call_count = 0
 
-        # 模拟账户状态
-        self.account = {
-            'total_equity': self.initial_balance,
-            'available_balance': self.initial_balance,
-            'total_pnl': 0.0,
-            'total_pnl_pct': 0.0,
-            'margin_used': 0.0,
-            'margin_used_pct': 0.0,
-            'position_count': 0
-        }
+        # 交易绩效统计：每笔平仓时增量更新（夏普、索提诺、胜率、盈亏比、最大回撤，含窗口统计），
+        # 配置状态文件后重启时直接恢复
+        self.performance_state_path = self.config.get('performance_state_path')
+        self.performance = PerformanceStats.load(
+            self.performance_state_path, initial_equity=self.initial_balance,
+            windows=self.config.get('performance_windows', {'last_20': {'max_trades': 20}, '24h': {'max_hours': 24}})
+        )
 
-        # 模拟持仓
-        self.positions = []
+        # 模拟账户：执行 AI 的开平仓决策，价格更新时向量化盯市并触发止损 / 止盈 / 强平
+        self.paper = PaperAccount(
+            self.initial_balance,
+            fee_rate=self.config.get('paper_fee_rate', 0.0004),
+            maintenance_margin_rate=self.config.get('paper_maintenance_margin_rate', 0.004),
+            listeners=[self.performance.add_trades]
+        )
 
-        # 历史交易记录（用于计算夏普比率）
-        self.trade_history = []
+        # 模拟账户状态和持仓：(账户信息, 持仓列表) 作为一个元组整体替换，
+        # 行情推送线程刷新时，主线程每个周期只读取一次，不会拿到来自不同时刻的账户和持仓
+        self._account_state = self.paper.snapshot()
+
+        # 历史交易记录
+        self.trade_history = self.paper.trade_history
+        # 已写入分析日志的交易数量（之后平仓的交易记入下一条日志）
+        self._logged_trades = 0
+
+        # 行情推送启用时，每次标记价格推送都检查止损 / 止盈 / 强平
+        stream = self.market_data.streams.get('BTC/USDT')
+        if stream is not None:
+            stream.price_listeners.append(self._on_mark_price)
 
     def _load_config(self, config_path: str) -> Dict:
         """加载配置文件"""
@@ -81,34 +168,8 @@ class BTCTradingMonitor:
         with open(config_path, 'r', encoding='utf-8') as f:
             return json.load(f)
 
-    def _calculate_sharpe_ratio(self) -> float:
-        """
-        计算夏普比率（简化版本）
-
-        Returns:
-            夏普比率
-        """
-        if len(self.trade_history) < 2:
-            return 0.0
-
-        # 提取收益率序列
-        returns = [trade['pnl_pct'] for trade in self.trade_history if 'pnl_pct' in trade]
-
-        if len(returns) < 2:
-            return 0.0
-
-        # 计算平均收益和标准差
-        import statistics
-        mean_return = statistics.mean(returns)
-        std_return = statistics.stdev(returns)
-
-        # 夏普比率 = 平均收益 / 收益波动率
-        if std_return == 0:
-            return 0.0
-
-        return mean_return / std_return
-
-    def _parse_ai_decisions(self, ai_response: str) -> tuple:
+    @staticmethod
+    def _parse_ai_decisions(ai_response: str) -> tuple:
         """
         解析 AI 响应，提取思维链和决策列表
 
@@ -118,53 +179,38 @@ class BTCTradingMonitor:
         Returns:
             (cot_trace, decisions) 元组
         """
-        # 提取思维链（JSON 之前的内容）
-        json_start = ai_response.find('[')
-        if json_start > 0:
-            cot_trace = ai_response[:json_start].strip()
-        else:
-            cot_trace = ai_response
-            return cot_trace, []
-
-        # 提取 JSON 决策列表
-        try:
-            # 找到匹配的右括号
-            bracket_count = 0
-            json_end = -1
-            for i in range(json_start, len(ai_response)):
-                if ai_response[i] == '[':
-                    bracket_count += 1
-                elif ai_response[i] == ']':
-                    bracket_count -= 1
-                    if bracket_count == 0:
-                        json_end = i + 1
-                        break
-
-            if json_end == -1:
-                print("  ⚠️ 无法找到完整的 JSON 数组")
-                return cot_trace, []
-
-            json_str = ai_response[json_start:json_end].strip()
-
-            # 修复中文引号
-            json_str = json_str.replace('"', '"').replace('"', '"')
-            json_str = json_str.replace(''', "'").replace(''', "'")
-
-            decisions = json.loads(json_str)
-            return cot_trace, decisions
-
-        except json.JSONDecodeError as e:
-            print(f"  ⚠️ JSON 解析失败: {e}")
-            print(f"  JSON 内容: {ai_response[json_start:json_start+200]}...")
-            return cot_trace, []
-
-    def run_analysis(self) -> Dict:
+        # 决策是最后一个元素都为对象的 JSON 数组（字符串和思维链中的括号不影响提取）
+        match = extract_last_json(ai_response, expect=list,
+                                  accept=lambda value: all(isinstance(item, dict) for item in value))
+        if match is None:
+            if '[' in ai_response:
+                print("  ⚠️ 无法找到完整的 JSON 决策数组")
+            return ai_response, []
+
+        # 思维链是 JSON 之前的内容
+        cot_trace = ai_response[:match.start].strip() if match.start > 0 else ai_response
+        return cot_trace, match.value
+
+    def _on_decisions_ready(self, decisions):
+        """流式模式下决策数组闭合时立即回调（模型仍在输出后续文本）"""
+        ready_ms = self.deepseek_client.last_call_stats.get('json_ready_ms') or 0
+        if isinstance(decisions, list):
+            print(f"  ⚡ 交易决策已就绪 ({ready_ms:.0f}ms): {len(decisions)} 个决策")
+
+    def run_analysis(self, market_data: Optional[Dict] = None,
+                     trigger_reasons: Optional[List[str]] = None) -> Dict:
         """
         执行一次完整的交易决策分析
 
+        Args:
+            market_data: 已获取的市场数据（事件触发模式下复用评估触发条件时的数据），为 None 时重新获取
+            trigger_reasons: 本次分析的触发原因（写入日志）
+
         Returns:
             分析结果字典
         """
+        timer = StageTimer()
+
         print(f"\n{'='*60}")
         print(f"🔍 开始第 {self.call_count + 1} 次分析 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"{'='*60}\n")
@@ -172,7 +218,8 @@ class BTCTradingMonitor:
         # 1. 获取市场数据
         print("📊 正在获取 BTC 市场数据...")
         try:
-            btc_data = self.market_data.get_btc_complete_data()
+            with timer.stage('fetch'):
+                btc_data = market_data if market_data is not None else self.market_data.get_btc_complete_data()
             print(f"✓ 市场数据获取成功")
             print(f"  当前价格: ${btc_data['current_price']:,.2f}")
             print(f"  15分钟涨跌: {btc_data['price_changes']['15m']:+.2f}%")
@@ -182,34 +229,62 @@ class BTCTradingMonitor:
             print(f"❌ 市场数据获取失败: {e}")
             return {'success': False, 'error': str(e)}
 
+        # 模拟持仓盯市：用上次分析以来的 K 线检查止损 / 止盈 / 强平
+        self._mark_positions(btc_data)
+        account, positions = self._account_state
+
         # 2. 构建 Prompts
         print("🔨 正在构建 AI 交易决策提示词...")
         runtime_minutes = int((datetime.now() - self.start_time).total_seconds() / 60)
         self.call_count += 1
 
-        # 计算夏普比率
-        sharpe_ratio = self._calculate_sharpe_ratio()
+        with timer.stage('prompt'):
+            # 绩效统计（平仓时已增量更新，这里只读取）
+            performance = self.performance.snapshot()
+            sharpe_ratio = performance['sharpe_ratio']
 
-        system_prompt = build_system_prompt(
-            account_equity=self.account['total_equity'],
-            btc_eth_leverage=self.btc_eth_leverage,
-            altcoin_leverage=self.altcoin_leverage
-        )
+            system_prompt = build_system_prompt(
+                account_equity=account['total_equity'],
+                btc_eth_leverage=self.btc_eth_leverage,
+                altcoin_leverage=self.altcoin_leverage,
+                cache_friendly=self.config.get('prompt_cache_layout', True)
+            )
 
-        user_prompt = build_user_prompt(
-            market_data=btc_data,
-            runtime_minutes=runtime_minutes,
-            call_count=self.call_count,
-            account_info=self.account,
-            positions=self.positions,
-            sharpe_ratio=sharpe_ratio
-        )
+            user_prompt = build_user_prompt(
+                market_data=btc_data,
+                runtime_minutes=runtime_minutes,
+                call_count=self.call_count,
+                account_info=account,
+                positions=positions,
+                sharpe_ratio=sharpe_ratio,
+                cache_friendly=self.config.get('prompt_cache_layout', True)
+            )
         print("✓ 提示词构建完成\n")
 
+        # 图表不依赖 AI 输出：在后台与 AI 调用并行生成
+        chart_future = self._background.submit(timer.timed, 'chart', self._generate_chart, btc_data)
+
         # 3. 调用 DeepSeek AI 分析
         print("🤖 正在调用 DeepSeek AI 进行交易决策分析...")
         try:
-            ai_response = self.deepseek_client.call_with_messages(system_prompt, user_prompt)
+            with timer.stage('llm'):
+                ai_response = self.deepseek_client.call_with_messages(
+                    system_prompt, user_prompt,
+                    stream=self.config.get('deepseek_stream', True),
+                    on_json=self._on_decisions_ready,
+                    json_opening='['
+                )
+            if self.deepseek_client.last_call_stats.get('cached'):
+                print("♻️ 行情与上次相同，复用缓存的 AI 响应")
+            call_stats = self.deepseek_client.last_call_stats
+            if not call_stats.get('cached'):
+                latency = get_registry().summary('deepseek.total_ms')
+                print(f"  ⏱ 首字节 {call_stats.get('ttfb_ms') or 0:.0f}ms | 总耗时 {call_stats.get('total_ms', 0):.0f}ms | "
+                      f"重试 {call_stats.get('retries', 0)} 次 | 近期 p95 {latency.get('p95', 0):.0f}ms")
+            usage = call_stats.get('usage')
+            if usage:
+                print(f"  📦 Prompt 缓存命中 {usage['cache_hit_tokens']}/{usage['prompt_tokens']} tokens "
+                      f"({usage['cache_hit_tokens'] / max(usage['prompt_tokens'], 1) * 100:.0f}%)")
             print("✓ AI 分析完成\n")
         except Exception as e:
             print(f"❌ AI 调用失败: {e}")
@@ -217,7 +292,8 @@ class BTCTradingMonitor:
 
         # 4. 解析 AI 响应
         print("📝 正在解析 AI 交易决策...")
-        cot_trace, decisions = self._parse_ai_decisions(ai_response)
+        with timer.stage('parse'):
+            cot_trace, decisions = self._parse_ai_decisions(ai_response)
 
         # 打印完整的 AI 分析过程
         print("\n" + "="*60)
@@ -236,61 +312,88 @@ class BTCTradingMonitor:
                 symbol = decision.get('symbol', 'N/A')
                 print(f"  {i}. {symbol}: {action}")
 
-        print()
+        # 在模拟账户中执行决策
+        executions = self.paper.apply_decisions(decisions, {'BTCUSDT': btc_data['current_price']})
+        for execution in executions:
+            if execution['status'] == 'opened':
+                print(f"  📥 {execution['symbol']} {execution['action']} 成交 @ ${execution['entry_price']:,.2f} "
+                      f"（强平价 ${execution['liquidation_price']:,.2f}）")
+            elif execution['status'] == 'closed':
+                for trade in execution['trades']:
+                    print(f"  📤 {trade['symbol']} {trade['side']} 平仓 @ ${trade['exit_price']:,.2f} "
+                          f"盈亏 ${trade['pnl']:+,.2f} ({trade['pnl_pct']:+.2f}%)")
+            elif execution['status'] == 'rejected':
+                print(f"  ⛔ {execution['symbol']} {execution['action']} 未执行: {execution['reason']}")
+        self._refresh_account()
+        self._save_performance()
+        account, positions = self._account_state
 
-        # 5. 生成图表
-        print("📈 正在生成 BTC 图表...")
-        chart_path = self._generate_chart()
-        if chart_path:
-            print(f"✓ 图表生成成功: {chart_path}\n")
-        else:
-            print("⚠️ 图表生成失败\n")
+        print()
 
-        # 6. 发送到 Telegram
-        if self.telegram_bot_token and self.telegram_chat_id:
-            print("📤 正在发送到 Telegram...")
-            message = format_trading_result(cot_trace, decisions, self.account)
-            success = self._send_to_telegram(message, chart_path)
-            if success:
-                print("✓ Telegram 消息发送成功\n")
-            else:
-                print("❌ Telegram 消息发送失败\n")
+        # 5. 发送到 Telegram：文本放入发送队列后立即返回，图表生成完成后图片排在文本之后
+        text_future = photo_future = None
+        if self.telegram is not None:
+            message = format_trading_result(cot_trace, decisions, account)
+            text_future = self._queue_telegram_text(message, timer)
+            photo_future = self._background.submit(self._send_chart_photo, chart_future, timer)
+            print(f"📤 Telegram 消息已加入发送队列（待发送 {self.telegram.pending()} 条）\n")
         else:
             print("⚠️ 未配置 Telegram，跳过发送\n")
+        timer.mark_critical_path()
 
         # 7. 保存结果
         result = {
             'success': True,
             'timestamp': datetime.now().isoformat(),
+            'trigger_reasons': trigger_reasons,
             'market_data': {
                 'current_price': btc_data['current_price'],
                 'price_changes': btc_data['price_changes']
             },
-            'account': self.account,
-            'positions': self.positions,
+            'account': account,  # 账户快照（之后的刷新会整体替换，不会修改这里的字典）
+            'positions': positions,
+            'executions': executions,
+            'closed_trades': self._take_closed_trades(),
             'sharpe_ratio': sharpe_ratio,
+            'performance': performance,
             'cot_trace': cot_trace,
             'decisions': decisions,
-            'chart_path': chart_path
+            'chart_path': None,  # 图表在后台生成，完成后写入
+            'http': self.http.stats.snapshot(),  # 连接复用与握手耗时统计
+            'deepseek': self.deepseek_client.last_call_stats,  # 状态码、首字节 / 总耗时、重试、token 用量
+            'usage_total': self.deepseek_client.usage.snapshot(),
+            'metrics': get_registry().snapshot()  # 耗时与 token 分位数
         }
 
-        self._save_analysis_log(result)
+        # 6. 等待图表和图片上传完成后在后台保存日志（不阻塞主流程）
+        self._background.submit(self._finish_cycle, result, timer, chart_future, text_future, photo_future)
 
         print(f"{'='*60}")
         print(f"✅ 第 {self.call_count} 次分析完成")
-        print(f"💰 账户净值: ${self.account['total_equity']:,.2f} | 盈亏: {self.account['total_pnl_pct']:+.2f}%")
-        print(f"📊 夏普比率: {sharpe_ratio:.2f}")
+        print(f"⏱ {timer.summary()}")
+        print(f"💰 账户净值: ${account['total_equity']:,.2f} | 盈亏: {account['total_pnl_pct']:+.2f}%")
+        print(f"📊 {format_performance(performance)}")
         print(f"{'='*60}\n")
 
         return result
 
-    def _generate_chart(self) -> Optional[str]:
+    def _generate_chart(self, market_data: Optional[Dict] = None) -> Optional[str]:
         """
         生成 BTC 图表
 
+        Args:
+            market_data: 本次分析的市场数据（本地渲染使用），为 None 时调用 Chart API
+
         Returns:
             图表文件路径，失败返回 None
         """
+        if self.chart_renderer is not None and market_data is not None:
+            try:
+                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                return self.chart_renderer.render(market_data, f"btc_chart_{timestamp}.png")
+            except Exception as e:
+                print(f"  本地图表渲染失败，改用 Chart API: {e}")
+
         if not self.chart_api_key:
             print("  未配置 Chart API，跳过图表生成")
             return None
@@ -316,7 +419,7 @@ class BTCTradingMonitor:
             }
 
             # 发送请求
-            response = requests.post(
+            response = self.http.post(
                 self.chart_api_url,
                 headers=headers,
                 json=payload,
@@ -338,9 +441,38 @@ class BTCTradingMonitor:
             print(f"  图表生成异常: {e}")
             return None
 
+    def _send_telegram_text(self, message: str) -> bool:
+        """
+        发送文本消息到 Telegram 并等待送达（超长消息自动拆分，HTML 解析失败时退回纯文本）
+
+        Returns:
+            是否发送成功
+        """
+        if self.telegram is None:
+            return False
+        return self.telegram.send_message(message).result()
+
+    def _send_telegram_photo(self, chart_path: str) -> bool:
+        """
+        发送图表图片到 Telegram 并等待送达
+
+        Returns:
+            是否发送成功
+        """
+        if self.telegram is None:
+            return False
+        return self.telegram.send_photo(chart_path).result()
+
+    def _queue_telegram_text(self, message: str, timer: StageTimer) -> Future:
+        """文本消息入队（不等待），送达时记录 telegram_text 阶段耗时"""
+        start = timer.clock()
+        future = self.telegram.send_message(message)
+        future.add_done_callback(lambda _: timer.record('telegram_text', start, timer.clock()))
+        return future
+
     def _send_to_telegram(self, message: str, chart_path: Optional[str] = None) -> bool:
         """
-        发送消息到 Telegram
+        发送消息到 Telegram（文本 + 图片，按顺序发送）
 
         Args:
             message: 消息文本
@@ -349,64 +481,178 @@ class BTCTradingMonitor:
         Returns:
             是否发送成功
         """
-        try:
-            # 发送文本消息（使用 HTML 模式）
-            url = f"https://api.telegram.org/bot{self.telegram_bot_token}/sendMessage"
-            data = {
-                'chat_id': self.telegram_chat_id,
-                'text': message,
-                'parse_mode': 'HTML'
-            }
-            response = requests.post(url, json=data, timeout=10)
-
-            if response.status_code != 200:
-                print(f"  文本消息发送失败: {response.text}")
-                # 尝试不使用格式化
-                print(f"  尝试发送纯文本...")
-                data['parse_mode'] = None
-                response = requests.post(url, json=data, timeout=10)
-                if response.status_code != 200:
-                    print(f"  纯文本发送也失败: {response.text}")
-                    return False
-
-            # 发送图片（如果有）
-            if chart_path and os.path.exists(chart_path):
-                url = f"https://api.telegram.org/bot{self.telegram_bot_token}/sendPhoto"
-                with open(chart_path, 'rb') as photo:
-                    files = {'photo': photo}
-                    data = {'chat_id': self.telegram_chat_id}
-                    response = requests.post(url, data=data, files=files, timeout=30)
-
-                if response.status_code != 200:
-                    print(f"  图片发送失败: {response.text}")
-                    return False
-
-            return True
+        if not self._send_telegram_text(message):
+            return False
+        if chart_path and os.path.exists(chart_path):
+            return self._send_telegram_photo(chart_path)
+        return True
+
+    def _send_chart_photo(self, chart_future: Future, timer: StageTimer) -> bool:
+        """后台任务：等待图表生成完成后把图片放入发送队列（排在本次文本消息之后），并等待送达"""
+        chart_path = chart_future.result()
+        if not chart_path or not os.path.exists(chart_path):
+            return False
+        with timer.stage('telegram_photo'):
+            return self.telegram.send_photo(chart_path).result()
 
+    def _finish_cycle(self, result: Dict, timer: StageTimer, chart_future: Future,
+                      text_future: Optional[Future], photo_future: Optional[Future]):
+        """后台任务：等待图表和 Telegram 发送完成，补全结果后保存日志"""
+        try:
+            result['chart_path'] = chart_future.result()
+            if text_future is not None:
+                result['telegram_sent'] = text_future.result()
+            if photo_future is not None:
+                result['telegram_photo_sent'] = photo_future.result()
+            with timer.stage('log'):
+                result['stage_timings'] = timer.timings()
+                self._save_analysis_log(result)
+            print(f"  🗂 后台任务完成: 图表 {result['chart_path'] or '无'} | {timer.summary()}")
         except Exception as e:
-            print(f"  Telegram 发送异常: {e}")
-            return False
+            print(f"⚠️ 后台任务失败: {e}")
 
     def _save_analysis_log(self, result: Dict):
         """
-        保存分析日志
+        保存分析日志（放入日志写入器的队列，序列化和磁盘写入在后台完成）
 
         Args:
             result: 分析结果
         """
         try:
-            # 创建日志目录
-            log_dir = 'analysis_logs'
-            os.makedirs(log_dir, exist_ok=True)
+            self.log_sink.write(result)
+        except Exception as e:
+            print(f"⚠️ 日志保存失败: {e}")
 
-            # 保存为 JSON Lines 格式
-            log_file = os.path.join(log_dir, f"{datetime.now().strftime('%Y-%m-%d')}.jsonl")
+    @property
+    def account(self) -> Dict:
+        """最新的账户信息（同一周期内需要账户和持仓时，一次读取 self._account_state）"""
+        return self._account_state[0]
 
-            with open(log_file, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(result, ensure_ascii=False) + '\n')
+    @property
+    def positions(self) -> List[Dict]:
+        """最新的持仓列表"""
+        return self._account_state[1]
 
+    def _refresh_account(self):
+        """从模拟账户刷新账户信息和持仓列表（可能在行情推送线程中调用，一次赋值整体替换）"""
+        self._account_state = self.paper.snapshot()
+
+    def _save_performance(self):
+        """保存绩效统计状态（配置了 performance_state_path 时）"""
+        if not self.performance_state_path:
+            return
+        try:
+            self.performance.save(self.performance_state_path)
+        except OSError as e:
+            print(f"⚠️ 绩效统计保存失败: {e}")
+
+    def _mark_positions(self, btc_data: Dict):
+        """
+        模拟持仓盯市：按时间顺序用 3 分钟 K 线的最高 / 最低价检查止损 / 止盈 / 强平，
+        没有 K 线时按当前价格检查；自动平仓的交易打印并推送到 Telegram
+
+        Args:
+            btc_data: 本周期的市场数据
+        """
+        klines = self.market_data.last_klines.get('BTC/USDT', {}).get('3m')
+        if klines is not None and len(klines) > 0:
+            candles = np.column_stack([
+                klines['timestamp'].to_numpy().astype('datetime64[ms]').astype('int64'),
+                klines[['open', 'high', 'low', 'close', 'volume']].to_numpy(dtype=float)
+            ])
+            trades = self.paper.mark_candles('BTCUSDT', candles)
+        else:
+            trades = self.paper.mark({'BTCUSDT': btc_data['current_price']})
+
+        self._report_closed_trades(trades)
+        self._refresh_account()
+
+    def _on_mark_price(self, symbol: str, price: float):
+        """行情推送的标记价格回调（后台线程）：两次分析之间实时触发止损 / 止盈 / 强平"""
+        trades = self.paper.mark({symbol.replace('/', ''): price})
+        if trades:
+            self._report_closed_trades(trades)
+            self._refresh_account()
+
+    def _report_closed_trades(self, trades: List[Dict]):
+        """打印自动平仓的交易，并放入 Telegram 发送队列"""
+        labels = {'stop_loss': '止损', 'take_profit': '止盈', 'liquidation': '强平'}
+        for trade in trades:
+            line = (f"{labels.get(trade['reason'], trade['reason'])} {trade['symbol']} {trade['side'].upper()} "
+                    f"@ ${trade['exit_price']:,.2f} | 盈亏 ${trade['pnl']:+,.2f} ({trade['pnl_pct']:+.2f}%)")
+            print(f"  🔔 模拟持仓{line}")
+            if self.telegram is not None:
+                self.telegram.send_message(f"🔔 <b>模拟持仓{line}</b>")
+
+    def _take_closed_trades(self) -> List[Dict]:
+        """上次写入日志以来平仓的交易"""
+        trades = self.trade_history[self._logged_trades:]
+        self._logged_trades += len(trades)
+        return [dict(trade) for trade in trades]
+
+    def _run_triggered_cycle(self):
+        """事件触发模式的一轮：获取行情并评估触发条件，触发时复用同一份行情执行完整分析"""
+        try:
+            btc_data = self.market_data.get_btc_complete_data()
         except Exception as e:
-            print(f"⚠️ 日志保存失败: {e}")
+            print(f"❌ 市场数据获取失败: {e}")
+            return
+
+        # 不触发分析的轮次也检查止损 / 止盈 / 强平
+        self._mark_positions(btc_data)
+
+        reasons = self.trigger_engine.evaluate(btc_data)
+        if not reasons:
+            since_minutes = self.trigger_engine.seconds_since_analysis() / 60
+            print(f"💤 {datetime.now().strftime('%H:%M:%S')} 无触发条件，跳过 AI 分析"
+                  f"（距上次分析 {since_minutes:.0f} 分钟）\n")
+            return
+
+        print(f"🔔 触发分析: {'；'.join(reasons)}")
+        result = self.run_analysis(market_data=btc_data, trigger_reasons=reasons)
+        # 分析失败时不更新参考状态，下一轮继续触发
+        if result.get('success'):
+            self.trigger_engine.mark_analyzed(btc_data)
+
+    def _create_scheduler(self, interval_minutes: int) -> Optional[CandleScheduler]:
+        """
+        创建 K 线收盘对齐的调度器（schedule_align 关闭时返回 None，沿用固定间隔休眠）
+
+        事件触发模式按 trigger_poll_seconds 对齐，否则按 schedule_timeframe（默认与分析间隔相同的 K 线周期）对齐
+        """
+        if not self.config.get('schedule_align', True):
+            return None
+
+        if self.trigger_engine is not None:
+            timeframe = f"{self.config.get('trigger_poll_seconds', 60)}s"
+        else:
+            timeframe = self.config.get('schedule_timeframe') or f"{interval_minutes}m"
+
+        scheduler = CandleScheduler(
+            timeframe=timeframe,
+            offset_ms=self.config.get('schedule_offset_ms', 300),
+            overrun=self.config.get('schedule_overrun', 'skip'),
+            time_source=self.market_data.exchange.fetch_time
+        )
+        offset = scheduler.sync_clock()
+        print(f"🕐 调度对齐 {timeframe} K 线收盘（+{scheduler.offset * 1000:.0f}ms），交易所时钟偏差 {offset * 1000:+.0f}ms")
+        return scheduler
+
+    def _wait_next_cycle(self, scheduler: Optional[CandleScheduler], wait_seconds: float, verbose: bool = True):
+        """等待下一个周期：有调度器时对齐 K 线收盘，否则固定休眠 wait_seconds 秒"""
+        if scheduler is None:
+            if verbose:
+                next_time = datetime.fromtimestamp(time.time() + wait_seconds).strftime('%H:%M:%S')
+                print(f"⏰ 等待 {wait_seconds / 60:.0f} 分钟后进行下一次分析...")
+                print(f"   下次分析时间: {next_time}\n")
+            time.sleep(wait_seconds)
+            return
+
+        if verbose:
+            print(f"⏰ 下次分析时间: {scheduler.next_run_local().strftime('%H:%M:%S')}\n")
+        tick = scheduler.wait_next()
+        if tick['skipped']:
+            print(f"⏭ 上一轮超时，跳过 {tick['skipped']} 个周期")
 
     def run_loop(self, interval_minutes: int = 5):
         """
@@ -416,7 +662,11 @@ class BTCTradingMonitor:
             interval_minutes: 分析间隔（分钟）
         """
         print(f"\n🚀 BTC 交易决策监控机器人启动")
-        print(f"📊 分析间隔: {interval_minutes} 分钟")
+        if self.trigger_engine is None:
+            print(f"📊 分析间隔: {interval_minutes} 分钟")
+        else:
+            print(f"🔔 事件触发模式: 每 {self.config.get('trigger_poll_seconds', 60)} 秒评估一次，"
+                  f"最长 {self.trigger_engine.max_staleness_seconds / 60:.0f} 分钟分析一次")
         print(f"🤖 AI 模型: {self.config.get('deepseek_model', 'deepseek-chat')}")
         print(f"💰 初始资金: ${self.initial_balance:,.2f}")
         print(f"⚡ 杠杆配置: BTC/ETH {self.btc_eth_leverage}x | 山寨 {self.altcoin_leverage}x")
@@ -426,24 +676,40 @@ class BTCTradingMonitor:
             print(f"📱 Telegram 推送: 未配置")
         print(f"\n按 Ctrl+C 停止运行\n")
 
+        scheduler = self._create_scheduler(interval_minutes)
+
         try:
             while True:
+                if self.trigger_engine is not None:
+                    self._run_triggered_cycle()
+                    self._wait_next_cycle(scheduler, self.config.get('trigger_poll_seconds', 60), verbose=False)
+                    continue
+
                 # 执行分析
                 result = self.run_analysis()
 
                 # 等待下一次分析
-                wait_seconds = interval_minutes * 60
-                next_time = datetime.fromtimestamp(time.time() + wait_seconds).strftime('%H:%M:%S')
-                print(f"⏰ 等待 {interval_minutes} 分钟后进行下一次分析...")
-                print(f"   下次分析时间: {next_time}\n")
-
-                time.sleep(wait_seconds)
+                self._wait_next_cycle(scheduler, interval_minutes * 60)
 
         except KeyboardInterrupt:
             print("\n\n👋 收到停止信号，正在退出...")
+            self._background.shutdown(wait=True)   # 等待后台的图片上传和日志写入完成
+            if self.chart_renderer is not None:
+                self.chart_renderer.close()
+            if self.telegram is not None:
+                self.telegram.close()          # 发送队列中剩余的消息
+            self.log_sink.close()              # 写完缓冲中的日志
+            if self.log_index is not None:
+                self.log_index.close()
             print(f"📊 总共完成 {self.call_count} 次分析")
-            print(f"💰 最终账户净值: ${self.account['total_equity']:,.2f}")
-            print(f"📈 总盈亏: {self.account['total_pnl_pct']:+.2f}%")
+            if self.trigger_engine is not None:
+                stats = self.trigger_engine.stats()
+                print(f"🔔 评估 {stats['evaluations']} 轮，触发 {stats['fired']} 轮，跳过 {stats['skipped']} 轮")
+            self._refresh_account()
+            self._save_performance()
+            account = self.account
+            print(f"💰 最终账户净值: ${account['total_equity']:,.2f}")
+            print(f"📈 总盈亏: {account['total_pnl_pct']:+.2f}%")
             print("感谢使用 BTC 交易决策监控机器人！\n")
 
 
@@ -0,0 +1,335 @@
+"""
+本地图表渲染
+直接用 MarketData 已计算好的 timeframe_* 序列绘制 K 线 + 成交量 + 均线/布林带 + MACD + RSI，
+布局与 chart-img API 的图表一致，不再依赖外部 API（离线可用，无 30 秒超时）
+
+两种后端：
+- matplotlib（Agg，已安装 matplotlib 时使用，带坐标轴和文字）
+- numpy 栅格（无额外依赖：直接在 RGB 数组上绘制，zlib 编码为 PNG）
+
+ChartRenderer 在独立的工作进程中渲染，不占用分析主循环
+"""
+
+import multiprocessing
+import os
+import struct
+import zlib
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Optional
+
+import numpy as np
+
+try:
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    HAS_MATPLOTLIB = True
+except ImportError:
+    HAS_MATPLOTLIB = False
+
+
+# 深色主题配色（与 TradingView dark 主题接近）
+COLORS = {
+    'background': (19, 23, 34),
+    'grid': (42, 46, 57),
+    'up': (38, 166, 154),
+    'down': (239, 83, 80),
+    'ema20': (255, 193, 7),
+    'ema50': (33, 150, 243),
+    'bb': (120, 123, 134),
+    'macd': (41, 98, 255),
+    'signal': (255, 109, 0),
+    'rsi': (126, 87, 194),
+    'level': (90, 90, 100)
+}
+
+# 绘图所需的序列字段
+CHART_FIELDS = ('prices', 'highs', 'lows', 'ema20', 'ema50', 'bb_upper', 'bb_lower',
+                'volumes', 'macd', 'macd_signal', 'macd_hist', 'rsi14')
+
+
+def extract_series(market_data: Dict, timeframe: str = '1h') -> Dict:
+    """
+    从完整市场数据中取出绘图所需的序列（numpy 数组，可直接传给工作进程）
+
+    序列中没有开盘价：相邻 K 线首尾相接，开盘价取上一根的收盘价；
+    均线和布林带在预热期内为 0，绘图时视为缺失
+    """
+    tf_data = market_data[f'timeframe_{timeframe}']
+    series = {field: np.asarray(tf_data[field], dtype=np.float64) for field in CHART_FIELDS}
+    for field in ('ema20', 'ema50', 'bb_upper', 'bb_lower'):
+        series[field] = np.where(series[field] > 0, series[field], np.nan)
+    closes = series['prices']
+    series['opens'] = np.concatenate([closes[:1], closes[:-1]])
+    series['title'] = f"{market_data.get('symbol', 'BTCUSDT')} {timeframe}  {market_data['current_price']:,.2f}"
+    return series
+
+
+def render_chart(series: Dict, path: str, width: int = 800, height: int = 600,
+                 backend: str = 'auto') -> str:
+    """
+    渲染图表并保存为 PNG
+
+    Args:
+        series: extract_series() 的返回值
+        path: 输出文件路径
+        width: 图片宽度（像素）
+        height: 图片高度（像素）
+        backend: 'matplotlib'、'raster'，或 'auto'（已安装 matplotlib 时优先使用）
+
+    Returns:
+        图表文件路径
+    """
+    if backend == 'auto':
+        backend = 'matplotlib' if HAS_MATPLOTLIB else 'raster'
+    if backend == 'matplotlib':
+        if not HAS_MATPLOTLIB:
+            raise ImportError("matplotlib 未安装，请使用 raster 后端或 pip install matplotlib")
+        _render_matplotlib(series, path, width, height)
+    else:
+        write_png(path, _render_raster(series, width, height))
+    return path
+
+
+# ========== matplotlib 后端 ==========
+
+def _render_matplotlib(series: Dict, path: str, width: int, height: int):
+    """matplotlib（Agg）渲染：价格 + 成交量叠加、MACD、RSI 三个面板"""
+    def rgb(name):
+        return tuple(c / 255 for c in COLORS[name])
+
+    dpi = 100
+    fig, (ax_price, ax_macd, ax_rsi) = plt.subplots(
+        3, 1, figsize=(width / dpi, height / dpi), dpi=dpi, sharex=True,
+        gridspec_kw={'height_ratios': [3, 1, 1]}, facecolor=rgb('background')
+    )
+    x = np.arange(len(series['prices']))
+    up = series['prices'] >= series['opens']
+    candle_colors = [rgb('up') if u else rgb('down') for u in up]
+
+    for ax in (ax_price, ax_macd, ax_rsi):
+        ax.set_facecolor(rgb('background'))
+        ax.grid(color=rgb('grid'), linewidth=0.5)
+        ax.tick_params(colors='#b2b5be', labelsize=7)
+
+    # K 线、均线、布林带
+    ax_price.vlines(x, series['lows'], series['highs'], colors=candle_colors, linewidth=1)
+    ax_price.bar(x, np.abs(series['prices'] - series['opens']),
+                 bottom=np.minimum(series['prices'], series['opens']), width=0.6, color=candle_colors)
+    ax_price.plot(x, series['ema20'], color=rgb('ema20'), linewidth=1, label='EMA20')
+    ax_price.plot(x, series['ema50'], color=rgb('ema50'), linewidth=1, label='EMA50')
+    ax_price.plot(x, series['bb_upper'], color=rgb('bb'), linewidth=0.8, linestyle='--')
+    ax_price.plot(x, series['bb_lower'], color=rgb('bb'), linewidth=0.8, linestyle='--')
+    ax_price.set_title(series['title'], color='#d1d4dc', fontsize=9, loc='left')
+
+    # 成交量叠加在价格面板底部
+    ax_volume = ax_price.twinx()
+    ax_volume.bar(x, series['volumes'], width=0.6, color=candle_colors, alpha=0.3)
+    ax_volume.set_ylim(0, series['volumes'].max() * 5 if series['volumes'].max() > 0 else 1)
+    ax_volume.axis('off')
+
+    # MACD
+    hist_colors = [rgb('up') if v >= 0 else rgb('down') for v in series['macd_hist']]
+    ax_macd.bar(x, series['macd_hist'], width=0.6, color=hist_colors)
+    ax_macd.plot(x, series['macd'], color=rgb('macd'), linewidth=1)
+    ax_macd.plot(x, series['macd_signal'], color=rgb('signal'), linewidth=1)
+
+    # RSI
+    ax_rsi.plot(x, series['rsi14'], color=rgb('rsi'), linewidth=1)
+    for level in (30, 70):
+        ax_rsi.axhline(level, color=rgb('level'), linewidth=0.8, linestyle='--')
+    ax_rsi.set_ylim(0, 100)
+
+    fig.tight_layout()
+    fig.savefig(path, facecolor=fig.get_facecolor())
+    plt.close(fig)
+
+
+# ========== numpy 栅格后端 ==========
+
+def _render_raster(series: Dict, width: int, height: int) -> np.ndarray:
+    """
+    在 (height, width, 3) 的 RGB 数组上绘制图表（无文字）
+
+    布局：价格面板 60%（K 线、EMA20/50、布林带，底部叠加成交量），MACD 20%，RSI 20%
+    """
+    canvas = np.empty((height, width, 3), dtype=np.uint8)
+    canvas[:] = COLORS['background']
+
+    margin, gap = 10, 8
+    usable = height - 2 * margin - 2 * gap
+    price_h = int(usable * 0.6)
+    macd_h = (usable - price_h) // 2
+    price_panel = (margin, margin + price_h)
+    macd_panel = (price_panel[1] + gap, price_panel[1] + gap + macd_h)
+    rsi_panel = (macd_panel[1] + gap, height - margin)
+    left, right = margin, width - margin
+
+    n = len(series['prices'])
+    slot = (right - left) / max(n, 1)
+    centers = (left + slot * (np.arange(n) + 0.5)).astype(int)
+    half_body = max(int(slot * 0.3), 1)
+
+    for top, bottom in (price_panel, macd_panel, rsi_panel):
+        _grid(canvas, top, bottom, left, right)
+
+    # 价格面板
+    top, bottom = price_panel
+    lo = np.nanmin(np.concatenate([series['lows'], series['bb_lower']]))
+    hi = np.nanmax(np.concatenate([series['highs'], series['bb_upper']]))
+    scale = _scaler(lo, hi, top, bottom)
+
+    volume_top = bottom - (bottom - top) // 5
+    max_volume = series['volumes'].max()
+    for i in range(n):
+        up = series['prices'][i] >= series['opens'][i]
+        color = COLORS['up'] if up else COLORS['down']
+        x = centers[i]
+
+        # 成交量（半透明叠加在价格面板底部）
+        if max_volume > 0:
+            bar_top = bottom - int((bottom - volume_top) * series['volumes'][i] / max_volume)
+            _blend(canvas, bar_top, bottom, x - half_body, x + half_body + 1, color, 0.35)
+
+        # 影线和实体
+        _fill(canvas, scale(series['highs'][i]), scale(series['lows'][i]) + 1, x, x + 1, color)
+        body_top, body_bottom = sorted((scale(series['opens'][i]), scale(series['prices'][i])))
+        _fill(canvas, body_top, body_bottom + 1, x - half_body, x + half_body + 1, color)
+
+    for field, color in (('bb_upper', 'bb'), ('bb_lower', 'bb'), ('ema50', 'ema50'), ('ema20', 'ema20')):
+        _polyline(canvas, centers, series[field], scale, COLORS[color])
+
+    # MACD 面板
+    top, bottom = macd_panel
+    extent = np.nanmax(np.abs(np.concatenate([series['macd'], series['macd_signal'], series['macd_hist']])))
+    extent = extent if extent > 0 else 1.0
+    scale = _scaler(-extent, extent, top, bottom)
+    zero = scale(0.0)
+    _fill(canvas, zero, zero + 1, left, right, COLORS['level'])
+    for i, value in enumerate(series['macd_hist']):
+        color = COLORS['up'] if value >= 0 else COLORS['down']
+        y = scale(value)
+        _fill(canvas, min(y, zero), max(y, zero) + 1, centers[i] - half_body, centers[i] + half_body + 1, color)
+    _polyline(canvas, centers, series['macd'], scale, COLORS['macd'])
+    _polyline(canvas, centers, series['macd_signal'], scale, COLORS['signal'])
+
+    # RSI 面板
+    top, bottom = rsi_panel
+    scale = _scaler(0.0, 100.0, top, bottom)
+    for level in (30, 70):
+        y = scale(level)
+        canvas[y, left:right:4] = COLORS['level']
+    _polyline(canvas, centers, series['rsi14'], scale, COLORS['rsi'])
+
+    return canvas
+
+
+def _scaler(lo: float, hi: float, top: int, bottom: int):
+    """数值 → 像素行号（数值越大越靠上），上下各留 5% 空白"""
+    pad = (hi - lo) * 0.05 or 1.0
+    lo, hi = lo - pad, hi + pad
+    span = bottom - 1 - top
+
+    def scale(values):
+        rows = top + (hi - np.asarray(values, dtype=np.float64)) / (hi - lo) * span
+        rows = np.clip(np.nan_to_num(rows, nan=bottom - 1), top, bottom - 1).astype(int)
+        return rows if rows.ndim else int(rows)
+
+    return scale
+
+
+def _grid(canvas: np.ndarray, top: int, bottom: int, left: int, right: int):
+    """面板边框和水平网格线"""
+    color = COLORS['grid']
+    for y in np.linspace(top, bottom - 1, 5).astype(int):
+        canvas[y, left:right] = color
+    canvas[top:bottom, left] = color
+    canvas[top:bottom, right - 1] = color
+
+
+def _fill(canvas: np.ndarray, y0: int, y1: int, x0: int, x1: int, color):
+    canvas[max(y0, 0):max(y1, 0), max(x0, 0):max(x1, 0)] = color
+
+
+def _blend(canvas: np.ndarray, y0: int, y1: int, x0: int, x1: int, color, alpha: float):
+    region = canvas[max(y0, 0):y1, max(x0, 0):x1]
+    region[:] = (region * (1 - alpha) + np.asarray(color) * alpha).astype(np.uint8)
+
+
+def _polyline(canvas: np.ndarray, xs: np.ndarray, values: np.ndarray, scale, color):
+    """折线：每段按像素步数插值（线宽 2 像素），缺失值（NaN）处断开"""
+    height, width = canvas.shape[:2]
+    valid = np.isfinite(values)
+    ys = scale(values)
+    segments_x, segments_y = [], []
+    for i in np.nonzero(valid[:-1] & valid[1:])[0]:
+        x0, y0, x1, y1 = xs[i], ys[i], xs[i + 1], ys[i + 1]
+        steps = max(abs(int(x1) - int(x0)), abs(int(y1) - int(y0))) + 1
+        segments_x.append(np.linspace(x0, x1, steps))
+        segments_y.append(np.linspace(y0, y1, steps))
+    if not segments_x:
+        return
+    px = np.rint(np.concatenate(segments_x)).astype(int)
+    py = np.rint(np.concatenate(segments_y)).astype(int)
+    for dy in (0, 1):
+        rows = np.clip(py + dy, 0, height - 1)
+        canvas[rows, np.clip(px, 0, width - 1)] = color
+
+
+def write_png(path: str, canvas: np.ndarray):
+    """把 (height, width, 3) 的 uint8 数组编码为 PNG（8 位 RGB，无滤波）"""
+    height, width = canvas.shape[:2]
+    # 每行前加一个滤波类型字节（0 = None）
+    raw = np.concatenate([np.zeros((height, 1), dtype=np.uint8), canvas.reshape(height, width * 3)], axis=1)
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    png = (b'\x89PNG\r\n\x1a\n'
+           + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+           + chunk(b'IDAT', zlib.compress(raw.tobytes(), 6))
+           + chunk(b'IEND', b''))
+
+    # 先写临时文件再改名，避免读取方看到写了一半的图片
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(png)
+    os.replace(tmp_path, path)
+
+
+class ChartRenderer:
+    """在独立工作进程中渲染图表"""
+
+    def __init__(self, timeframe: str = '1h', width: int = 800, height: int = 600,
+                 backend: str = 'auto', workers: int = 1):
+        """
+        Args:
+            timeframe: 绘制的时间框架
+            width: 图片宽度（像素）
+            height: 图片高度（像素）
+            backend: 渲染后端（见 render_chart）
+            workers: 工作进程数
+        """
+        self.timeframe = timeframe
+        self.width = width
+        self.height = height
+        self.backend = backend
+        # spawn：监控器进程中已有多个线程，fork 可能复制持有中的锁
+        self._executor = ProcessPoolExecutor(max_workers=workers,
+                                             mp_context=multiprocessing.get_context('spawn'))
+
+    def submit(self, market_data: Dict, path: str) -> Future:
+        """提交渲染任务，立即返回 Future（结果为图表路径）"""
+        series = extract_series(market_data, self.timeframe)
+        return self._executor.submit(render_chart, series, path, self.width, self.height, self.backend)
+
+    def render(self, market_data: Dict, path: str, timeout: Optional[float] = 30) -> str:
+        """渲染并等待完成"""
+        return self.submit(market_data, path).result(timeout=timeout)
+
+    def warm_up(self):
+        """预先启动工作进程（首次 spawn 需要导入 numpy 等模块）"""
+        self._executor.submit(int).result()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
@@ -1,20 +1,118 @@
 """
 DeepSeek API 客户端
 改编自 NOFX 的 mcp/client.go
-支持调用 DeepSeek API 进行市场分析
+支持调用 DeepSeek API 进行市场分析（支持 SSE 流式输出，决策 JSON 闭合时即可提前回调）
+AsyncDeepSeekClient 为 asyncio 版本，可在一个事件循环中并发分析多个交易对 / 角色
 """
 
-import requests
+import asyncio
 import json
+import random
 import time
-from typing import Dict, Tuple, Optional
+from typing import Any, Callable, Dict, Iterator, List, Tuple, Optional
+
+import aiohttp
+
+from http_transport import HTTPTransport, get_shared_transport
+from json_extract import extract_last_json, fix_json_quotes
+from metrics import MetricsRegistry, get_registry
+from rate_limit import TokenBucket
+from response_cache import ResponseCache
+
+
+# 可重试的 HTTP 状态码（限流 / 服务端临时错误）
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+# 每次调用的输出 token 上限（与请求体 max_tokens 一致）
+MAX_TOKENS = 2000
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的 token 数（DeepSeek 分词器：中日韩字符约 0.6 token，其他字符约 0.3 token）
+
+    用于 token 预算限流，不需要精确
+    """
+    cjk = sum(1 for ch in text if '\u2e80' <= ch <= '\u9fff' or '\uff00' <= ch <= '\uffef')
+    return int(cjk * 0.6 + (len(text) - cjk) * 0.3) + 1
+
+
+class APIError(Exception):
+    """API 返回非 200 状态码（status 属性为 HTTP 状态码）"""
+
+    def __init__(self, status: int, body: str):
+        super().__init__(f"API返回错误 (status {status}): {body}")
+        self.status = status
+
+
+def parse_usage(usage: Optional[Dict]) -> Optional[Dict]:
+    """
+    解析响应中的 usage 字段（含 DeepSeek 前缀缓存命中统计）
+
+    DeepSeek 对与之前请求相同的 prompt 前缀做磁盘缓存：
+    prompt_cache_hit_tokens 为命中缓存的输入 token（计费更低），prompt_cache_miss_tokens 为未命中部分
+
+    Returns:
+        {'prompt_tokens', 'completion_tokens', 'cache_hit_tokens', 'cache_miss_tokens'}，无 usage 时返回 None
+    """
+    if not usage:
+        return None
+    prompt_tokens = usage.get('prompt_tokens') or 0
+    hit = usage.get('prompt_cache_hit_tokens') or 0
+    miss = usage.get('prompt_cache_miss_tokens')
+    return {
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': usage.get('completion_tokens') or 0,
+        'cache_hit_tokens': hit,
+        'cache_miss_tokens': miss if miss is not None else max(prompt_tokens - hit, 0)
+    }
+
+
+class UsageStats:
+    """累计 token 用量和前缀缓存命中率"""
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cache_hit_tokens = 0
+        self.cache_miss_tokens = 0
+
+    def add(self, usage: Optional[Dict]):
+        """累加一次调用的用量（parse_usage 的返回值）"""
+        if not usage:
+            return
+        self.calls += 1
+        self.prompt_tokens += usage['prompt_tokens']
+        self.completion_tokens += usage['completion_tokens']
+        self.cache_hit_tokens += usage['cache_hit_tokens']
+        self.cache_miss_tokens += usage['cache_miss_tokens']
+
+    @property
+    def hit_ratio(self) -> float:
+        """输入 token 的前缀缓存命中率"""
+        total = self.cache_hit_tokens + self.cache_miss_tokens
+        return self.cache_hit_tokens / total if total else 0.0
+
+    def snapshot(self) -> Dict:
+        return {
+            'calls': self.calls,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'cache_hit_tokens': self.cache_hit_tokens,
+            'cache_miss_tokens': self.cache_miss_tokens,
+            'hit_ratio': self.hit_ratio
+        }
 
 
 class DeepSeekClient:
     """DeepSeek API 客户端"""
 
     def __init__(self, api_key: str, base_url: str = "https://api.deepseek.com/v1",
-                 model: str = "deepseek-chat", timeout: int = 120):
+                 model: str = "deepseek-chat", timeout: int = 120,
+                 transport: Optional[HTTPTransport] = None,
+                 cache: Optional[ResponseCache] = None,
+                 metrics: Optional[MetricsRegistry] = None):
         """
         初始化 DeepSeek 客户端
 
@@ -23,14 +121,29 @@ class DeepSeekClient:
             base_url: API 基础 URL
             model: 模型名称
             timeout: 超时时间（秒）
+            transport: 共享 HTTP 传输层（连接复用），为 None 时使用进程内默认实例
+            cache: 响应缓存（按归一化 prompt 命中），为 None 时不缓存
+            metrics: 指标注册表（token 用量、耗时分位数、重试、状态码），为 None 时使用进程内默认实例
         """
         self.api_key = api_key
         self.base_url = base_url
         self.model = model
         self.timeout = timeout
+        self.transport = transport or get_shared_transport()
+        self.cache = cache
+        self.metrics = metrics or get_registry()
+
+        # 最近一次调用的统计：HTTP 状态、首字节 / 总耗时、重试次数、token 用量
+        # （流式模式下 ttfb_ms 为首个 token 到达时间，另含 JSON 就绪时间）
+        self.last_call_stats = {}
+
+        # 累计 token 用量和前缀缓存命中
+        self.usage = UsageStats()
 
     def call_with_messages(self, system_prompt: str, user_prompt: str,
-                          max_retries: int = 3) -> str:
+                          max_retries: int = 3, stream: bool = False,
+                          on_json: Optional[Callable[[Any], None]] = None,
+                          json_opening: str = '{') -> str:
         """
         使用 system + user prompt 调用 AI API（带重试）
         对应 NOFX 的 CallWithMessages() 函数
@@ -39,28 +152,57 @@ class DeepSeekClient:
             system_prompt: 系统提示词
             user_prompt: 用户提示词
             max_retries: 最大重试次数
+            stream: 是否使用 SSE 流式输出
+            on_json: 流式模式下，第一个完整的 JSON 对象/数组闭合时立即回调（不等待后续文本）
+            json_opening: 要检测的 JSON 起始字符（'{' 对象 或 '[' 数组）
 
         Returns:
-            AI 响应文本
+            AI 响应文本（完整）
 
         Raises:
             Exception: API 调用失败
         """
+        # 行情平稳时 prompt 归一化后相同，直接返回缓存的响应
+        start = time.perf_counter()
+        cache_key, cached = _lookup_cache(self.cache, system_prompt, user_prompt, on_json, json_opening)
+        if cached is not None:
+            self.last_call_stats = {'cached': True, 'total_ms': (time.perf_counter() - start) * 1000}
+            self.metrics.inc('deepseek.response_cache_hits')
+            return cached
+
         last_error = None
 
+        # 重试时回调只触发一次
+        fired = []
+
+        def fire_once(value):
+            if not fired:
+                fired.append(value)
+                on_json(value)
+
         for attempt in range(1, max_retries + 1):
             if attempt > 1:
                 print(f"⚠️  AI API调用失败，正在重试 ({attempt}/{max_retries})...")
 
             try:
-                result = self._call_once(system_prompt, user_prompt)
+                if stream:
+                    result = self._call_once_stream(system_prompt, user_prompt,
+                                                    fire_once if on_json else None, json_opening)
+                else:
+                    result = self._call_once(system_prompt, user_prompt)
                 if attempt > 1:
                     print("✓ AI API重试成功")
+                self.last_call_stats['retries'] = attempt - 1
+                _record_call(self.metrics, self.last_call_stats)
+                if cache_key is not None:
+                    self.cache.put(cache_key, result)
                 return result
             except Exception as e:
                 last_error = e
                 # 检查是否可重试
                 if not self._is_retryable_error(e):
+                    self.last_call_stats = _failed_call_stats(e, attempt - 1)
+                    _record_call(self.metrics, self.last_call_stats)
                     raise
 
                 # 重试前等待
@@ -69,6 +211,8 @@ class DeepSeekClient:
                     print(f"⏳ 等待{wait_time}秒后重试...")
                     time.sleep(wait_time)
 
+        self.last_call_stats = _failed_call_stats(last_error, max_retries - 1)
+        _record_call(self.metrics, self.last_call_stats)
         raise Exception(f"重试{max_retries}次后仍然失败: {last_error}")
 
     def _call_once(self, system_prompt: str, user_prompt: str) -> str:
@@ -82,6 +226,49 @@ class DeepSeekClient:
         Returns:
             AI 响应文本
         """
+        url, headers, request_body = self._build_request(system_prompt, user_prompt)
+
+        # 发送请求（复用 keep-alive 连接）
+        start = time.perf_counter()
+        response = self.transport.post(
+            url,
+            headers=headers,
+            json=request_body,
+            timeout=self.timeout
+        )
+        # requests 的 elapsed 为发出请求到解析完响应头的时间
+        elapsed = getattr(response, 'elapsed', None)
+        self.last_call_stats = {
+            'stream': False,
+            'status': response.status_code,
+            'ttfb_ms': elapsed.total_seconds() * 1000 if elapsed is not None else None,
+            'total_ms': (time.perf_counter() - start) * 1000
+        }
+
+        # 检查响应状态
+        if response.status_code != 200:
+            raise APIError(response.status_code, response.text)
+
+        # 解析响应
+        result = response.json()
+
+        if 'choices' not in result or len(result['choices']) == 0:
+            raise Exception("API返回空响应")
+
+        usage = parse_usage(result.get('usage'))
+        self.last_call_stats['usage'] = usage
+        self.usage.add(usage)
+
+        return result['choices'][0]['message']['content']
+
+    def _build_request(self, system_prompt: str, user_prompt: str,
+                       stream: bool = False) -> Tuple[str, Dict, Dict]:
+        """
+        构建请求地址、请求头和请求体
+
+        Returns:
+            (url, headers, request_body) 元组
+        """
         # 构建 messages 数组
         messages = []
 
@@ -103,8 +290,12 @@ class DeepSeekClient:
             "model": self.model,
             "messages": messages,
             "temperature": 0.5,  # 降低temperature以提高JSON格式稳定性
-            "max_tokens": 2000
+            "max_tokens": MAX_TOKENS
         }
+        if stream:
+            request_body["stream"] = True
+            # 最后一个事件附带 usage（含前缀缓存命中统计）
+            request_body["stream_options"] = {"include_usage": True}
 
         # 创建HTTP请求
         url = f"{self.base_url}/chat/completions"
@@ -112,26 +303,92 @@ class DeepSeekClient:
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}"
         }
+        return url, headers, request_body
+
+    def stream_chat(self, system_prompt: str, user_prompt: str,
+                    on_usage: Optional[Callable[[Dict], None]] = None) -> Iterator[str]:
+        """
+        流式调用 AI API（SSE），逐块返回模型输出的文本增量
+
+        Args:
+            system_prompt: 系统提示词
+            user_prompt: 用户提示词
+            on_usage: 收到 usage 事件（流的最后一个事件）时回调，参数为 parse_usage 的返回值
 
-        # 发送请求
-        response = requests.post(
+        Yields:
+            文本增量（choices[0].delta.content）
+        """
+        url, headers, request_body = self._build_request(system_prompt, user_prompt, stream=True)
+        response = self.transport.post(
             url,
             headers=headers,
             json=request_body,
-            timeout=self.timeout
+            timeout=self.timeout,
+            stream=True
         )
 
-        # 检查响应状态
-        if response.status_code != 200:
-            raise Exception(f"API返回错误 (status {response.status_code}): {response.text}")
-
-        # 解析响应
-        result = response.json()
-
-        if 'choices' not in result or len(result['choices']) == 0:
+        try:
+            if response.status_code != 200:
+                if hasattr(response, 'read'):   # httpx 流式响应需要先读取响应体
+                    response.read()
+                raise APIError(response.status_code, response.text)
+
+            # SSE：每个事件一行 "data: {...}"，以 "data: [DONE]" 结束
+            for line in response.iter_lines():
+                if isinstance(line, bytes):
+                    line = line.decode('utf-8')
+                if not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+
+                event = json.loads(data)
+                if on_usage and event.get('usage'):
+                    on_usage(parse_usage(event['usage']))
+                choices = event.get('choices')
+                if not choices:
+                    continue
+                content = (choices[0].get('delta') or {}).get('content')
+                if content:
+                    yield content
+        finally:
+            response.close()
+
+    def _call_once_stream(self, system_prompt: str, user_prompt: str,
+                          on_json: Optional[Callable[[Any], None]] = None,
+                          json_opening: str = '{') -> str:
+        """
+        单次流式调用：边接收边检测 JSON，返回完整响应文本（内部使用）
+        """
+        start = time.perf_counter()
+        stats = {'stream': True, 'status': None, 'ttfb_ms': None, 'json_ready_ms': None, 'chunks': 0, 'usage': None}
+        self.last_call_stats = stats
+
+        def on_usage(usage):
+            stats['usage'] = usage
+            self.usage.add(usage)
+
+        def on_detected(value):
+            stats['json_ready_ms'] = (time.perf_counter() - start) * 1000
+            if on_json:
+                on_json(value)
+
+        detector = IncrementalJSONDetector(on_detected, opening=json_opening)
+        chunks = []
+        for chunk in self.stream_chat(system_prompt, user_prompt, on_usage):
+            if stats['ttfb_ms'] is None:
+                stats['ttfb_ms'] = (time.perf_counter() - start) * 1000
+            stats['chunks'] += 1
+            chunks.append(chunk)
+            detector.feed(chunk)
+
+        stats['status'] = 200   # stream_chat 只在状态码为 200 时产出内容
+        stats['total_ms'] = (time.perf_counter() - start) * 1000
+
+        if not chunks:
             raise Exception("API返回空响应")
-
-        return result['choices'][0]['message']['content']
+        return ''.join(chunks)
 
     def _is_retryable_error(self, error: Exception) -> bool:
         """
@@ -167,124 +424,376 @@ def parse_ai_response(ai_response: str) -> Tuple[str, Optional[Dict]]:
         - cot_trace: 思维链分析文本
         - json_result: 解析后的 JSON 字典，如果解析失败则为 None
     """
-    # 提取思维链（JSON 之前的内容）
-    cot_trace = _extract_cot_trace(ai_response)
+    # 提取最后一个能解析的 JSON 对象（字符串中的括号、思维链中的括号不影响提取）
+    match = extract_last_json(ai_response, expect=dict)
+    if match is None:
+        print("⚠️ JSON解析失败: 无法找到完整的 JSON 对象")
+        return _extract_cot_trace(ai_response, -1), None
 
-    # 提取 JSON
-    try:
-        json_result = _extract_json(ai_response)
-        return cot_trace, json_result
-    except Exception as e:
-        print(f"⚠️ JSON解析失败: {e}")
-        return cot_trace, None
+    # 思维链是 JSON 之前的内容
+    return _extract_cot_trace(ai_response, match.start), match.value
 
 
-def _extract_cot_trace(response: str) -> str:
+class AsyncDeepSeekClient:
     """
-    提取思维链分析
-    对应 NOFX 的 extractCoTTrace() 函数
-
-    Args:
-        response: AI 响应文本
+    asyncio 版本的 DeepSeek API 客户端（aiohttp）
 
-    Returns:
-        思维链文本
+    call_with_messages() 与 DeepSeekClient 的参数和返回值一致（需要 await）；
+    acall_many() 在信号量和每分钟 token 预算的约束下并发执行多个 prompt。
+    重试等待使用 asyncio.sleep + 随机抖动，不阻塞事件循环。
     """
-    # 查找 JSON 对象的开始位置
-    json_start = response.find('{')
 
-    if json_start > 0:
-        # 思维链是 JSON 之前的内容
-        return response[:json_start].strip()
+    # 请求构建与 DeepSeekClient 完全一致
+    _build_request = DeepSeekClient._build_request
 
-    # 如果找不到 JSON，整个响应都是思维链
-    return response.strip()
+    def __init__(self, api_key: str, base_url: str = "https://api.deepseek.com/v1",
+                 model: str = "deepseek-chat", timeout: int = 120,
+                 max_concurrency: int = 8, tokens_per_minute: Optional[int] = None,
+                 retry_base_delay: float = 1.0, cache: Optional[ResponseCache] = None,
+                 metrics: Optional[MetricsRegistry] = None):
+        """
+        初始化异步 DeepSeek 客户端
+
+        Args:
+            api_key: DeepSeek API 密钥
+            base_url: API 基础 URL
+            model: 模型名称
+            timeout: 单次请求超时时间（秒）
+            max_concurrency: 最大同时在途请求数
+            tokens_per_minute: 每分钟 token 预算（输入估算 + max_tokens），为 None 时不限制
+            retry_base_delay: 重试退避基准时间（秒），第 n 次重试等待 base * 2^(n-1) * [0.5, 1.5)
+            cache: 响应缓存（按归一化 prompt 命中），为 None 时不缓存
+            metrics: 指标注册表，为 None 时使用进程内默认实例
+        """
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.retry_base_delay = retry_base_delay
+        self.cache = cache
+        self.metrics = metrics or get_registry()
+        self.token_budget = (TokenBucket(rate=tokens_per_minute / 60, capacity=tokens_per_minute)
+                             if tokens_per_minute else None)
+
+        # 会话和信号量在事件循环内首次使用时创建
+        self._session = None
+        self._semaphore = None
+
+        # 累计统计
+        self.stats = {'calls': 0, 'cached': 0, 'retries': 0, 'failures': 0, 'budget_wait_seconds': 0.0}
+        self.usage = UsageStats()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        """关闭 HTTP 会话"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _ensure_session(self):
+        if self._session is None or self._session.closed:
+            # trust_env=True：与 requests 一样读取 HTTP(S)_PROXY 环境变量
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+                trust_env=True
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def call_with_messages(self, system_prompt: str, user_prompt: str,
+                                 max_retries: int = 3, stream: bool = False,
+                                 on_json: Optional[Callable[[Any], None]] = None,
+                                 json_opening: str = '{') -> str:
+        """
+        使用 system + user prompt 调用 AI API（带重试，参数同 DeepSeekClient.call_with_messages）
 
+        Returns:
+            AI 响应文本（完整）
 
-def _extract_json(response: str) -> Dict:
-    """
-    提取 JSON 结果
-    对应 NOFX 的 extractDecisions() 函数
+        Raises:
+            Exception: API 调用失败
+        """
+        cache_key, cached = _lookup_cache(self.cache, system_prompt, user_prompt, on_json, json_opening)
+        if cached is not None:
+            self.stats['cached'] += 1
+            self.metrics.inc('deepseek.response_cache_hits')
+            return cached
 
-    Args:
-        response: AI 响应文本
+        last_error = None
+        fired = []
 
-    Returns:
-        解析后的 JSON 字典
+        def fire_once(value):
+            if not fired:
+                fired.append(value)
+                on_json(value)
 
-    Raises:
-        Exception: JSON 解析失败
-    """
-    # 查找 JSON 对象
-    json_start = response.find('{')
-    if json_start == -1:
-        raise Exception("无法找到JSON对象起始")
+        for attempt in range(1, max_retries + 1):
+            try:
+                call_stats = {'stream': stream, 'retries': attempt - 1}
+                result = await self._call_once(system_prompt, user_prompt, stream,
+                                               fire_once if on_json else None, json_opening, call_stats)
+                _record_call(self.metrics, call_stats)
+                if cache_key is not None:
+                    self.cache.put(cache_key, result)
+                return result
+            except Exception as e:
+                last_error = e
+                if not self._is_retryable_error(e):
+                    self.stats['failures'] += 1
+                    _record_call(self.metrics, _failed_call_stats(e, attempt - 1))
+                    raise
 
-    # 从 { 开始，匹配括号找到对应的 }
-    json_end = _find_matching_brace(response, json_start)
-    if json_end == -1:
-        raise Exception("无法找到JSON对象结束")
+                # 指数退避 + 随机抖动，避免并发请求同时重试
+                if attempt < max_retries:
+                    self.stats['retries'] += 1
+                    await asyncio.sleep(self.retry_base_delay * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
 
-    json_content = response[json_start:json_end + 1].strip()
+        self.stats['failures'] += 1
+        _record_call(self.metrics, _failed_call_stats(last_error, max_retries - 1))
+        raise Exception(f"重试{max_retries}次后仍然失败: {last_error}")
 
-    # 修复常见的 JSON 格式错误（替换中文引号）
-    json_content = _fix_json_quotes(json_content)
+    async def acall_many(self, prompts: List[Tuple[str, str]], max_retries: int = 3,
+                         return_exceptions: bool = True) -> List[Any]:
+        """
+        并发执行多个 prompt（多个交易对 / 多个角色）
 
-    # 解析 JSON
-    try:
-        result = json.loads(json_content)
-        return result
-    except json.JSONDecodeError as e:
-        raise Exception(f"JSON解析失败: {e}\nJSON内容: {json_content}")
+        Args:
+            prompts: [(system_prompt, user_prompt), ...]
+            max_retries: 每个 prompt 的最大重试次数
+            return_exceptions: 为 True 时失败的 prompt 在结果中返回异常对象，不影响其他 prompt
 
+        Returns:
+            与 prompts 顺序一致的响应文本列表
+        """
+        return await asyncio.gather(
+            *(self.call_with_messages(system_prompt, user_prompt, max_retries)
+              for system_prompt, user_prompt in prompts),
+            return_exceptions=return_exceptions
+        )
 
-def _find_matching_brace(s: str, start: int) -> int:
-    """
-    查找匹配的右花括号
-    对应 NOFX 的 findMatchingBracket() 函数
+    async def _call_once(self, system_prompt: str, user_prompt: str, stream: bool,
+                         on_json: Optional[Callable[[Any], None]], json_opening: str,
+                         call_stats: Dict) -> str:
+        """单次调用：先等待 token 预算，再在信号量内发送请求；状态码、耗时和用量写入 call_stats（内部使用）"""
+        session = self._ensure_session()
+
+        if self.token_budget is not None:
+            wait = self.token_budget.delay_for(estimate_tokens(system_prompt + user_prompt) + MAX_TOKENS)
+            if wait > 0:
+                self.stats['budget_wait_seconds'] += wait
+                await asyncio.sleep(wait)
+
+        url, headers, request_body = self._build_request(system_prompt, user_prompt, stream=stream)
+
+        def on_usage(usage):
+            call_stats['usage'] = usage
+            self.usage.add(usage)
+
+        def on_first_chunk():
+            call_stats['ttfb_ms'] = (time.perf_counter() - start) * 1000
+
+        async with self._semaphore:
+            self.stats['calls'] += 1
+            start = time.perf_counter()
+            async with session.post(url, headers=headers, json=request_body) as response:
+                call_stats['status'] = response.status
+                if response.status != 200:
+                    raise APIError(response.status, await response.text())
+                if stream:
+                    text = await self._read_stream(response, on_json, json_opening, on_usage, on_first_chunk)
+                    call_stats['total_ms'] = (time.perf_counter() - start) * 1000
+                    return text
+                on_first_chunk()
+                result = await response.json(content_type=None)
+                call_stats['total_ms'] = (time.perf_counter() - start) * 1000
 
-    Args:
-        s: 字符串
-        start: 左花括号的位置
+        if 'choices' not in result or len(result['choices']) == 0:
+            raise Exception("API返回空响应")
+        on_usage(parse_usage(result.get('usage')))
+        return result['choices'][0]['message']['content']
+
+    @staticmethod
+    async def _read_stream(response, on_json: Optional[Callable[[Any], None]], json_opening: str,
+                           on_usage: Optional[Callable[[Dict], None]] = None,
+                           on_first_chunk: Optional[Callable[[], None]] = None) -> str:
+        """读取 SSE 流，边接收边检测 JSON（最后的 usage 事件交给 on_usage），返回完整文本"""
+        detector = IncrementalJSONDetector(on_json, opening=json_opening) if on_json else None
+        chunks = []
+        async for raw_line in response.content:
+            line = raw_line.decode('utf-8').strip()
+            if not line.startswith('data:'):
+                continue
+            data = line[len('data:'):].strip()
+            if data == '[DONE]':
+                break
+
+            event = json.loads(data)
+            if on_usage and event.get('usage'):
+                on_usage(parse_usage(event['usage']))
+            choices = event.get('choices')
+            if not choices:
+                continue
+            content = (choices[0].get('delta') or {}).get('content')
+            if content:
+                if on_first_chunk and not chunks:
+                    on_first_chunk()
+                chunks.append(content)
+                if detector:
+                    detector.feed(content)
+
+        if not chunks:
+            raise Exception("API返回空响应")
+        return ''.join(chunks)
+
+    @staticmethod
+    def _is_retryable_error(error: Exception) -> bool:
+        """判断错误是否可重试：网络错误、超时、限流和服务端临时错误"""
+        if isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError)):
+            return True
+        error_str = str(error).lower()
+        if any(f'status {status}' in error_str for status in RETRYABLE_STATUS):
+            return True
+        return any(retryable in error_str for retryable in ('timeout', 'connection', 'temporary', 'network', 'eof'))
+
+
+def _failed_call_stats(error: Exception, retries: int) -> Dict:
+    """失败调用的统计（状态码取自 APIError，网络错误等为 None）"""
+    return {'status': getattr(error, 'status', None), 'retries': retries, 'error': str(error)}
+
+
+def _record_call(metrics: MetricsRegistry, stats: Dict):
+    """把一次调用（含重试）的统计写入指标注册表"""
+    metrics.inc('deepseek.calls')
+    if stats.get('retries'):
+        metrics.inc('deepseek.retries', stats['retries'])
+    metrics.inc(f"deepseek.status.{stats.get('status') or 'error'}")
+    if 'error' in stats:
+        metrics.inc('deepseek.failures')
+        return
+
+    metrics.observe('deepseek.ttfb_ms', stats.get('ttfb_ms'))
+    metrics.observe('deepseek.total_ms', stats.get('total_ms'))
+    metrics.observe('deepseek.json_ready_ms', stats.get('json_ready_ms'))
+    usage = stats.get('usage')
+    if usage:
+        metrics.observe('deepseek.prompt_tokens', usage['prompt_tokens'])
+        metrics.observe('deepseek.completion_tokens', usage['completion_tokens'])
+        metrics.observe('deepseek.cached_tokens', usage['cache_hit_tokens'])
+
+
+def _lookup_cache(cache: Optional[ResponseCache], system_prompt: str, user_prompt: str,
+                  on_json: Optional[Callable[[Any], None]], json_opening: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    查询响应缓存；命中时立即按流式语义触发 on_json 回调
 
     Returns:
-        右花括号的位置，如果找不到返回 -1
+        (缓存键, 缓存的响应)，未启用缓存时均为 None，未命中时响应为 None
     """
-    if start >= len(s) or s[start] != '{':
-        return -1
+    if cache is None:
+        return None, None
+    key = cache.make_key(system_prompt, user_prompt)
+    cached = cache.get(key)
+    if cached is not None and on_json:
+        IncrementalJSONDetector(on_json, opening=json_opening).feed(cached)
+    return key, cached
+
 
-    depth = 0
-    for i in range(start, len(s)):
-        if s[i] == '{':
-            depth += 1
-        elif s[i] == '}':
-            depth -= 1
-            if depth == 0:
-                return i
+class IncrementalJSONDetector:
+    """
+    增量 JSON 检测器
 
-    return -1
+    逐块输入流式文本，第一个顶层 JSON 对象（或数组）闭合并能成功解析时立即回调。
+    只扫描新到达的字符；JSON 内部跟踪字符串和转义，字符串中的括号不计入深度。
+    JSON 之前的正文中出现的括号（如 "{说明}"）解析失败后会被跳过，继续向后检测。
+    """
 
+    def __init__(self, callback: Callable[[Any], None], opening: str = '{'):
+        """
+        Args:
+            callback: JSON 闭合时的回调，参数为解析后的对象
+            opening: JSON 起始字符（'{' 或 '['）
+        """
+        self.callback = callback
+        self.opening = opening
+        self.closing = '}' if opening == '{' else ']'
+        self.result = None
+        self.done = False
+
+        self._text = ''
+        self._start = -1
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> Optional[Any]:
+        """
+        输入一段文本
 
-def _fix_json_quotes(json_str: str) -> str:
+        Returns:
+            本次检测到的 JSON（未检测到时为 None）
+        """
+        if self.done:
+            return None
+
+        offset = len(self._text)
+        self._text += chunk
+        opening, closing = self.opening, self.closing
+
+        for i, ch in enumerate(chunk, offset):
+            if self._start < 0:
+                if ch == opening:
+                    self._start, self._depth = i, 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch in '"\u201c\u201d':
+                    self._in_string = False
+            elif ch in '"\u201c\u201d':
+                self._in_string = True
+            elif ch == opening:
+                self._depth += 1
+            elif ch == closing:
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate = fix_json_quotes(self._text[self._start:i + 1])
+                    self._start = -1
+                    try:
+                        value = json.loads(candidate)
+                    except json.JSONDecodeError:
+                        continue
+                    self.result = value
+                    self.done = True
+                    self.callback(value)
+                    return value
+        return None
+
+
+def _extract_cot_trace(response: str, json_start: int) -> str:
     """
-    修复 JSON 中的中文引号
-    对应 NOFX 的 fixMissingQuotes() 函数
+    提取思维链分析
+    对应 NOFX 的 extractCoTTrace() 函数
 
     Args:
-        json_str: JSON 字符串
+        response: AI 响应文本
+        json_start: JSON 在响应中的起始位置（-1 表示没有 JSON）
 
     Returns:
-        修复后的 JSON 字符串
+        思维链文本
     """
-    # 替换中文引号为英文引号
-    replacements = {
-        '\u201c': '"',  # "
-        '\u201d': '"',  # "
-        '\u2018': "'",  # '
-        '\u2019': "'"   # '
-    }
-
-    for old, new in replacements.items():
-        json_str = json_str.replace(old, new)
+    if json_start > 0:
+        # 思维链是 JSON 之前的内容
+        return response[:json_start].strip()
 
-    return json_str
+    # 如果找不到 JSON，整个响应都是思维链
+    return response.strip()
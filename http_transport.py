@@ -0,0 +1,203 @@
+"""
+共享 HTTP 传输层
+DeepSeek API、Telegram、Chart API 共用一个按主机复用连接池的 keep-alive 会话，
+避免每次请求都重新进行 TCP + TLS（以及代理 CONNECT）握手，并统计握手耗时
+
+默认使用 requests.Session（HTTP/1.1 keep-alive）；
+启用 http2 且已安装 httpx[http2] 时使用 httpx.Client（HTTP/2 多路复用）
+"""
+
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import get_registry
+
+
+class HandshakeStats:
+    """新建连接次数和握手耗时统计（线程安全）"""
+
+    def __init__(self):
+        self.requests = 0
+        self.connections = 0
+        self.handshake_seconds = 0.0
+        self.last_handshake_ms = None
+        self.by_host = {}
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_handshake(self, host: str, seconds: float):
+        with self._lock:
+            self.connections += 1
+            self.handshake_seconds += seconds
+            self.last_handshake_ms = seconds * 1000
+            host_stats = self.by_host.setdefault(host, {'connections': 0, 'handshake_ms': 0.0})
+            host_stats['connections'] += 1
+            host_stats['handshake_ms'] += seconds * 1000
+        get_registry().observe('http.handshake_ms', seconds * 1000)
+
+    def snapshot(self) -> Dict:
+        """当前统计（连接复用率 = 1 - 新建连接数 / 请求数）"""
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'connections': self.connections,
+                'reuse_ratio': 1 - self.connections / self.requests if self.requests else 0.0,
+                'handshake_ms_total': self.handshake_seconds * 1000,
+                'handshake_ms_avg': self.handshake_seconds * 1000 / self.connections if self.connections else 0.0,
+                'handshake_ms_last': self.last_handshake_ms,
+                'by_host': {host: dict(stats) for host, stats in self.by_host.items()}
+            }
+
+
+def _timed_connection_class(connection_cls, stats: HandshakeStats):
+    """包装 urllib3 连接类：connect()（TCP + 代理隧道 + TLS）计时"""
+
+    class TimedConnection(connection_cls):
+        def connect(self):
+            start = time.perf_counter()
+            super().connect()
+            stats.record_handshake(self.host, time.perf_counter() - start)
+
+    TimedConnection.__name__ = f"Timed{connection_cls.__name__}"
+    return TimedConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """为直连和代理连接池都装上握手计时的 HTTPAdapter"""
+
+    def __init__(self, stats: HandshakeStats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def _instrument(self, manager):
+        if getattr(manager, '_handshake_timed', False):
+            return manager
+        manager.pool_classes_by_scheme = {
+            scheme: type(pool_cls.__name__, (pool_cls,),
+                         {'ConnectionCls': _timed_connection_class(pool_cls.ConnectionCls, self.stats)})
+            for scheme, pool_cls in manager.pool_classes_by_scheme.items()
+        }
+        manager._handshake_timed = True
+        return manager
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self._instrument(self.poolmanager)
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        return self._instrument(super().proxy_manager_for(proxy, **proxy_kwargs))
+
+
+class HTTPTransport:
+    """
+    共享 HTTP 传输层（线程安全，可在多个客户端之间共享）
+
+    用法与 requests 一致：transport.post(url, json=..., timeout=30)，
+    返回对象支持 status_code / text / content / json()。
+    """
+
+    def __init__(self, pool_connections: int = 4, pool_maxsize: int = 8,
+                 connect_timeout: float = 10, http2: bool = False):
+        """
+        Args:
+            pool_connections: 缓存的主机连接池数量（每个主机一个池）
+            pool_maxsize: 每个主机保持的最大 keep-alive 连接数
+            connect_timeout: 建立连接（含 TLS 握手）超时（秒），读超时由每次请求的 timeout 指定
+            http2: 是否尝试使用 HTTP/2（需要 httpx[http2]，未安装时回退到 HTTP/1.1）
+        """
+        self.connect_timeout = connect_timeout
+        self.stats = HandshakeStats()
+        self._client = None
+
+        if http2:
+            try:
+                import httpx
+                import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+                self._httpx = httpx
+                self._client = httpx.Client(
+                    http2=True,
+                    limits=httpx.Limits(max_connections=pool_connections * pool_maxsize,
+                                        max_keepalive_connections=pool_maxsize)
+                )
+            except ImportError:
+                print("⚠️ 未安装 httpx[http2]，HTTP 传输回退到 HTTP/1.1 keep-alive")
+
+        self.http2 = self._client is not None
+        if not self.http2:
+            self._session = requests.Session()
+            adapter = TimedHTTPAdapter(self.stats, pool_connections=pool_connections,
+                                       pool_maxsize=pool_maxsize, max_retries=0)
+            self._session.mount('https://', adapter)
+            self._session.mount('http://', adapter)
+
+    def request(self, method: str, url: str, timeout: Optional[float] = 30, **kwargs):
+        """
+        发送请求（连接复用，keep-alive）
+
+        Args:
+            method: HTTP 方法
+            url: 请求地址
+            timeout: 读超时（秒）
+            **kwargs: 透传给 requests / httpx（json、data、files、headers、stream 等）
+        """
+        self.stats.record_request()
+        if self.http2:
+            return self._httpx_request(method, url, timeout, **kwargs)
+        return self._session.request(method, url, timeout=(self.connect_timeout, timeout), **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def get(self, url: str, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def _httpx_request(self, method: str, url: str, timeout: Optional[float], **kwargs):
+        """httpx 请求：通过 httpcore trace 扩展统计 TCP 连接和 TLS 握手耗时"""
+        started = {}
+        handshake = []
+
+        def trace(event_name, info):
+            phase, _, state = event_name.rpartition('.')
+            if phase not in ('connection.connect_tcp', 'connection.start_tls'):
+                return
+            if state == 'started':
+                started[phase] = time.perf_counter()
+            elif state == 'complete' and phase in started:
+                handshake.append(time.perf_counter() - started.pop(phase))
+
+        stream = kwargs.pop('stream', False)
+        request = self._client.build_request(
+            method, url, timeout=self._httpx.Timeout(timeout, connect=self.connect_timeout),
+            extensions={'trace': trace}, **kwargs
+        )
+        response = self._client.send(request, stream=stream)
+        if handshake:
+            self.stats.record_handshake(request.url.host, sum(handshake))
+        return response
+
+    def close(self):
+        """关闭所有连接"""
+        if self.http2:
+            self._client.close()
+        else:
+            self._session.close()
+
+
+_shared_transport = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_transport() -> HTTPTransport:
+    """进程内默认共享的传输层（未显式传入 transport 的客户端使用）"""
+    global _shared_transport
+    with _shared_lock:
+        if _shared_transport is None:
+            _shared_transport = HTTPTransport()
+        return _shared_transport
@@ -0,0 +1,524 @@
+"""
+增量技术指标引擎
+按 K 线逐根更新 EMA、MACD、RSI（Wilder）、ATR、布林带、SMA，每根 K 线 O(1)
+计算规则与 TA-Lib 默认实现保持一致（EMA 以 SMA 作为种子，RSI/ATR 使用 Wilder 平滑）
+
+用法：
+- 已收盘的 K 线调用 update(..., closed=True)，提交状态并写入历史
+- 未收盘的实时 K 线调用 update(..., closed=False)，只预览指标值，不修改状态
+"""
+
+import math
+from collections import deque
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+NAN = float('nan')
+
+# 各时间框架返回的数据点数量（短周期返回更多）
+SERIES_POINTS = {
+    '3m': 30,    # 30个点 = 90分钟
+    '15m': 24,   # 24个点 = 6小时
+    '1h': 24,    # 24个点 = 1天
+    '4h': 20     # 20个点 = 3.3天
+}
+
+# 时间框架序列字段（与 MarketData._calculate_timeframe_series 返回结构一致）
+SERIES_FIELDS = (
+    'prices', 'highs', 'lows',
+    'ema20', 'ema50',
+    'macd', 'macd_signal', 'macd_hist',
+    'rsi7', 'rsi14',
+    'atr14',
+    'bb_upper', 'bb_middle', 'bb_lower',
+    'volumes', 'volume_ma'
+)
+
+# 'current' 子字典字段 -> 序列字段
+CURRENT_FIELDS = (
+    ('price', 'prices'),
+    ('ema20', 'ema20'),
+    ('ema50', 'ema50'),
+    ('macd', 'macd'),
+    ('rsi7', 'rsi7'),
+    ('rsi14', 'rsi14'),
+    ('atr14', 'atr14'),
+    ('volume', 'volumes'),
+    ('volume_ma', 'volume_ma')
+)
+
+
+class EMA:
+    """指数移动平均（TA-Lib 兼容：前 period 个值的简单平均作为种子）"""
+
+    def __init__(self, period: int):
+        self.period = period
+        self.k = 2.0 / (period + 1)
+        self.count = 0
+        self.seed_sum = 0.0
+        self.value = None
+
+    def update(self, x: float, commit: bool = True) -> float:
+        """输入新值，返回 EMA（预热期间返回 NaN）"""
+        if self.value is None:
+            count = self.count + 1
+            seed_sum = self.seed_sum + x
+            value = seed_sum / self.period if count == self.period else NAN
+            if commit:
+                self.count = count
+                self.seed_sum = seed_sum
+                if count == self.period:
+                    self.value = value
+            return value
+
+        value = self.value + self.k * (x - self.value)
+        if commit:
+            self.value = value
+        return value
+
+
+class MACD:
+    """
+    MACD（TA-Lib 兼容）
+
+    TA-Lib 让快慢 EMA 在同一根 K 线上开始输出：快线从第 (slow - fast) 根开始预热，
+    信号线以前 signal 个 MACD 值的简单平均作为种子，三个输出都从第 slow + signal - 2 根开始有效。
+    """
+
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9):
+        self.fast_offset = slow - fast
+        self.fast = EMA(fast)
+        self.slow = EMA(slow)
+        self.signal = EMA(signal)
+        self.count = 0
+
+    def update(self, x: float, commit: bool = True):
+        """输入收盘价，返回 (macd, signal, hist)"""
+        slow = self.slow.update(x, commit)
+        fast = self.fast.update(x, commit) if self.count >= self.fast_offset else NAN
+        if commit:
+            self.count += 1
+
+        if math.isnan(slow):
+            return NAN, NAN, NAN
+
+        macd = fast - slow
+        signal = self.signal.update(macd, commit)
+        if math.isnan(signal):
+            return NAN, NAN, NAN
+        return macd, signal, macd - signal
+
+
+class RSI:
+    """RSI（Wilder 平滑，TA-Lib 兼容：前 period 个涨跌幅的简单平均作为种子）"""
+
+    def __init__(self, period: int):
+        self.period = period
+        self.prev_close = None
+        self.count = 0
+        self.avg_gain = 0.0
+        self.avg_loss = 0.0
+
+    def update(self, x: float, commit: bool = True) -> float:
+        """输入收盘价，返回 RSI（预热期间返回 NaN）"""
+        if self.prev_close is None:
+            if commit:
+                self.prev_close = x
+            return NAN
+
+        change = x - self.prev_close
+        gain = change if change > 0 else 0.0
+        loss = -change if change < 0 else 0.0
+        count = self.count + 1
+        period = self.period
+
+        if count < period:
+            avg_gain, avg_loss = self.avg_gain + gain, self.avg_loss + loss
+            value = NAN
+        else:
+            if count == period:
+                avg_gain = (self.avg_gain + gain) / period
+                avg_loss = (self.avg_loss + loss) / period
+            else:
+                avg_gain = (self.avg_gain * (period - 1) + gain) / period
+                avg_loss = (self.avg_loss * (period - 1) + loss) / period
+            total = avg_gain + avg_loss
+            value = 100.0 * avg_gain / total if total != 0 else 0.0
+
+        if commit:
+            self.prev_close = x
+            self.count = count
+            self.avg_gain = avg_gain
+            self.avg_loss = avg_loss
+        return value
+
+
+class ATR:
+    """ATR（Wilder 平滑，TA-Lib 兼容：第 1..period 根真实波幅的简单平均作为种子）"""
+
+    def __init__(self, period: int):
+        self.period = period
+        self.prev_close = None
+        self.count = 0
+        self.value = 0.0
+
+    def update(self, high: float, low: float, close: float, commit: bool = True) -> float:
+        """输入最高、最低、收盘价，返回 ATR（预热期间返回 NaN）"""
+        if self.prev_close is None:
+            if commit:
+                self.prev_close = close
+            return NAN
+
+        tr = max(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+        count = self.count + 1
+        period = self.period
+
+        if count < period:
+            value = self.value + tr
+            output = NAN
+        elif count == period:
+            value = output = (self.value + tr) / period
+        else:
+            value = output = (self.value * (period - 1) + tr) / period
+
+        if commit:
+            self.prev_close = close
+            self.count = count
+            self.value = value
+        return output
+
+
+class RollingWindow:
+    """
+    滑动窗口均值 / 总体标准差（维护窗口和与平方和，O(1) 更新）
+
+    以第一个输入值为基准做平移后再累加，避免价格量级较大时平方和相减的精度损失。
+    """
+
+    def __init__(self, period: int):
+        self.period = period
+        self.window = deque()
+        self.shift = None
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def update(self, x: float, commit: bool = True):
+        """输入新值，返回 (mean, std)（窗口未满时返回 NaN）"""
+        shift = x if self.shift is None else self.shift
+        d = x - shift
+        total = self.total + d
+        total_sq = self.total_sq + d * d
+        full = len(self.window) >= self.period
+        if full:
+            old = self.window[0]
+            total -= old
+            total_sq -= old * old
+
+        if commit:
+            self.shift = shift
+            self.window.append(d)
+            if full:
+                self.window.popleft()
+            self.total = total
+            self.total_sq = total_sq
+
+        if not full and len(self.window) + (0 if commit else 1) < self.period:
+            return NAN, NAN
+
+        mean = total / self.period
+        variance = total_sq / self.period - mean * mean
+        return mean + shift, math.sqrt(variance) if variance > 0 else 0.0
+
+
+class TimeframeIndicators:
+    """
+    单个时间框架的增量指标状态
+
+    维护全部指标的运行状态和最近 history 根已收盘 K 线的指标历史，
+    series() 返回与 MarketData._calculate_timeframe_series 相同结构的字典。
+    """
+
+    def __init__(self, timeframe: str, history: int = 100):
+        """
+        Args:
+            timeframe: 时间框架标识 ("3m", "15m", "1h", "4h")
+            history: 保留的已收盘 K 线指标历史数量
+        """
+        self.timeframe = timeframe
+        self.ema20 = EMA(20)
+        self.ema50 = EMA(50)
+        self.macd = MACD(12, 26, 9)
+        self.rsi7 = RSI(7)
+        self.rsi14 = RSI(14)
+        self.atr14 = ATR(14)
+        self.bbands = RollingWindow(20)
+        self.volume_ma = RollingWindow(20)
+
+        self.history = deque(maxlen=history)
+        self.live = None
+        self.last_closed_ts = None
+
+    def update(self, timestamp: int, high: float, low: float, close: float,
+               volume: float, closed: bool = True) -> tuple:
+        """
+        输入一根 K 线
+
+        Args:
+            timestamp: K 线开盘时间戳（毫秒）
+            high, low, close, volume: K 线数据
+            closed: 是否已收盘。已收盘则提交状态；未收盘只预览，不修改状态
+
+        Returns:
+            该 K 线的指标行（按 SERIES_FIELDS 顺序）
+        """
+        macd, macd_signal, macd_hist = self.macd.update(close, closed)
+        bb_middle, bb_std = self.bbands.update(close, closed)
+        volume_ma, _ = self.volume_ma.update(volume, closed)
+
+        row = (
+            close, high, low,
+            self.ema20.update(close, closed),
+            self.ema50.update(close, closed),
+            macd, macd_signal, macd_hist,
+            self.rsi7.update(close, closed),
+            self.rsi14.update(close, closed),
+            self.atr14.update(high, low, close, closed),
+            bb_middle + 2 * bb_std, bb_middle, bb_middle - 2 * bb_std,
+            volume, volume_ma
+        )
+
+        if closed:
+            self.history.append(row)
+            self.last_closed_ts = timestamp
+            self.live = None
+        else:
+            self.live = row
+        return row
+
+    def series(self, data_points: Optional[int] = None) -> Dict:
+        """
+        输出最近 data_points 个点的指标序列（包含实时 K 线）
+
+        Returns:
+            与 MarketData._calculate_timeframe_series 结构一致的字典
+        """
+        if data_points is None:
+            data_points = SERIES_POINTS.get(self.timeframe, 20)
+
+        return matrix_to_dict(self.timeframe, data_points, self.series_matrix(data_points))
+
+    def series_matrix(self, data_points: Optional[int] = None) -> np.ndarray:
+        """
+        输出最近 data_points 个点的指标矩阵（包含实时 K 线）
+
+        Returns:
+            形状 (len(SERIES_FIELDS), n) 的数组，行顺序同 SERIES_FIELDS，NaN 已转为 0
+        """
+        if data_points is None:
+            data_points = SERIES_POINTS.get(self.timeframe, 20)
+
+        rows = list(self.history)
+        if self.live is not None:
+            rows.append(self.live)
+        rows = rows[-data_points:]
+
+        if not rows:
+            return np.zeros((len(SERIES_FIELDS), 0))
+        return np.nan_to_num(np.array(rows, dtype=float).T, nan=0.0)
+
+
+def series_to_dict(timeframe: str, data_points: int, columns: Dict[str, List[float]]) -> Dict:
+    """
+    按统一结构组装时间框架序列字典
+
+    Args:
+        timeframe: 时间框架标识
+        data_points: 数据点数量
+        columns: {字段名: 已清洗 NaN 的最近 data_points 个值}
+
+    Returns:
+        时间框架序列字典（各字段序列 + 'current' 最新值）
+    """
+    result = {'timeframe': timeframe, 'data_points': data_points}
+    result.update(columns)
+    result['current'] = {key: (columns[field][-1] if columns[field] else 0.0)
+                         for key, field in CURRENT_FIELDS}
+    return result
+
+
+def matrix_to_dict(timeframe: str, data_points: int, matrix: np.ndarray) -> Dict:
+    """把 (len(SERIES_FIELDS), n) 的指标矩阵转换为时间框架序列字典"""
+    return series_to_dict(timeframe, data_points, dict(zip(SERIES_FIELDS, matrix.tolist())))
+
+
+def tail_array(values: np.ndarray, n: int) -> np.ndarray:
+    """取数组最后 n 个值，NaN 转为 0（向量化处理）"""
+    return np.nan_to_num(np.asarray(values[-n:], dtype=float), nan=0.0)
+
+
+def tail_list(values: np.ndarray, n: int) -> List[float]:
+    """取数组最后 n 个值转为 Python 列表，NaN 转为 0（向量化处理）"""
+    return tail_array(values, n).tolist()
+
+
+# ============================================================
+# 批量（向量化）计算：多个交易对 / 时间框架的 K 线按列堆叠为二维数组，
+# 所有指标按列同时计算，只在最后转换为 Python 列表时做一次 NaN 处理
+# ============================================================
+
+def _ema_2d(values: np.ndarray, period: int, start: int = 0) -> np.ndarray:
+    """按列计算 EMA（TA-Lib 兼容），values 形状 (T, N)，从第 start 行开始预热"""
+    out = np.full(values.shape, np.nan)
+    seed_end = start + period
+    if values.shape[0] < seed_end:
+        return out
+
+    k = 2.0 / (period + 1)
+    value = values[start:seed_end].sum(axis=0) / period
+    out[seed_end - 1] = value
+    for t in range(seed_end, values.shape[0]):
+        value = value + k * (values[t] - value)
+        out[t] = value
+    return out
+
+
+def _wilder_2d(values: np.ndarray, period: int) -> np.ndarray:
+    """
+    按列做 Wilder 平滑：前 period 行的简单平均作为种子，之后 (prev * (period - 1) + x) / period
+
+    Returns:
+        与 values 形状相同，前 period - 1 行为 NaN
+    """
+    out = np.full(values.shape, np.nan)
+    if values.shape[0] < period:
+        return out
+
+    value = values[:period].sum(axis=0) / period
+    out[period - 1] = value
+    for t in range(period, values.shape[0]):
+        value = (value * (period - 1) + values[t]) / period
+        out[t] = value
+    return out
+
+
+def _rsi_2d(closes: np.ndarray, period: int) -> np.ndarray:
+    """按列计算 RSI（Wilder 平滑，TA-Lib 兼容）"""
+    out = np.full(closes.shape, np.nan)
+    if closes.shape[0] <= period:
+        return out
+
+    change = np.diff(closes, axis=0)
+    avg_gain = _wilder_2d(np.where(change > 0, change, 0.0), period)
+    avg_loss = _wilder_2d(np.where(change < 0, -change, 0.0), period)
+    total = avg_gain + avg_loss
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rsi = np.where(total != 0, 100.0 * avg_gain / total, 0.0)
+    rsi[np.isnan(total)] = np.nan
+    out[1:] = rsi
+    return out
+
+
+def _atr_2d(highs: np.ndarray, lows: np.ndarray, closes: np.ndarray, period: int) -> np.ndarray:
+    """按列计算 ATR（Wilder 平滑，TA-Lib 兼容）"""
+    out = np.full(closes.shape, np.nan)
+    if closes.shape[0] <= period:
+        return out
+
+    prev_close = closes[:-1]
+    true_range = np.maximum.reduce([
+        highs[1:] - lows[1:],
+        np.abs(highs[1:] - prev_close),
+        np.abs(lows[1:] - prev_close)
+    ])
+    out[1:] = _wilder_2d(true_range, period)
+    return out
+
+
+def _rolling_2d(values: np.ndarray, period: int):
+    """按列计算滑动窗口均值和总体标准差（累加和实现，以首行为基准平移减少精度损失）"""
+    mean = np.full(values.shape, np.nan)
+    std = np.full(values.shape, np.nan)
+    if values.shape[0] < period:
+        return mean, std
+
+    shifted = values - values[0]
+    zeros = np.zeros((1, values.shape[1]))
+    sums = np.concatenate([zeros, np.cumsum(shifted, axis=0)])
+    sums_sq = np.concatenate([zeros, np.cumsum(shifted * shifted, axis=0)])
+
+    window_mean = (sums[period:] - sums[:-period]) / period
+    window_var = (sums_sq[period:] - sums_sq[:-period]) / period - window_mean * window_mean
+    mean[period - 1:] = window_mean + values[0]
+    std[period - 1:] = np.sqrt(np.maximum(window_var, 0.0))
+    return mean, std
+
+
+def compute_batch(highs: np.ndarray, lows: np.ndarray, closes: np.ndarray,
+                  volumes: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    批量计算全部指标，每一列是一个交易对（或时间框架）的 K 线序列
+
+    Args:
+        highs, lows, closes, volumes: 形状 (T, N) 的二维数组，按时间升序
+
+    Returns:
+        {SERIES_FIELDS 中的字段: 形状 (T, N) 的数组}，预热期为 NaN
+    """
+    macd_slow = _ema_2d(closes, 26)
+    macd_fast = _ema_2d(closes, 12, start=26 - 12)
+    macd = macd_fast - macd_slow
+    macd_signal = _ema_2d(macd, 9, start=26 - 1)
+    macd[np.isnan(macd_signal)] = np.nan
+
+    bb_middle, bb_std = _rolling_2d(closes, 20)
+    volume_ma, _ = _rolling_2d(volumes, 20)
+
+    return {
+        'prices': closes,
+        'highs': highs,
+        'lows': lows,
+        'ema20': _ema_2d(closes, 20),
+        'ema50': _ema_2d(closes, 50),
+        'macd': macd,
+        'macd_signal': macd_signal,
+        'macd_hist': macd - macd_signal,
+        'rsi7': _rsi_2d(closes, 7),
+        'rsi14': _rsi_2d(closes, 14),
+        'atr14': _atr_2d(highs, lows, closes, 14),
+        'bb_upper': bb_middle + 2 * bb_std,
+        'bb_middle': bb_middle,
+        'bb_lower': bb_middle - 2 * bb_std,
+        'volumes': volumes,
+        'volume_ma': volume_ma
+    }
+
+
+def batch_matrix(columns: Dict[str, np.ndarray], data_points: int) -> np.ndarray:
+    """
+    把 compute_batch() 的结果整理为每一列的指标矩阵
+
+    Returns:
+        形状 (列数, len(SERIES_FIELDS), data_points) 的连续数组，NaN 已转为 0；
+        第 j 个元素即第 j 列的指标矩阵（行顺序同 SERIES_FIELDS）
+    """
+    stacked = np.stack([columns[field][-data_points:] for field in SERIES_FIELDS])
+    return np.ascontiguousarray(np.nan_to_num(stacked, nan=0.0).transpose(2, 0, 1))
+
+
+def batch_series(timeframe: str, columns: Dict[str, np.ndarray],
+                 data_points: Optional[int] = None) -> List[Dict]:
+    """
+    把 compute_batch() 的结果拆分为每一列的时间框架序列字典
+
+    所有字段一次性切片 + np.nan_to_num，每列只做一次 tolist()，不再逐元素判断 NaN。
+
+    Returns:
+        与输入列顺序一致的序列字典列表（结构同 MarketData._calculate_timeframe_series）
+    """
+    if data_points is None:
+        data_points = SERIES_POINTS.get(timeframe, 20)
+
+    return [matrix_to_dict(timeframe, data_points, matrix)
+            for matrix in batch_matrix(columns, data_points)]
@@ -0,0 +1,158 @@
+"""
+AI 响应中的 JSON 提取
+一次扫描找出文本中所有顶层 JSON 对象 / 数组，返回最后一个能成功解析的：
+- 扫描由正则表达式（C 实现）完成：JSON 之外只查找 '{' / '['，JSON 之内只匹配字符串和括号，
+  Python 层只处理结构字符，不逐个字符循环
+- 理解字符串和转义：reasoning 等字段中的 ']'、'}'、'\\"' 不影响括号配对
+- 思维链中的括号（如 "[注意]"、未闭合的 "{"）解析失败后自动跳过
+- 优先使用 orjson 解码（未安装时回退到标准库 json）；解析失败时再把中文引号替换为英文引号重试
+"""
+
+import json
+import re
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+
+# JSON 之外：候选的起始括号
+_OPENING = re.compile(r'[{\[]')
+
+# JSON 之内：ASCII 双引号字符串（含转义）、中文引号字符串、括号；单独的 '"' 表示字符串未闭合
+_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|\u201c[^\u201d"]*[\u201d"]|[{}\[\]]|"', re.S)
+
+_CLOSING = {'}': '{', ']': '['}
+
+_QUOTE_REPLACEMENTS = {
+    '\u201c': '"',  # “
+    '\u201d': '"',  # ”
+    '\u2018': "'",  # ‘
+    '\u2019': "'"   # ’
+}
+
+# 候选解析失败的标记（None 是合法的 JSON 值）
+_INVALID = object()
+
+
+class JSONMatch(NamedTuple):
+    """提取结果：解析后的值，以及在原文中的位置 text[start:end]"""
+    value: Any
+    start: int
+    end: int
+
+
+def loads(text: str) -> Any:
+    """解码 JSON（orjson 可用时使用 orjson）"""
+    if HAS_ORJSON:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def fix_json_quotes(json_str: str) -> str:
+    """
+    把中文引号替换为英文引号
+    对应 NOFX 的 fixMissingQuotes() 函数
+    """
+    for old, new in _QUOTE_REPLACEMENTS.items():
+        json_str = json_str.replace(old, new)
+    return json_str
+
+
+def find_json_spans(text: str) -> List[Tuple[int, int]]:
+    """
+    一次扫描找出所有括号配对完整的顶层 JSON 候选
+
+    候选内的括号不匹配（如 '{ ... ]'）、字符串未闭合或到文本结束仍未闭合时，丢弃该候选，从它的下一个字符继续查找。
+    失败的扫描中已经见过的起始括号，其结果（在哪里闭合 / 无法闭合）与从它重新扫描完全相同，直接复用，
+    因此大量未闭合的括号（如 '[[[[...'）也不会重复扫描。
+
+    Returns:
+        [(start, end), ...]，按出现顺序，text[start:end] 为候选文本
+    """
+    spans = []
+    # 起始括号位置 → 候选结束位置（-1 表示无法闭合），来自之前失败的扫描
+    known = {}
+    pos = 0
+    while True:
+        opening = _OPENING.search(text, pos)
+        if opening is None:
+            break
+        start = opening.start()
+        end = known.get(start)
+        if end is None:
+            end = _scan(text, start, known)
+        if end < 0:
+            pos = start + 1
+            continue
+        spans.append((start, end))
+        pos = end
+    return spans
+
+
+def _scan(text: str, start: int, known: Dict[int, int]) -> int:
+    """从 start 处的起始括号开始配对，返回候选结束位置；失败时返回 -1，并把嵌套候选的结果记入 known"""
+    stack = [start]
+    nested = []
+    for token in _TOKEN.finditer(text, start + 1):
+        ch = token.group()
+        if ch in '{[':
+            stack.append(token.start())
+        elif ch in '}]':
+            if text[stack[-1]] != _CLOSING[ch]:
+                break
+            opened = stack.pop()
+            if not stack:
+                return token.end()
+            nested.append((opened, token.end()))
+        elif ch == '"':
+            # 未闭合的字符串：之后不可能再形成完整的 JSON
+            break
+
+    # 仍在栈中的括号遇到同样的失败；已闭合的嵌套候选从其起点重新扫描会得到同样的结束位置
+    for opened in stack:
+        known[opened] = -1
+    known.update(nested)
+    return -1
+
+
+def extract_last_json(text: str, expect: Optional[type] = None,
+                      accept: Optional[Callable[[Any], bool]] = None) -> Optional[JSONMatch]:
+    """
+    提取最后一个能成功解析的顶层 JSON
+
+    Args:
+        text: AI 响应文本
+        expect: 期望的类型（dict 或 list），类型不符的候选跳过
+        accept: 额外的校验函数，返回 False 的候选跳过（如要求数组元素都是对象）
+
+    Returns:
+        JSONMatch，找不到时返回 None
+    """
+    for start, end in reversed(find_json_spans(text)):
+        value = _decode(text[start:end])
+        if value is _INVALID:
+            continue
+        if expect is not None and not isinstance(value, expect):
+            continue
+        if accept is not None and not accept(value):
+            continue
+        return JSONMatch(value, start, end)
+    return None
+
+
+def _decode(candidate: str) -> Any:
+    try:
+        return loads(candidate)
+    except ValueError:
+        pass
+    fixed = fix_json_quotes(candidate)
+    if fixed == candidate:
+        return _INVALID
+    try:
+        return loads(fixed)
+    except ValueError:
+        return _INVALID
@@ -0,0 +1,444 @@
+"""
+分析日志索引
+把 analysis_logs 下的 JSONL 日志（含已压缩的 .jsonl.gz / .jsonl.zst 分段）导入 SQLite，
+时间、价格、各时间框架指标、市场状态、信心度、交易决策都是带索引的类型化列，
+范围 / 条件查询不再需要逐行 json.loads 全部历史日志
+
+增量导入：
+- ingest() 记录每个未压缩文件已读到的字节位置和第一行的哈希，下次只读新增的完整行；
+  同名文件被轮转替换（第一行变化）时从头导入；压缩分段只导入一次
+- 作为 LogSink 的 listener 时，每批记录写入文件后直接入库
+- 同一条记录（按 timestamp 去重）重复导入不会产生重复行
+
+命令行：
+    python log_index.py ingest
+    python log_index.py query --since 2025-11-01 --where "confidence>75" --where "rsi14_1h<30"
+    python log_index.py query --action open_long --columns ts,price,confidence,actions --limit 20
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from log_sink import open_log
+
+
+TIMEFRAMES = ('3m', '15m', '1h', '4h')
+INDICATORS = ('rsi7', 'rsi14', 'macd', 'atr14', 'ema20', 'ema50')
+
+# 周期表的列（列名, 类型）；指标列为 <指标>_<时间框架>，如 rsi14_1h
+CYCLE_COLUMNS = [
+    ('ts', 'TEXT'),
+    ('epoch', 'REAL'),
+    ('kind', 'TEXT'),                # analysis（盯盘）/ trading（交易决策）
+    ('success', 'INTEGER'),
+    ('price', 'REAL'),
+    ('change_15m', 'REAL'),
+    ('change_1h', 'REAL'),
+    ('change_4h', 'REAL'),
+    ('change_24h', 'REAL'),
+    ('funding_rate', 'REAL'),
+    *[(f'{indicator}_{tf}', 'REAL') for tf in TIMEFRAMES for indicator in INDICATORS],
+    ('market_state', 'TEXT'),
+    ('confidence', 'REAL'),          # 交易日志取各条决策信心度的最大值
+    ('actions', 'TEXT'),             # 本周期的决策动作（逗号分隔，去重）
+    ('decision_count', 'INTEGER'),
+    ('equity', 'REAL'),
+    ('sharpe_ratio', 'REAL'),
+    ('trigger_reasons', 'TEXT'),
+    ('llm_ms', 'REAL'),
+    ('prompt_tokens', 'INTEGER'),
+    ('completion_tokens', 'INTEGER'),
+    ('cached_tokens', 'INTEGER'),
+]
+COLUMN_NAMES_ORDERED = [name for name, _ in CYCLE_COLUMNS]
+COLUMN_NAMES = set(COLUMN_NAMES_ORDERED)
+
+DECISION_COLUMNS = ('symbol', 'action', 'leverage', 'position_size_usd', 'stop_loss', 'take_profit',
+                    'confidence', 'risk_usd')
+
+_OPERATORS = ('>=', '<=', '!=', '=', '>', '<')
+_WHERE_PATTERN = re.compile(r'^\s*(\w+)\s*(>=|<=|!=|=|>|<)\s*(.+?)\s*$')
+_LOG_FILE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}(\.\d+)?\.jsonl(\.gz|\.zst)?$')
+
+
+def _number(value) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_time(value) -> Optional[float]:
+    """ISO 时间字符串 / 日期 / 时间戳 → epoch 秒"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(str(value)).timestamp()
+
+
+def flatten_record(record: Dict) -> Tuple[Dict, List[Dict]]:
+    """
+    把一条分析日志展开为周期行和决策行
+
+    Returns:
+        (周期列字典, 决策列表)
+    """
+    market = record.get('market_data') or {}
+    changes = market.get('price_changes') or {}
+    json_result = record.get('json_result') or {}
+    decisions = [d for d in (record.get('decisions') or []) if isinstance(d, dict)]
+    account = record.get('account') or {}
+    deepseek = record.get('deepseek') or {}
+    usage = deepseek.get('usage') or {}
+
+    row = {
+        'ts': record['timestamp'],
+        'epoch': _parse_time(record['timestamp']),
+        'kind': 'trading' if 'decisions' in record else 'analysis',
+        'success': int(bool(record.get('success', True))),
+        'price': _number(market.get('current_price')),
+        'funding_rate': _number(market.get('funding_rate')),
+        'market_state': json_result.get('market_state'),
+        'confidence': _number(json_result.get('confidence')),
+        'decision_count': len(decisions),
+        'equity': _number(account.get('total_equity')),
+        'sharpe_ratio': _number(record.get('sharpe_ratio')),
+        'trigger_reasons': '；'.join(record.get('trigger_reasons') or []) or None,
+        'llm_ms': _number(deepseek.get('total_ms')),
+        'prompt_tokens': usage.get('prompt_tokens'),
+        'completion_tokens': usage.get('completion_tokens'),
+        'cached_tokens': usage.get('cache_hit_tokens'),
+    }
+    for period in ('15m', '1h', '4h', '24h'):
+        row[f'change_{period}'] = _number(changes.get(period))
+    for tf in TIMEFRAMES:
+        current = (market.get(f'timeframe_{tf}') or {}).get('current') or {}
+        for indicator in INDICATORS:
+            row[f'{indicator}_{tf}'] = _number(current.get(indicator))
+
+    if decisions:
+        actions = list(dict.fromkeys(str(d.get('action')) for d in decisions))
+        row['actions'] = ','.join(actions)
+        confidences = [c for c in (_number(d.get('confidence')) for d in decisions) if c is not None]
+        if row['confidence'] is None and confidences:
+            row['confidence'] = max(confidences)
+    else:
+        row['actions'] = None
+    return row, decisions
+
+
+class LogIndex:
+    """分析日志的 SQLite 索引（线程安全）"""
+
+    def __init__(self, db_path: str = 'analysis_logs/index.sqlite3'):
+        """
+        Args:
+            db_path: SQLite 数据库文件路径
+        """
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self.db_path = db_path
+        # LogSink 回调在日志线程中写入，查询可能来自其他线程
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+
+        columns = ',\n'.join(f"{name} {kind}" for name, kind in CYCLE_COLUMNS)
+        self._conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS cycles (
+                id INTEGER PRIMARY KEY,
+                {columns},
+                UNIQUE (ts)
+            );
+            CREATE INDEX IF NOT EXISTS cycles_epoch ON cycles (epoch);
+            CREATE INDEX IF NOT EXISTS cycles_confidence ON cycles (confidence);
+            CREATE INDEX IF NOT EXISTS cycles_state ON cycles (market_state, epoch);
+            CREATE INDEX IF NOT EXISTS cycles_rsi14_1h ON cycles (rsi14_1h);
+            CREATE TABLE IF NOT EXISTS decisions (
+                cycle_id INTEGER NOT NULL REFERENCES cycles (id),
+                idx INTEGER NOT NULL,
+                {', '.join(f'{name} {"TEXT" if name in ("symbol", "action") else "REAL"}' for name in DECISION_COLUMNS)},
+                PRIMARY KEY (cycle_id, idx)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS decisions_action ON decisions (action, symbol);
+            CREATE TABLE IF NOT EXISTS files (
+                name TEXT PRIMARY KEY,
+                offset INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                head TEXT
+            );
+        """)
+        # 早期版本的 files 表没有 head 列（为空时视为文件已变化，从头导入一次）
+        if 'head' not in {row['name'] for row in self._conn.execute("PRAGMA table_info(files)")}:
+            self._conn.execute("ALTER TABLE files ADD COLUMN head TEXT")
+        self._conn.commit()
+
+    # ========== 导入 ==========
+
+    def add_records(self, records: Iterable[Dict]) -> int:
+        """
+        导入记录（已存在的 timestamp 跳过），可直接作为 LogSink 的 listener
+
+        Returns:
+            新增的周期数
+        """
+        placeholders = ', '.join('?' for _ in CYCLE_COLUMNS)
+        cycle_sql = f"INSERT OR IGNORE INTO cycles ({', '.join(COLUMN_NAMES_ORDERED)}) VALUES ({placeholders})"
+        decision_sql = (f"INSERT OR IGNORE INTO decisions (cycle_id, idx, {', '.join(DECISION_COLUMNS)}) "
+                        f"VALUES ({', '.join('?' for _ in range(len(DECISION_COLUMNS) + 2))})")
+        added = 0
+        with self._lock:
+            for record in records:
+                if not isinstance(record, dict) or 'timestamp' not in record:
+                    continue
+                row, decisions = flatten_record(record)
+                cursor = self._conn.execute(cycle_sql, [row[name] for name in COLUMN_NAMES_ORDERED])
+                if cursor.rowcount == 0:
+                    continue
+                added += 1
+                cycle_id = cursor.lastrowid
+                self._conn.executemany(decision_sql, [
+                    (cycle_id, i, str(d.get('symbol')), str(d.get('action')),
+                     *(_number(d.get(name)) for name in DECISION_COLUMNS[2:]))
+                    for i, d in enumerate(decisions)
+                ])
+            self._conn.commit()
+        return added
+
+    def ingest(self, directory: str = 'analysis_logs') -> Dict:
+        """
+        增量导入日志目录
+
+        Returns:
+            {'files': 读取的文件数, 'lines': 读取的行数, 'added': 新增周期数, 'errors': 无法解析的行数, 'ms': 耗时}
+        """
+        start = time.perf_counter()
+        stats = {'files': 0, 'lines': 0, 'added': 0, 'errors': 0}
+        if not os.path.isdir(directory):
+            return {**stats, 'ms': 0.0}
+
+        with self._lock:
+            known = {row['name']: (row['offset'], row['size'], row['head'])
+                     for row in self._conn.execute("SELECT name, offset, size, head FROM files")}
+
+        for name in sorted(os.listdir(directory)):
+            if not _LOG_FILE_PATTERN.match(name):
+                continue
+            path = os.path.join(directory, name)
+            size = os.path.getsize(path)
+            offset, known_size, known_head = known.get(name, (0, 0, ''))
+            compressed = not name.endswith('.jsonl')
+            if compressed and name in known:
+                continue        # 压缩分段不会再变化
+            head = None if compressed else _head_hash(path)
+            if not compressed and (size < known_size or head != known_head):
+                # 文件被截断，或轮转后同名的新文件（第一行不同）：从头导入（重复记录按 timestamp 跳过）
+                offset = 0
+            if not compressed and size == offset:
+                continue
+
+            records, offset = self._read_lines(path, 0 if compressed else offset, stats)
+            stats['files'] += 1
+            stats['added'] += self.add_records(records)
+            with self._lock:
+                self._conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                                   (name, size if compressed else offset, size, head))
+                self._conn.commit()
+
+        stats['ms'] = (time.perf_counter() - start) * 1000
+        return stats
+
+    @staticmethod
+    def _read_lines(path: str, offset: int, stats: Dict) -> Tuple[List[Dict], int]:
+        """从 offset 开始读取完整的行（末尾未写完的行留到下次），返回 (记录, 新的 offset)"""
+        records = []
+        with open_log(path) as f:
+            if offset:
+                f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                offset += len(line)
+                stats['lines'] += 1
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    stats['errors'] += 1
+        return records, offset
+
+    # ========== 查询 ==========
+
+    def query(self, since=None, until=None, where: Sequence[Tuple[str, str, object]] = (),
+              market_state: Optional[str] = None, action: Optional[str] = None,
+              columns: Optional[Sequence[str]] = None, order: str = 'asc',
+              limit: Optional[int] = None) -> List[Dict]:
+        """
+        范围 + 条件查询
+
+        Args:
+            since: 起始时间（ISO 字符串 / 日期 / epoch 秒，含）
+            until: 结束时间（不含）
+            where: 条件列表 [(列名, 运算符, 值)]，如 [('confidence', '>', 75), ('rsi14_1h', '<', 30)]
+            market_state: 市场状态
+            action: 包含该动作的决策（如 open_long）
+            columns: 返回的列，默认全部
+            order: 'asc' / 'desc'（按时间）
+            limit: 最多返回条数
+
+        Returns:
+            周期行字典列表
+        """
+        sql, params = self._select(since, until, where, market_state, action, columns, order, limit)
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def explain(self, **filters) -> List[str]:
+        """
+        query() 的查询计划（EXPLAIN QUERY PLAN 的 detail 列），用于确认条件查询走索引
+
+        Args:
+            filters: 与 query() 相同的参数
+        """
+        sql, params = self._select(**filters)
+        with self._lock:
+            return [row['detail'] for row in self._conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+    @staticmethod
+    def _select(since=None, until=None, where: Sequence[Tuple[str, str, object]] = (),
+                market_state: Optional[str] = None, action: Optional[str] = None,
+                columns: Optional[Sequence[str]] = None, order: str = 'asc',
+                limit: Optional[int] = None) -> Tuple[str, List]:
+        """拼接 query() 的 SQL 和参数"""
+        selected = list(columns) if columns else ['id', *COLUMN_NAMES_ORDERED]
+        for name in selected:
+            if name != 'id' and name not in COLUMN_NAMES:
+                raise ValueError(f"未知的列: {name}")
+
+        clauses, params = [], []
+        if since is not None:
+            clauses.append("epoch >= ?")
+            params.append(_parse_time(since))
+        if until is not None:
+            clauses.append("epoch < ?")
+            params.append(_parse_time(until))
+        if market_state is not None:
+            clauses.append("market_state = ?")
+            params.append(market_state)
+        if action is not None:
+            clauses.append("id IN (SELECT cycle_id FROM decisions WHERE action = ?)")
+            params.append(action)
+        for name, operator, value in where:
+            if name not in COLUMN_NAMES or operator not in _OPERATORS:
+                raise ValueError(f"无效的条件: {name} {operator} {value}")
+            clauses.append(f"{name} {operator} ?")
+            params.append(value)
+
+        sql = f"SELECT {', '.join(selected)} FROM cycles"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += f" ORDER BY epoch {'DESC' if order == 'desc' else 'ASC'}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return sql, params
+
+    def decisions(self, cycle_id: int) -> List[Dict]:
+        """某个周期的决策明细"""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM decisions WHERE cycle_id = ? ORDER BY idx", (cycle_id,))
+            return [dict(row) for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cycles").fetchone()[0]
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+def _head_hash(path: str) -> str:
+    """文件第一行（含 timestamp）的哈希；第一行尚未写完时为空字符串"""
+    with open(path, 'rb') as f:
+        line = f.readline()
+    if not line.endswith(b'\n'):
+        return ''
+    return hashlib.sha1(line).hexdigest()
+
+
+def parse_where(expression: str) -> Tuple[str, str, object]:
+    """解析命令行条件，如 "confidence>75"、"market_state=震荡" """
+    match = _WHERE_PATTERN.match(expression)
+    if match is None:
+        raise ValueError(f"无法解析条件: {expression}（格式：列名 运算符 值，如 confidence>75）")
+    name, operator, value = match.groups()
+    number = _number(value)
+    return name, operator, number if number is not None else value
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="分析日志索引：导入 analysis_logs 并查询")
+    parser.add_argument('--dir', default='analysis_logs', help="日志目录")
+    parser.add_argument('--db', default=None, help="索引数据库（默认 <日志目录>/index.sqlite3）")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('ingest', help="增量导入日志")
+
+    query_parser = commands.add_parser('query', help="查询（查询前自动增量导入）")
+    query_parser.add_argument('--since', help="起始时间，如 2025-11-01 或 2025-11-01T08:00")
+    query_parser.add_argument('--until', help="结束时间（不含）")
+    query_parser.add_argument('--where', action='append', default=[], help="条件，如 confidence>75（可重复）")
+    query_parser.add_argument('--state', help="市场状态")
+    query_parser.add_argument('--action', help="包含该决策动作，如 open_long")
+    query_parser.add_argument('--columns', default='ts,price,market_state,confidence,rsi14_1h,actions',
+                              help="输出列（逗号分隔）")
+    query_parser.add_argument('--limit', type=int, default=100)
+    query_parser.add_argument('--desc', action='store_true', help="按时间倒序")
+    query_parser.add_argument('--json', action='store_true', help="输出 JSON Lines")
+
+    args = parser.parse_args(argv)
+    index = LogIndex(args.db or os.path.join(args.dir, 'index.sqlite3'))
+    stats = index.ingest(args.dir)
+    print(f"📥 导入 {stats['files']} 个文件，{stats['lines']} 行，新增 {stats['added']} 个周期"
+          f"（{stats['ms']:.0f}ms，共 {index.count()} 个周期）", file=sys.stderr)
+    if args.command == 'ingest':
+        return
+
+    start = time.perf_counter()
+    rows = index.query(
+        since=args.since, until=args.until, where=[parse_where(w) for w in args.where],
+        market_state=args.state, action=args.action, columns=args.columns.split(','),
+        order='desc' if args.desc else 'asc', limit=args.limit
+    )
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    if args.json:
+        for row in rows:
+            print(json.dumps(row, ensure_ascii=False))
+    else:
+        names = args.columns.split(',')
+        print(' | '.join(names))
+        for row in rows:
+            print(' | '.join('' if row[name] is None else
+                             f"{row[name]:.2f}" if isinstance(row[name], float) else str(row[name])
+                             for name in names))
+    print(f"🔎 {len(rows)} 条结果（查询 {elapsed_ms:.1f}ms）", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
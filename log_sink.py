@@ -0,0 +1,339 @@
+"""
+分析日志写入器
+write() 只把记录放入队列（不序列化、不做磁盘 I/O），后台线程负责：
+- 序列化为 JSON Lines，缓冲到一定大小或时间后批量写入
+- 按日期（YYYY-MM-DD.jsonl）和大小轮转，本写入器关闭的分段压缩为 .jsonl.gz（或 .jsonl.zst）；
+  目录中已有的其他文件（之前运行留下的、手动放入的）不会被压缩或删除
+- 按 fsync 策略落盘；进程退出时（atexit）写完缓冲
+- 重新打开当天文件时截掉上次崩溃留下的不完整行
+"""
+
+import atexit
+import gzip
+import io
+import json
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from metrics import MetricsRegistry, get_registry
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+
+# 压缩格式 → 文件后缀
+COMPRESSION_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+
+# fsync 策略：never 交给操作系统；flush 每次批量写入后；always 每条记录后
+FSYNC_POLICIES = ('never', 'flush', 'always')
+
+_STOP = object()
+
+
+class LogSink:
+    """带缓冲、轮转和压缩的 JSONL 日志写入器（后台线程写入，线程安全）"""
+
+    def __init__(self, directory: str = 'analysis_logs', max_bytes: int = 64 * 1024 * 1024,
+                 compression: Optional[str] = 'gzip', fsync: str = 'flush',
+                 flush_interval: float = 1.0, flush_bytes: int = 256 * 1024,
+                 listeners: Optional[List[Callable[[List[Dict]], None]]] = None,
+                 clock: Callable[[], float] = time.time, metrics: Optional[MetricsRegistry] = None):
+        """
+        Args:
+            directory: 日志目录
+            max_bytes: 单个文件的最大字节数，超过后轮转为 YYYY-MM-DD.N.jsonl
+            compression: 关闭分段的压缩格式：'gzip'、'zstd'（需要 zstandard，未安装时回退到 gzip）或 None
+            fsync: fsync 策略（见 FSYNC_POLICIES）
+            flush_interval: 缓冲最长保留时间（秒）
+            flush_bytes: 缓冲达到该字节数时立即写入
+            listeners: 每批记录写入文件后在后台线程中调用的回调（参数为记录列表），如 LogIndex.add_records
+            clock: 时间函数（秒），决定记录写入哪一天的文件
+            metrics: 指标注册表，为 None 时使用进程内默认实例
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"未知的 fsync 策略: {fsync}")
+        if compression == 'zstd' and not HAS_ZSTD:
+            print("⚠️ 未安装 zstandard，日志压缩回退到 gzip")
+            compression = 'gzip'
+        if compression not in (None, *COMPRESSION_SUFFIXES):
+            raise ValueError(f"未知的压缩格式: {compression}")
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self.fsync = fsync
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.clock = clock
+        self.metrics = metrics or get_registry()
+        self.listeners = list(listeners or [])
+
+        self._queue = queue.Queue()
+        self._buffer: List[tuple] = []   # (日期, 行字节, 记录)
+        self._buffer_bytes = 0
+        self._file = None
+        self._file_date = None
+        self._file_size = 0
+        # 本写入器关闭、尚未压缩的分段（压缩失败时下次轮转重试）
+        self._pending_compress: List[str] = []
+        self._closed = False
+
+        self._worker = threading.Thread(target=self._run, name='log-sink', daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    @classmethod
+    def from_config(cls, config: Dict, **kwargs) -> 'LogSink':
+        return cls(
+            directory=config.get('log_dir', 'analysis_logs'),
+            max_bytes=int(config.get('log_max_mb', 64) * 1024 * 1024),
+            compression=config.get('log_compression', 'gzip'),
+            fsync=config.get('log_fsync', 'flush'),
+            flush_interval=config.get('log_flush_seconds', 1.0),
+            **kwargs
+        )
+
+    # ========== 调用方接口 ==========
+
+    def write(self, record: Dict):
+        """记录入队（立即返回）；记录入队后不应再被修改"""
+        if self._closed:
+            raise RuntimeError("日志写入器已关闭")
+        self._queue.put((self.clock(), record))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待已入队的记录全部写入文件（按 fsync 策略落盘），返回是否在超时前完成"""
+        if self._closed:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = 30):
+        """写完缓冲并关闭当前文件（当天的文件不压缩，下次启动继续追加；重复调用无副作用）"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._worker.join(timeout)
+
+    # ========== 后台线程 ==========
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            timeout = None
+            if self._buffer:
+                timeout = max(last_flush + self.flush_interval - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            try:
+                if item is _STOP:
+                    self._drain()
+                    self._write_buffer()
+                    self._close_file(compress=False)
+                    return
+                if isinstance(item, threading.Event):
+                    self._write_buffer()
+                    item.set()
+                    last_flush = time.monotonic()
+                    continue
+                if item is not None:
+                    self._append(*item)
+
+                if (self._buffer_bytes >= self.flush_bytes or self.fsync == 'always'
+                        or time.monotonic() - last_flush >= self.flush_interval):
+                    self._write_buffer()
+                    last_flush = time.monotonic()
+            except Exception as e:
+                print(f"⚠️ 日志写入失败: {e}")
+                self.metrics.inc('log.errors')
+                last_flush = time.monotonic()   # 缓冲保留，下个周期重试
+                if isinstance(item, threading.Event):
+                    item.set()
+
+    def _drain(self):
+        """退出前取出队列中剩余的记录"""
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is not _STOP:
+                self._append(*item)
+
+    def _append(self, timestamp: float, record: Dict):
+        line = (json.dumps(record, ensure_ascii=False, default=str) + '\n').encode('utf-8')
+        date = datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d')
+        self._buffer.append((date, line, record))
+        self._buffer_bytes += len(line)
+        self.metrics.inc('log.records')
+
+    def _write_buffer(self):
+        """
+        把缓冲写入文件（按日期和大小轮转）
+
+        每段写入成功后立即从缓冲中移除：中途失败（磁盘写满、轮转出错）时缓冲只保留未写入的行，
+        下次重试不会重复写入已写入的行
+        """
+        if not self._buffer:
+            return
+        start = time.perf_counter()
+        written = []
+        written_bytes = 0
+        try:
+            while self._buffer:
+                date, line, _ = self._buffer[0]
+                if (self._file is None or date != self._file_date
+                        or (self._file_size + len(line) > self.max_bytes and self._file_size > 0)):
+                    self._rotate(date)
+
+                # 当前文件能容纳的同一天的连续行（至少一行）
+                count = 0
+                size = self._file_size
+                for line_date, line, _ in self._buffer:
+                    if line_date != date or (count and size + len(line) > self.max_bytes):
+                        break
+                    count += 1
+                    size += len(line)
+
+                chunk = self._buffer[:count]
+                self._write_chunk([line for _, line, _ in chunk])
+                del self._buffer[:count]
+                chunk_bytes = size - self._file_size
+                self._file_size = size
+                self._buffer_bytes -= chunk_bytes
+                written_bytes += chunk_bytes
+                written.extend(record for _, _, record in chunk)
+        finally:
+            if written:
+                self.metrics.observe('log.flush_ms', (time.perf_counter() - start) * 1000)
+                self.metrics.observe('log.flush_bytes', written_bytes)
+                for listener in self.listeners:
+                    try:
+                        listener(written)
+                    except Exception as e:
+                        print(f"⚠️ 日志回调失败: {e}")
+
+    def _write_chunk(self, lines: List[bytes]):
+        if not lines:
+            return
+        self._file.write(b''.join(lines))
+        self._file.flush()
+        if self.fsync != 'never':
+            os.fsync(self._file.fileno())
+
+    def _active_path(self, date: str) -> str:
+        return os.path.join(self.directory, f"{date}.jsonl")
+
+    def _rotate(self, date: str):
+        """切换到 date 当天的文件：换日时压缩前一天的文件，超过大小时先把当前文件改名为分段再压缩"""
+        if self._file is not None and date == self._file_date:
+            self._file.close()
+            self._file = None
+            active = self._active_path(date)
+            segment = os.path.join(self.directory, f"{date}.{self._next_segment(date)}.jsonl")
+            os.replace(active, segment)
+            self._pending_compress.append(segment)
+        else:
+            self._close_file(compress=True)
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._active_path(date)
+        self._repair(path)
+        self._file = open(path, 'ab')
+        self._file_date = date
+        self._file_size = self._file.tell()
+        self.metrics.inc('log.rotations')
+        # 新文件打开后再压缩：压缩失败不影响后续写入
+        self._compress_pending()
+
+    def _compress_pending(self):
+        """压缩本写入器关闭的分段（只处理自己写过的文件）"""
+        while self._pending_compress:
+            self._compress(self._pending_compress[0])
+            self._pending_compress.pop(0)
+
+    def _next_segment(self, date: str) -> int:
+        pattern = re.compile(rf'^{re.escape(date)}\.(\d+)\.jsonl')
+        numbers = [int(m.group(1)) for m in map(pattern.match, os.listdir(self.directory)) if m]
+        return max(numbers, default=0) + 1
+
+    def _close_file(self, compress: bool):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        if compress:
+            self._pending_compress.append(self._active_path(self._file_date))
+        self._file_date = None
+        self._file_size = 0
+
+    def _compress(self, path: str):
+        """压缩已关闭的分段（先写临时文件再改名，压缩完成后删除原文件）"""
+        if self.compression is None or not os.path.exists(path):
+            return
+        target = path + COMPRESSION_SUFFIXES[self.compression]
+        tmp_path = target + '.tmp'
+        with open(path, 'rb') as src, open(tmp_path, 'wb') as dst:
+            if self.compression == 'zstd':
+                zstandard.ZstdCompressor(level=10).copy_stream(src, dst)
+            else:
+                with gzip.GzipFile(fileobj=dst, mode='wb', compresslevel=6) as gz:
+                    shutil.copyfileobj(src, gz)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(tmp_path, target)
+        os.remove(path)
+        self.metrics.inc('log.compressed')
+
+    @staticmethod
+    def _repair(path: str):
+        """截掉文件末尾不完整的一行（上次进程崩溃时写了一半的记录）"""
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b'\n':
+                return
+            # 向前查找最后一个换行
+            position = size
+            while position > 0:
+                step = min(65536, position)
+                position -= step
+                f.seek(position)
+                index = f.read(step).rfind(b'\n')
+                if index >= 0:
+                    f.truncate(position + index + 1)
+                    break
+            else:
+                f.truncate(0)
+        print(f"⚠️ 日志文件 {path} 末尾有不完整的记录（上次异常退出），已截断")
+
+
+def open_log(path: str):
+    """按后缀打开日志文件（.jsonl / .jsonl.gz / .jsonl.zst），返回二进制行迭代器"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.zst'):
+        if not HAS_ZSTD:
+            raise ImportError("读取 .zst 日志需要 zstandard：pip install zstandard")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True))
+    return open(path, 'rb')
@@ -4,19 +4,75 @@
 """
 
 import ccxt
+import time
+import threading
 import pandas as pd
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 import talib
 
+from ohlcv_store import OHLCVStore
+from indicators import (TimeframeIndicators, SERIES_FIELDS, SERIES_POINTS, compute_batch, batch_matrix,
+                        matrix_to_dict, tail_array, tail_list)
+from market_snapshot import MarketSnapshot, TimeframeSeries
+from market_stream import MarketStream, BINANCE_FUTURES_WS
+from metrics import get_registry
+from rate_limit import TokenBucket
+
+
+# 交易所单次请求最多返回的 K 线数量（Binance 合约为 1500）
+MAX_FETCH_LIMIT = 1500
+
+# 推送模式下持仓量（无 WebSocket 推送）的 REST 刷新间隔（秒）
+OI_REFRESH_SECONDS = 60
+
+# 请求权重（Binance 合约）：持仓量、资金费率各 1，K 线按 limit 分档
+OI_WEIGHT = 1
+FUNDING_RATE_WEIGHT = 1
+
+
+def kline_weight(limit: int) -> int:
+    """K 线请求权重（Binance 合约 /fapi/v1/klines）"""
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+
+# 各时间框架获取的 K 线数量
+KLINE_LIMITS = {
+    '3m': 40,    # 40根 = 2小时
+    '15m': 40,   # 40根 = 10小时
+    '1h': 60,    # 60根 = 2.5天
+    '4h': 60     # 60根 = 10天
+}
+
 
 class MarketData:
     """市场数据获取和处理类"""
 
-    def __init__(self, exchange_id='binance'):
-        """初始化交易所连接"""
+    def __init__(self, exchange_id='binance', concurrent: bool = True,
+                 store_path: Optional[str] = None, incremental: bool = False,
+                 max_concurrency: int = 8, weight_per_minute: int = 1200, snapshot: bool = False):
+        """
+        初始化交易所连接
+
+        Args:
+            exchange_id: 交易所 ID
+            concurrent: 是否并发获取各项数据（False 时按顺序逐个请求）
+            store_path: 本地 K 线缓存（SQLite）路径，为 None 时每次全量获取
+            incremental: 是否使用增量指标引擎（每根新 K 线 O(1) 更新，不再每周期全量 TA-Lib 重算）
+            max_concurrency: 多币种扫描时的最大并发请求数
+            weight_per_minute: 所有 REST 请求共享的每分钟权重预算（Binance 合约上限 2400）
+            snapshot: 是否返回紧凑的 MarketSnapshot（numpy 数组存储）代替嵌套字典
+        """
         proxy_url = 'http://127.0.0.1:7890'
+        self.proxy_url = proxy_url
 
         self.exchange = ccxt.binance({
             'enableRateLimit': True,
@@ -27,6 +83,40 @@ class MarketData:
             'https': proxy_url,
         }
 
+        # 并发获取：K 线 (4个时间框架) + 持仓量 + 资金费率 = 6 个请求
+        self.concurrent = concurrent
+        self._executor = ThreadPoolExecutor(max_workers=len(KLINE_LIMITS) + 2,
+                                            thread_name_prefix='market-data')
+        self._markets_lock = threading.Lock()
+
+        # 多币种扫描：有界并发 + 共享权重预算（令牌桶，允许 10 秒的突发量）
+        self.max_concurrency = max_concurrency
+        self._scan_executor = None
+        self.rate_limiter = TokenBucket(rate=weight_per_minute / 60,
+                                        capacity=weight_per_minute / 6)
+
+        # 最近一次数据获取的耗时统计
+        self.last_fetch_stats = {}
+        self.last_scan_stats = {}
+
+        # 最近一次获取的原始 K 线 {symbol: {timeframe: DataFrame}}（模拟账户用 3 分钟 K 线检查止损 / 止盈）
+        self.last_klines = {}
+
+        # 本地 K 线缓存（增量获取）
+        self.store = OHLCVStore(store_path) if store_path else None
+
+        # 增量指标引擎 {(symbol, timeframe): TimeframeIndicators}
+        self.incremental = incremental
+        self._engines = {}
+
+        # WebSocket 行情流 {symbol: MarketStream}，以及推送模式下缓存的持仓量
+        self.streams = {}
+        self._stream_oi = {}
+        self._oi_refreshing = set()
+
+        # 返回 MarketSnapshot（只读 Mapping，与字典结构兼容）还是嵌套字典
+        self.snapshot = snapshot
+
     def get_btc_complete_data(self) -> Dict:
         """
         获取 BTC 完整市场数据 - 多时间框架分析
@@ -37,69 +127,423 @@ class MarketData:
         - 1小时：中短期趋势（最近 2.5 天）
         - 4小时：中长期趋势（最近 10 天）
 
+        并发模式下 4 个时间框架 K 线、持仓量、资金费率共 6 个请求同时发出，
+        单周期耗时取决于最慢的一个请求，而不是所有请求之和。
+        各请求耗时和失败信息记录在 self.last_fetch_stats 中。
+
+        已通过 start_stream() 启动行情推送时，直接从本地缓冲区读取，不再请求 REST。
+
         返回结构与 NOFX 的 market.Data 结构一致
         """
         symbol = 'BTC/USDT'
 
-        # 获取多时间框架 K 线数据
-        print("  获取 3分钟 K线 (40根 = 2小时)...")
-        klines_3m = self._fetch_klines(symbol, '3m', limit=40)
+        stream = self.streams.get(symbol)
+        if stream is not None and stream.is_ready():
+            klines, oi_data, funding_rate = self._read_stream(symbol)
+        else:
+            klines, oi_data, funding_rate = self._fetch_all(symbol)
 
-        print("  获取 15分钟 K线 (40根 = 10小时)...")
-        klines_15m = self._fetch_klines(symbol, '15m', limit=40)
+        self.last_klines[symbol] = klines
+        return self._build_complete_data(symbol, klines, oi_data, funding_rate)
 
-        print("  获取 1小时 K线 (60根 = 2.5天)...")
-        klines_1h = self._fetch_klines(symbol, '1h', limit=60)
+    def get_complete_data(self, symbols: List[str],
+                          timeframes: Optional[Dict[str, int]] = None) -> Dict[str, Dict]:
+        """
+        多币种扫描：并行获取多个交易对的数据并计算指标
 
-        print("  获取 4小时 K线 (60根 = 10天)...")
-        klines_4h = self._fetch_klines(symbol, '4h', limit=60)
+        所有交易对的请求放入同一个有界线程池（max_concurrency），并共享每分钟权重预算，
+        单个交易对失败不影响其他交易对。吞吐量记录在 self.last_scan_stats 中。
 
-        # 计算当前指标（基于 3 分钟最新数据）
-        current_price = klines_3m['close'].iloc[-1]
-        current_ema20 = self._calculate_ema(klines_3m['close'], 20)
-        current_macd = self._calculate_macd(klines_3m['close'])
-        current_rsi7 = self._calculate_rsi(klines_3m['close'], 7)
+        Args:
+            symbols: 交易对列表，如 ['BTC/USDT', 'ETH/USDT']
+            timeframes: {时间框架: K 线数量}，默认与 get_btc_complete_data 相同（KLINE_LIMITS）
 
-        # 计算各时间框架的价格变化百分比
-        price_change_15m = self._calculate_price_change(klines_15m['close'], periods=1)   # 1 个 15分钟前
-        price_change_1h = self._calculate_price_change(klines_1h['close'], periods=1)     # 1 个 1小时前
-        price_change_4h = self._calculate_price_change(klines_4h['close'], periods=1)     # 1 个 4小时前
-        price_change_24h = self._calculate_price_change(klines_1h['close'], periods=24)   # 24 个 1小时前
+        Returns:
+            {symbol: 完整市场数据}，每个值的结构与 get_btc_complete_data() 一致；失败的交易对不在结果中
+        """
+        timeframes = timeframes or KLINE_LIMITS
+        if self._scan_executor is None:
+            self._scan_executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                     thread_name_prefix='market-scan')
+
+        start = time.perf_counter()
+        self._ensure_markets_loaded()
+
+        # 已有行情推送的交易对直接读取本地状态，其余交易对的请求一起放入线程池
+        raw = {}
+        tasks = {}
+        for symbol in symbols:
+            stream = self.streams.get(symbol)
+            if stream is not None and stream.is_ready():
+                raw[symbol] = self._read_stream(symbol)
+                continue
+            for name, task in self._build_fetch_tasks(symbol, timeframes).items():
+                tasks[(symbol, name)] = task
+
+        outcomes = self._execute_tasks(tasks, self._scan_executor)
+        fetch_seconds = time.perf_counter() - start
+
+        failed = {}
+        for symbol in symbols:
+            if symbol in raw:
+                continue
+            kline_errors = [f"{tf}: {outcomes[(symbol, f'klines_{tf}')][1]}" for tf in timeframes
+                            if outcomes[(symbol, f'klines_{tf}')][1] is not None]
+            if kline_errors:
+                failed[symbol] = "; ".join(kline_errors)
+                continue
+            klines = {tf: outcomes[(symbol, f'klines_{tf}')][0] for tf in timeframes}
+            oi_value, oi_error, _ = outcomes[(symbol, 'open_interest')]
+            funding_value, funding_error, _ = outcomes[(symbol, 'funding_rate')]
+            raw[symbol] = (
+                klines,
+                oi_value if oi_error is None else {'latest': 0.0, 'average': 0.0},
+                funding_value if funding_error is None else 0.0
+            )
+
+        # 非增量模式下，所有交易对的指标按时间框架堆叠后批量计算
+        batch = self._calculate_batch_series(raw) if not self.incremental else {}
+
+        results = {}
+        for symbol in symbols:
+            if symbol not in raw:
+                continue
+            try:
+                results[symbol] = self._build_complete_data(symbol, *raw[symbol], verbose=False,
+                                                            series=batch.get(symbol))
+            except Exception as e:
+                failed[symbol] = f"指标计算失败: {e}"
+
+        elapsed = time.perf_counter() - start
+        self.last_scan_stats = {
+            'symbols': len(symbols),
+            'succeeded': len(results),
+            'failed': failed,
+            'requests': len(tasks),
+            'fetch_seconds': fetch_seconds,
+            'compute_seconds': elapsed - fetch_seconds,
+            'elapsed_seconds': elapsed,
+            'symbols_per_second': len(results) / elapsed if elapsed > 0 else 0.0,
+            'rate_limit_wait_seconds': self.rate_limiter.waited_seconds
+        }
 
-        # 获取持仓量数据
-        oi_data = self._get_open_interest(symbol)
+        print(f"  ✓ 扫描 {len(symbols)} 个交易对完成: 成功 {len(results)}，失败 {len(failed)} | "
+              f"耗时 {elapsed:.2f}s (请求 {fetch_seconds:.2f}s) | "
+              f"吞吐 {self.last_scan_stats['symbols_per_second']:.1f} 个/秒")
+        return results
 
-        # 获取资金费率
-        funding_rate = self._get_funding_rate(symbol)
+    def _fetch_all(self, symbol: str) -> Tuple[Dict[str, pd.DataFrame], Dict, float]:
+        """
+        获取单个交易对的全部原始数据（K 线 + 持仓量 + 资金费率）
 
-        # 计算各时间框架的技术指标序列
-        print("  计算技术指标...")
-        series_3m = self._calculate_timeframe_series(klines_3m, "3m")
-        series_15m = self._calculate_timeframe_series(klines_15m, "15m")
-        series_1h = self._calculate_timeframe_series(klines_1h, "1h")
-        series_4h = self._calculate_timeframe_series(klines_4h, "4h")
+        部分失败语义：
+        - 所有请求都会执行完毕，任何一个失败都不会中断其他请求
+        - 持仓量 / 资金费率失败时使用默认值
+        - 任一时间框架 K 线失败时，在所有请求结束后统一抛出异常
 
-        return {
-            'symbol': 'BTCUSDT',
+        Args:
+            symbol: 交易对符号，如 'BTC/USDT'
+
+        Returns:
+            (klines, oi_data, funding_rate) 元组，klines 以时间框架为键
+        """
+        tasks = self._build_fetch_tasks(symbol, KLINE_LIMITS)
+
+        if self.concurrent:
+            print(f"  并发获取 {len(KLINE_LIMITS)} 个时间框架 K线 + 持仓量 + 资金费率...")
+        results, errors = self._run_tasks(tasks)
+
+        kline_errors = {name: err for name, err in errors.items() if name.startswith('klines_')}
+        if kline_errors:
+            detail = "; ".join(f"{name}: {err}" for name, err in kline_errors.items())
+            raise Exception(f"K 线数据获取失败 ({len(kline_errors)}/{len(KLINE_LIMITS)}): {detail}")
+
+        klines = {timeframe: results[f'klines_{timeframe}'] for timeframe in KLINE_LIMITS}
+        oi_data = results['open_interest'] if 'open_interest' not in errors else {'latest': 0.0, 'average': 0.0}
+        funding_rate = results['funding_rate'] if 'funding_rate' not in errors else 0.0
+
+        return klines, oi_data, funding_rate
+
+    def _calculate_batch_series(self, raw: Dict[str, tuple]) -> Dict[str, Dict[str, Dict]]:
+        """
+        批量计算多个交易对的时间框架序列
+
+        相同时间框架、相同 K 线数量的交易对堆叠为 (T, N) 二维数组，
+        全部指标按列向量化计算，每个字段只做一次 NaN 处理和列表转换。
+
+        Args:
+            raw: {symbol: (klines, oi_data, funding_rate)}
+
+        Returns:
+            {symbol: {timeframe: 序列字典}}，时间框架顺序与 klines 一致
+        """
+        groups = {}
+        for symbol, (klines, _, _) in raw.items():
+            for timeframe, df in klines.items():
+                groups.setdefault((timeframe, len(df)), []).append(symbol)
+
+        computed = {symbol: {} for symbol in raw}
+        for (timeframe, _), group in groups.items():
+            def stack(column):
+                return np.column_stack([raw[symbol][0][timeframe][column].to_numpy(dtype=float)
+                                        for symbol in group])
+
+            columns = compute_batch(stack('high'), stack('low'), stack('close'), stack('volume'))
+            data_points = SERIES_POINTS.get(timeframe, 20)
+            for symbol, matrix in zip(group, batch_matrix(columns, data_points)):
+                computed[symbol][timeframe] = self._make_series(timeframe, data_points, matrix)
+
+        return {symbol: {timeframe: computed[symbol][timeframe] for timeframe in klines}
+                for symbol, (klines, _, _) in raw.items()}
+
+    def _build_fetch_tasks(self, symbol: str, timeframes: Dict[str, int]) -> Dict[str, Tuple[Callable, tuple]]:
+        """
+        构建单个交易对的数据请求任务，每个任务执行前先从共享权重预算中扣除对应权重
+
+        Returns:
+            {任务名称: (函数, 参数元组)}
+        """
+        tasks = {}
+        for timeframe, limit in timeframes.items():
+            tasks[f'klines_{timeframe}'] = (self._limited(self._fetch_klines, kline_weight(limit)),
+                                            (symbol, timeframe, limit))
+        # 持仓量 / 资金费率失败时抛出异常，计入 last_fetch_stats['errors'] 和 market.fetch_errors，
+        # 默认值由 _fetch_all / get_complete_data 按失败结果填充
+        tasks['open_interest'] = (self._limited(self._fetch_open_interest, OI_WEIGHT), (symbol,))
+        tasks['funding_rate'] = (self._limited(self._fetch_funding_rate, FUNDING_RATE_WEIGHT), (symbol,))
+        return tasks
+
+    def _limited(self, func: Callable, weight: int) -> Callable:
+        """包装请求函数：调用前阻塞等待权重预算"""
+        def wrapper(*args):
+            self.rate_limiter.acquire(weight)
+            return func(*args)
+        return wrapper
+
+    @staticmethod
+    def _execute_tasks(tasks: Dict, executor: Optional[ThreadPoolExecutor]) -> Dict:
+        """
+        执行一组任务并记录耗时，单个任务失败不影响其他任务
+
+        Args:
+            tasks: {名称: (函数, 参数元组)}
+            executor: 线程池，为 None 时按顺序执行
+
+        Returns:
+            {名称: (结果, 异常, 耗时秒数)}
+        """
+        def timed_call(func, args):
+            start = time.perf_counter()
+            try:
+                return func(*args), None, time.perf_counter() - start
+            except Exception as e:
+                return None, e, time.perf_counter() - start
+
+        if executor is None:
+            return {name: timed_call(func, args) for name, (func, args) in tasks.items()}
+
+        futures = {name: executor.submit(timed_call, func, args) for name, (func, args) in tasks.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+    def _run_tasks(self, tasks: Dict[str, Tuple[Callable, tuple]]) -> Tuple[Dict, Dict]:
+        """
+        执行一组数据请求（并发或顺序），记录每个请求的耗时
+
+        Args:
+            tasks: {名称: (函数, 参数元组)}
+
+        Returns:
+            (results, errors) 元组，分别以任务名称为键
+        """
+        # 先加载市场信息，避免多个线程同时触发 load_markets()
+        self._ensure_markets_loaded()
+
+        wall_start = time.perf_counter()
+        outcomes = self._execute_tasks(tasks, self._executor if self.concurrent else None)
+        wall_seconds = time.perf_counter() - wall_start
+
+        results = {name: value for name, (value, error, _) in outcomes.items() if error is None}
+        errors = {name: error for name, (_, error, _) in outcomes.items() if error is not None}
+        timings = {name: elapsed * 1000 for name, (_, _, elapsed) in outcomes.items()}
+
+        slowest = max(timings, key=timings.get)
+        metrics = get_registry()
+        metrics.observe('market.fetch_ms', wall_seconds * 1000)
+        if errors:
+            metrics.inc('market.fetch_errors', len(errors))
+        self.last_fetch_stats = {
+            'mode': 'concurrent' if self.concurrent else 'sequential',
+            'total_ms': wall_seconds * 1000,
+            'sum_ms': sum(timings.values()),
+            'slowest': slowest,
+            'timings_ms': timings,
+            'errors': {name: str(error) for name, error in errors.items()}
+        }
+
+        print(f"  ✓ 数据请求完成: 总耗时 {wall_seconds * 1000:.0f}ms "
+              f"(各请求合计 {self.last_fetch_stats['sum_ms']:.0f}ms，最慢 {slowest} {timings[slowest]:.0f}ms)")
+        if errors:
+            print(f"  ⚠️ {len(errors)} 个请求失败: {', '.join(errors)}")
+
+        return results, errors
+
+    def start_stream(self, symbol: str = 'BTC/USDT', url: str = BINANCE_FUTURES_WS,
+                     use_proxy: bool = True) -> MarketStream:
+        """
+        启动 WebSocket 行情推送（K 线 + 标记价格/资金费率）
+
+        连接前先用 REST 补齐各时间框架的 K 线，之后由推送实时更新缓冲区，
+        get_btc_complete_data() 在推送就绪时直接返回本地状态。
+
+        Args:
+            symbol: 交易对符号
+            url: WebSocket 组合流地址（测试时可指向本地回放服务）
+            use_proxy: 是否通过代理连接
+
+        Returns:
+            MarketStream 实例
+        """
+        if symbol in self.streams:
+            return self.streams[symbol]
+
+        # 持仓量没有 WebSocket 推送，先同步获取一次，之后在后台定期刷新
+        self._stream_oi[symbol] = (self._get_open_interest(symbol), time.time())
+
+        stream = MarketStream(
+            symbol,
+            KLINE_LIMITS,
+            bootstrap=lambda timeframe, limit: self._fetch_ohlcv(symbol, timeframe, limit),
+            url=url,
+            proxy=self.proxy_url if use_proxy else None,
+            store=self.store
+        )
+        stream.start()
+        self.streams[symbol] = stream
+        return stream
+
+    def stop_streams(self):
+        """停止所有行情推送"""
+        for stream in self.streams.values():
+            stream.stop()
+        self.streams.clear()
+
+    def _read_stream(self, symbol: str) -> Tuple[Dict[str, pd.DataFrame], Dict, float]:
+        """
+        从行情推送缓冲区读取数据（不发起任何网络请求）
+
+        Returns:
+            (klines, oi_data, funding_rate) 元组，结构与 _fetch_all() 一致
+        """
+        stream = self.streams[symbol]
+        klines = {timeframe: self._to_dataframe(stream.klines(timeframe)) for timeframe in KLINE_LIMITS}
+
+        oi_data, fetched_at = self._stream_oi.get(symbol, ({'latest': 0.0, 'average': 0.0}, 0.0))
+        if time.time() - fetched_at > OI_REFRESH_SECONDS and symbol not in self._oi_refreshing:
+            self._oi_refreshing.add(symbol)
+            self._executor.submit(self._refresh_stream_oi, symbol)
+
+        funding_rate = stream.funding_rate
+        if funding_rate is None:
+            funding_rate = self._get_funding_rate(symbol)
+
+        self.last_fetch_stats = {
+            'mode': 'stream',
+            'total_ms': 0.0,
+            'messages': stream.message_count,
+            'reconnects': stream.reconnect_count,
+            'age_ms': (time.time() - stream.last_message_time) * 1000
+        }
+        return klines, oi_data, funding_rate
+
+    def _refresh_stream_oi(self, symbol: str):
+        """后台刷新推送模式下的持仓量"""
+        try:
+            self._stream_oi[symbol] = (self._get_open_interest(symbol), time.time())
+        finally:
+            self._oi_refreshing.discard(symbol)
+
+    def _ensure_markets_loaded(self):
+        """加载交易所市场信息（只加载一次，线程安全）"""
+        with self._markets_lock:
+            if not self.exchange.markets:
+                self.exchange.load_markets()
+
+    def _build_complete_data(self, symbol: str, klines: Dict[str, pd.DataFrame],
+                             oi_data: Dict, funding_rate: float, verbose: bool = True,
+                             series: Optional[Dict[str, Dict]] = None) -> Dict:
+        """
+        基于已获取的原始数据计算指标，组装完整市场数据
+
+        Args:
+            symbol: 交易对符号，如 'BTC/USDT'
+            klines: 各时间框架 K 线，如 {'3m': df, '15m': df, '1h': df, '4h': df}（按周期从短到长）
+            oi_data: 持仓量数据
+            funding_rate: 资金费率
+            verbose: 是否打印进度
+            series: 已批量计算好的各时间框架序列（为 None 时逐个时间框架计算）
+
+        Returns:
+            完整市场数据字典（snapshot 模式下为 MarketSnapshot）
+        """
+        # 当前指标基于最短时间框架（默认 3 分钟）的最新数据
+        primary = next(iter(klines))
+        primary_close = klines[primary]['close']
+
+        # 计算各时间框架的价格变化百分比
+        price_changes = {}
+        for timeframe in ('15m', '1h', '4h'):
+            if timeframe in klines:
+                price_changes[timeframe] = self._calculate_price_change(klines[timeframe]['close'], periods=1)
+        if '1h' in klines:
+            price_changes['24h'] = self._calculate_price_change(klines['1h']['close'], periods=24)   # 24 个 1小时前
+
+        # 计算各时间框架的技术指标序列
+        if series is None:
+            if verbose:
+                print("  计算技术指标...")
+            series = {}
+            for timeframe, df in klines.items():
+                if self.incremental:
+                    series[timeframe] = self._calculate_incremental_series(symbol, df, timeframe)
+                else:
+                    series[timeframe] = self._calculate_timeframe_series(df, timeframe)
+
+        # 当前指标直接取最短时间框架序列的最新值（与单独计算 EMA20/MACD/RSI7 的结果相同）
+        current_price = primary_close.iloc[-1]
+        current = series[primary]['current']
+        current_ema20 = current['ema20']
+        current_macd = current['macd']
+        current_rsi7 = current['rsi7']
+
+        if self.snapshot:
+            return MarketSnapshot(
+                symbol=symbol.replace('/', ''),
+                current_price=current_price,
+                price_changes=price_changes,
+                current_ema20=current_ema20,
+                current_macd=current_macd,
+                current_rsi7=current_rsi7,
+                open_interest=oi_data,
+                funding_rate=funding_rate,
+                timeframes=series,
+                timestamp=datetime.now().isoformat()
+            )
+
+        result = {
+            'symbol': symbol.replace('/', ''),
             'current_price': current_price,
-            'price_changes': {
-                '15m': price_change_15m,
-                '1h': price_change_1h,
-                '4h': price_change_4h,
-                '24h': price_change_24h
-            },
+            'price_changes': price_changes,
             'current_ema20': current_ema20,
             'current_macd': current_macd,
             'current_rsi7': current_rsi7,
             'open_interest': oi_data,
-            'funding_rate': funding_rate,
-            # 多时间框架数据
-            'timeframe_3m': series_3m,
-            'timeframe_15m': series_15m,
-            'timeframe_1h': series_1h,
-            'timeframe_4h': series_4h,
-            'timestamp': datetime.now().isoformat()
+            'funding_rate': funding_rate
         }
+        # 多时间框架数据
+        for timeframe, timeframe_series in series.items():
+            result[f'timeframe_{timeframe}'] = timeframe_series
+        result['timestamp'] = datetime.now().isoformat()
+        return result
 
     def _fetch_klines(self, symbol: str, timeframe: str, limit: int = 100) -> pd.DataFrame:
         """
@@ -114,14 +558,48 @@ class MarketData:
             DataFrame with columns: timestamp, open, high, low, close, volume
         """
         try:
-            ohlcv = self.exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
-            df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-            return df
+            return self._to_dataframe(self._fetch_ohlcv(symbol, timeframe, limit))
         except Exception as e:
             print(f"获取 K 线数据失败: {e}")
             raise
 
+    def _fetch_ohlcv(self, symbol: str, timeframe: str, limit: int) -> List[List[float]]:
+        """获取 CCXT 格式的原始 K 线（配置了本地缓存时增量获取）"""
+        if self.store is not None:
+            return self._fetch_klines_incremental(symbol, timeframe, limit)
+        return self.exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
+
+    @staticmethod
+    def _to_dataframe(ohlcv: List[List[float]]) -> pd.DataFrame:
+        """CCXT 格式 K 线转为 DataFrame（timestamp 转为 datetime）"""
+        df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+        return df
+
+    def _fetch_klines_incremental(self, symbol: str, timeframe: str, limit: int) -> List[List[float]]:
+        """
+        增量获取 K 线：只请求本地缓存最后一根 K 线之后的数据，合并后从缓存读取
+
+        最后一根缓存 K 线可能在写入时尚未收盘，因此从它的时间戳开始重新获取并覆盖。
+        缓存为空或断档超过单次请求上限时，退化为全量获取 limit 根。
+
+        Returns:
+            CCXT 格式的 K 线列表（最近 limit 根）
+        """
+        last_ts = self.store.last_timestamp(symbol, timeframe)
+        timeframe_ms = self.exchange.parse_timeframe(timeframe) * 1000
+        now_ms = self.exchange.milliseconds()
+
+        missing = (now_ms - last_ts) // timeframe_ms + 1 if last_ts is not None else None
+        if missing is None or missing > MAX_FETCH_LIMIT:
+            new_rows = self.exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
+        else:
+            new_rows = self.exchange.fetch_ohlcv(symbol, timeframe, since=last_ts,
+                                                 limit=max(int(missing), 2))
+
+        self.store.upsert(symbol, timeframe, new_rows)
+        return self.store.load(symbol, timeframe, limit)
+
     def _calculate_ema(self, close_prices: pd.Series, period: int) -> float:
         """计算 EMA（指数移动平均线）"""
         ema_values = talib.EMA(close_prices.values, timeperiod=period)
@@ -169,32 +647,45 @@ class MarketData:
             return ((current_price - past_price) / past_price) * 100
         return 0.0
 
+    def _fetch_open_interest(self, symbol: str) -> Dict:
+        """
+        获取持仓量数据（失败时抛出异常，由调用方决定默认值）
+
+        Returns:
+            {'latest': float, 'average': float}
+        """
+        # 使用 CCXT 标准方法获取持仓量
+        oi_data = self.exchange.fetch_open_interest(symbol)
+        latest_oi = float(oi_data['openInterestAmount']) if 'openInterestAmount' in oi_data else 0.0
+
+        return {
+            'latest': latest_oi,
+            'average': latest_oi  # 简化处理，可以后续优化计算平均值
+        }
+
+    def _fetch_funding_rate(self, symbol: str) -> float:
+        """获取资金费率（失败时抛出异常，由调用方决定默认值）"""
+        # 使用 CCXT 标准方法获取资金费率
+        funding_rate = self.exchange.fetch_funding_rate(symbol)
+        return float(funding_rate['fundingRate']) if 'fundingRate' in funding_rate else 0.0
+
     def _get_open_interest(self, symbol: str) -> Dict:
         """
-        获取持仓量数据
+        获取持仓量数据（失败时返回 0，用于行情推送模式的单独请求）
 
         Returns:
             {'latest': float, 'average': float}
         """
         try:
-            # 使用 CCXT 标准方法获取持仓量
-            oi_data = self.exchange.fetch_open_interest(symbol)
-            latest_oi = float(oi_data['openInterestAmount']) if 'openInterestAmount' in oi_data else 0.0
-
-            return {
-                'latest': latest_oi,
-                'average': latest_oi  # 简化处理，可以后续优化计算平均值
-            }
+            return self._fetch_open_interest(symbol)
         except Exception as e:
             print(f"获取持仓量失败: {e}")
             return {'latest': 0.0, 'average': 0.0}
 
     def _get_funding_rate(self, symbol: str) -> float:
-        """获取资金费率"""
+        """获取资金费率（失败时返回 0，用于行情推送模式的单独请求）"""
         try:
-            # 使用 CCXT 标准方法获取资金费率
-            funding_rate = self.exchange.fetch_funding_rate(symbol)
-            return float(funding_rate['fundingRate']) if 'fundingRate' in funding_rate else 0.0
+            return self._fetch_funding_rate(symbol)
         except Exception as e:
             print(f"获取资金费率失败: {e}")
             return 0.0
@@ -217,10 +708,10 @@ class MarketData:
 
         return {
             'mid_prices': close_prices.tolist()[-20:],  # 最近 20 个价格点
-            'ema20_values': [float(v) if not np.isnan(v) else 0 for v in ema20_values[-20:]],
-            'macd_values': [float(v) if not np.isnan(v) else 0 for v in macd_values[-20:]],
-            'rsi7_values': [float(v) if not np.isnan(v) else 0 for v in rsi7_values[-20:]],
-            'rsi14_values': [float(v) if not np.isnan(v) else 0 for v in rsi14_values[-20:]]
+            'ema20_values': tail_list(ema20_values, 20),
+            'macd_values': tail_list(macd_values, 20),
+            'rsi7_values': tail_list(rsi7_values, 20),
+            'rsi14_values': tail_list(rsi14_values, 20)
         }
 
     def _calculate_longer_term_data(self, klines_4h: pd.DataFrame) -> Dict:
@@ -256,10 +747,51 @@ class MarketData:
             'atr14': atr14,
             'current_volume': float(current_volume),
             'average_volume': float(average_volume),
-            'macd_values': [float(v) if not np.isnan(v) else 0 for v in macd_values[-10:]],
-            'rsi14_values': [float(v) if not np.isnan(v) else 0 for v in rsi14_values[-10:]]
+            'macd_values': tail_list(macd_values, 10),
+            'rsi14_values': tail_list(rsi14_values, 10)
         }
 
+    def _calculate_incremental_series(self, symbol: str, klines: pd.DataFrame, timeframe: str) -> Dict:
+        """
+        用增量指标引擎计算时间框架序列
+
+        只把引擎尚未见过的已收盘 K 线提交进状态，最后一根（未收盘）K 线仅做预览，
+        因此每个周期只有新收盘的 1~2 根 K 线需要计算。
+        引擎首次使用或 K 线出现断档时，用本次获取的全部 K 线重新预热。
+
+        Args:
+            symbol: 交易对符号
+            klines: K线数据 DataFrame（最后一根为实时 K 线）
+            timeframe: 时间框架标识 ("3m", "15m", "1h", "4h")
+
+        Returns:
+            与 _calculate_timeframe_series 结构一致的字典
+        """
+        timestamps = ((klines['timestamp'] - pd.Timestamp(0)) // pd.Timedelta(milliseconds=1)).to_numpy()
+        timeframe_ms = ccxt.Exchange.parse_timeframe(timeframe) * 1000
+
+        key = (symbol, timeframe)
+        engine = self._engines.get(key)
+        if engine is None or engine.last_closed_ts is None or timestamps[0] > engine.last_closed_ts + timeframe_ms:
+            engine = TimeframeIndicators(timeframe, history=max(KLINE_LIMITS.values()))
+            self._engines[key] = engine
+
+        highs = klines['high'].to_numpy()
+        lows = klines['low'].to_numpy()
+        closes = klines['close'].to_numpy()
+        volumes = klines['volume'].to_numpy()
+
+        last = len(klines) - 1
+        for i in range(last + 1):
+            closed = i < last
+            if closed and engine.last_closed_ts is not None and timestamps[i] <= engine.last_closed_ts:
+                continue
+            engine.update(int(timestamps[i]), float(highs[i]), float(lows[i]),
+                          float(closes[i]), float(volumes[i]), closed=closed)
+
+        data_points = SERIES_POINTS.get(timeframe, 20)
+        return self._make_series(timeframe, data_points, engine.series_matrix(data_points))
+
     def _calculate_timeframe_series(self, klines: pd.DataFrame, timeframe: str) -> Dict:
         """
         计算单个时间框架的完整技术指标序列（统一处理）
@@ -277,14 +809,7 @@ class MarketData:
         volumes = klines['volume'].values
 
         # 决定返回多少个数据点（短周期返回更多）
-        if timeframe == "3m":
-            data_points = 30  # 30个点 = 90分钟
-        elif timeframe == "15m":
-            data_points = 24  # 24个点 = 6小时
-        elif timeframe == "1h":
-            data_points = 24  # 24个点 = 1天
-        else:  # 4h
-            data_points = 20  # 20个点 = 3.3天
+        data_points = SERIES_POINTS.get(timeframe, 20)
 
         # 计算技术指标序列
         ema20_values = talib.EMA(close_prices, timeperiod=20)
@@ -300,51 +825,48 @@ class MarketData:
         # 成交量均线
         volume_ma = talib.SMA(volumes, timeperiod=20)
 
-        # 转换为 Python 列表，处理 NaN
-        def to_list(arr, n):
-            """转换数组为列表，取最后 n 个点"""
-            return [float(v) if not np.isnan(v) else 0 for v in arr[-n:]]
-
-        return {
-            'timeframe': timeframe,
-            'data_points': data_points,
+        # 取最近 data_points 个值（每个序列一次切片 + 向量化 NaN 处理）
+        columns = {
             # 价格数据
-            'prices': to_list(close_prices, data_points),
-            'highs': to_list(high_prices, data_points),
-            'lows': to_list(low_prices, data_points),
+            'prices': tail_array(close_prices, data_points),
+            'highs': tail_array(high_prices, data_points),
+            'lows': tail_array(low_prices, data_points),
             # 均线
-            'ema20': to_list(ema20_values, data_points),
-            'ema50': to_list(ema50_values, data_points),
+            'ema20': tail_array(ema20_values, data_points),
+            'ema50': tail_array(ema50_values, data_points),
             # MACD
-            'macd': to_list(macd_values, data_points),
-            'macd_signal': to_list(macd_signal, data_points),
-            'macd_hist': to_list(macd_hist, data_points),
+            'macd': tail_array(macd_values, data_points),
+            'macd_signal': tail_array(macd_signal, data_points),
+            'macd_hist': tail_array(macd_hist, data_points),
             # RSI
-            'rsi7': to_list(rsi7_values, data_points),
-            'rsi14': to_list(rsi14_values, data_points),
+            'rsi7': tail_array(rsi7_values, data_points),
+            'rsi14': tail_array(rsi14_values, data_points),
             # ATR
-            'atr14': to_list(atr14_values, data_points),
+            'atr14': tail_array(atr14_values, data_points),
             # 布林带
-            'bb_upper': to_list(upper_band, data_points),
-            'bb_middle': to_list(middle_band, data_points),
-            'bb_lower': to_list(lower_band, data_points),
+            'bb_upper': tail_array(upper_band, data_points),
+            'bb_middle': tail_array(middle_band, data_points),
+            'bb_lower': tail_array(lower_band, data_points),
             # 成交量
-            'volumes': to_list(volumes, data_points),
-            'volume_ma': to_list(volume_ma, data_points),
-            # 当前值（最新一根K线的指标值）
-            'current': {
-                'price': float(close_prices[-1]),
-                'ema20': float(ema20_values[-1]) if not np.isnan(ema20_values[-1]) else 0,
-                'ema50': float(ema50_values[-1]) if not np.isnan(ema50_values[-1]) else 0,
-                'macd': float(macd_values[-1]) if not np.isnan(macd_values[-1]) else 0,
-                'rsi7': float(rsi7_values[-1]) if not np.isnan(rsi7_values[-1]) else 0,
-                'rsi14': float(rsi14_values[-1]) if not np.isnan(rsi14_values[-1]) else 0,
-                'atr14': float(atr14_values[-1]) if not np.isnan(atr14_values[-1]) else 0,
-                'volume': float(volumes[-1]),
-                'volume_ma': float(volume_ma[-1]) if not np.isnan(volume_ma[-1]) else 0
-            }
+            'volumes': tail_array(volumes, data_points),
+            'volume_ma': tail_array(volume_ma, data_points)
         }
 
+        # 'current' 为最新一根K线的指标值
+        matrix = np.vstack([columns[field] for field in SERIES_FIELDS])
+        return self._make_series(timeframe, data_points, matrix)
+
+    def _make_series(self, timeframe: str, data_points: int, matrix: np.ndarray):
+        """
+        把 (len(SERIES_FIELDS), n) 的指标矩阵包装为时间框架序列
+
+        Returns:
+            snapshot 模式下为 TimeframeSeries（直接持有数组），否则为序列字典
+        """
+        if self.snapshot:
+            return TimeframeSeries(timeframe, data_points, matrix)
+        return matrix_to_dict(timeframe, data_points, matrix)
+
 
 def format_market_data_for_display(data: Dict) -> str:
     """
@@ -0,0 +1,157 @@
+"""
+紧凑的市场数据快照
+用连续的 numpy 数组保存各时间框架的指标序列，替代嵌套的 dict-of-lists，
+同时实现只读 Mapping 接口，prompt 构建函数可以像访问原字典一样直接读取（序列返回数组视图，不复制）
+"""
+
+from collections.abc import Mapping
+from typing import Dict, Optional
+
+import numpy as np
+
+from indicators import SERIES_FIELDS, CURRENT_FIELDS
+
+
+_FIELD_INDEX = {field: i for i, field in enumerate(SERIES_FIELDS)}
+_CURRENT_INDEX = tuple((key, _FIELD_INDEX[field]) for key, field in CURRENT_FIELDS)
+
+
+class TimeframeSeries(Mapping):
+    """
+    单个时间框架的指标序列
+
+    所有字段保存在一个形状为 (len(SERIES_FIELDS), n) 的 float64 数组中，
+    tf['prices'] 等返回该数组对应行的视图，tf['current'] 首次访问时生成并缓存。
+    """
+
+    __slots__ = ('timeframe', 'data_points', 'values', '_current')
+
+    def __init__(self, timeframe: str, data_points: int, values: np.ndarray):
+        """
+        Args:
+            timeframe: 时间框架标识
+            data_points: 数据点数量
+            values: 形状 (len(SERIES_FIELDS), n) 的数组，NaN 已处理为 0
+        """
+        self.timeframe = timeframe
+        self.data_points = data_points
+        self.values = values
+        self._current = None
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'TimeframeSeries':
+        """从旧的字典结构构建"""
+        values = np.array([data[field] for field in SERIES_FIELDS], dtype=np.float64)
+        return cls(data['timeframe'], data['data_points'], values)
+
+    @property
+    def current(self) -> Dict[str, float]:
+        """最新一根 K 线的指标值（结构同旧字典的 'current'）"""
+        if self._current is None:
+            if self.values.shape[1] == 0:
+                self._current = {key: 0.0 for key, _ in _CURRENT_INDEX}
+            else:
+                last = self.values[:, -1].tolist()
+                self._current = {key: last[i] for key, i in _CURRENT_INDEX}
+        return self._current
+
+    def __getitem__(self, key: str):
+        index = _FIELD_INDEX.get(key)
+        if index is not None:
+            return self.values[index]
+        if key == 'current':
+            return self.current
+        if key == 'timeframe':
+            return self.timeframe
+        if key == 'data_points':
+            return self.data_points
+        raise KeyError(key)
+
+    def __iter__(self):
+        yield 'timeframe'
+        yield 'data_points'
+        yield from SERIES_FIELDS
+        yield 'current'
+
+    def __len__(self) -> int:
+        return len(SERIES_FIELDS) + 3
+
+    def to_dict(self) -> Dict:
+        """转换为旧的字典结构（向后兼容，用于日志和 JSON 序列化）"""
+        result = {'timeframe': self.timeframe, 'data_points': self.data_points}
+        result.update(zip(SERIES_FIELDS, self.values.tolist()))
+        result['current'] = dict(self.current)
+        return result
+
+
+class MarketSnapshot(Mapping):
+    """
+    完整市场数据快照（结构与 MarketData.get_btc_complete_data() 返回的字典一致）
+
+    snapshot['timeframe_1h'] 返回 TimeframeSeries，其余键返回对应的标量或小字典。
+    """
+
+    __slots__ = ('symbol', 'current_price', 'price_changes', 'current_ema20', 'current_macd',
+                 'current_rsi7', 'open_interest', 'funding_rate', 'timeframes', 'timestamp')
+
+    _SCALAR_KEYS = ('symbol', 'current_price', 'price_changes', 'current_ema20', 'current_macd',
+                    'current_rsi7', 'open_interest', 'funding_rate')
+
+    def __init__(self, symbol: str, current_price: float, price_changes: Dict[str, float],
+                 current_ema20: float, current_macd: float, current_rsi7: float,
+                 open_interest: Dict, funding_rate: float,
+                 timeframes: Dict[str, TimeframeSeries], timestamp: Optional[str] = None):
+        self.symbol = symbol
+        self.current_price = current_price
+        self.price_changes = price_changes
+        self.current_ema20 = current_ema20
+        self.current_macd = current_macd
+        self.current_rsi7 = current_rsi7
+        self.open_interest = open_interest
+        self.funding_rate = funding_rate
+        self.timeframes = timeframes
+        self.timestamp = timestamp
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'MarketSnapshot':
+        """从旧的字典结构构建"""
+        timeframes = {key[len('timeframe_'):]: TimeframeSeries.from_dict(value)
+                      for key, value in data.items() if key.startswith('timeframe_')}
+        return cls(timeframes=timeframes, timestamp=data.get('timestamp'),
+                   **{key: data[key] for key in cls._SCALAR_KEYS})
+
+    def __getitem__(self, key: str):
+        if key.startswith('timeframe_'):
+            series = self.timeframes.get(key[len('timeframe_'):])
+            if series is None:
+                raise KeyError(key)
+            return series
+        if key in self._SCALAR_KEYS or key == 'timestamp':
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __iter__(self):
+        yield from self._SCALAR_KEYS
+        for timeframe in self.timeframes:
+            yield f'timeframe_{timeframe}'
+        yield 'timestamp'
+
+    def __len__(self) -> int:
+        return len(self._SCALAR_KEYS) + len(self.timeframes) + 1
+
+    def to_dict(self) -> Dict:
+        """转换为旧的字典结构（向后兼容，用于日志和 JSON 序列化）"""
+        result = {key: getattr(self, key) for key in self._SCALAR_KEYS}
+        result['price_changes'] = dict(self.price_changes)
+        result['open_interest'] = dict(self.open_interest)
+        for timeframe, series in self.timeframes.items():
+            result[f'timeframe_{timeframe}'] = series.to_dict()
+        result['timestamp'] = self.timestamp
+        return result
+
+
+def to_plain_dict(market_data) -> Dict:
+    """市场数据转为普通字典（MarketSnapshot 调用 to_dict()，字典原样返回）"""
+    if isinstance(market_data, MarketSnapshot):
+        return market_data.to_dict()
+    return market_data
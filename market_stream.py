@@ -0,0 +1,201 @@
+"""
+WebSocket 行情推送模块
+订阅 Binance 合约 K 线（多时间框架）和标记价格（含资金费率）推送，
+在内存中为每个时间框架维护滚动 K 线缓冲区，供 MarketData 直接读取本地状态
+"""
+
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+import aiohttp
+
+
+# Binance U 本位合约组合流地址
+BINANCE_FUTURES_WS = 'wss://fstream.binance.com/stream'
+
+# 超过该时长没有收到任何推送，视为数据过期（标记价格每秒推送一次）
+STALE_SECONDS = 30
+
+# 断线重连的最大等待时间（秒）
+MAX_RECONNECT_DELAY = 60
+
+
+class MarketStream:
+    """单个交易对的 WebSocket 行情流（后台线程运行 asyncio 事件循环）"""
+
+    def __init__(self, symbol: str, buffer_sizes: Dict[str, int],
+                 bootstrap: Optional[Callable[[str, int], List[List[float]]]] = None,
+                 url: str = BINANCE_FUTURES_WS, proxy: Optional[str] = None, store=None):
+        """
+        Args:
+            symbol: 交易对符号，如 'BTC/USDT'
+            buffer_sizes: {时间框架: 缓冲区 K 线数量}，如 {'3m': 40, '4h': 60}
+            bootstrap: 连接（及重连）前用于补齐历史 K 线的函数 (timeframe, limit) -> ohlcv 列表
+            url: WebSocket 组合流地址
+            proxy: HTTP 代理地址
+            store: 可选的 OHLCVStore，收盘 K 线会同步写入本地缓存
+        """
+        self.symbol = symbol
+        self.buffer_sizes = dict(buffer_sizes)
+        self.bootstrap = bootstrap
+        self.proxy = proxy
+        self.store = store
+
+        stream_symbol = symbol.replace('/', '').lower()
+        streams = [f"{stream_symbol}@kline_{tf}" for tf in self.buffer_sizes]
+        streams.append(f"{stream_symbol}@markPrice@1s")
+        self.url = f"{url}?streams={'/'.join(streams)}"
+
+        self._lock = threading.Lock()
+        self._buffers = {tf: deque(maxlen=size) for tf, size in self.buffer_sizes.items()}
+
+        # 标记价格推送中的最新值
+        self.mark_price = None
+        self.funding_rate = None
+        self.next_funding_time = None
+
+        # 标记价格回调 listener(symbol, price)，每次 markPriceUpdate 推送时调用（在后台线程中）
+        self.price_listeners: List[Callable[[str, float], None]] = []
+
+        # 连接状态
+        self.connected = False
+        self.last_message_time = 0.0
+        self.message_count = 0
+        self.reconnect_count = 0
+
+        self._thread = None
+        self._loop = None
+        self._task = None
+
+    def start(self):
+        """在后台线程中启动行情流"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._thread_main, name=f'market-stream-{self.symbol}',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """停止行情流并等待后台线程退出"""
+        if self._loop and self._task:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        if self._thread:
+            self._thread.join(timeout)
+        self.connected = False
+
+    def is_ready(self) -> bool:
+        """连接正常、各时间框架都有数据且推送未过期"""
+        if not self.connected:
+            return False
+        if time.time() - self.last_message_time > STALE_SECONDS:
+            return False
+        with self._lock:
+            return all(len(buffer) > 0 for buffer in self._buffers.values())
+
+    def klines(self, timeframe: str) -> List[List[float]]:
+        """
+        读取某个时间框架缓冲区中的 K 线（按时间升序，最后一根为实时 K 线）
+
+        Returns:
+            CCXT 格式的 K 线列表副本
+        """
+        with self._lock:
+            return [list(candle) for candle in self._buffers[timeframe]]
+
+    def _thread_main(self):
+        """后台线程入口"""
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._task = self._loop.create_task(self._run())
+        try:
+            self._loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._loop.close()
+
+    async def _run(self):
+        """连接、接收推送、断线后指数退避重连"""
+        delay = 1
+        while True:
+            try:
+                await self._bootstrap_buffers()
+                async with aiohttp.ClientSession() as session:
+                    async with session.ws_connect(self.url, proxy=self.proxy, heartbeat=30) as ws:
+                        self.connected = True
+                        delay = 1
+                        async for msg in ws:
+                            if msg.type == aiohttp.WSMsgType.TEXT:
+                                self._handle_message(json.loads(msg.data))
+                            elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ 行情推送连接异常: {e}")
+            finally:
+                self.connected = False
+
+            self.reconnect_count += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    async def _bootstrap_buffers(self):
+        """用 REST 数据补齐缓冲区（首次连接和断线重连时），避免断线期间缺失 K 线"""
+        if self.bootstrap is None:
+            return
+
+        loop = asyncio.get_running_loop()
+        for timeframe, size in self.buffer_sizes.items():
+            try:
+                ohlcv = await loop.run_in_executor(None, self.bootstrap, timeframe, size)
+            except Exception as e:
+                print(f"⚠️ {timeframe} K 线补齐失败，沿用现有缓冲区: {e}")
+                continue
+            with self._lock:
+                buffer = self._buffers[timeframe]
+                buffer.clear()
+                buffer.extend([list(candle[:6]) for candle in ohlcv])
+
+    def _handle_message(self, message: Dict):
+        """处理一条推送（兼容组合流 {'stream', 'data'} 和单一流两种格式）"""
+        data = message.get('data', message)
+        event = data.get('e')
+
+        if event == 'kline':
+            self._handle_kline(data['k'])
+        elif event == 'markPriceUpdate':
+            self.mark_price = float(data['p'])
+            if data.get('r') not in (None, ''):
+                self.funding_rate = float(data['r'])
+            self.next_funding_time = data.get('T')
+            for listener in self.price_listeners:
+                try:
+                    listener(self.symbol, self.mark_price)
+                except Exception as e:
+                    print(f"⚠️ 标记价格回调失败: {e}")
+
+        self.last_message_time = time.time()
+        self.message_count += 1
+
+    def _handle_kline(self, k: Dict):
+        """更新 K 线缓冲区：同一开盘时间覆盖（实时 K 线跳动），更新的时间追加"""
+        timeframe = k['i']
+        if timeframe not in self._buffers:
+            return
+
+        candle = [int(k['t']), float(k['o']), float(k['h']), float(k['l']), float(k['c']), float(k['v'])]
+        with self._lock:
+            buffer = self._buffers[timeframe]
+            if buffer and buffer[-1][0] == candle[0]:
+                buffer[-1] = candle
+            elif not buffer or candle[0] > buffer[-1][0]:
+                buffer.append(candle)
+
+        # 收盘 K 线写入本地缓存
+        if k.get('x') and self.store is not None:
+            self.store.upsert(self.symbol, timeframe, [candle])
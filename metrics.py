@@ -0,0 +1,107 @@
+"""
+进程内指标注册表
+计数器 + 滚动窗口直方图（最近 N 个样本的 p50 / p95 / p99），线程安全
+
+DeepSeek 调用的 token 用量、首字节时间、总耗时、重试次数、HTTP 状态，
+以及行情请求耗时、HTTP 握手耗时都记录在默认注册表中，快照写入分析日志，
+用于确定分析间隔、规划 token 预算，以及区分变慢发生在模型侧还是本地
+"""
+
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+import numpy as np
+
+
+class RollingHistogram:
+    """保留最近 window 个样本的直方图，按需计算分位数"""
+
+    def __init__(self, window: int = 500):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def summary(self) -> Dict:
+        """窗口内的分位数（count / sum 为累计值）"""
+        if not self.samples:
+            return {'count': self.count, 'sum': self.total}
+        values = np.fromiter(self.samples, dtype=np.float64, count=len(self.samples))
+        p50, p95, p99 = np.percentile(values, (50, 95, 99))
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'window': len(values),
+            'mean': float(values.mean()),
+            'p50': float(p50),
+            'p95': float(p95),
+            'p99': float(p99),
+            'max': float(values.max()),
+            'last': float(values[-1])
+        }
+
+
+class MetricsRegistry:
+    """计数器和滚动直方图的注册表（按名称自动创建）"""
+
+    def __init__(self, window: int = 500):
+        """
+        Args:
+            window: 每个直方图保留的最近样本数
+        """
+        self.window = window
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, amount: float = 1):
+        """计数器累加"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name: str, value: Optional[float]):
+        """记录一个样本（None 忽略，便于直接传入可能缺失的耗时）"""
+        if value is None:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = RollingHistogram(self.window)
+            histogram.observe(value)
+
+    def summary(self, name: str) -> Dict:
+        """单个直方图的分位数"""
+        with self._lock:
+            histogram = self.histograms.get(name)
+            return histogram.summary() if histogram else {'count': 0, 'sum': 0.0}
+
+    def snapshot(self) -> Dict:
+        """所有计数器和直方图分位数"""
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'histograms': {name: h.summary() for name, h in self.histograms.items()}
+            }
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> MetricsRegistry:
+    """进程内默认注册表"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry()
+        return _registry
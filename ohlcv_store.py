@@ -0,0 +1,132 @@
+"""
+本地 K 线存储模块
+使用 SQLite 持久化各交易对、各时间框架的 OHLCV 数据
+配合 MarketData 实现增量获取：只向交易所请求最后一根已缓存 K 线之后的数据
+"""
+
+import os
+import sqlite3
+import threading
+from typing import List, Optional
+
+
+class OHLCVStore:
+    """K 线本地存储（SQLite，按 symbol + timeframe + 时间戳索引）"""
+
+    def __init__(self, db_path: str):
+        """
+        打开（或创建）K 线数据库
+
+        Args:
+            db_path: SQLite 数据库文件路径
+        """
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self.db_path = db_path
+        # MarketData 会在多个线程中并发读写，统一用一个锁串行化
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS candles (
+                symbol TEXT NOT NULL,
+                timeframe TEXT NOT NULL,
+                ts INTEGER NOT NULL,
+                open REAL NOT NULL,
+                high REAL NOT NULL,
+                low REAL NOT NULL,
+                close REAL NOT NULL,
+                volume REAL NOT NULL,
+                PRIMARY KEY (symbol, timeframe, ts)
+            ) WITHOUT ROWID
+        """)
+        self._conn.commit()
+
+    def last_timestamp(self, symbol: str, timeframe: str) -> Optional[int]:
+        """
+        获取已缓存的最后一根 K 线时间戳（毫秒）
+
+        Returns:
+            时间戳，没有缓存时返回 None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(ts) FROM candles WHERE symbol = ? AND timeframe = ?",
+                (symbol, timeframe)
+            ).fetchone()
+        return row[0] if row else None
+
+    def upsert(self, symbol: str, timeframe: str, ohlcv: List[List[float]]):
+        """
+        写入 K 线（相同时间戳覆盖，用于更新未收盘的 K 线）
+
+        Args:
+            symbol: 交易对符号
+            timeframe: 时间框架
+            ohlcv: CCXT 格式 [[timestamp, open, high, low, close, volume], ...]
+        """
+        if not ohlcv:
+            return
+
+        rows = [(symbol, timeframe, int(c[0]), float(c[1]), float(c[2]),
+                 float(c[3]), float(c[4]), float(c[5])) for c in ohlcv]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO candles VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def load(self, symbol: str, timeframe: str, limit: int,
+             end_ts: Optional[int] = None) -> List[List[float]]:
+        """
+        读取最近 limit 根 K 线（按时间升序）
+
+        Args:
+            symbol: 交易对符号
+            timeframe: 时间框架
+            limit: 数量
+            end_ts: 只读取该时间戳（含）之前的 K 线，默认读取到最新
+
+        Returns:
+            CCXT 格式的 K 线列表
+        """
+        sql = "SELECT ts, open, high, low, close, volume FROM candles WHERE symbol = ? AND timeframe = ?"
+        params = [symbol, timeframe]
+        if end_ts is not None:
+            sql += " AND ts <= ?"
+            params.append(end_ts)
+        sql += " ORDER BY ts DESC LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [list(row) for row in reversed(rows)]
+
+    def load_range(self, symbol: str, timeframe: str, start_ts: int, end_ts: int) -> List[List[float]]:
+        """
+        读取时间范围内的 K 线（按时间升序，用于历史回放）
+
+        Args:
+            symbol: 交易对符号
+            timeframe: 时间框架
+            start_ts: 起始时间戳（毫秒，含）
+            end_ts: 结束时间戳（毫秒，不含）
+
+        Returns:
+            CCXT 格式的 K 线列表
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT ts, open, high, low, close, volume FROM candles "
+                "WHERE symbol = ? AND timeframe = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                (symbol, timeframe, int(start_ts), int(end_ts))
+            ).fetchall()
+        return [list(row) for row in rows]
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
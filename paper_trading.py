@@ -0,0 +1,389 @@
+"""
+模拟交易账户（纸面交易）
+把 AI 的开仓 / 平仓决策按杠杆和保证金记入虚拟账户（逐仓，不对接交易所）：
+- 持仓按列保存在 NumPy 数组中（交易对编号、方向、入场价、数量、杠杆、保证金、止损、止盈、强平价），
+  每次价格更新对全部持仓向量化盯市，每个持仓的工作量为 O(1)，只有触发平仓的持仓才逐个处理
+- 两次 AI 分析之间用 K 线的最高 / 最低价检查止损、止盈和强平（同一根 K 线同时触及时按止损 / 强平计），
+  按触发价成交
+- 账户净值、可用余额、保证金使用率、持仓列表和历史交易的结构与 prompts_trading 使用的一致
+"""
+
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+# Binance 合约 taker 手续费率
+DEFAULT_FEE_RATE = 0.0004
+
+# 维持保证金率（BTC 合约第一档）
+DEFAULT_MAINTENANCE_MARGIN_RATE = 0.004
+
+OPEN_ACTIONS = {'open_long': 1.0, 'open_short': -1.0}
+CLOSE_ACTIONS = {'close_long': 1.0, 'close_short': -1.0}
+
+# 持仓数组的列
+_COLUMNS = ('symbol', 'side', 'entry', 'quantity', 'leverage', 'margin', 'stop_loss', 'take_profit',
+            'liquidation', 'opened_at')
+
+
+class PaperAccount:
+    """向量化的模拟交易账户（线程安全）"""
+
+    def __init__(self, initial_balance: float = 1000.0, fee_rate: float = DEFAULT_FEE_RATE,
+                 maintenance_margin_rate: float = DEFAULT_MAINTENANCE_MARGIN_RATE,
+                 capacity: int = 16, clock: Callable[[], float] = time.time,
+                 listeners: Optional[List[Callable[[List[Dict]], None]]] = None):
+        """
+        Args:
+            initial_balance: 初始资金（美元）
+            fee_rate: 开仓、平仓的手续费率（按成交价值）
+            maintenance_margin_rate: 维持保证金率，决定强平价
+            capacity: 持仓数组的初始容量（不足时自动翻倍）
+            clock: 时间函数（秒），记录开仓 / 平仓时间
+            listeners: 每批平仓后调用的回调（参数为交易记录列表），如 PerformanceStats.add_trades；
+                在持有账户锁时调用，回调中不能再调用本账户的方法
+        """
+        self.initial_balance = initial_balance
+        self.fee_rate = fee_rate
+        self.maintenance_margin_rate = maintenance_margin_rate
+        self.clock = clock
+        self.listeners = list(listeners or [])
+
+        # 钱包余额 = 初始资金 + 已实现盈亏 - 手续费
+        self.balance = initial_balance
+        self.fees_paid = 0.0
+        self.trade_history: List[Dict] = []
+
+        # 可重入：mark_candles() / snapshot() 持有锁时调用 mark() / account_info() / positions()
+        self._lock = threading.RLock()
+        self._count = 0
+        self._columns = {name: np.zeros(capacity) for name in _COLUMNS}
+
+        # 交易对 → 编号；每个编号的最新标记价格
+        self._symbols: List[str] = []
+        self._symbol_ids: Dict[str, int] = {}
+        self._marks = np.zeros(0)
+        # 每个交易对已处理到的 K 线开盘时间（毫秒），mark_candles() 不重复处理更早的 K 线
+        self._candle_ts: Dict[str, int] = {}
+
+    # ========== 决策执行 ==========
+
+    def apply_decisions(self, decisions: Sequence[Dict], prices: Dict[str, float]) -> List[Dict]:
+        """
+        执行一轮 AI 决策
+
+        Args:
+            decisions: 解析后的决策列表（action: open_long / open_short / close_long / close_short / hold / wait）
+            prices: {交易对: 当前价格}，如 {'BTCUSDT': 96500.0}；没有价格的交易对的开平仓被拒绝
+
+        Returns:
+            每条决策的执行结果 {'symbol', 'action', 'status': opened / closed / rejected / skipped, 'reason'?, 'trades'?}
+        """
+        results = []
+        with self._lock:
+            self._set_marks(prices)
+            for decision in decisions:
+                action = decision.get('action')
+                symbol = decision.get('symbol')
+                result = {'symbol': symbol, 'action': action}
+                if action in OPEN_ACTIONS:
+                    result.update(self._open(decision, OPEN_ACTIONS[action], prices.get(symbol)))
+                elif action in CLOSE_ACTIONS:
+                    result.update(self._close_side(symbol, CLOSE_ACTIONS[action], prices.get(symbol)))
+                else:
+                    result['status'] = 'skipped'
+                results.append(result)
+        return results
+
+    def _open(self, decision: Dict, side: float, price: Optional[float]) -> Dict:
+        symbol = decision.get('symbol')
+        if not price:
+            return {'status': 'rejected', 'reason': '没有该交易对的行情'}
+
+        size = _number(decision.get('position_size_usd'))
+        leverage = _number(decision.get('leverage')) or 1.0
+        if not size or size <= 0 or leverage < 1:
+            return {'status': 'rejected', 'reason': '仓位或杠杆无效'}
+
+        stop_loss = _number(decision.get('stop_loss'))
+        take_profit = _number(decision.get('take_profit'))
+        if stop_loss and (stop_loss - price) * side >= 0:
+            return {'status': 'rejected', 'reason': f'止损价 {stop_loss} 在入场价错误的一侧'}
+        if take_profit and (take_profit - price) * side <= 0:
+            return {'status': 'rejected', 'reason': f'止盈价 {take_profit} 在入场价错误的一侧'}
+
+        symbol_id = self._symbol_id(symbol)
+        n = self._count
+        columns = self._columns
+        if ((columns['symbol'][:n] == symbol_id) & (columns['side'][:n] == side)).any():
+            return {'status': 'rejected', 'reason': '已有同方向持仓'}
+
+        margin = size / leverage
+        fee = size * self.fee_rate
+        if margin + fee > self._available():
+            return {'status': 'rejected', 'reason': f'可用余额不足（需要保证金 {margin:.2f} + 手续费 {fee:.2f}）'}
+
+        if n == len(columns['symbol']):
+            for name in _COLUMNS:
+                columns[name] = np.concatenate([columns[name], np.zeros(max(n, 1))])
+        row = {
+            'symbol': symbol_id, 'side': side, 'entry': price, 'quantity': size / price,
+            'leverage': leverage, 'margin': margin,
+            'stop_loss': stop_loss if stop_loss else np.nan,
+            'take_profit': take_profit if take_profit else np.nan,
+            'liquidation': price * (1 - side / leverage + side * self.maintenance_margin_rate),
+            'opened_at': self.clock()
+        }
+        for name, value in row.items():
+            columns[name][n] = value
+        self._count = n + 1
+        self.balance -= fee
+        self.fees_paid += fee
+        return {'status': 'opened', 'entry_price': price, 'liquidation_price': row['liquidation']}
+
+    def _close_side(self, symbol: str, side: float, price: Optional[float]) -> Dict:
+        symbol_id = self._symbol_ids.get(symbol)
+        n = self._count
+        if symbol_id is None:
+            return {'status': 'rejected', 'reason': '没有该持仓'}
+        matches = (self._columns['symbol'][:n] == symbol_id) & (self._columns['side'][:n] == side)
+        if not matches.any():
+            return {'status': 'rejected', 'reason': '没有该持仓'}
+        if not price:
+            return {'status': 'rejected', 'reason': '没有该交易对的行情'}
+        indices = np.flatnonzero(matches)
+        trades = self._close(indices, np.full(len(indices), float(price)), ['manual'] * len(indices))
+        return {'status': 'closed', 'trades': trades}
+
+    # ========== 盯市与止损 / 止盈 / 强平 ==========
+
+    def mark(self, prices: Dict[str, float], highs: Optional[Dict[str, float]] = None,
+             lows: Optional[Dict[str, float]] = None, since: Optional[float] = None) -> List[Dict]:
+        """
+        价格更新：更新标记价格，并检查全部持仓的止损 / 止盈 / 强平
+
+        Args:
+            prices: {交易对: 最新价格}
+            highs, lows: 本次更新覆盖的时间段内的最高 / 最低价（如一根 K 线），默认等于最新价格
+            since: 该时间段的开始时间（秒）；在这之后才开仓的持仓只按最新价格检查，不使用之前的最高 / 最低价
+
+        Returns:
+            本次触发平仓的交易记录
+        """
+        with self._lock:
+            ids = self._set_marks(prices)
+            n = self._count
+            if n == 0:
+                return []
+
+            columns = self._columns
+            symbol = columns['symbol'][:n].astype(np.intp)
+            mark = self._marks[symbol]
+            high, low = mark, mark
+            if highs or lows:
+                high_by_symbol = self._marks.copy()
+                low_by_symbol = self._marks.copy()
+                for name, symbol_id in ids.items():
+                    high_by_symbol[symbol_id] = (highs or {}).get(name, prices[name])
+                    low_by_symbol[symbol_id] = (lows or {}).get(name, prices[name])
+                high, low = high_by_symbol[symbol], low_by_symbol[symbol]
+                if since is not None:
+                    ranged = columns['opened_at'][:n] <= since
+                    high = np.where(ranged, high, mark)
+                    low = np.where(ranged, low, mark)
+
+            long = columns['side'][:n] > 0
+            adverse = np.where(long, low, high)
+            favourable = np.where(long, high, low)
+            stop_loss = columns['stop_loss'][:n]
+            liquidation = columns['liquidation'][:n]
+            # 止损和强平取先被触及的一个（多单取较高者，空单取较低者；未设置止损时为 NaN，fmax / fmin 忽略）
+            stop = np.where(long, np.fmax(stop_loss, liquidation), np.fmin(stop_loss, liquidation))
+            stop_hit = np.where(long, adverse <= stop, adverse >= stop)
+            take_profit = columns['take_profit'][:n]
+            target_hit = np.where(long, favourable >= take_profit, favourable <= take_profit)
+
+            hit = np.flatnonzero(stop_hit | target_hit)
+            if len(hit) == 0:
+                return []
+            stopped = stop_hit[hit]
+            exits = np.where(stopped, stop[hit], take_profit[hit])
+            reasons = ['take_profit' if not s else 'liquidation' if stop[i] == liquidation[i] else 'stop_loss'
+                       for i, s in zip(hit, stopped)]
+            return self._close(hit, exits, reasons)
+
+    def mark_candles(self, symbol: str, candles: Sequence[Sequence[float]]) -> List[Dict]:
+        """
+        用 K 线补齐两次分析之间的价格路径：按时间顺序对每根 K 线调用 mark()
+
+        已处理过的 K 线跳过；最后处理的那根 K 线（可能未收盘）下次会用更新后的数据再检查一次。
+
+        Args:
+            symbol: 交易对，如 'BTCUSDT'
+            candles: CCXT 格式 [[timestamp(ms), open, high, low, close, volume], ...]，按时间升序
+
+        Returns:
+            触发平仓的交易记录
+        """
+        trades = []
+        with self._lock:
+            last = self._candle_ts.get(symbol)
+            for candle in candles:
+                ts = int(candle[0])
+                if last is not None and ts < last:
+                    continue
+                trades.extend(self.mark({symbol: float(candle[4])}, {symbol: float(candle[2])},
+                                        {symbol: float(candle[3])}, since=ts / 1000))
+                self._candle_ts[symbol] = ts
+        return trades
+
+    def _close(self, indices: np.ndarray, exits: np.ndarray, reasons: List[str]) -> List[Dict]:
+        """按成交价平掉 indices 处的持仓，释放保证金、记入已实现盈亏，并压缩持仓数组"""
+        n = self._count
+        columns = self._columns
+        side = columns['side'][indices]
+        quantity = columns['quantity'][indices]
+        margin = columns['margin'][indices]
+        pnl = side * (exits - columns['entry'][indices]) * quantity
+        fees = exits * quantity * self.fee_rate
+        liquidated = np.array([reason == 'liquidation' for reason in reasons])
+        # 逐仓强平：损失全部保证金，不再收取平仓手续费
+        pnl = np.where(liquidated, -margin, pnl)
+        fees = np.where(liquidated, 0.0, fees)
+
+        self.balance += float((pnl - fees).sum())
+        self.fees_paid += float(fees.sum())
+
+        now = self.clock()
+        trades = []
+        for j, i in enumerate(indices):
+            opened_at = columns['opened_at'][i]
+            trade = {
+                'symbol': self._symbols[int(columns['symbol'][i])],
+                'side': 'long' if side[j] > 0 else 'short',
+                'entry_price': float(columns['entry'][i]),
+                'exit_price': float(exits[j]),
+                'quantity': float(quantity[j]),
+                'position_size_usd': float(columns['entry'][i] * quantity[j]),
+                'leverage': float(columns['leverage'][i]),
+                'margin': float(margin[j]),
+                'pnl': float(pnl[j] - fees[j]),
+                'pnl_pct': float((pnl[j] - fees[j]) / margin[j] * 100),
+                'fee': float(fees[j]),
+                'reason': reasons[j],
+                'opened_at': datetime.fromtimestamp(opened_at).isoformat(),
+                'closed_at': datetime.fromtimestamp(now).isoformat(),
+                'holding_minutes': int((now - opened_at) // 60)
+            }
+            trades.append(trade)
+        self.trade_history.extend(trades)
+        for listener in self.listeners:
+            try:
+                listener(trades)
+            except Exception as e:
+                print(f"⚠️ 平仓回调失败: {e}")
+
+        keep = np.ones(n, dtype=bool)
+        keep[indices] = False
+        remaining = int(keep.sum())
+        for name in _COLUMNS:
+            columns[name][:remaining] = columns[name][:n][keep]
+        self._count = remaining
+        return trades
+
+    # ========== 账户状态 ==========
+
+    def account_info(self) -> Dict:
+        """账户信息（结构与 BTCTradingMonitor.account / build_user_prompt 的 account_info 一致）"""
+        with self._lock:
+            unrealized = float(self._unrealized().sum())
+            margin_used = float(self._columns['margin'][:self._count].sum())
+            equity = self.balance + unrealized
+            total_pnl = equity - self.initial_balance
+            return {
+                'total_equity': equity,
+                'available_balance': max(equity - margin_used, 0.0),
+                'total_pnl': total_pnl,
+                'total_pnl_pct': total_pnl / self.initial_balance * 100 if self.initial_balance else 0.0,
+                'margin_used': margin_used,
+                'margin_used_pct': margin_used / equity * 100 if equity > 0 else 0.0,
+                'position_count': self._count
+            }
+
+    def positions(self) -> List[Dict]:
+        """当前持仓列表（结构与 prompts_trading._format_positions 使用的一致）"""
+        with self._lock:
+            n = self._count
+            columns = self._columns
+            unrealized = self._unrealized()
+            marks = self._marks[columns['symbol'][:n].astype(np.intp)]
+            now = self.clock()
+            result = []
+            for i in range(n):
+                leverage = float(columns['leverage'][i])
+                stop_loss = columns['stop_loss'][i]
+                take_profit = columns['take_profit'][i]
+                result.append({
+                    'symbol': self._symbols[int(columns['symbol'][i])],
+                    'side': 'long' if columns['side'][i] > 0 else 'short',
+                    'entry_price': float(columns['entry'][i]),
+                    'mark_price': float(marks[i]),
+                    'quantity': float(columns['quantity'][i]),
+                    'leverage': int(leverage) if leverage.is_integer() else leverage,
+                    'margin_used': float(columns['margin'][i]),
+                    'unrealized_pnl': float(unrealized[i]),
+                    'unrealized_pnl_pct': float(unrealized[i] / columns['margin'][i] * 100),
+                    'stop_loss': None if np.isnan(stop_loss) else float(stop_loss),
+                    'take_profit': None if np.isnan(take_profit) else float(take_profit),
+                    'liquidation_price': float(columns['liquidation'][i]),
+                    'holding_minutes': int((now - columns['opened_at'][i]) // 60)
+                })
+            return result
+
+    def snapshot(self) -> Tuple[Dict, List[Dict]]:
+        """同一时刻的 (账户信息, 持仓列表)：其他线程的盯市不会插在两者之间"""
+        with self._lock:
+            return self.account_info(), self.positions()
+
+    @property
+    def position_count(self) -> int:
+        return self._count
+
+    def _unrealized(self) -> np.ndarray:
+        n = self._count
+        columns = self._columns
+        marks = self._marks[columns['symbol'][:n].astype(np.intp)]
+        return columns['side'][:n] * (marks - columns['entry'][:n]) * columns['quantity'][:n]
+
+    def _available(self) -> float:
+        margin_used = float(self._columns['margin'][:self._count].sum())
+        return self.balance + float(self._unrealized().sum()) - margin_used
+
+    def _symbol_id(self, symbol: str) -> int:
+        symbol_id = self._symbol_ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = len(self._symbols)
+            self._symbols.append(symbol)
+            self._symbol_ids[symbol] = symbol_id
+            self._marks = np.append(self._marks, 0.0)
+        return symbol_id
+
+    def _set_marks(self, prices: Dict[str, float]) -> Dict[str, int]:
+        ids = {}
+        for symbol, price in prices.items():
+            if price:
+                symbol_id = self._symbol_id(symbol)
+                self._marks[symbol_id] = price
+                ids[symbol] = symbol_id
+        return ids
+
+
+def _number(value) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,92 @@
+"""
+分析周期的阶段计时
+run_analysis 中图表生成与 AI 调用并行、Telegram 图片与文本并行发送、日志在后台写入，
+StageTimer 记录每个阶段相对周期开始的起止时间，以及主流程（关键路径）的总耗时
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from metrics import MetricsRegistry, get_registry
+
+
+# 阶段名称 → 显示名称（按流程顺序）
+STAGE_LABELS = {
+    'fetch': '行情',
+    'prompt': '提示词',
+    'llm': 'AI',
+    'parse': '解析',
+    'chart': '图表',
+    'telegram_text': '文本推送',
+    'telegram_photo': '图片推送',
+    'log': '日志'
+}
+
+
+class StageTimer:
+    """一个分析周期内各阶段的起止时间（线程安全，后台阶段可在其他线程中记录）"""
+
+    def __init__(self, metrics: Optional[MetricsRegistry] = None,
+                 clock: Callable[[], float] = time.perf_counter):
+        """
+        Args:
+            metrics: 指标注册表（各阶段耗时记录为 stage.<名称>_ms），为 None 时使用进程内默认实例
+            clock: 计时函数（秒）
+        """
+        self.metrics = metrics or get_registry()
+        self.clock = clock
+        self.started_at = clock()
+        self.stages = {}
+        self.critical_path_ms = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        """计时一个阶段（异常时同样记录耗时）"""
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.record(name, start, self.clock())
+
+    def timed(self, name: str, func: Callable, *args, **kwargs):
+        """计时执行 func（供线程池 submit 使用）"""
+        with self.stage(name):
+            return func(*args, **kwargs)
+
+    def record(self, name: str, start: float, end: float):
+        ms = (end - start) * 1000
+        with self._lock:
+            self.stages[name] = {'start_ms': (start - self.started_at) * 1000, 'ms': ms}
+        self.metrics.observe(f'stage.{name}_ms', ms)
+
+    def mark_critical_path(self):
+        """主流程结束：记录从周期开始到此刻的耗时（后台阶段不计入）"""
+        self.critical_path_ms = (self.clock() - self.started_at) * 1000
+        self.metrics.observe('stage.critical_path_ms', self.critical_path_ms)
+
+    def timings(self) -> Dict:
+        """各阶段耗时（写入日志）"""
+        with self._lock:
+            return {
+                'stages': {name: dict(stage) for name, stage in self.stages.items()},
+                'critical_path_ms': self.critical_path_ms
+            }
+
+    def summary(self) -> str:
+        """单行摘要，如 "行情 120ms | AI 8200ms | 图表 1500ms (并行) | 关键路径 8500ms" """
+        with self._lock:
+            stages = dict(self.stages)
+        parts = []
+        for name, label in STAGE_LABELS.items():
+            stage = stages.get(name)
+            if stage is None:
+                continue
+            end_ms = stage['start_ms'] + stage['ms']
+            background = self.critical_path_ms is not None and end_ms > self.critical_path_ms + 1
+            parts.append(f"{label} {stage['ms']:.0f}ms{' (后台)' if background else ''}")
+        if self.critical_path_ms is not None:
+            parts.append(f"关键路径 {self.critical_path_ms:.0f}ms")
+        return ' | '.join(parts)
@@ -0,0 +1,192 @@
+"""
+紧凑的行情 prompt 编码（按 token 预算裁剪）
+经典格式把每个序列写成带引号的字符串列表（['110090.80', '110232.00', ...]），每个时间框架重复一遍
+emoji 和标签，大量 token 花在格式上。紧凑模式：
+- 各时间框架的最新指标合并为一张 CSV 表，只有一行表头
+- 序列合并为一张 CSV 表：价格序列首值为价格，其后为逐根涨跌（%）；MACD 柱、RSI 按固定精度
+- 数值按量级取固定的有效位数（BTC 价格取整到美元，MACD 以 ATR 为量级）
+- 可设置 token 预算：超出时按价值从低到高整行裁剪（RSI 序列 → MACD 柱序列 → 价格序列 → 资金面，
+  同类中短周期先裁剪），指标表和状态行始终保留
+
+token 数用 deepseek_client.estimate_tokens 估算
+"""
+
+import math
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from deepseek_client import estimate_tokens
+
+
+# 时间框架（从短到长）与裁剪时的附加优先级：短周期噪声更大，先裁剪
+TIMEFRAMES = (('3m', 0.0), ('15m', 0.1), ('1h', 0.2), ('4h', 0.3))
+
+# 序列表中的字段与基础优先级（按表中的顺序）；优先级越低越先裁剪
+SERIES_FIELDS = (('close', 3.0), ('macd_hist', 2.0), ('rsi14', 1.0))
+
+FUNDING_PRIORITY = 4.0
+
+
+class PromptSection(NamedTuple):
+    """prompt 中的一段（一行或一个文本块）"""
+    text: str
+    # None 表示必须保留；数值越小越先被裁剪
+    priority: Optional[float] = None
+    # 裁剪记录中的名称，如 '3m rsi14'
+    name: str = ''
+    # 所属表格；表头（header=True）在该表格的行全部被裁剪后一并去掉
+    table: Optional[str] = None
+    header: bool = False
+
+
+def decimals_for(scale: float, significant: int) -> int:
+    """量级为 scale 的数值保留 significant 位有效数字所需的小数位数（0-6）"""
+    if not scale or not math.isfinite(scale):
+        return 2
+    return min(6, max(0, significant - 1 - math.floor(math.log10(abs(scale)))))
+
+
+def encode_percent_series(values: Sequence[float], decimals: int, pct_decimals: int = 2) -> List[str]:
+    """
+    价格序列编码：首值为价格（decimals 位小数），其后为相对上一根的涨跌（%，pct_decimals 位小数）
+
+    涨跌相对的是解码后的上一个值，舍入误差不会沿序列累积（每个点的误差都不超过半个最小单位）
+    """
+    if len(values) == 0:
+        return []
+    previous = round(float(values[0]), decimals)
+    cells = [f"{previous:.{decimals}f}"]
+    for value in values[1:]:
+        pct = round((value / previous - 1) * 100, pct_decimals) if previous else 0.0
+        cells.append(f"{pct:+.{pct_decimals}f}")
+        previous *= 1 + pct / 100
+    return cells
+
+
+def decode_percent_series(cells: Sequence[str]) -> List[float]:
+    """encode_percent_series 的逆变换"""
+    if not cells:
+        return []
+    values = [float(cells[0])]
+    for cell in cells[1:]:
+        values.append(values[-1] * (1 + float(cell) / 100))
+    return values
+
+
+def _fixed(values: Sequence[float], decimals: int) -> List[str]:
+    return [f"{value:.{decimals}f}" for value in values]
+
+
+def macd_decimals(tf_data: Dict) -> int:
+    """MACD / MACD 柱的小数位数：以该时间框架的 ATR 为量级保留 4 位有效数字（MACD 在零轴附近时不会输出过多小数）"""
+    return decimals_for(tf_data['current']['atr14'], 4)
+
+
+def _indicator_row(tf: str, tf_data: Dict, price_decimals: int) -> str:
+    """指标表的一行：最新K线的价格、均线、MACD、RSI、ATR、量比、布林带位置和带宽"""
+    current = tf_data['current']
+    price = current['price']
+    vol_ratio = current['volume'] / current['volume_ma'] * 100 if current['volume_ma'] > 0 else 100
+    bb_upper = tf_data['bb_upper'][-1]
+    bb_lower = tf_data['bb_lower'][-1]
+    bb_position = (price - bb_lower) / (bb_upper - bb_lower) * 100 if bb_upper > bb_lower else 50
+    bb_width = (bb_upper - bb_lower) / price * 100 if price > 0 else 0
+    cells = [
+        tf,
+        f"{price:.{price_decimals}f}",
+        f"{current['ema20']:.{price_decimals}f}",
+        f"{current['ema50']:.{price_decimals}f}",
+        f"{current['macd']:.{macd_decimals(tf_data)}f}",
+        f"{current['rsi7']:.1f}",
+        f"{current['rsi14']:.1f}",
+        f"{current['atr14']:.{decimals_for(current['atr14'], 3)}f}",
+        f"{vol_ratio:.0f}",
+        f"{bb_position:.0f}",
+        f"{bb_width:.2f}",
+    ]
+    return ','.join(cells)
+
+
+def build_market_sections(market_data: Dict, points: int = 10) -> List[PromptSection]:
+    """
+    行情数据的紧凑段落：概览、资金面、指标表、序列表
+
+    Args:
+        market_data: 市场数据（来自 market_data.py，4 个时间框架）
+        points: 每个序列保留的最近K线数
+
+    Returns:
+        PromptSection 列表（按 prompt 中的顺序）
+    """
+    timeframes = [(tf, extra, market_data[f'timeframe_{tf}']) for tf, extra in TIMEFRAMES]
+    price_decimals = decimals_for(market_data['current_price'], 6)
+    pc = market_data['price_changes']
+    oi = market_data['open_interest']
+
+    sections = [
+        PromptSection("## BTC 行情"),
+        PromptSection(f"价格 {market_data['current_price']:.{price_decimals}f} | 涨跌% 15m {pc['15m']:+.2f} "
+                      f"1h {pc['1h']:+.2f} 4h {pc['4h']:+.2f} 24h {pc['24h']:+.2f}"),
+        PromptSection(f"持仓量 {oi['latest']:,.0f} BTC | 资金费率 {market_data['funding_rate'] * 100:.4f}%",
+                      FUNDING_PRIORITY, '资金面'),
+    ]
+
+    # === 指标表：每个时间框架一行 ===
+    sections.append(PromptSection(
+        "\n## 指标（各时间框架最新K线；vol%=成交量/均量，bb%=布林带位置，bbw%=带宽/价格）\n"
+        "tf,price,ema20,ema50,macd,rsi7,rsi14,atr14,vol%,bb%,bbw%",
+        table='indicators', header=True))
+    for tf, _, data in timeframes:
+        sections.append(PromptSection(_indicator_row(tf, data, price_decimals),
+                                      table='indicators'))
+
+    # === 序列表：旧 → 新 ===
+    n = min([points] + [len(data['prices']) for _, _, data in timeframes])
+    sections.append(PromptSection(
+        f"\n## 序列（最近{n}根K线，旧→新；close 首值为价格，其后为逐根涨跌%）\n"
+        f"tf,series,{','.join(f'v{i}' for i in range(1, n + 1))}",
+        table='series', header=True))
+    for tf, extra, data in timeframes:
+        closes = data['prices'][-n:]
+        encoded = {
+            'close': encode_percent_series(closes, price_decimals),
+            'macd_hist': _fixed(data['macd_hist'][-n:], macd_decimals(data)),
+            'rsi14': _fixed(data['rsi14'][-n:], 0),
+        }
+        for field, priority in SERIES_FIELDS:
+            sections.append(PromptSection(f"{tf},{field},{','.join(encoded[field])}",
+                                          priority + extra, f"{tf} {field}", table='series'))
+    return sections
+
+
+def render_sections(sections: Sequence[PromptSection]) -> str:
+    """拼接段落；没有剩余行的表格不输出表头"""
+    tables = {section.table for section in sections if section.table and not section.header}
+    return "\n".join(section.text for section in sections
+                     if not section.header or section.table in tables)
+
+
+def fit_token_budget(sections: Sequence[PromptSection], budget: Optional[int],
+                     estimate: Callable[[str], int] = estimate_tokens) -> Tuple[str, List[str]]:
+    """
+    按优先级从低到高裁剪段落，直到估算的 token 数不超过预算
+
+    必须保留的段落不会被裁剪：全部可裁剪的段落去掉后仍超出预算时，返回剩余内容
+
+    Returns:
+        (prompt 文本, 被裁剪的段落名称列表（按裁剪顺序）)
+    """
+    text = render_sections(sections)
+    trimmed = []
+    if budget is None:
+        return text, trimmed
+
+    order = sorted((i for i, section in enumerate(sections) if section.priority is not None),
+                   key=lambda i: sections[i].priority)
+    dropped = set()
+    for index in order:
+        if estimate(text) <= budget:
+            break
+        dropped.add(index)
+        trimmed.append(sections[index].name)
+        text = render_sections([section for i, section in enumerate(sections) if i not in dropped])
+    return text, trimmed
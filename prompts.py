@@ -7,7 +7,10 @@ Prompt 构建模块 - 多时间框架版本
 """
 
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
+
+from deepseek_client import estimate_tokens
+from prompt_compact import PromptSection, build_market_sections, fit_token_budget
 
 
 def build_system_prompt() -> str:
@@ -166,7 +169,15 @@ def build_system_prompt() -> str:
     return prompt
 
 
-def build_user_prompt(market_data: Dict, runtime_minutes: int = 0, call_count: int = 0) -> str:
+def _format_status(runtime_minutes: int, call_count: int, now: Optional[datetime]) -> str:
+    """状态行（格式与 response_cache 的归一化规则对应）"""
+    current_time = (now or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+    return f"**时间**: {current_time} | **周期**: #{call_count} | **运行**: {runtime_minutes}分钟"
+
+
+def build_user_prompt(market_data: Dict, runtime_minutes: int = 0, call_count: int = 0,
+                      now: Optional[datetime] = None, compact: bool = False,
+                      token_budget: Optional[int] = None) -> str:
     """
     构建 User Prompt（动态市场数据 - 多时间框架版本）
 
@@ -174,15 +185,20 @@ def build_user_prompt(market_data: Dict, runtime_minutes: int = 0, call_count: i
         market_data: 市场数据字典（来自 market_data.py）
         runtime_minutes: 系统运行时长（分钟）
         call_count: AI 调用次数
+        now: prompt 中显示的当前时间，默认 datetime.now()（历史回放时传入回放时刻）
+        compact: 为 True 时使用紧凑编码（见 build_compact_user_prompt）
+        token_budget: 紧凑模式的 token 预算（None 表示不裁剪）
 
     Returns:
         格式化的 user prompt 字符串
     """
+    if compact:
+        return build_compact_user_prompt(market_data, runtime_minutes, call_count, now, token_budget)[0]
+
     lines = []
 
     # === 系统状态 ===
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    lines.append(f"**时间**: {current_time} | **周期**: #{call_count} | **运行**: {runtime_minutes}分钟\n")
+    lines.append(_format_status(runtime_minutes, call_count, now) + "\n")
 
     # === BTC 市场概览 ===
     lines.append("## 📊 BTC 市场概览\n")
@@ -294,6 +310,29 @@ def build_user_prompt(market_data: Dict, runtime_minutes: int = 0, call_count: i
     return "\n".join(lines)
 
 
+def build_compact_user_prompt(market_data: Dict, runtime_minutes: int = 0, call_count: int = 0,
+                              now: Optional[datetime] = None,
+                              token_budget: Optional[int] = None) -> Tuple[str, Dict]:
+    """
+    紧凑编码的 User Prompt：指标和序列为共用表头的 CSV 表，价格序列按逐根涨跌编码（见 prompt_compact.py）
+
+    超出 token_budget 时按价值从低到高裁剪序列行，状态行、指标表和分析要求始终保留
+
+    Returns:
+        (user prompt, {'tokens': 估算 token 数, 'budget': 预算, 'trimmed': 被裁剪的段落名称})
+    """
+    sections = [PromptSection(_format_status(runtime_minutes, call_count, now) + "\n")]
+    sections.extend(build_market_sections(market_data))
+    sections.append(PromptSection(
+        "\n---\n"
+        "请基于以上4个时间框架做多周期分析：各周期趋势、共振/背离、关键信号、支撑阻力位、"
+        "未来1-2小时和4-6小时走势、风险提示。\n"
+        "输出格式: 思维链分析 + JSON结构化总结（包含 timeframe_analysis 字段）\n"))
+
+    prompt, trimmed = fit_token_budget(sections, token_budget)
+    return prompt, {'tokens': estimate_tokens(prompt), 'budget': token_budget, 'trimmed': trimmed}
+
+
 def format_analysis_result(cot_trace: str, json_result: Dict) -> str:
     """
     格式化分析结果用于 Telegram 消息（HTML 格式）
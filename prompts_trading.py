@@ -8,7 +8,8 @@ from datetime import datetime
 from typing import Dict, List, Optional
 
 
-def build_system_prompt(account_equity: float = 1000.0, btc_eth_leverage: int = 5, altcoin_leverage: int = 5) -> str:
+def build_system_prompt(account_equity: float = 1000.0, btc_eth_leverage: int = 5, altcoin_leverage: int = 5,
+                        cache_friendly: bool = False) -> str:
     """
     构建 System Prompt（固定规则）
     直接从 NOFX decision/engine.go 的 buildSystemPrompt() 函数提取
@@ -17,6 +18,8 @@ def build_system_prompt(account_equity: float = 1000.0, btc_eth_leverage: int =
         account_equity: 账户净值（美元）
         btc_eth_leverage: BTC/ETH 杠杆倍数
         altcoin_leverage: 山寨币杠杆倍数
+        cache_friendly: 为 True 时不写入随净值变化的金额（仓位按净值倍数描述），
+                        使 system prompt 在各周期完全相同，可被 DeepSeek 前缀缓存命中
 
     Returns:
         System prompt 字符串
@@ -48,7 +51,10 @@ def build_system_prompt(account_equity: float = 1000.0, btc_eth_leverage: int =
 """
 
     # 单币仓位约束
-    prompt += f"3. 单币仓位: 山寨{account_equity*0.8:.0f}-{account_equity*1.5:.0f} U({altcoin_leverage}x杠杆) | BTC/ETH {account_equity*5:.0f}-{account_equity*10:.0f} U({btc_eth_leverage}x杠杆)\n"
+    if cache_friendly:
+        prompt += f"3. 单币仓位: 山寨 0.8-1.5 倍账户净值({altcoin_leverage}x杠杆) | BTC/ETH 5-10 倍账户净值({btc_eth_leverage}x杠杆)，按账户信息中的当前净值换算\n"
+    else:
+        prompt += f"3. 单币仓位: 山寨{account_equity*0.8:.0f}-{account_equity*1.5:.0f} U({altcoin_leverage}x杠杆) | BTC/ETH {account_equity*5:.0f}-{account_equity*10:.0f} U({btc_eth_leverage}x杠杆)\n"
     prompt += "4. 保证金: 总使用率 ≤ 90%\n\n"
 
     # 交易哲学 & 最佳实践
@@ -152,8 +158,9 @@ def build_system_prompt(account_equity: float = 1000.0, btc_eth_leverage: int =
 [
 """
 
-    # 示例决策
-    prompt += f"""  {{"symbol": "BTCUSDT", "action": "open_short", "leverage": {btc_eth_leverage}, "position_size_usd": {account_equity*5:.0f}, "stop_loss": 97000, "take_profit": 91000, "confidence": 85, "risk_usd": 300, "reasoning": "下跌趋势+MACD死叉"}},
+    # 示例决策（前缀缓存模式下示例金额固定，不随净值变化）
+    example_size = 5000 if cache_friendly else account_equity * 5
+    prompt += f"""  {{"symbol": "BTCUSDT", "action": "open_short", "leverage": {btc_eth_leverage}, "position_size_usd": {example_size:.0f}, "stop_loss": 97000, "take_profit": 91000, "confidence": 85, "risk_usd": 300, "reasoning": "下跌趋势+MACD死叉"}},
   {{"symbol": "ETHUSDT", "action": "close_long", "reasoning": "止盈离场"}}
 ]
 ```
@@ -180,7 +187,9 @@ def build_user_prompt(
     call_count: int = 0,
     account_info: Optional[Dict] = None,
     positions: Optional[List[Dict]] = None,
-    sharpe_ratio: Optional[float] = None
+    sharpe_ratio: Optional[float] = None,
+    cache_friendly: bool = False,
+    now: Optional[datetime] = None
 ) -> str:
     """
     构建 User Prompt（动态市场数据）
@@ -193,21 +202,12 @@ def build_user_prompt(
         account_info: 账户信息（模拟）
         positions: 当前持仓列表（模拟）
         sharpe_ratio: 夏普比率（可选）
+        cache_friendly: 为 True 时按"最稳定 → 最易变"排列内容（见 _build_user_prompt_cache_friendly）
+        now: prompt 中显示的当前时间，默认 datetime.now()（历史回放时传入回放时刻）
 
     Returns:
         格式化的 user prompt 字符串
     """
-    lines = []
-
-    # === 系统状态 ===
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    lines.append(f"时间: {current_time} | 周期: #{call_count} | 运行: {runtime_minutes}分钟\n")
-
-    # === BTC 市场概览 ===
-    pc = market_data['price_changes']
-    lines.append(f"BTC: ${market_data['current_price']:,.2f} (1h: {pc['1h']:+.2f}%, 4h: {pc['4h']:+.2f}%) | MACD: {market_data['current_macd']:.4f} | RSI: {market_data['current_rsi7']:.2f}\n")
-
-    # === 账户信息 ===
     if account_info is None:
         # 默认模拟账户
         account_info = {
@@ -218,9 +218,156 @@ def build_user_prompt(
             'position_count': 0
         }
 
-    lines.append(f"账户: 净值{account_info['total_equity']:.2f} | 余额{account_info['available_balance']:.2f} ({account_info['available_balance']/account_info['total_equity']*100:.1f}%) | 盈亏{account_info['total_pnl_pct']:+.2f}% | 保证金{account_info['margin_used_pct']:.1f}% | 持仓{account_info['position_count']}个\n")
+    if cache_friendly:
+        return _build_user_prompt_cache_friendly(market_data, runtime_minutes, call_count,
+                                                 account_info, positions, sharpe_ratio, now)
+
+    lines = []
+
+    # === 系统状态 ===
+    lines.append(_format_status(runtime_minutes, call_count, now))
+
+    # === BTC 市场概览 ===
+    pc = market_data['price_changes']
+    lines.append(f"BTC: ${market_data['current_price']:,.2f} (1h: {pc['1h']:+.2f}%, 4h: {pc['4h']:+.2f}%) | MACD: {market_data['current_macd']:.4f} | RSI: {market_data['current_rsi7']:.2f}\n")
+
+    # === 账户信息 ===
+    lines.append(_format_account(account_info))
 
     # === 当前持仓 ===
+    lines.extend(_format_positions(market_data, positions))
+
+    # === 候选币种（BTC 完整市场数据）===
+    lines.append("\n## 候选币种 (1个)\n\n")
+    lines.append("### 1. BTCUSDT\n\n")
+
+    # 多时间框架数据（与监控版本相同）
+    lines.append("**多时间框架数据**:\n\n")
+
+    # 展示4个时间框架的关键信息
+    lines.append(_format_timeframe_brief(market_data['timeframe_3m'], "⚡", "3分钟"))
+    lines.append(_format_timeframe_brief(market_data['timeframe_15m'], "🔥", "15分钟"))
+    lines.append(_format_timeframe_brief(market_data['timeframe_1h'], "📊", "1小时"))
+    lines.append(_format_timeframe_brief(market_data['timeframe_4h'], "🌊", "4小时"))
+    lines.append("\n")
+
+    # 详细的技术指标数据（用于深度分析）
+    lines.append("**详细技术指标** (用于深度分析):\n\n")
+
+    for tf_key, tf_name in [('3m', '3分钟'), ('15m', '15分钟'), ('1h', '1小时'), ('4h', '4小时')]:
+        tf_data = market_data[f'timeframe_{tf_key}']
+        current = tf_data['current']
+
+        lines.append(f"**{tf_name}级别** ({tf_data['data_points']}个数据点):\n")
+        lines.append(f"  • 价格序列 (最近10个): {[f'{p:.2f}' for p in tf_data['prices'][-10:]]}\n")
+        lines.append(f"  • EMA20: ${current['ema20']:,.2f} | EMA50: ${current['ema50']:,.2f}\n")
+        lines.append(f"  • MACD: {current['macd']:.4f} | MACD柱状图: {[f'{v:.3f}' for v in tf_data['macd_hist'][-5:]]}\n")
+        lines.append(f"  • RSI(7): {current['rsi7']:.2f} | RSI(14): {current['rsi14']:.2f} | RSI序列: {[f'{v:.1f}' for v in tf_data['rsi14'][-5:]]}\n")
+        lines.append(f"  • ATR(14): {current['atr14']:.2f}\n")
+        lines.extend(_format_bands_and_volume(tf_data))
+
+    # === 市场资金面 ===
+    lines.extend(_format_funding(market_data))
+
+    # === 夏普比率（如果有）===
+    if sharpe_ratio is not None:
+        lines.append(f"\n## 📊 夏普比率: {sharpe_ratio:.2f}\n")
+
+    # === 请求AI分析 ===
+    lines.append("\n---\n\n")
+    lines.append("现在请分析并输出决策（思维链 + JSON）\n")
+
+    return "".join(lines)
+
+
+def _build_user_prompt_cache_friendly(
+    market_data: Dict,
+    runtime_minutes: int,
+    call_count: int,
+    account_info: Dict,
+    positions: Optional[List[Dict]],
+    sharpe_ratio: Optional[float],
+    now: Optional[datetime] = None
+) -> str:
+    """
+    前缀缓存友好的 User Prompt：内容按"最稳定 → 最易变"排列
+
+    DeepSeek 会缓存与之前请求相同的 prompt 前缀（命中部分计费更低、首 token 更快），
+    因此把各周期不变的内容放在前面，时间、周期编号等每次都变的内容放在最后：
+    1. 固定说明（数据结构）
+    2. 已收盘 K 线序列：4h → 1h → 15m → 3m（周期越长，越久才变化一次）
+    3. 实时数据：各时间框架最新（未收盘）K 线的指标值、资金面
+    4. 账户、持仓、夏普比率
+    5. 时间 / 周期 / 运行时长
+    """
+    lines = []
+
+    # === 1. 固定说明 ===
+    lines.append("## 候选币种 (1个)\n\n")
+    lines.append("### 1. BTCUSDT\n\n")
+    lines.append("数据按时间框架从长到短排列：先给出已收盘 K 线的历史序列，再给出最新（未收盘）K 线的实时指标。\n\n")
+
+    # === 2. 已收盘 K 线序列（长周期在前）===
+    lines.append("**已收盘K线序列**:\n\n")
+    for tf_key, tf_name in [('4h', '4小时'), ('1h', '1小时'), ('15m', '15分钟'), ('3m', '3分钟')]:
+        tf_data = market_data[f'timeframe_{tf_key}']
+        lines.append(f"**{tf_name}级别** ({tf_data['data_points']}个数据点):\n")
+        lines.append(f"  • 价格序列 (最近10根): {[f'{p:.2f}' for p in tf_data['prices'][-11:-1]]}\n")
+        lines.append(f"  • MACD柱状图: {[f'{v:.3f}' for v in tf_data['macd_hist'][-6:-1]]}\n")
+        lines.append(f"  • RSI(14)序列: {[f'{v:.1f}' for v in tf_data['rsi14'][-6:-1]]}\n\n")
+
+    # === 3. 实时数据 ===
+    lines.append("**实时数据** (最新未收盘K线):\n\n")
+    lines.append(_format_timeframe_brief(market_data['timeframe_4h'], "🌊", "4小时"))
+    lines.append(_format_timeframe_brief(market_data['timeframe_1h'], "📊", "1小时"))
+    lines.append(_format_timeframe_brief(market_data['timeframe_15m'], "🔥", "15分钟"))
+    lines.append(_format_timeframe_brief(market_data['timeframe_3m'], "⚡", "3分钟"))
+    lines.append("\n")
+
+    for tf_key, tf_name in [('4h', '4小时'), ('1h', '1小时'), ('15m', '15分钟'), ('3m', '3分钟')]:
+        tf_data = market_data[f'timeframe_{tf_key}']
+        current = tf_data['current']
+
+        lines.append(f"**{tf_name}级别**:\n")
+        lines.append(f"  • EMA20: ${current['ema20']:,.2f} | EMA50: ${current['ema50']:,.2f}\n")
+        lines.append(f"  • MACD: {current['macd']:.4f} | MACD柱: {tf_data['macd_hist'][-1]:.3f}\n")
+        lines.append(f"  • RSI(7): {current['rsi7']:.2f} | RSI(14): {current['rsi14']:.2f}\n")
+        lines.append(f"  • ATR(14): {current['atr14']:.2f}\n")
+        lines.extend(_format_bands_and_volume(tf_data))
+
+    pc = market_data['price_changes']
+    lines.append(f"BTC: ${market_data['current_price']:,.2f} (1h: {pc['1h']:+.2f}%, 4h: {pc['4h']:+.2f}%) | MACD: {market_data['current_macd']:.4f} | RSI: {market_data['current_rsi7']:.2f}\n\n")
+    lines.extend(_format_funding(market_data))
+
+    # === 4. 账户、持仓、夏普比率 ===
+    lines.append("\n")
+    lines.append(_format_account(account_info))
+    lines.extend(_format_positions(market_data, positions))
+    if sharpe_ratio is not None:
+        lines.append(f"\n## 📊 夏普比率: {sharpe_ratio:.2f}\n")
+
+    # === 5. 时间 / 周期（每次都变，放在最后）===
+    lines.append("\n---\n\n")
+    lines.append(_format_status(runtime_minutes, call_count, now))
+    lines.append("现在请分析并输出决策（思维链 + JSON）\n")
+
+    return "".join(lines)
+
+
+def _format_status(runtime_minutes: int, call_count: int, now: Optional[datetime] = None) -> str:
+    """系统状态行（时间 / 周期 / 运行时长）"""
+    current_time = (now or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+    return f"时间: {current_time} | 周期: #{call_count} | 运行: {runtime_minutes}分钟\n"
+
+
+def _format_account(account_info: Dict) -> str:
+    """账户信息行"""
+    return f"账户: 净值{account_info['total_equity']:.2f} | 余额{account_info['available_balance']:.2f} ({account_info['available_balance']/account_info['total_equity']*100:.1f}%) | 盈亏{account_info['total_pnl_pct']:+.2f}% | 保证金{account_info['margin_used_pct']:.1f}% | 持仓{account_info['position_count']}个\n"
+
+
+def _format_positions(market_data: Dict, positions: Optional[List[Dict]]) -> List[str]:
+    """当前持仓列表"""
+    lines = []
     if positions and len(positions) > 0:
         lines.append("\n## 当前持仓\n")
         for i, pos in enumerate(positions, 1):
@@ -241,69 +388,52 @@ def build_user_prompt(
             lines.append(f"  当前价格: ${market_data['current_price']:,.2f} | EMA20: ${market_data['current_ema20']:.2f} | MACD: {market_data['current_macd']:.4f} | RSI(7): {market_data['current_rsi7']:.2f}\n\n")
     else:
         lines.append("\n当前持仓: 无\n")
+    return lines
 
-    # === 候选币种（BTC 完整市场数据）===
-    lines.append("\n## 候选币种 (1个)\n\n")
-    lines.append("### 1. BTCUSDT\n\n")
 
-    # 多时间框架数据（与监控版本相同）
-    lines.append("**多时间框架数据**:\n\n")
+def _format_timeframe_brief(tf_data, emoji, name):
+    """简化版时间框架展示"""
+    current = tf_data['current']
 
-    # 函数：格式化时间框架数据（简化版）
-    def format_timeframe_brief(tf_data, emoji, name):
-        """简化版时间框架展示"""
-        current = tf_data['current']
+    # EMA 趋势判断
+    ema_trend = "↑ 上升" if current['price'] > current['ema20'] > current['ema50'] else \
+               "↓ 下降" if current['price'] < current['ema20'] < current['ema50'] else \
+               "↔ 震荡"
 
-        # EMA 趋势判断
-        ema_trend = "↑ 上升" if current['price'] > current['ema20'] > current['ema50'] else \
-                   "↓ 下降" if current['price'] < current['ema20'] < current['ema50'] else \
-                   "↔ 震荡"
+    # MACD 状态
+    macd_status = "金叉" if current['macd'] > 0 else "死叉"
 
-        # MACD 状态
-        macd_status = "金叉" if current['macd'] > 0 else "死叉"
+    # RSI 状态
+    rsi_status = "超买" if current['rsi14'] > 70 else "超卖" if current['rsi14'] < 30 else "中性"
 
-        # RSI 状态
-        rsi_status = "超买" if current['rsi14'] > 70 else "超卖" if current['rsi14'] < 30 else "中性"
+    return (
+        f"{emoji} **{name}**: 价格${current['price']:,.2f} | "
+        f"趋势{ema_trend} | MACD {macd_status} | RSI(14) {current['rsi14']:.1f} ({rsi_status})\n"
+    )
 
-        return (
-            f"{emoji} **{name}**: 价格${current['price']:,.2f} | "
-            f"趋势{ema_trend} | MACD {macd_status} | RSI(14) {current['rsi14']:.1f} ({rsi_status})\n"
-        )
 
-    # 展示4个时间框架的关键信息
-    lines.append(format_timeframe_brief(market_data['timeframe_3m'], "⚡", "3分钟"))
-    lines.append(format_timeframe_brief(market_data['timeframe_15m'], "🔥", "15分钟"))
-    lines.append(format_timeframe_brief(market_data['timeframe_1h'], "📊", "1小时"))
-    lines.append(format_timeframe_brief(market_data['timeframe_4h'], "🌊", "4小时"))
-    lines.append("\n")
+def _format_bands_and_volume(tf_data) -> List[str]:
+    """布林带位置和成交量状态"""
+    current = tf_data['current']
 
-    # 详细的技术指标数据（用于深度分析）
-    lines.append("**详细技术指标** (用于深度分析):\n\n")
+    # 布林带
+    bb_upper = tf_data['bb_upper'][-1]
+    bb_lower = tf_data['bb_lower'][-1]
+    bb_position = ((current['price'] - bb_lower) / (bb_upper - bb_lower) * 100) if bb_upper > bb_lower else 50
 
-    for tf_key, tf_name in [('3m', '3分钟'), ('15m', '15分钟'), ('1h', '1小时'), ('4h', '4小时')]:
-        tf_data = market_data[f'timeframe_{tf_key}']
-        current = tf_data['current']
+    # 成交量
+    vol_ratio = (current['volume'] / current['volume_ma'] * 100) if current['volume_ma'] > 0 else 100
+    vol_status = "放量" if vol_ratio > 120 else "缩量" if vol_ratio < 80 else "正常"
 
-        lines.append(f"**{tf_name}级别** ({tf_data['data_points']}个数据点):\n")
-        lines.append(f"  • 价格序列 (最近10个): {[f'{p:.2f}' for p in tf_data['prices'][-10:]]}\n")
-        lines.append(f"  • EMA20: ${current['ema20']:,.2f} | EMA50: ${current['ema50']:,.2f}\n")
-        lines.append(f"  • MACD: {current['macd']:.4f} | MACD柱状图: {[f'{v:.3f}' for v in tf_data['macd_hist'][-5:]]}\n")
-        lines.append(f"  • RSI(7): {current['rsi7']:.2f} | RSI(14): {current['rsi14']:.2f} | RSI序列: {[f'{v:.1f}' for v in tf_data['rsi14'][-5:]]}\n")
-        lines.append(f"  • ATR(14): {current['atr14']:.2f}\n")
-
-        # 布林带
-        bb_upper = tf_data['bb_upper'][-1]
-        bb_lower = tf_data['bb_lower'][-1]
-        bb_position = ((current['price'] - bb_lower) / (bb_upper - bb_lower) * 100) if bb_upper > bb_lower else 50
-        lines.append(f"  • 布林带: 上轨${bb_upper:.2f} 下轨${bb_lower:.2f} | 价格位置{bb_position:.1f}%\n")
+    return [
+        f"  • 布林带: 上轨${bb_upper:.2f} 下轨${bb_lower:.2f} | 价格位置{bb_position:.1f}%\n",
+        f"  • 成交量: {current['volume']:,.0f} ({vol_status}, {vol_ratio:.0f}% of MA)\n\n"
+    ]
 
-        # 成交量
-        vol_ratio = (current['volume'] / current['volume_ma'] * 100) if current['volume_ma'] > 0 else 100
-        vol_status = "放量" if vol_ratio > 120 else "缩量" if vol_ratio < 80 else "正常"
-        lines.append(f"  • 成交量: {current['volume']:,.0f} ({vol_status}, {vol_ratio:.0f}% of MA)\n\n")
 
-    # === 市场资金面 ===
-    lines.append("**市场资金面**:\n")
+def _format_funding(market_data: Dict) -> List[str]:
+    """市场资金面（持仓量、资金费率及解读）"""
+    lines = ["**市场资金面**:\n"]
     oi = market_data['open_interest']
     lines.append(f"  • 持仓量: {oi['latest']:,.0f} BTC\n")
     lines.append(f"  • 资金费率: {market_data['funding_rate']:.6f} ({market_data['funding_rate']*100:.4f}%)")
@@ -315,16 +445,7 @@ def build_user_prompt(
         lines.append(f" → 做空资金费率偏高，市场看空情绪较强\n")
     else:
         lines.append(f" → 资金费率接近中性，多空相对平衡\n")
-
-    # === 夏普比率（如果有）===
-    if sharpe_ratio is not None:
-        lines.append(f"\n## 📊 夏普比率: {sharpe_ratio:.2f}\n")
-
-    # === 请求AI分析 ===
-    lines.append("\n---\n\n")
-    lines.append("现在请分析并输出决策（思维链 + JSON）\n")
-
-    return "".join(lines)
+    return lines
 
 
 def format_trading_result(cot_trace: str, decisions: List[Dict], account_info: Dict) -> str:
@@ -416,16 +537,7 @@ def format_trading_result(cot_trace: str, decisions: List[Dict], account_info: D
     # 思维链（完整显示，不截断）
     lines.append("💭 <b>AI 分析过程</b>:\n")
 
-    # Telegram 消息有长度限制（4096字符），需要分段发送
-    # 但我们先尝试完整显示，如果超长则在 btc_trading_monitor.py 中分段
-    cot_escaped = escape_html(cot_trace)
-
-    # 如果太长（>3000字符），只发送摘要到 Telegram
-    if len(cot_escaped) > 3000:
-        lines.append(f"<pre>{cot_escaped[:3000]}</pre>\n")
-        lines.append(f"<i>... 还有 {len(cot_escaped) - 3000} 字符</i>\n")
-        lines.append("<i>💾 完整分析已保存到日志，请查看 analysis_logs/</i>\n")
-    else:
-        lines.append(f"<pre>{cot_escaped}</pre>\n")
+    # Telegram 消息有长度限制（4096字符），超长时由发送队列在换行处分段发送（见 telegram_outbox.split_html）
+    lines.append(f"<pre>{escape_html(cot_trace)}</pre>\n")
 
     return "".join(lines)
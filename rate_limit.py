@@ -0,0 +1,75 @@
+"""
+限流工具
+令牌桶实现，供多线程共享同一份请求配额（交易所权重、API 调用频率等）
+"""
+
+import threading
+import time
+from typing import Callable
+
+
+class TokenBucket:
+    """线程安全的令牌桶：按固定速率补充令牌，acquire() 在令牌不足时阻塞等待"""
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            rate: 每秒补充的令牌数
+            capacity: 桶容量（允许的最大突发量）
+            clock: 计时函数（秒）；不是实际时间时用 delay_for() 并由调用方推进时钟，acquire() 会用 time.sleep 等待
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated_at = clock()
+        self.waited_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        """按流逝时间补充令牌（调用方需持有锁）"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """
+        获取令牌，不足时阻塞直到补足
+
+        Args:
+            amount: 需要的令牌数（超过容量时按容量计算，避免永久阻塞）
+
+        Returns:
+            本次等待的秒数
+        """
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(self.clock())
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    self.waited_seconds += waited
+                    return waited
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def delay_for(self, amount: float = 1.0) -> float:
+        """
+        非阻塞地预留令牌，返回调用方需要等待的秒数（供 asyncio 等不能阻塞线程的场景使用）
+
+        令牌会被立即扣除（允许为负数），之后的调用会顺延等待时间。
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(self.clock())
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            self.waited_seconds += wait
+            return wait
+
+    def pause(self, seconds: float):
+        """服务端要求等待（如 429 的 retry_after）：清空令牌，seconds 秒内不再发放"""
+        with self._lock:
+            self._refill(self.clock())
+            self.tokens = min(self.tokens, 1.0) - seconds * self.rate
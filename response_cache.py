@@ -0,0 +1,167 @@
+"""
+AI 响应缓存
+以 system prompt + 归一化 user prompt 的哈希为键缓存 DeepSeek 响应：
+行情平稳时相邻周期的 prompt 几乎相同，命中缓存可以省去一次完整的 LLM 往返
+
+归一化规则：
+- 去掉时间、周期编号、运行时长等每次都会变化的字段
+- 数值按有效数字分桶（默认 4 位，价格 110234.56 与 110241.10 视为相同）
+
+内存 LRU + TTL 淘汰，可选 SQLite 磁盘存储（进程重启后仍可命中）
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+# 每次调用都会变化的字段：时间戳、周期编号、运行时长（模式, 替换）
+_VOLATILE_PATTERNS = (
+    (re.compile(r'\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?'), ''),
+    (re.compile(r'(周期\**:\s*)#\d+'), r'\1'),
+    (re.compile(r'(运行\**:\s*)\d+分钟'), r'\1'),
+)
+
+# 数值：千分位写法（如 110,234.56）只在前后都不紧邻逗号 / 数字时成立，
+# 避免把逗号分隔的数值列表（如 CSV 行 45,47,52,55 或 210,141,59）合并成一个数
+_NUMBER = re.compile(r'(?<![\d,])-?\d{1,3}(?:,\d{3})+(?![\d,])(?:\.\d+)?|-?\d+(?:\.\d+)?')
+
+
+def normalize_prompt(text: str, significant_digits: int = 4) -> str:
+    """
+    归一化 user prompt：去掉易变字段，数值按有效数字分桶
+
+    Args:
+        text: 原始 prompt
+        significant_digits: 数值保留的有效数字位数
+
+    Returns:
+        归一化后的文本（仅用于计算缓存键）
+    """
+    for pattern, replacement in _VOLATILE_PATTERNS:
+        text = pattern.sub(replacement, text)
+
+    def bucket(match):
+        value = float(match.group(0).replace(',', ''))
+        return f'{value:.{significant_digits}g}'
+
+    return _NUMBER.sub(bucket, text)
+
+
+class ResponseCache:
+    """LRU + TTL 响应缓存（线程安全），可选 SQLite 磁盘存储"""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 600,
+                 db_path: Optional[str] = None, significant_digits: int = 4):
+        """
+        Args:
+            max_entries: 内存中最多保留的条目数（超出时淘汰最久未使用的）
+            ttl_seconds: 条目有效期（秒）
+            db_path: SQLite 磁盘存储路径，为 None 时只使用内存
+            significant_digits: 归一化时数值保留的有效数字位数
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.significant_digits = significant_digits
+
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()   # key -> (created_at, response)
+        self._lock = threading.Lock()
+
+        self._conn = None
+        if db_path:
+            db_dir = os.path.dirname(db_path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    created_at REAL NOT NULL,
+                    response TEXT NOT NULL
+                )
+            """)
+            self._conn.commit()
+
+    def make_key(self, system_prompt: str, user_prompt: str) -> str:
+        """缓存键：sha256(system prompt + 归一化 user prompt)"""
+        digest = hashlib.sha256()
+        digest.update(system_prompt.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(normalize_prompt(user_prompt, self.significant_digits).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存（内存未命中时查磁盘），过期条目视为未命中"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+
+            if entry is None and self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT created_at, response FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row and now - row[0] <= self.ttl_seconds:
+                    entry = (row[0], row[1])
+                    self._store(key, entry)
+                    self.disk_hits += 1
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, response: str):
+        """写入缓存（同时写入磁盘存储）"""
+        entry = (time.time(), response)
+        with self._lock:
+            self._store(key, entry)
+            if self._conn is not None:
+                self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, *entry))
+                self._conn.execute("DELETE FROM responses WHERE created_at < ?",
+                                   (entry[0] - self.ttl_seconds,))
+                self._conn.commit()
+
+    def _store(self, key: str, entry: tuple):
+        """写入内存 LRU（调用方需持有锁）"""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'disk_hits': self.disk_hits,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'hit_ratio': self.hits / total if total else 0.0
+            }
+
+    def close(self):
+        """关闭磁盘存储"""
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,286 @@
+"""
+交易绩效的增量统计
+每笔交易平仓时 O(1) 更新，不再每个周期遍历全部历史交易：
+- 收益率的均值 / 方差用 Welford 算法累计（窗口统计在移出旧交易时反向更新）
+- 夏普比率、索提诺比率、胜率、盈亏比、最大回撤
+- 窗口统计：最近 N 笔交易 / 最近 T 小时（环形缓冲区保存窗口内的交易）
+- 状态可序列化为 JSON，重启后直接恢复，不需要重放历史交易
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Optional
+
+
+class _Moments:
+    """收益率的累计量：Welford 均值 / 方差、下行平方和、盈亏笔数和金额（支持移出）"""
+
+    FIELDS = ('count', 'mean', 'm2', 'downside_sq', 'wins', 'losses', 'gross_profit', 'gross_loss')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.downside_sq = 0.0
+        self.wins = 0
+        self.losses = 0
+        self.gross_profit = 0.0
+        self.gross_loss = 0.0
+
+    def add(self, ret: float, pnl: float):
+        self.count += 1
+        delta = ret - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (ret - self.mean)
+        self._tally(ret, pnl, 1)
+
+    def remove(self, ret: float, pnl: float):
+        if self.count <= 1:
+            self.__init__()
+            return
+        self.count -= 1
+        delta = ret - self.mean
+        self.mean -= delta / self.count
+        # 反向更新可能累积微小的负误差
+        self.m2 = max(self.m2 - delta * (ret - self.mean), 0.0)
+        self._tally(ret, pnl, -1)
+
+    def _tally(self, ret: float, pnl: float, sign: int):
+        if ret < 0:
+            self.downside_sq = max(self.downside_sq + sign * ret * ret, 0.0)
+        if pnl > 0:
+            self.wins += sign
+            self.gross_profit += sign * pnl
+        elif pnl < 0:
+            self.losses += sign
+            self.gross_loss -= sign * pnl
+
+    def metrics(self) -> Dict:
+        """
+        Returns:
+            {'trades', 'mean_return_pct', 'std_return_pct', 'sharpe_ratio', 'sortino_ratio', 'win_rate',
+             'profit_factor'}；样本不足或分母为 0 时比率为 0.0（盈亏比没有亏损时为 None）
+        """
+        std = math.sqrt(self.m2 / (self.count - 1)) if self.count >= 2 else 0.0
+        downside = math.sqrt(self.downside_sq / self.count) if self.count else 0.0
+        return {
+            'trades': self.count,
+            'mean_return_pct': self.mean,
+            'std_return_pct': std,
+            # 与原先的简化版本一致：平均收益 / 收益率样本标准差（不扣无风险利率、不年化）
+            'sharpe_ratio': self.mean / std if std > 0 else 0.0,
+            'sortino_ratio': self.mean / downside if self.count >= 2 and downside > 0 else 0.0,
+            'win_rate': self.wins / self.count * 100 if self.count else 0.0,
+            'profit_factor': self.gross_profit / self.gross_loss if self.gross_loss > 0 else None
+        }
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def load(self, state: Dict):
+        for name in self.FIELDS:
+            setattr(self, name, state[name])
+
+
+class WindowStats:
+    """窗口统计：最近 max_trades 笔交易和 / 或最近 max_hours 小时内平仓的交易"""
+
+    def __init__(self, max_trades: Optional[int] = None, max_hours: Optional[float] = None):
+        """
+        Args:
+            max_trades: 窗口内最多保留的交易笔数
+            max_hours: 窗口时长（小时），按平仓时间移出过期交易
+        """
+        if max_trades is None and max_hours is None:
+            raise ValueError("窗口需要指定 max_trades 或 max_hours")
+        self.max_trades = max_trades
+        self.max_hours = max_hours
+        self.moments = _Moments()
+        # 环形缓冲区：(平仓时间, 收益率%, 盈亏, 平仓后净值)
+        self._entries = deque()
+
+    def add(self, ret: float, pnl: float, timestamp: float, equity: float):
+        self._entries.append((timestamp, ret, pnl, equity))
+        self.moments.add(ret, pnl)
+        if self.max_trades is not None and len(self._entries) > self.max_trades:
+            self._evict()
+        self.expire(timestamp)
+
+    def expire(self, now: float):
+        """移出窗口时长之外的交易"""
+        if self.max_hours is None:
+            return
+        cutoff = now - self.max_hours * 3600
+        while self._entries and self._entries[0][0] < cutoff:
+            self._evict()
+
+    def _evict(self):
+        _, ret, pnl, _ = self._entries.popleft()
+        self.moments.remove(ret, pnl)
+
+    def max_drawdown_pct(self) -> float:
+        """窗口内的最大回撤（%，从窗口开始前的净值算起；只遍历窗口内的交易）"""
+        if not self._entries:
+            return 0.0
+        _, _, first_pnl, first_equity = self._entries[0]
+        peak = first_equity - first_pnl
+        drawdown = 0.0
+        for _, _, _, equity in self._entries:
+            peak = max(peak, equity)
+            if peak > 0:
+                drawdown = max(drawdown, (peak - equity) / peak * 100)
+        return drawdown
+
+    def snapshot(self, now: Optional[float] = None) -> Dict:
+        if now is not None:
+            self.expire(now)
+        return {**self.moments.metrics(), 'max_drawdown_pct': self.max_drawdown_pct()}
+
+    def to_dict(self) -> Dict:
+        return {'max_trades': self.max_trades, 'max_hours': self.max_hours,
+                'moments': self.moments.to_dict(), 'entries': [list(entry) for entry in self._entries]}
+
+    @classmethod
+    def from_dict(cls, state: Dict) -> 'WindowStats':
+        window = cls(state['max_trades'], state['max_hours'])
+        window.moments.load(state['moments'])
+        window._entries.extend(tuple(entry) for entry in state['entries'])
+        return window
+
+
+class PerformanceStats:
+    """全部交易的累计统计 + 若干窗口统计（线程安全，通常作为平仓回调更新）"""
+
+    def __init__(self, initial_equity: float = 1000.0, windows: Optional[Dict[str, Dict]] = None,
+                 clock: Callable[[], float] = time.time):
+        """
+        Args:
+            initial_equity: 初始净值（计算回撤的起点）
+            windows: {名称: {'max_trades': N, 'max_hours': T}}，如 {'last_20': {'max_trades': 20}, '24h': {'max_hours': 24}}
+            clock: 时间函数（秒），snapshot() 据此移出过期的窗口交易
+        """
+        self.initial_equity = initial_equity
+        self.clock = clock
+        self._lock = threading.RLock()
+        self.moments = _Moments()
+        self.equity = initial_equity
+        self.peak = initial_equity
+        self.max_drawdown_pct = 0.0
+        self.windows = {name: WindowStats(**spec) for name, spec in (windows or {}).items()}
+
+    def add(self, pnl_pct: float, pnl: float = 0.0, timestamp: Optional[float] = None):
+        """
+        记入一笔平仓交易
+
+        Args:
+            pnl_pct: 收益率（%，相对保证金）
+            pnl: 已实现盈亏（美元，扣除手续费）
+            timestamp: 平仓时间（秒），默认当前时间
+        """
+        timestamp = self.clock() if timestamp is None else timestamp
+        with self._lock:
+            self.moments.add(pnl_pct, pnl)
+            self.equity += pnl
+            self.peak = max(self.peak, self.equity)
+            if self.peak > 0:
+                self.max_drawdown_pct = max(self.max_drawdown_pct, (self.peak - self.equity) / self.peak * 100)
+            for window in self.windows.values():
+                window.add(pnl_pct, pnl, timestamp, self.equity)
+
+    def add_trades(self, trades: Iterable[Dict]):
+        """记入交易记录（PaperAccount.trade_history 的格式：pnl_pct、pnl、closed_at），可直接作为平仓回调"""
+        for trade in trades:
+            if 'pnl_pct' not in trade:
+                continue
+            closed_at = trade.get('closed_at')
+            timestamp = datetime.fromisoformat(closed_at).timestamp() if closed_at else None
+            self.add(trade['pnl_pct'], trade.get('pnl', 0.0), timestamp)
+
+    @property
+    def sharpe_ratio(self) -> float:
+        with self._lock:
+            return self.moments.metrics()['sharpe_ratio']
+
+    def snapshot(self) -> Dict:
+        """当前的累计统计和各窗口统计"""
+        now = self.clock()
+        with self._lock:
+            return {
+                **self.moments.metrics(),
+                'max_drawdown_pct': self.max_drawdown_pct,
+                'current_drawdown_pct': (self.peak - self.equity) / self.peak * 100 if self.peak > 0 else 0.0,
+                'windows': {name: window.snapshot(now) for name, window in self.windows.items()}
+            }
+
+    # ========== 序列化 ==========
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                'initial_equity': self.initial_equity,
+                'equity': self.equity,
+                'peak': self.peak,
+                'max_drawdown_pct': self.max_drawdown_pct,
+                'moments': self.moments.to_dict(),
+                'windows': {name: window.to_dict() for name, window in self.windows.items()}
+            }
+
+    @classmethod
+    def from_dict(cls, state: Dict, clock: Callable[[], float] = time.time) -> 'PerformanceStats':
+        stats = cls(state['initial_equity'], clock=clock)
+        stats.equity = state['equity']
+        stats.peak = state['peak']
+        stats.max_drawdown_pct = state['max_drawdown_pct']
+        stats.moments.load(state['moments'])
+        stats.windows = {name: WindowStats.from_dict(window) for name, window in state['windows'].items()}
+        return stats
+
+    def save(self, path: str):
+        """写入 JSON 状态文件（先写临时文件再替换，中途退出不会留下损坏的文件）"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, initial_equity: float = 1000.0, windows: Optional[Dict[str, Dict]] = None,
+             clock: Callable[[], float] = time.time) -> 'PerformanceStats':
+        """
+        从状态文件恢复；文件不存在或无法解析时新建
+
+        已保存的窗口按保存时的参数恢复，windows 中新增的窗口从空开始
+        """
+        stats = None
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    stats = cls.from_dict(json.load(f), clock=clock)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"⚠️ 绩效统计状态读取失败，重新开始统计: {e}")
+        if stats is None:
+            return cls(initial_equity, windows, clock=clock)
+        for name, spec in (windows or {}).items():
+            stats.windows.setdefault(name, WindowStats(**spec))
+        return stats
+
+
+def format_performance(snapshot: Dict) -> str:
+    """一行绩效摘要，如 '夏普 0.42 | 索提诺 0.61 | 胜率 55.0% | 盈亏比 1.32 | 最大回撤 4.10% (12 笔)'"""
+    profit_factor = snapshot['profit_factor']
+    parts = [
+        f"夏普 {snapshot['sharpe_ratio']:.2f}",
+        f"索提诺 {snapshot['sortino_ratio']:.2f}",
+        f"胜率 {snapshot['win_rate']:.1f}%",
+        f"盈亏比 {profit_factor:.2f}" if profit_factor is not None else "盈亏比 -",
+        f"最大回撤 {snapshot['max_drawdown_pct']:.2f}% ({snapshot['trades']} 笔)"
+    ]
+    return ' | '.join(parts)
+
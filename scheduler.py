@@ -0,0 +1,137 @@
+"""
+K 线收盘对齐调度器
+按交易所时间把分析周期对齐到 K 线边界（收盘后若干毫秒），不随分析耗时漂移：
+- 下次运行时间由边界计算，而不是"上次结束 + 间隔"
+- 通过交易所服务器时间校正本地时钟偏差（定期重新同步）
+- 分析超时跨过一个或多个边界时，跳过（skip）或合并为一次立即运行（coalesce），不会堆积
+- 每次唤醒相对计划时间的延迟记录为 scheduler.lag_ms 指标
+"""
+
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+import ccxt
+
+from metrics import MetricsRegistry, get_registry
+
+
+class CandleScheduler:
+    """对齐 K 线收盘的无漂移调度器"""
+
+    def __init__(self, timeframe: str = '3m', offset_ms: float = 300, overrun: str = 'skip',
+                 time_source: Optional[Callable[[], int]] = None, resync_seconds: float = 3600,
+                 clock: Callable[[], float] = time.time, sleep: Callable[[float], None] = time.sleep,
+                 metrics: Optional[MetricsRegistry] = None):
+        """
+        Args:
+            timeframe: 对齐的 K 线周期（'3m'、'15m'、'1h'，也支持 '60s' 这样的秒级周期）
+            offset_ms: 收盘后延迟多少毫秒运行（等待交易所完成收盘 K 线）
+            overrun: 错过边界时的处理方式：'skip' 等待下一个边界；'coalesce' 合并为一次立即运行
+            time_source: 返回交易所服务器时间（毫秒）的函数，如 exchange.fetch_time；为 None 时不校正
+            resync_seconds: 重新同步时钟偏差的间隔（秒）
+            clock: 本地时间函数（秒）
+            sleep: 休眠函数（秒）
+            metrics: 指标注册表，为 None 时使用进程内默认实例
+        """
+        if overrun not in ('skip', 'coalesce'):
+            raise ValueError(f"未知的 overrun 策略: {overrun}")
+
+        self.timeframe = timeframe
+        self.period = ccxt.Exchange.parse_timeframe(timeframe)
+        self.offset = offset_ms / 1000
+        self.overrun = overrun
+        self.time_source = time_source
+        self.resync_seconds = resync_seconds
+        self.clock = clock
+        self.sleep = sleep
+        self.metrics = metrics or get_registry()
+
+        # 交易所时间 - 本地时间（秒）
+        self.clock_offset = 0.0
+        self.synced_at = None
+
+        # 下一次计划运行的时间（交易所时间，秒）
+        self.next_run = None
+        self.skipped = 0
+        self.last_lag_ms = None
+
+    def sync_clock(self) -> float:
+        """
+        用交易所服务器时间校正本地时钟（取请求往返的中点）
+
+        Returns:
+            当前的时钟偏差（秒，正数表示交易所时间比本地快）
+        """
+        if self.time_source is None:
+            return self.clock_offset
+        try:
+            before = self.clock()
+            server_ms = self.time_source()
+            after = self.clock()
+            self.clock_offset = server_ms / 1000 - (before + after) / 2
+            self.synced_at = after
+            self.metrics.observe('scheduler.clock_offset_ms', self.clock_offset * 1000)
+        except Exception as e:
+            print(f"⚠️ 交易所时间同步失败，沿用上次偏差 {self.clock_offset * 1000:.0f}ms: {e}")
+            self.synced_at = self.clock()
+        return self.clock_offset
+
+    def exchange_time(self) -> float:
+        """当前交易所时间（秒）"""
+        return self.clock() + self.clock_offset
+
+    def _boundary_after(self, t: float) -> float:
+        """t 之后的第一个运行时间（K 线边界 + 偏移）"""
+        return ((t - self.offset) // self.period + 1) * self.period + self.offset
+
+    def next_run_time(self) -> float:
+        """下一次计划运行的交易所时间（秒）"""
+        if self.next_run is None:
+            self.next_run = self._boundary_after(self.exchange_time())
+        return self.next_run
+
+    def next_run_local(self) -> datetime:
+        """下一次运行的本地时间（用于显示）"""
+        return datetime.fromtimestamp(self.next_run_time() - self.clock_offset)
+
+    def wait_next(self) -> Dict:
+        """
+        休眠到下一次计划运行时间
+
+        Returns:
+            {'scheduled': 计划时间, 'lag_ms': 实际唤醒相对计划的延迟, 'skipped': 本次跳过的边界数}
+        """
+        if self.time_source is not None and (
+                self.synced_at is None or self.clock() - self.synced_at >= self.resync_seconds):
+            self.sync_clock()
+
+        target = self.next_run_time()
+        now = self.exchange_time()
+        skipped = 0
+
+        # 上一次运行跨过了计划时间：跳过已错过的边界，或合并为一次立即运行
+        if now > target + 1:
+            missed = int((now - target) // self.period) + 1
+            if self.overrun == 'skip':
+                skipped = missed
+                target = self._boundary_after(now)
+            else:
+                skipped = missed - 1
+                target = now
+            self.skipped += skipped
+            self.metrics.inc('scheduler.skipped', skipped)
+
+        # 分段休眠，期间系统时间调整也能及时修正
+        while True:
+            remaining = target - self.exchange_time()
+            if remaining <= 0:
+                break
+            self.sleep(min(remaining, 60))
+
+        lag_ms = (self.exchange_time() - target) * 1000
+        self.last_lag_ms = lag_ms
+        self.metrics.observe('scheduler.lag_ms', lag_ms)
+
+        self.next_run = self._boundary_after(target)
+        return {'scheduled': target, 'lag_ms': lag_ms, 'skipped': skipped}
@@ -0,0 +1,332 @@
+"""
+Telegram 发送队列
+分析流程只把消息放入队列（立即返回 Future），由后台线程按入队顺序发送：
+- 全局和每个聊天各一个令牌桶限速（Telegram 限制约 30 条/秒、单聊天约 1 条/秒）
+- 429 按返回的 retry_after 等待后重发，5xx / 网络错误指数退避重试
+- 超过 4096 字符的消息在换行 / 空格处拆分，不切断 HTML 标签和实体，被拆开的标签在下一段重新打开
+- HTML 解析失败（400 can't parse entities）时去掉标签以纯文本重发
+"""
+
+import html
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+from http_transport import HTTPTransport, get_shared_transport
+from metrics import MetricsRegistry, get_registry
+from rate_limit import TokenBucket
+
+
+# Telegram 单条消息的最大长度
+TELEGRAM_MAX_LENGTH = 4096
+
+# 标签、实体、换行、空白、普通文本（遇到 < 或 & 时单独成一个字符）
+_TOKEN_PATTERN = re.compile(r'<[^<>]*>|&#?\w+;|\n|[^\S\n]+|[^\s<&]+|[<&]')
+_TAG_PATTERN = re.compile(r'<[^<>]*>')
+_TAG_NAME_PATTERN = re.compile(r'<\s*/?\s*([a-zA-Z][\w-]*)')
+
+
+def _tokenize(text: str, max_token: int) -> List[str]:
+    """切分为不可再分的片段；过长的连续文本（如无空格的中文段落）按 max_token 硬切"""
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(text):
+        if len(token) > max_token and not token.startswith('<'):
+            tokens.extend(token[i:i + max_token] for i in range(0, len(token), max_token))
+        else:
+            tokens.append(token)
+    return tokens
+
+
+def _apply_tag(stack: List, token: str) -> List:
+    """根据片段更新未闭合的标签栈（返回新列表）"""
+    if not token.startswith('<') or not token.endswith('>') or token.endswith('/>'):
+        return stack
+    match = _TAG_NAME_PATTERN.match(token)
+    if match is None:
+        return stack
+    name = match.group(1).lower()
+    if token.startswith('</') or token.startswith('< /'):
+        for i in range(len(stack) - 1, -1, -1):
+            if stack[i][0] == name:
+                return stack[:i] + stack[i + 1:]
+        return stack
+    return stack + [(name, token)]
+
+
+def _closing(stack: List) -> str:
+    return ''.join(f'</{name}>' for name, _ in reversed(stack))
+
+
+def split_html(text: str, limit: int = TELEGRAM_MAX_LENGTH) -> List[str]:
+    """
+    把 HTML 消息拆分为不超过 limit 字符的若干段
+
+    优先在换行处拆分（段落不小于 limit 的一半），其次在空白处，最后才硬切；
+    每段末尾补齐未闭合的标签，下一段开头重新打开
+
+    Returns:
+        消息段列表（不含空白段）
+    """
+    if len(text) <= limit:
+        return [text]
+
+    tokens = deque(_tokenize(text, max(limit // 4, 1)))
+    chunks = []
+    stack = []
+    while tokens:
+        prefix = ''.join(tag for _, tag in stack)
+        consumed = []
+        length = len(prefix)
+        chunk_stack = stack
+        newline_cut = space_cut = None
+
+        while tokens:
+            token = tokens[0]
+            new_stack = _apply_tag(chunk_stack, token)
+            if consumed and length + len(token) + len(_closing(new_stack)) > limit:
+                break
+            tokens.popleft()
+            consumed.append(token)
+            length += len(token)
+            chunk_stack = new_stack
+            if token == '\n':
+                newline_cut = (len(consumed), length, chunk_stack)
+            elif token.isspace():
+                space_cut = (len(consumed), length, chunk_stack)
+
+        if tokens:
+            # 超长：退回到最近的换行（或空白）处，剩余片段放回队列
+            for cut in (newline_cut, space_cut):
+                if cut is not None and cut[1] >= limit // 2:
+                    count, _, chunk_stack = cut
+                    tokens.extendleft(reversed(consumed[count:]))
+                    consumed = consumed[:count]
+                    break
+
+        chunk = prefix + ''.join(consumed) + _closing(chunk_stack)
+        if _TAG_PATTERN.sub('', chunk).strip():
+            chunks.append(chunk)
+        stack = chunk_stack
+    return chunks
+
+
+def html_to_plain(text: str) -> str:
+    """去掉 HTML 标签并还原实体（HTML 解析失败时的纯文本版本）"""
+    return html.unescape(_TAG_PATTERN.sub('', text))
+
+
+class TelegramOutbox:
+    """后台发送队列（单个发送线程，保证消息按入队顺序送达）"""
+
+    def __init__(self, bot_token: str, chat_id: Optional[str] = None,
+                 http: Optional[HTTPTransport] = None, api_base: str = 'https://api.telegram.org',
+                 global_rate: float = 30, chat_rate: float = 1, chat_burst: float = 3,
+                 max_retries: int = 5, max_queue: int = 1000, timeout: float = 30,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep,
+                 metrics: Optional[MetricsRegistry] = None):
+        """
+        Args:
+            bot_token: Bot Token
+            chat_id: 默认聊天 ID
+            http: HTTP 传输层，为 None 时使用进程内共享实例
+            api_base: Bot API 地址
+            global_rate: 全局限速（条/秒）
+            chat_rate: 单个聊天限速（条/秒）
+            chat_burst: 单个聊天允许的突发条数
+            max_retries: 单条请求的最大重试次数（429、5xx、网络错误）
+            max_queue: 队列上限，已满时新消息直接失败（不阻塞调用方）
+            timeout: 单次请求的读超时（秒）
+            clock: 计时函数（秒）
+            sleep: 休眠函数（秒）
+            metrics: 指标注册表，为 None 时使用进程内默认实例
+        """
+        self.bot_token = bot_token
+        self.chat_id = chat_id
+        self.http = http or get_shared_transport()
+        self.api_base = api_base.rstrip('/')
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.clock = clock
+        self.sleep = sleep
+        self.metrics = metrics or get_registry()
+
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.global_bucket = TokenBucket(global_rate, global_rate, clock)
+        self.chat_buckets: Dict[str, TokenBucket] = {}
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name='telegram-outbox', daemon=True)
+        self._worker.start()
+
+    # ========== 生产者接口（不阻塞） ==========
+
+    def send_message(self, text: str, chat_id: Optional[str] = None, parse_mode: Optional[str] = 'HTML') -> Future:
+        """
+        消息入队（超长时自动拆分为多条）
+
+        Returns:
+            Future，全部分段发送成功时结果为 True
+        """
+        return self._enqueue({'kind': 'message', 'text': text, 'chat_id': chat_id or self.chat_id,
+                              'parse_mode': parse_mode})
+
+    def send_photo(self, path: str, chat_id: Optional[str] = None, caption: Optional[str] = None) -> Future:
+        """
+        图片入队（按入队顺序排在之前的文本消息之后）
+
+        Returns:
+            Future，发送成功时结果为 True
+        """
+        return self._enqueue({'kind': 'photo', 'path': path, 'chat_id': chat_id or self.chat_id,
+                              'caption': caption})
+
+    def _enqueue(self, item: Dict) -> Future:
+        future = Future()
+        item['future'] = future
+        item['enqueued_at'] = self.clock()
+        if self._closed:
+            future.set_result(False)
+            return future
+        try:
+            self._queue.put_nowait(item)
+            self.metrics.inc('telegram.enqueued')
+        except queue.Full:
+            print(f"⚠️ Telegram 发送队列已满（{self._queue.maxsize} 条），丢弃消息")
+            self.metrics.inc('telegram.dropped')
+            future.set_result(False)
+        return future
+
+    def pending(self) -> int:
+        """队列中尚未发送完成的条数"""
+        return self._queue.unfinished_tasks
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待队列发送完毕，返回是否在超时前完成"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout: Optional[float] = 30) -> bool:
+        """停止接收新消息，等待已入队的消息发送完毕"""
+        self._closed = True
+        done = self.flush(timeout)
+        self._queue.put(None)
+        return done
+
+    # ========== 发送线程 ==========
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                ok = self._deliver(item)
+                self.metrics.observe('telegram.queue_ms', (self.clock() - item['enqueued_at']) * 1000)
+                item['future'].set_result(ok)
+            except Exception as e:
+                print(f"  Telegram 发送异常: {e}")
+                self.metrics.inc('telegram.failed')
+                item['future'].set_result(False)
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, item: Dict) -> bool:
+        chat_id = item['chat_id']
+        if item['kind'] == 'photo':
+            path = item['path']
+            if not path or not os.path.exists(path):
+                return False
+            data = {'chat_id': chat_id}
+            if item['caption']:
+                data['caption'] = item['caption']
+            return self._call('sendPhoto', chat_id, data=data, photo_path=path)
+
+        parts = split_html(item['text']) if item['parse_mode'] == 'HTML' else [
+            item['text'][i:i + TELEGRAM_MAX_LENGTH] for i in range(0, len(item['text']), TELEGRAM_MAX_LENGTH)]
+        self.metrics.observe('telegram.parts', len(parts))
+        for part in parts:
+            payload = {'chat_id': chat_id, 'text': part}
+            if item['parse_mode']:
+                payload['parse_mode'] = item['parse_mode']
+            if not self._call('sendMessage', chat_id, json=payload):
+                return False
+        return True
+
+    def _throttle(self, chat_id: str):
+        """从全局和该聊天的令牌桶各预留一个令牌，等到两者都允许发送"""
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, self.clock)
+        wait = max(self.global_bucket.delay_for(), bucket.delay_for())
+        if wait > 0:
+            self.metrics.observe('telegram.throttle_ms', wait * 1000)
+            self.sleep(wait)
+
+    def _call(self, method: str, chat_id: str, json: Optional[Dict] = None, data: Optional[Dict] = None,
+              photo_path: Optional[str] = None) -> bool:
+        """调用 Bot API（限速、429 / 5xx / 网络错误重试、HTML 解析失败时以纯文本重发）"""
+        url = f"{self.api_base}/bot{self.bot_token}/{method}"
+        for attempt in range(self.max_retries + 1):
+            self._throttle(chat_id)
+            try:
+                if photo_path is not None:
+                    with open(photo_path, 'rb') as photo:
+                        response = self.http.post(url, data=data, files={'photo': photo}, timeout=self.timeout)
+                else:
+                    response = self.http.post(url, json=json, timeout=self.timeout)
+            except Exception as e:
+                delay = min(2 ** attempt, 30)
+                print(f"  Telegram 网络错误，{delay}s 后重试: {e}")
+                self.metrics.inc('telegram.retries')
+                self.sleep(delay)
+                continue
+
+            if response.status_code == 200:
+                self.metrics.inc('telegram.sent')
+                return True
+
+            if response.status_code == 429:
+                retry_after = self._retry_after(response)
+                print(f"  Telegram 限流，{retry_after}s 后重试")
+                self.metrics.inc('telegram.rate_limited')
+                self.metrics.inc('telegram.retries')
+                self.global_bucket.pause(retry_after)
+                self.chat_buckets[chat_id].pause(retry_after)
+                continue
+
+            if response.status_code >= 500:
+                delay = min(2 ** attempt, 30)
+                print(f"  Telegram 服务端错误 {response.status_code}，{delay}s 后重试")
+                self.metrics.inc('telegram.retries')
+                self.sleep(delay)
+                continue
+
+            if json is not None and json.get('parse_mode') and "can't parse entities" in response.text:
+                print(f"  HTML 解析失败，改为纯文本发送: {response.text[:200]}")
+                json = {'chat_id': json['chat_id'], 'text': html_to_plain(json['text'])}
+                continue
+
+            print(f"  Telegram {method} 失败 {response.status_code}: {response.text[:200]}")
+            break
+
+        self.metrics.inc('telegram.failed')
+        return False
+
+    @staticmethod
+    def _retry_after(response) -> float:
+        """429 响应的等待秒数（优先取 parameters.retry_after，其次 Retry-After 头）"""
+        try:
+            return float(response.json()['parameters']['retry_after'])
+        except Exception:
+            return float(response.headers.get('Retry-After', 1))
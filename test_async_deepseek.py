@@ -0,0 +1,157 @@
+"""
+AsyncDeepSeekClient 测试
+启动本地 aiohttp 模拟服务（固定延迟，可注入 503 错误），
+验证并发扇出、并发上限、重试和 token 预算限流
+"""
+
+import asyncio
+import json
+import time
+
+from aiohttp import web
+
+from deepseek_client import AsyncDeepSeekClient
+from rate_limit import TokenBucket
+
+
+class StubAPI:
+    """模拟 chat/completions：回显 user prompt，记录最大在途请求数"""
+
+    def __init__(self, latency: float = 0.1, fail_first=()):
+        self.latency = latency
+        self.fail_first = set(fail_first)
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.runner = None
+        self.url = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        self.url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/v1"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    async def handle(self, request):
+        body = await request.json()
+        prompt = body['messages'][-1]['content']
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+
+        if prompt in self.fail_first:
+            self.fail_first.discard(prompt)
+            return web.Response(status=503, text='Service Unavailable')
+
+        content = f'{prompt} {{"symbol": "{prompt}"}}'
+        if body.get('stream'):
+            response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+            await response.prepare(request)
+            for i in range(0, len(content), 3):
+                event = {'choices': [{'delta': {'content': content[i:i + 3]}}]}
+                await response.write(f"data: {json.dumps(event)}\n\n".encode())
+            await response.write(b"data: [DONE]\n\n")
+            return response
+        return web.json_response({'choices': [{'message': {'content': content}}]})
+
+
+def test_fan_out(n_prompts: int = 20, max_concurrency: int = 5):
+    """并发扇出：结果顺序与输入一致，在途请求数不超过上限，总耗时约为 批次数 × 单次延迟"""
+
+    async def run():
+        api = StubAPI(latency=0.1)
+        await api.start()
+        try:
+            async with AsyncDeepSeekClient('test', base_url=api.url, max_concurrency=max_concurrency) as client:
+                prompts = [('system', f'COIN{i}') for i in range(n_prompts)]
+                start = time.perf_counter()
+                results = await client.acall_many(prompts)
+                elapsed = time.perf_counter() - start
+        finally:
+            await api.stop()
+        return api, results, elapsed
+
+    api, results, elapsed = asyncio.run(run())
+
+    assert [r.split()[0] for r in results] == [f'COIN{i}' for i in range(n_prompts)]
+    assert api.max_in_flight == max_concurrency
+    sequential = n_prompts * api.latency
+    assert elapsed < sequential / 2
+    print(f"  {n_prompts} 个 prompt，并发 {max_concurrency}: {elapsed:.2f}s（顺序调用约 {sequential:.1f}s）")
+
+
+def test_retry_and_stream():
+    """503 后非阻塞重试成功；流式模式下 JSON 提前回调；失败不影响其他 prompt"""
+
+    async def run():
+        api = StubAPI(latency=0.01, fail_first={'FLAKY'})
+        await api.start()
+        detected = []
+        try:
+            client = AsyncDeepSeekClient('test', base_url=api.url, retry_base_delay=0.01)
+            results = await client.acall_many([('s', 'FLAKY'), ('s', 'OK')])
+            streamed = await client.call_with_messages('s', 'STREAM', stream=True, on_json=detected.append)
+            await client.close()
+        finally:
+            await api.stop()
+        return client, results, streamed, detected
+
+    client, results, streamed, detected = asyncio.run(run())
+
+    assert results == ['FLAKY {"symbol": "FLAKY"}', 'OK {"symbol": "OK"}']
+    assert client.stats['retries'] == 1
+    assert streamed == 'STREAM {"symbol": "STREAM"}'
+    assert detected == [{'symbol': 'STREAM'}]
+
+
+def test_token_budget():
+    """token 预算：超出突发容量的调用在事件循环内等待（不阻塞其他协程）"""
+
+    async def run():
+        api = StubAPI(latency=0.0)
+        await api.start()
+        try:
+            async with AsyncDeepSeekClient('test', base_url=api.url) as client:
+                # 每次调用约 2000 token（max_tokens），容量只够 2 次，之后按 20000 token/秒补充
+                client.token_budget = TokenBucket(rate=20000, capacity=4100)
+                start = time.perf_counter()
+                await client.acall_many([('s', f'COIN{i}') for i in range(6)])
+                return client, time.perf_counter() - start
+        finally:
+            await api.stop()
+
+    client, elapsed = asyncio.run(run())
+
+    assert elapsed >= 0.35, elapsed
+    assert client.stats['budget_wait_seconds'] > 0
+    print(f"  token 预算限流: 6 次调用耗时 {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    print("\n" + "=" * 60)
+    print("🧪 AsyncDeepSeekClient 测试（本地模拟服务，单次延迟 100ms）")
+    print("=" * 60 + "\n")
+
+    test_fan_out()
+    test_fan_out(50, 10)
+    print("✓ 并发扇出\n")
+
+    test_retry_and_stream()
+    print("✓ 非阻塞重试与流式 JSON 回调\n")
+
+    test_token_budget()
+    print("✓ token 预算限流\n")
+
+    print("=" * 60)
+    print("✅ 测试完成")
+    print("=" * 60 + "\n")
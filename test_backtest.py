@@ -0,0 +1,229 @@
+"""
+历史回放 / 回测引擎测试
+用随机游走生成的 K 线缓存（3 分钟 K 线聚合出 15m / 1h / 4h）回放交易决策流程：
+验证回放窗口不含未来数据、未收盘 K 线合成正确、批量指标与 TA-Lib 一致、止损 / 止盈判定、串行与多进程结果一致、
+录制响应按时间匹配，并报告每秒周期数
+"""
+
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from backtest import (CandleHistory, DecisionSource, RecordedDecisions, ReplayEngine, RuleModel, evaluate_decision,
+                      format_report, run_backtest, timeframe_ms, to_dataframe, to_ms)
+from log_sink import LogSink
+from metrics import MetricsRegistry
+from ohlcv_store import OHLCVStore
+
+SYMBOL = 'BTC/USDT'
+HISTORY_START = datetime(2025, 9, 1)
+REPLAY_START = datetime(2025, 9, 12)
+REPLAY_END = datetime(2025, 9, 15)
+
+
+def _build_store(path, days=15, seed=11):
+    """随机游走的 3 分钟 K 线，聚合为 15m / 1h / 4h 后写入缓存"""
+    rng = np.random.default_rng(seed)
+    count = days * 480
+    step = timeframe_ms('3m')
+    start = to_ms(HISTORY_START) // timeframe_ms('4h') * timeframe_ms('4h')
+    timestamps = start + np.arange(count) * step
+    closes = 100000 * np.exp(np.cumsum(rng.normal(0, 0.0015, count)))
+    opens = np.concatenate([[100000.0], closes[:-1]])
+    highs = np.maximum(opens, closes) * (1 + rng.uniform(0, 0.001, count))
+    lows = np.minimum(opens, closes) * (1 - rng.uniform(0, 0.001, count))
+    volumes = rng.uniform(50, 150, count)
+    base = np.column_stack([timestamps, opens, highs, lows, closes, volumes])
+
+    store = OHLCVStore(path)
+    store.upsert(SYMBOL, '3m', base.tolist())
+    for timeframe in ('15m', '1h', '4h'):
+        size = timeframe_ms(timeframe) // step
+        groups = base[:count // size * size].reshape(-1, size, 6)
+        store.upsert(SYMBOL, timeframe, np.column_stack([
+            groups[:, 0, 0], groups[:, 0, 1], groups[:, :, 2].max(axis=1),
+            groups[:, :, 3].min(axis=1), groups[:, -1, 4], groups[:, :, 5].sum(axis=1)
+        ]).tolist())
+    store.close()
+    return base
+
+
+class PromptRecorder(DecisionSource):
+    """记录每个周期收到的回放时刻和 prompt，再交给规则模型决策"""
+
+    name = 'recorder'
+
+    def __init__(self):
+        self.model = RuleModel()
+        self.cycles = []
+
+    def respond(self, cycle):
+        self.cycles.append((cycle['time'], cycle['user_prompt']))
+        return self.model.respond(cycle)
+
+
+def test_windows_without_lookahead():
+    """回放窗口只含 t 之前已收盘的 K 线；未收盘 K 线由 3 分钟 K 线合成，与交易所的聚合结果一致"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'ohlcv.sqlite3')
+        base = _build_store(path)
+        store = OHLCVStore(path)
+        history = CandleHistory(store, SYMBOL, to_ms(REPLAY_START), to_ms(REPLAY_END), forward_ms=timeframe_ms('4h'))
+        store.close()
+
+        t = to_ms(REPLAY_START + timedelta(hours=2, minutes=35))
+        for timeframe, rows in ((tf, history.window(tf, t)) for tf in history.timeframes):
+            assert rows is not None
+            # 已收盘的 K 线收盘时间不晚于 t；最后一根（未收盘）的开盘时间早于 t
+            assert (rows[:-1, 0] + timeframe_ms(timeframe) <= t).all() and rows[-1, 0] < t
+
+        # 1h 未收盘 K 线 = 02:00 之后已收盘的 3 分钟 K 线（02:00 ~ 02:30 共 11 根）
+        forming = history.window('1h', t)[-1]
+        visible = base[(base[:, 0] >= t - 35 * 60000) & (base[:, 0] + timeframe_ms('3m') <= t)]
+        assert len(visible) == 11
+        assert forming[1] == visible[0, 1] and forming[4] == visible[-1, 4]
+        assert forming[2] == visible[:, 2].max() and forming[3] == visible[:, 3].min()
+
+        # 对齐整点时没有未收盘的 1h K 线，窗口最后一根是刚收盘的 K 线（与缓存中的完全一致）
+        t = to_ms(REPLAY_START + timedelta(hours=3))
+        assert history.window('1h', t)[-1, 0] == t - timeframe_ms('1h')
+
+        # 之后的 3 分钟 K 线从 t 时未收盘的那根开始
+        assert history.forward(t, 5)[0, 0] == t
+
+
+def test_batch_matches_talib():
+    """批量计算的回放指标与实盘逐个时间框架的 TA-Lib 计算一致"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'ohlcv.sqlite3')
+        _build_store(path)
+        store = OHLCVStore(path)
+        history = CandleHistory(store, SYMBOL, to_ms(REPLAY_START), to_ms(REPLAY_END))
+        store.close()
+
+    engine = ReplayEngine(path, RuleModel())
+    times = range(to_ms(REPLAY_START), to_ms(REPLAY_END), 37 * 60000)
+    cycles = [(t, {tf: history.window(tf, t) for tf in history.timeframes}) for t in times]
+    for (_, windows), series in zip(cycles, engine._batch_series(cycles)):
+        for timeframe, rows in windows.items():
+            expected = engine.market_data._calculate_timeframe_series(to_dataframe(rows), timeframe)
+            assert np.allclose(series[timeframe].values, expected.values, rtol=1e-6, atol=1e-6), timeframe
+
+
+def test_evaluate_decision():
+    """止损 / 止盈按先触发者平仓；同一根 K 线都触及时按止损计；都未触及按观察期末收盘价"""
+    forward = np.array([
+        # ts, open, high, low, close, volume
+        [0, 100, 101, 99, 100, 1],
+        [1, 100, 104, 99, 103, 1],
+        [2, 103, 112, 102, 110, 1],
+        [3, 110, 111, 90, 95, 1],
+    ], dtype=float)
+    long = {'action': 'open_long', 'stop_loss': 95, 'take_profit': 110, 'position_size_usd': 1000}
+    outcome = evaluate_decision(long, 100, forward)
+    assert outcome['exit'] == 'take_profit' and outcome['bars'] == 3
+    assert abs(outcome['return_pct'] - 10) < 1e-9 and abs(outcome['pnl_usd'] - 100) < 1e-9
+
+    short = {'action': 'open_short', 'stop_loss': 103.5, 'take_profit': 90}
+    outcome = evaluate_decision(short, 100, forward)
+    assert outcome['exit'] == 'stop_loss' and outcome['bars'] == 2 and abs(outcome['return_pct'] + 3.5) < 1e-9
+
+    both = {'action': 'open_long', 'stop_loss': 91, 'take_profit': 111}
+    outcome = evaluate_decision(both, 105, forward[3:])
+    assert outcome['exit'] == 'stop_loss'
+
+    neither = {'action': 'open_long', 'stop_loss': 50, 'take_profit': 200}
+    outcome = evaluate_decision(neither, 100, forward)
+    assert outcome['exit'] == 'timeout' and abs(outcome['return_pct'] + 5) < 1e-9
+
+    wait = evaluate_decision({'action': 'wait'}, 100, forward)
+    assert 'exit' not in wait and abs(wait['forward_pct'] + 5) < 1e-9
+
+
+def test_replay_serial_and_parallel():
+    """三天的 5 分钟周期：串行与多进程回放结果一致，prompt 使用回放时刻"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'ohlcv.sqlite3')
+        _build_store(path)
+
+        recorder = PromptRecorder()
+        serial = run_backtest(path, REPLAY_START, REPLAY_END, source=recorder, workers=1)
+        parallel = run_backtest(path, REPLAY_START, REPLAY_END, source=RuleModel(), workers=2)
+
+    assert serial['cycles'] == 3 * 288 and serial['skipped'] == 0
+    assert serial['records'] == parallel['records'] and parallel['workers'] == 2
+    assert serial['responded'] == serial['cycles']
+
+    actions = serial['actions']
+    assert actions['wait']['count'] > 0 and 'avg_forward_pct' in actions['wait']
+    opened = [action for action in ('open_long', 'open_short') if action in actions]
+    assert opened and all(sum(actions[action]['exits'].values()) == actions[action]['count'] for action in opened)
+
+    # prompt 中的时间和周期编号来自回放时刻
+    first_time, first_prompt = recorder.cycles[0]
+    assert first_time == REPLAY_START
+    assert f"时间: {REPLAY_START:%Y-%m-%d %H:%M:%S} | 周期: #1 |" in first_prompt
+    assert f"周期: #{serial['cycles']} |" in recorder.cycles[-1][1]
+
+    print(format_report(serial))
+    print(format_report({**parallel, 'actions': {}}))
+
+
+def test_recorded_decisions():
+    """录制的响应按回放时刻匹配（日志时间晚于周期开始）；没有录制的周期不产生决策"""
+    rng = random.Random(2)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'ohlcv.sqlite3')
+        _build_store(path)
+
+        logs = os.path.join(tmp, 'analysis_logs')
+        clock_now = [0.0]
+        sink = LogSink(logs, clock=lambda: clock_now[0], metrics=MetricsRegistry())
+        expected = {}
+        t = REPLAY_START
+        while t < REPLAY_START + timedelta(days=1):
+            if rng.random() < 0.5:
+                action = rng.choice(['open_long', 'open_short', 'wait'])
+                logged = t + timedelta(seconds=rng.uniform(20, 60))
+                clock_now[0] = logged.timestamp()
+                sink.write({'success': True, 'timestamp': logged.isoformat(), 'cot_trace': '录制的分析',
+                            'decisions': [{'symbol': 'BTCUSDT', 'action': action}]})
+                expected[t.isoformat()] = action
+            t += timedelta(minutes=5)
+        sink.close()
+
+        report = run_backtest(path, REPLAY_START, REPLAY_START + timedelta(days=1),
+                              source=RecordedDecisions(logs, tolerance_seconds=120), workers=1)
+
+    assert report['responded'] == len(expected)
+    replayed = {record['time']: record['decisions'][0]['action'] for record in report['records'] if record['decisions']}
+    assert replayed == expected
+    print(f"  录制响应 {len(expected)}/{report['cycles']} 个周期全部匹配")
+
+
+if __name__ == '__main__':
+    print("\n" + "=" * 60)
+    print("🧪 历史回放 / 回测引擎测试")
+    print("=" * 60 + "\n")
+
+    test_windows_without_lookahead()
+    print("✓ 回放窗口不含未来数据\n")
+
+    test_batch_matches_talib()
+    print("✓ 批量指标与 TA-Lib 一致\n")
+
+    test_evaluate_decision()
+    print("✓ 止损 / 止盈判定\n")
+
+    test_replay_serial_and_parallel()
+    print("✓ 串行与多进程回放\n")
+
+    test_recorded_decisions()
+    print("✓ 录制响应回放\n")
+
+    print("=" * 60)
+    print("✅ 测试完成")
+    print("=" * 60 + "\n")
@@ -0,0 +1,170 @@
+"""
+本地图表渲染测试
+用模拟行情验证 PNG 输出（文件结构、尺寸、各面板颜色）、工作进程渲染、监控器的本地渲染与回退，
+并统计渲染耗时（设置 CHART_API_KEY 环境变量时同时测量 Chart API 的往返耗时作对比）
+"""
+
+import json
+import os
+import struct
+import tempfile
+import time
+import zlib
+
+import numpy as np
+import requests
+
+from btc_monitor import BTCMonitor
+from chart_renderer import COLORS, ChartRenderer, extract_series, render_chart
+from test_helpers import mock_market_data
+
+
+def _read_png(path):
+    """解析 PNG（只支持 write_png 输出的 8 位 RGB 无滤波格式）→ (height, width, 3) 数组"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert data[:8] == b'\x89PNG\r\n\x1a\n'
+
+    pos, chunks = 8, {}
+    while pos < len(data):
+        length, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        body = data[pos + 8:pos + 8 + length]
+        crc, = struct.unpack('>I', data[pos + 8 + length:pos + 12 + length])
+        assert crc == zlib.crc32(kind + body)
+        chunks[kind] = chunks.get(kind, b'') + body
+        pos += 12 + length
+
+    width, height, depth, color_type = struct.unpack('>IIBB', chunks[b'IHDR'][:10])
+    assert (depth, color_type) == (8, 2) and b'IEND' in chunks
+    raw = np.frombuffer(zlib.decompress(chunks[b'IDAT']), dtype=np.uint8).reshape(height, width * 3 + 1)
+    assert not raw[:, 0].any()
+    return raw[:, 1:].reshape(height, width, 3)
+
+
+def _has_color(pixels, name):
+    return bool(np.all(pixels == COLORS[name], axis=-1).any())
+
+
+def test_raster_png():
+    """栅格后端输出合法 PNG，价格/MACD/RSI 各面板都有内容"""
+    data = mock_market_data()
+    series = extract_series(data, '1h')
+    # 开盘价取上一根收盘价
+    assert series['opens'][1:].tolist() == series['prices'][:-1].tolist()
+    # 标题使用行情数据中的交易对（多币种扫描的结果不会被标成 BTCUSDT）
+    assert series['title'].startswith('BTCUSDT 1h')
+    assert extract_series({**data, 'symbol': 'ETHUSDT'}, '4h')['title'].startswith('ETHUSDT 4h')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'chart.png')
+        assert render_chart(series, path, backend='raster') == path
+        pixels = _read_png(path)
+
+    assert pixels.shape == (600, 800, 3)
+    assert (pixels[0, 0] == COLORS['background']).all()
+    for name in ('up', 'down', 'ema20', 'ema50', 'bb', 'macd', 'signal', 'rsi'):
+        assert _has_color(pixels, name), name
+
+    # RSI 线只出现在最下方的面板
+    rows = np.nonzero(np.all(pixels == COLORS['rsi'], axis=-1).any(axis=1))[0]
+    assert rows.min() > 600 * 0.75
+
+
+def _worker_timings(rounds: int = 5):
+    """在工作进程中渲染 rounds 张图 → (进程启动耗时, 每张图耗时中位数)，单位毫秒"""
+    data = mock_market_data()
+    renderer = ChartRenderer(backend='raster')
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            start = time.perf_counter()
+            renderer.warm_up()
+            warm_up_ms = (time.perf_counter() - start) * 1000
+
+            timings = []
+            for i in range(rounds):
+                path = os.path.join(tmp, f'chart_{i}.png')
+                start = time.perf_counter()
+                assert renderer.render(data, path) == path
+                timings.append((time.perf_counter() - start) * 1000)
+                assert _read_png(path).shape == (600, 800, 3)
+        finally:
+            renderer.close()
+
+    return warm_up_ms, float(np.median(timings))
+
+
+def test_worker_process():
+    """工作进程渲染：首次启动进程后，每张图的耗时在毫秒级"""
+    warm_up_ms, median = _worker_timings()
+    assert median < 1000
+    print(f"  工作进程启动 {warm_up_ms:.0f}ms，每张图 {median:.1f}ms（中位数）")
+
+
+def test_monitor_local_chart():
+    """监控器默认在本地渲染；时间框架不在行情数据中时回退到 Chart API（未配置则跳过）"""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = os.path.join(tmp, 'config.json')
+        with open(config_path, 'w') as f:
+            json.dump({'deepseek_api_key': 'test', 'chart_backend': 'raster', 'ohlcv_store_path': None}, f)
+
+        os.chdir(tmp)
+        try:
+            monitor = BTCMonitor(config_path)
+            data = mock_market_data()
+            chart_path = monitor._generate_chart(data)
+            assert chart_path.startswith('btc_chart_') and _read_png(chart_path).shape == (600, 800, 3)
+
+            monitor.chart_renderer.timeframe = '1d'
+            assert monitor._generate_chart(data) is None
+            # 未传入行情数据时走 Chart API
+            assert monitor._generate_chart() is None
+        finally:
+            monitor.chart_renderer.close()
+            monitor._background.shutdown(wait=True)
+            os.chdir(cwd)
+
+
+def benchmark_api(rounds: int = 3):
+    """Chart API 往返耗时（需要 CHART_API_KEY 环境变量和网络）"""
+    api_key = os.environ.get('CHART_API_KEY')
+    if not api_key:
+        return None
+    payload = {
+        "symbol": "BINANCE:BTCUSDT", "interval": "1h", "theme": "dark", "width": 800, "height": 600,
+        "studies": [{"name": "Volume", "forceOverlay": True}, {"name": "MACD"}, {"name": "Relative Strength Index"}]
+    }
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        response = requests.post('https://api.chart-img.com/v2/tradingview/advanced-chart',
+                                 headers={"x-api-key": api_key}, json=payload, timeout=30)
+        response.raise_for_status()
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+if __name__ == '__main__':
+    print("\n" + "=" * 60)
+    print("🧪 本地图表渲染测试")
+    print("=" * 60 + "\n")
+
+    test_raster_png()
+    print("✓ PNG 输出\n")
+
+    test_worker_process()
+    print("✓ 工作进程渲染\n")
+
+    test_monitor_local_chart()
+    print("✓ 监控器本地渲染与回退\n")
+
+    _, local_ms = _worker_timings(rounds=20)
+    api_ms = benchmark_api()
+    if api_ms is None:
+        print(f"  本地渲染 {local_ms:.1f}ms（未设置 CHART_API_KEY，跳过 Chart API 对比）\n")
+    else:
+        print(f"  Chart API 往返 {api_ms:.0f}ms vs 本地渲染 {local_ms:.1f}ms（{api_ms / local_ms:.0f} 倍）\n")
+
+    print("=" * 60)
+    print("✅ 测试完成")
+    print("=" * 60 + "\n")
@@ -0,0 +1,128 @@
+"""
+DeepSeek 流式输出测试
+启动本地 SSE 模拟服务（OpenAI 兼容的 chat/completions 流式格式），
+验证文本增量迭代、决策 JSON 提前回调，以及增量 JSON 检测器的边界情况
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from deepseek_client import DeepSeekClient, IncrementalJSONDetector
+from http_transport import HTTPTransport
+
+
+ANALYSIS = ('市场处于震荡区间 {注意: 这不是JSON}，短周期偏弱。\n'
+            '{"market_state": "震荡", "confidence": 65, '
+            '"summary": "区间 {105000, 110000} 内 \\"高抛低吸\\"", "key_signals": ["RSI 中性"]}'
+            '\n\n补充说明：以上仅供参考，注意控制仓位。')
+
+# 模型输出 JSON 之后还有一段较慢的尾部文本
+TRAILING_DELAY = 0.5
+
+
+class SSEHandler(BaseHTTPRequestHandler):
+    """按 token 切分 ANALYSIS，以 SSE 事件逐块推送（HTTP/1.1 chunked）"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        assert request.get('stream') is True
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        json_end = ANALYSIS.index('}\n\n') + 1
+        position = 0
+        while position < len(ANALYSIS):
+            token = ANALYSIS[position:position + 4]
+            position += len(token)
+            event = {'choices': [{'index': 0, 'delta': {'content': token}}]}
+            self._send_event(json.dumps(event, ensure_ascii=False))
+            time.sleep(TRAILING_DELAY / 10 if position > json_end else 0.001)
+
+        self._send_event('[DONE]')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _send_event(self, data: str):
+        payload = f"data: {data}\n\n".encode('utf-8')
+        self.wfile.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _start_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SSEHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_stream_early_json():
+    """流式调用：拼接结果与完整响应一致，决策 JSON 在尾部文本结束前回调"""
+    server = _start_server()
+    client = DeepSeekClient(api_key='test', base_url=f"http://127.0.0.1:{server.server_address[1]}/v1",
+                            transport=HTTPTransport())
+    detected = []
+
+    try:
+        chunks = list(client.stream_chat('system', 'user'))
+        assert ''.join(chunks) == ANALYSIS
+        assert len(chunks) > 10
+
+        response = client.call_with_messages(
+            'system', 'user', stream=True,
+            on_json=detected.append
+        )
+    finally:
+        server.shutdown()
+
+    stats = client.last_call_stats
+    assert response == ANALYSIS
+    assert len(detected) == 1
+    value = detected[0]
+    assert value['market_state'] == '震荡' and value['confidence'] == 65
+    assert stats['json_ready_ms'] < stats['total_ms'] - TRAILING_DELAY * 500
+    print(f"  首 token {stats['ttfb_ms']:.1f}ms | JSON 就绪 {stats['json_ready_ms']:.1f}ms | "
+          f"完整响应 {stats['total_ms']:.1f}ms | {stats['chunks']} 个增量")
+
+
+def test_detector_edge_cases():
+    """增量检测器：跨块切分、字符串内的括号和转义引号、中文引号、正文中的伪 JSON"""
+    text = '分析 {不是json} 结论：\n[{"action": "open_long", "reason": "突破 ]} \\"关键\\" 位"}, {"action": “wait”}] 尾部'
+    for size in (1, 3, 7, len(text)):
+        found = []
+        detector = IncrementalJSONDetector(found.append, opening='[')
+        for i in range(0, len(text), size):
+            detector.feed(text[i:i + size])
+        assert found == [[{'action': 'open_long', 'reason': '突破 ]} "关键" 位'}, {'action': 'wait'}]], found
+        assert detector.done
+
+    found = []
+    detector = IncrementalJSONDetector(found.append)
+    detector.feed('还没有结束 {"a": [1, 2')
+    assert not found
+    detector.feed('], "b": "}"} 之后')
+    assert found == [{'a': [1, 2], 'b': '}'}]
+
+
+if __name__ == '__main__':
+    print("\n" + "=" * 60)
+    print("🧪 DeepSeek 流式输出测试（本地 SSE 模拟服务）")
+    print("=" * 60 + "\n")
+
+    test_detector_edge_cases()
+    print("✓ 增量 JSON 检测器边界情况\n")
+
+    test_stream_early_json()
+    print("✓ 决策 JSON 提前回调\n")
+
+    print("=" * 60)
+    print("✅ 测试完成")
+    print("=" * 60 + "\n")
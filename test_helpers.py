@@ -0,0 +1,127 @@
+"""
+测试共用的辅助类：可手动推进的时钟、模拟交易所、模拟行情数据、模拟 DeepSeek / Telegram 的本地 HTTP 服务
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from market_data import MarketData
+
+
+class FakeClock:
+    """
+    可手动推进的时钟
+
+    clock() / clock.time() 返回当前时间（秒），clock.sleep(seconds) 推进时间（可附加每次唤醒的额外延迟），
+    可直接作为各模块的 clock / sleep 参数
+    """
+
+    def __init__(self, now: float = 1_700_000_000.0, wake_delay: float = 0.0):
+        self.now = now
+        self.wake_delay = wake_delay
+
+    def __call__(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds + self.wake_delay
+
+
+TIMEFRAME_MS = {'3m': 180_000, '15m': 900_000, '1h': 3_600_000, '4h': 14_400_000}
+
+
+class MockExchange:
+    """模拟交易所：每个请求固定延迟，并记录同时在途的最大请求数"""
+
+    def __init__(self, latency: float = 0.02, failing_symbols=()):
+        self.markets = {}
+        self.latency = latency
+        self.failing_symbols = set(failing_symbols)
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def load_markets(self):
+        self.markets = {'loaded': True}
+        return self.markets
+
+    def _request(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.latency)
+        with self._lock:
+            self.in_flight -= 1
+
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=100):
+        self._request()
+        if symbol in self.failing_symbols:
+            raise Exception(f"{symbol} 模拟请求失败")
+        step = TIMEFRAME_MS[timeframe]
+        rng = np.random.default_rng(abs(hash((symbol, timeframe))) % 2 ** 32)
+        closes = 100 + np.cumsum(rng.normal(0, 0.5, limit))
+        last = int(time.time() * 1000) // step * step
+        return [[last - (limit - 1 - i) * step, c, c + 0.3, c - 0.3, c, 1000.0]
+                for i, c in enumerate(closes)]
+
+    def fetch_open_interest(self, symbol):
+        self._request()
+        return {'openInterestAmount': 1000.0}
+
+    def fetch_funding_rate(self, symbol):
+        self._request()
+        return {'fundingRate': 0.0001}
+
+
+def mock_market_data():
+    """模拟交易所生成的完整 BTC 行情数据（get_btc_complete_data 的结果）"""
+    market_data = MarketData(concurrent=False)
+    market_data.exchange = MockExchange(latency=0.0)
+    return market_data.get_btc_complete_data()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """模拟 DeepSeek / Telegram 接口（HTTP/1.1 keep-alive）"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True   # 响应头和响应体分两次写出，避免 keep-alive 下的 Nagle + 延迟 ACK 等待
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path.endswith('/chat/completions'):
+            body = {'choices': [{'message': {'content': '分析 {"summary": "ok"}'}}]}
+        else:
+            body = {'ok': True}
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server():
+    """启动模拟 DeepSeek / Telegram 接口的本地服务（server.connections 为已建立的连接数）"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
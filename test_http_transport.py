@@ -0,0 +1,80 @@
+"""
+共享 HTTP 传输层测试
+启动本地 keep-alive HTTP 服务，验证 DeepSeekClient 与 Telegram 请求复用同一条连接，
+并对比每次 requests.post 新建连接的耗时
+"""
+
+import time
+
+import requests
+
+from deepseek_client import DeepSeekClient
+from http_transport import HTTPTransport
+from test_helpers import start_stub_server
+
+
+def test_connections_reused(calls: int = 20):
+    """DeepSeek 与 Telegram 请求共享传输层：每个主机只建立一条连接"""
+    server = start_stub_server()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    transport = HTTPTransport()
+    client = DeepSeekClient(api_key='test', base_url=f"{base}/v1", transport=transport)
+
+    try:
+        for _ in range(calls):
+            assert client.call_with_messages('system', 'user').endswith('{"summary": "ok"}')
+            response = transport.post(f"{base}/bottoken/sendMessage", json={'text': 'hi'}, timeout=10)
+            assert response.status_code == 200
+
+        stats = transport.stats.snapshot()
+        assert server.connections == 1, server.connections
+        assert stats['requests'] == calls * 2
+        assert stats['connections'] == 1
+        assert stats['handshake_ms_last'] is not None
+        print(f"  {stats['requests']} 个请求 | 新建连接 {stats['connections']} | "
+              f"复用率 {stats['reuse_ratio']:.0%} | 握手 {stats['handshake_ms_total']:.2f}ms")
+    finally:
+        transport.close()
+        server.shutdown()
+
+
+def benchmark_transport(calls: int = 200):
+    """对比每次 requests.post（新连接）与共享传输层（keep-alive）的总耗时"""
+    server = start_stub_server()
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+    transport = HTTPTransport()
+
+    try:
+        start = time.perf_counter()
+        for _ in range(calls):
+            requests.post(url, json={}, timeout=10)
+        unpooled = time.perf_counter() - start
+        unpooled_connections = server.connections
+
+        start = time.perf_counter()
+        for _ in range(calls):
+            transport.post(url, json={}, timeout=10)
+        pooled = time.perf_counter() - start
+
+        print(f"  requests.post: {unpooled * 1000 / calls:.2f}ms/请求，新建连接 {unpooled_connections}")
+        print(f"  HTTPTransport: {pooled * 1000 / calls:.2f}ms/请求，新建连接 "
+              f"{transport.stats.snapshot()['connections']}")
+    finally:
+        transport.close()
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    print("\n" + "=" * 60)
+    print("🧪 共享 HTTP 传输层测试（本地 keep-alive 服务）")
+    print("=" * 60 + "\n")
+
+    test_connections_reused()
+    print("✓ DeepSeek 与 Telegram 请求复用连接\n")
+
+    benchmark_transport()
+    print()
+
+    print("=" * 60)
+    print("✅ 测试完成")
+    print("=" * 60 + "\n")
@@ -0,0 +1,153 @@
+"""
+技术指标一致性测试
+用随机 K 线对比 indicators 模块（增量引擎 / 批量向量化计算）与 TA-Lib 的计算结果
+"""
+
+import time
+
+import numpy as np
+import talib
+
+from indicators import TimeframeIndicators, SERIES_FIELDS, compute_batch, batch_series
+
+
+# 允许的最大误差（价格量级 1e5，布林带平方和相减有少量浮点误差）
+TOLERANCE = 1e-6
+
+
+def _random_klines(n: int, seed: int = 42):
+    """生成随机 K 线（最高、最低、收盘、成交量）"""
+    rng = np.random.default_rng(seed)
+    closes = 100000 + np.cumsum(rng.normal(0, 80, n))
+    highs = closes + np.abs(rng.normal(0, 30, n))
+    lows = closes - np.abs(rng.normal(0, 30, n))
+    volumes = np.abs(rng.normal(100, 20, n))
+    return highs, lows, closes, volumes
+
+
+def _talib_reference(highs, lows, closes, volumes) -> dict:
+    """用 TA-Lib 全量计算各指标"""
+    macd, macd_signal, macd_hist = talib.MACD(closes, fastperiod=12, slowperiod=26, signalperiod=9)
+    bb_upper, bb_middle, bb_lower = talib.BBANDS(closes, timeperiod=20, nbdevup=2, nbdevdn=2)
+    return {
+        'ema20': talib.EMA(closes, timeperiod=20),
+        'ema50': talib.EMA(closes, timeperiod=50),
+        'macd': macd,
+        'macd_signal': macd_signal,
+        'macd_hist': macd_hist,
+        'rsi7': talib.RSI(closes, timeperiod=7),
+        'rsi14': talib.RSI(closes, timeperiod=14),
+        'atr14': talib.ATR(highs, lows, closes, timeperiod=14),
+        'bb_upper': bb_upper,
+        'bb_middle': bb_middle,
+        'bb_lower': bb_lower,
+        'volume_ma': talib.SMA(volumes, timeperiod=20)
+    }
+
+
+def test_closed_candles_match_talib():
+    """逐根提交已收盘 K 线，每个指标都应与 TA-Lib 一致（包括预热期的 NaN 位置）"""
+    n = 500
+    highs, lows, closes, volumes = _random_klines(n)
+
+    engine = TimeframeIndicators('1h', history=n)
+    for i in range(n):
+        engine.update(i, highs[i], lows[i], closes[i], volumes[i], closed=True)
+
+    rows = np.array(engine.history)
+    for name, expected in _talib_reference(highs, lows, closes, volumes).items():
+        actual = rows[:, SERIES_FIELDS.index(name)]
+        assert np.array_equal(np.isnan(actual), np.isnan(expected)), f"{name} 预热期不一致"
+        max_error = np.nanmax(np.abs(actual - expected))
+        print(f"  {name:12s} 最大误差 {max_error:.2e}")
+        assert max_error < TOLERANCE, f"{name} 误差过大: {max_error}"
+
+
+def test_live_candle_preview():
+    """实时 K 线预览应等于把它当作最后一根 K 线的 TA-Lib 结果，且不修改引擎状态"""
+    n = 200
+    highs, lows, closes, volumes = _random_klines(n, seed=7)
+
+    engine = TimeframeIndicators('15m', history=n)
+    for i in range(n - 1):
+        engine.update(i, highs[i], lows[i], closes[i], volumes[i], closed=True)
+
+    # 同一根实时 K 线多次跳动，只有最后一次的价格生效
+    for tick in (closes[-1] - 50, closes[-1] + 50, closes[-1]):
+        row = engine.update(n - 1, highs[-1], lows[-1], tick, volumes[-1], closed=False)
+
+    expected = _talib_reference(highs, lows, closes, volumes)
+    for name, values in expected.items():
+        assert abs(row[SERIES_FIELDS.index(name)] - values[-1]) < TOLERANCE, name
+
+    assert len(engine.history) == n - 1
+    assert engine.last_closed_ts == n - 2
+
+    series = engine.series(24)
+    assert len(series['prices']) == 24
+    assert series['current']['price'] == closes[-1]
+    assert abs(series['current']['rsi14'] - expected['rsi14'][-1]) < TOLERANCE
+
+
+def test_batch_matches_talib():
+    """批量计算：每一列都应与该列单独用 TA-Lib 计算的结果一致"""
+    n, columns = 60, 50
+    klines = [_random_klines(n, seed=j) for j in range(columns)]
+    highs, lows, closes, volumes = (np.column_stack([k[i] for k in klines]) for i in range(4))
+
+    batch = compute_batch(highs, lows, closes, volumes)
+    for j in (0, columns // 2, columns - 1):
+        expected = _talib_reference(highs[:, j], lows[:, j], closes[:, j], volumes[:, j])
+        for name, values in expected.items():
+            actual = batch[name][:, j]
+            assert np.array_equal(np.isnan(actual), np.isnan(values)), f"{name} 预热期不一致"
+            assert np.nanmax(np.abs(actual - values)) < TOLERANCE, name
+
+    series = batch_series('1h', batch)
+    assert len(series) == columns
+    assert len(series[0]['rsi14']) == 24
+    assert series[0]['ema50'][0] == 0.0 and series[0]['ema50'][-1] > 0
+
+
+def benchmark_batch(n: int = 60, columns: int = 800):
+    """对比逐列 TA-Lib + 逐元素 NaN 转换 与 批量向量化计算的耗时"""
+    klines = [_random_klines(n, seed=j) for j in range(columns)]
+    highs, lows, closes, volumes = (np.column_stack([k[i] for k in klines]) for i in range(4))
+
+    def to_list(arr, count):
+        return [float(v) if not np.isnan(v) else 0 for v in arr[-count:]]
+
+    start = time.perf_counter()
+    for j in range(columns):
+        reference = _talib_reference(highs[:, j], lows[:, j], closes[:, j], volumes[:, j])
+        {name: to_list(values, 24) for name, values in reference.items()}
+    per_column = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch_series('1h', compute_batch(highs, lows, closes, volumes))
+    batched = time.perf_counter() - start
+
+    print(f"  {columns} 个序列 × {n} 根 K 线: 逐列 TA-Lib {per_column * 1000:.1f}ms | "
+          f"批量向量化 {batched * 1000:.1f}ms ({per_column / batched:.1f}x)")
+
+
+if __name__ == '__main__':
+    print("\n" + "=" * 60)
+    print("🧪 技术指标 vs TA-Lib")
+    print("=" * 60 + "\n")
+
+    test_closed_candles_match_talib()
+    print("✓ 已收盘 K 线逐根更新与 TA-Lib 一致\n")
+
+    test_live_candle_preview()
+    print("✓ 实时 K 线预览与 TA-Lib 一致\n")
+
+    test_batch_matches_talib()
+    print("✓ 批量向量化计算与 TA-Lib 一致\n")
+
+    benchmark_batch()
+    print()
+
+    print("=" * 60)
+    print("✅ 测试完成")
+    print("=" * 60 + "\n")
@@ -0,0 +1,226 @@
+"""
+AI 响应 JSON 提取测试
+以 analysis_logs 中的真实响应（思维链 + JSON）为语料，随机注入干扰：字符串中的括号 / 转义引号、
+思维链中的括号和未闭合的引号、JSON 之后的正文、中文引号、截断的 JSON，
+验证 parse_ai_response / _parse_ai_decisions 提取结果不变，并与逐字符括号匹配的旧实现比较正确率和耗时
+"""
+
+import glob
+import json
+import os
+import random
+import time
+
+import json_extract
+from btc_trading_monitor import BTCTradingMonitor
+from deepseek_client import parse_ai_response
+from json_extract import extract_last_json, find_json_spans
+from log_sink import open_log
+
+# 语料目录按测试文件所在位置定位，不依赖当前工作目录
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'analysis_logs')
+
+NOISE_IN_STRINGS = [']', '}', '[', '{', '"', '\\', '"}]', '价格 [110,000-110,500]', '{注意}', '\\"引用\\"']
+NOISE_BEFORE = ['[注意] ', '数组 [1, 2 ', '区间 {110000 ', '他说 "突破', '“关键位”', '(见 {图1}) ', '**[重要]** ']
+NOISE_AFTER = ['', '\n```', '\n```\n\n以上分析仅供参考 {完}', '\n\n[1] 数据来源: Binance', '\n后续 {未闭合']
+
+
+def _load_corpus():
+    """真实响应：日志中的思维链 + JSON 结果"""
+    records = []
+    # LogSink 会压缩本进程写过的旧分段：未压缩和已压缩的文件都读取（跳过压缩中途留下的临时文件）
+    paths = sorted(path for path in glob.glob(os.path.join(CORPUS_DIR, '*.jsonl*')) if not path.endswith('.tmp'))
+    assert paths, f"语料目录为空: {CORPUS_DIR}"
+    for path in paths:
+        with open_log(path) as f:
+            for line in f:
+                record = json.loads(line)
+                if record.get('json_result'):
+                    records.append((record['cot_trace'], record['json_result']))
+    assert records, f"{CORPUS_DIR} 中没有带 json_result 的响应"
+    return records
+
+
+def _inject(value, rng):
+    """在 JSON 的字符串值中随机插入括号和引号"""
+    if isinstance(value, dict):
+        return {key: _inject(item, rng) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_inject(item, rng) for item in value]
+    if isinstance(value, str) and rng.random() < 0.5:
+        position = rng.randint(0, len(value))
+        return value[:position] + rng.choice(NOISE_IN_STRINGS) + value[position:]
+    return value
+
+
+def _render(cot, value, rng, after=None):
+    """拼出一条响应：思维链（可能带干扰）+ JSON（随机缩进 / 转义）+ 之后的正文"""
+    prefix = rng.choice(NOISE_BEFORE) if rng.random() < 0.7 else ''
+    body = json.dumps(value, ensure_ascii=rng.random() < 0.3, indent=rng.choice([None, 2]))
+    cot_trace = f"{prefix}{cot}\n".strip()
+    return cot_trace, f"{cot_trace}\n{body}{rng.choice(NOISE_AFTER) if after is None else after}"
+
+
+def _legacy_extract(response, opening='{'):
+    """旧实现：从第一个起始括号开始逐字符计数（不理解字符串）"""
+    closing = '}' if opening == '{' else ']'
+    start = response.find(opening)
+    if start == -1:
+        return None
+    depth = 0
+    for i in range(start, len(response)):
+        if response[i] == opening:
+            depth += 1
+        elif response[i] == closing:
+            depth -= 1
+            if depth == 0:
+                try:
+                    return json.loads(response[start:i + 1])
+                except json.JSONDecodeError:
+                    return None
+    return None
+
+
+def _decisions(result):
+    """由日志中的分析结果构造一组交易决策"""
+    return [
+        {'symbol': 'BTCUSDT', 'action': 'wait', 'confidence': result.get('confidence', 50),
+         'reasoning': result.get('summary', '')},
+        {'symbol': 'BTCUSDT', 'action': 'open_long', 'leverage': 5, 'position_size_usd': 1000,
+         'stop_loss': result.get('key_levels', {}).get('support'), 'take_profit': result.get('key_levels', {}).get('resistance'),
+         'reasoning': result.get('mid_term_trend', '')}
+    ]
+
+
+def test_real_responses():
+    """未修改的真实响应：提取的思维链和 JSON 与日志一致"""
+    for cot, result in _load_corpus():
+        response = f"{cot}\n{json.dumps(result, ensure_ascii=False, indent=2)}\n```"
+        cot_trace, extracted = parse_ai_response(response)
+        assert extracted == result and cot_trace == cot.strip()
+
+
+def test_fuzz_objects(rounds: int = 600):
+    """随机干扰下 parse_ai_response 仍提取出完整的 JSON 对象；旧实现的失败数作为对照"""
+    rng = random.Random(21)
+    corpus = _load_corpus()
+    legacy_failures = 0
+    for _ in range(rounds):
+        cot, result = rng.choice(corpus)
+        expected = _inject(result, rng)
+        cot_trace, response = _render(cot, expected, rng)
+        extracted_cot, extracted = parse_ai_response(response)
+        assert extracted == expected, response
+        assert extracted_cot == cot_trace
+        legacy_failures += _legacy_extract(response) != expected
+    print(f"  {rounds} 条干扰响应全部提取正确（逐字符括号匹配的旧实现失败 {legacy_failures} 条）")
+
+
+def test_fuzz_decisions(rounds: int = 600):
+    """交易决策数组：思维链中的 '[' 和字符串中的 ']' 不影响提取；数字数组等非决策数组被跳过"""
+    rng = random.Random(34)
+    corpus = _load_corpus()
+    legacy_failures = 0
+    for _ in range(rounds):
+        cot, result = rng.choice(corpus)
+        expected = _inject(_decisions(result), rng)
+        cot_trace, response = _render(cot, expected, rng)
+        extracted_cot, decisions = BTCTradingMonitor._parse_ai_decisions(response)
+        assert decisions == expected, response
+        assert extracted_cot == cot_trace
+        legacy_failures += _legacy_extract(response, '[') != expected
+    print(f"  {rounds} 条决策响应全部提取正确（旧实现失败 {legacy_failures} 条）")
+
+
+def test_edge_cases():
+    """截断的 JSON 回退到之前完整的一个；中文引号；没有 JSON；纯 JSON 响应；大量未闭合的括号"""
+    rng = random.Random(5)
+    cot, result = _load_corpus()[0]
+    _, response = _render(cot, result, rng, after='')
+    truncated = response + '\n\n补充: {"market_state": "震荡", "confidence": '
+    assert parse_ai_response(truncated)[1] == result
+
+    # 模型用中文引号作为 JSON 的引号
+    assert extract_last_json('结论 {“action”: “wait”, “confidence”: 60}').value == {'action': 'wait', 'confidence': 60}
+    # 英文引号字符串中的中文引号保持原样
+    assert extract_last_json('{"reasoning": "价格“突破”阻力"}').value == {'reasoning': '价格“突破”阻力'}
+
+    assert parse_ai_response('只有分析，没有 JSON [待定]') == ('只有分析，没有 JSON [待定]', None)
+    assert BTCTradingMonitor._parse_ai_decisions('观望') == ('观望', [])
+    assert BTCTradingMonitor._parse_ai_decisions('[{"action": "wait"}]')[1] == [{'action': 'wait'}]
+    assert BTCTradingMonitor._parse_ai_decisions('分析\n[{"action": "wait"}]\n参考 [1]')[1] == [{'action': 'wait'}]
+
+    # 括号不匹配或未闭合的候选被丢弃，从下一个字符继续查找
+    assert find_json_spans('{ ] [1] "x {2}') == [(4, 7), (11, 14)]
+
+    # 大量未闭合的括号不会重复扫描（耗时随长度线性增长）
+    start = time.perf_counter()
+    assert extract_last_json('[' * 5000 + ' 分析 {"a": [1, 2]}').value == {'a': [1, 2]}
+    assert extract_last_json('{' * 5000 + ']{"a": 1}').value == {'a': 1}
+    assert time.perf_counter() - start < 1.0
+
+
+def test_without_orjson():
+    """未安装 orjson 时回退到标准库 json，结果一致"""
+    rng = random.Random(8)
+    corpus = _load_corpus()
+    responses = [_render(cot, _inject(result, rng), rng)[1] for cot, result in corpus]
+    fast = [extract_last_json(response, expect=dict) for response in responses]
+    original = json_extract.HAS_ORJSON
+    json_extract.HAS_ORJSON = False
+    try:
+        fallback = [extract_last_json(response, expect=dict) for response in responses]
+    finally:
+        json_extract.HAS_ORJSON = original
+    assert fast == fallback
+
+
+def test_extract_speed(repeat: int = 20):
+    """语料上的提取耗时：正则扫描 + orjson 与逐字符括号匹配 + json 对比"""
+    rng = random.Random(13)
+    responses = [_render(cot, result, rng, after='\n```')[1] for cot, result in _load_corpus()]
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for response in responses:
+            extract_last_json(response, expect=dict)
+    fast_us = (time.perf_counter() - start) / (repeat * len(responses)) * 1e6
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for response in responses:
+            _legacy_extract(response)
+    legacy_us = (time.perf_counter() - start) / (repeat * len(responses)) * 1e6
+
+    size = sum(len(response) for response in responses) / len(responses)
+    print(f"  平均 {size:.0f} 字符的响应：提取 {fast_us:.1f}µs/条（逐字符实现 {legacy_us:.1f}µs/条，"
+          f"orjson {'已' if json_extract.HAS_ORJSON else '未'}安装）")
+    assert fast_us < legacy_us
+
+
+if __name__ == '__main__':
+    print("\n" + "=" * 60)
+    print("🧪 AI 响应 JSON 提取测试")
+    print("=" * 60 + "\n")
+
+    test_real_responses()
+    print("✓ 真实响应\n")
+
+    test_fuzz_objects()
+    print("✓ 分析结果对象（随机干扰）\n")
+
+    test_fuzz_decisions()
+    print("✓ 交易决策数组（随机干扰）\n")
+
+    test_edge_cases()
+    print("✓ 边界情况\n")
+
+    test_without_orjson()
+    print("✓ 回退到标准库 json\n")
+
+    test_extract_speed()
+    print("✓ 提取耗时\n")
+
+    print("=" * 60)
+    print("✅ 测试完成")
+    print("=" * 60 + "\n")
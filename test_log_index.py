@@ -0,0 +1,225 @@
+"""
+分析日志索引测试
+用 LogSink 生成两个月的模拟日志（每 5 分钟一条，历史日期已压缩），验证导入、增量导入、
+LogSink 回调直接入库、决策动作查询，并对比逐行扫描 JSONL 与索引查询的耗时
+"""
+
+import contextlib
+import io
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+
+from log_index import LogIndex, main, parse_where
+from log_sink import LogSink, open_log
+from metrics import MetricsRegistry
+from test_helpers import FakeClock
+
+DAYS = 60
+INTERVAL = 300
+
+
+START = datetime(2025, 9, 1).timestamp()
+
+
+def _record(rng, now, trading=False):
+    """精简的分析日志记录（结构与 BTCMonitor / BTCTradingMonitor 的日志一致）"""
+    rsi = rng.uniform(10, 90)
+    record = {
+        'success': True,
+        'timestamp': datetime.fromtimestamp(now).isoformat(),
+        'market_data': {
+            'current_price': rng.uniform(90000, 110000),
+            'price_changes': {'15m': rng.gauss(0, 0.3), '1h': rng.gauss(0, 0.8), '4h': rng.gauss(0, 1.5),
+                              '24h': rng.gauss(0, 3)},
+            'funding_rate': 0.0001,
+            'timeframe_1h': {'current': {'price': 100000.0, 'rsi7': rsi + 2, 'rsi14': rsi, 'macd': rng.gauss(0, 50),
+                                         'atr14': 400.0, 'ema20': 100000.0, 'ema50': 99800.0}},
+        },
+        'cot_trace': '分析过程' * 50,
+        'deepseek': {'total_ms': rng.uniform(3000, 12000),
+                     'usage': {'prompt_tokens': 3000, 'completion_tokens': 600, 'cache_hit_tokens': 2200}},
+    }
+    if trading:
+        action = rng.choice(['open_long', 'open_short', 'hold', 'wait'])
+        record['decisions'] = [{'symbol': 'BTCUSDT', 'action': action, 'leverage': 5, 'position_size_usd': 5000,
+                                'stop_loss': 95000, 'take_profit': 105000, 'confidence': rng.randint(50, 95)}]
+        record['account'] = {'total_equity': 1000 + rng.gauss(0, 50)}
+    else:
+        record['json_result'] = {'market_state': rng.choice(['上涨', '下跌', '震荡']),
+                                 'confidence': rng.randint(30, 95)}
+    return record
+
+
+def _write_logs(directory, days=DAYS, seed=5, trading=False):
+    rng = random.Random(seed)
+    clock = FakeClock(START)
+    sink = LogSink(directory, clock=clock, metrics=MetricsRegistry(), flush_interval=60)
+    for _ in range(days * 86400 // INTERVAL):
+        sink.write(_record(rng, clock.now, trading))
+        clock.now += INTERVAL
+    sink.close()
+    return clock
+
+
+def _scan(directory, predicate):
+    """不用索引：解压并逐行解析全部日志"""
+    matches = []
+    for name in sorted(os.listdir(directory)):
+        if '.jsonl' not in name:
+            continue
+        with open_log(os.path.join(directory, name)) as f:
+            for line in f:
+                record = json.loads(line)
+                if predicate(record):
+                    matches.append(record['timestamp'])
+    return sorted(matches)
+
+
+def test_ingest_and_query():
+    """导入两个月的日志；条件查询结果与逐行扫描一致，时间范围查询使用索引（耗时对比只打印）"""
+    with tempfile.TemporaryDirectory() as tmp:
+        logs = os.path.join(tmp, 'analysis_logs')
+        _write_logs(logs)
+        assert sum(name.endswith('.jsonl.gz') for name in os.listdir(logs)) == DAYS - 1
+
+        index = LogIndex(os.path.join(tmp, 'index.sqlite3'))
+        stats = index.ingest(logs)
+        assert stats['added'] == DAYS * 86400 // INTERVAL and stats['errors'] == 0
+
+        start = time.perf_counter()
+        expected = _scan(logs, lambda r: r['json_result']['confidence'] > 75
+                         and r['market_data']['timeframe_1h']['current']['rsi14'] < 30)
+        scan_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        rows = index.query(where=[parse_where('confidence>75'), parse_where('rsi14_1h<30')], columns=['ts'])
+        query_ms = (time.perf_counter() - start) * 1000
+        assert [row['ts'] for row in rows] == expected and expected
+
+        # 时间范围 + 市场状态
+        october = index.query(since='2025-10-01', until='2025-10-02', market_state='震荡',
+                              columns=['ts', 'market_state', 'price'])
+        assert october and all(row['ts'].startswith('2025-10-01') for row in october)
+        assert all(row['market_state'] == '震荡' for row in october)
+        # 时间范围查询走索引（按查询计划判断，不比较耗时）
+        plan = index.explain(since='2025-10-01', until='2025-10-02', market_state='震荡')
+        assert any(detail.startswith('SEARCH cycles USING INDEX cycles_state') for detail in plan), plan
+        plan = index.explain(since='2025-10-01', until='2025-10-02')
+        assert any(detail.startswith('SEARCH cycles USING INDEX cycles_epoch') for detail in plan), plan
+
+        # 第二次导入：没有新数据，不读取任何文件
+        assert index.ingest(logs)['files'] == 0
+        index.close()
+
+    print(f"  导入 {stats['added']} 个周期 {stats['ms']:.0f}ms；条件查询 {len(rows)} 条："
+          f"逐行扫描 {scan_ms:.0f}ms → 索引 {query_ms:.1f}ms")
+
+
+def test_incremental_and_listener():
+    """当天文件只读新增的完整行；作为 LogSink 回调时写入即入库"""
+    rng = random.Random(1)
+    clock = FakeClock(START)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = LogIndex(os.path.join(tmp, 'index.sqlite3'))
+        sink = LogSink(tmp, clock=clock, metrics=MetricsRegistry(), listeners=[index.add_records])
+        for _ in range(10):
+            sink.write(_record(rng, clock.now))
+            clock.now += INTERVAL
+        assert sink.flush(timeout=10)
+        assert index.count() == 10
+
+        # 直接追加到当天文件（含一行未写完的记录），增量导入只读新增的完整行
+        path = os.path.join(tmp, '2025-09-01.jsonl')
+        with open(path, 'a', encoding='utf-8') as f:
+            for _ in range(5):
+                f.write(json.dumps(_record(rng, clock.now), ensure_ascii=False) + '\n')
+                clock.now += INTERVAL
+            f.write('{"timestamp": "2025-09-01T')
+        stats = index.ingest(tmp)
+        assert stats['added'] == 5 and stats['lines'] == 15 and index.count() == 15
+
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write('09:00:00", "success": true}\n')
+        stats = index.ingest(tmp)
+        assert stats['lines'] == 1 and stats['added'] == 1
+        sink.close()
+        index.close()
+
+
+def test_rotation_reingest():
+    """按大小轮转后，同名的新文件超过上次读到的位置时仍从头导入，不跳过记录"""
+    rng = random.Random(3)
+    clock = FakeClock(START)
+    line_size = len(json.dumps(_record(rng, clock.now), ensure_ascii=False).encode('utf-8')) + 1
+    with tempfile.TemporaryDirectory() as tmp:
+        index = LogIndex(os.path.join(tmp, 'index.sqlite3'))
+        sink = LogSink(tmp, clock=clock, metrics=MetricsRegistry(), max_bytes=int(line_size * 4.5))
+        for _ in range(2):
+            sink.write(_record(rng, clock.now))
+            clock.now += INTERVAL
+        assert sink.flush(timeout=10)
+        assert index.ingest(tmp)['added'] == 2
+
+        # 第 5 条触发轮转：前 4 条改名为分段，新的 2025-09-01.jsonl 写入第 5-7 条（大于上次读到的位置）
+        for _ in range(5):
+            sink.write(_record(rng, clock.now))
+            clock.now += INTERVAL
+        assert sink.flush(timeout=10)
+        active = os.path.join(tmp, '2025-09-01.jsonl')
+        assert any(name.startswith('2025-09-01.1.') for name in os.listdir(tmp))
+        assert os.path.getsize(active) > line_size * 2
+
+        stats = index.ingest(tmp)
+        assert stats['added'] == 5 and stats['errors'] == 0
+        assert index.count() == 7
+        sink.close()
+        index.close()
+
+
+def test_decisions_and_cli():
+    """交易日志：按决策动作查询；命令行输出"""
+    with tempfile.TemporaryDirectory() as tmp:
+        logs = os.path.join(tmp, 'analysis_logs')
+        _write_logs(logs, days=2, trading=True)
+
+        index = LogIndex(os.path.join(logs, 'index.sqlite3'))
+        index.ingest(logs)
+        rows = index.query(action='open_long', where=[('confidence', '>=', 90)], columns=['id', 'actions', 'confidence'])
+        assert rows and all(row['actions'] == 'open_long' and row['confidence'] >= 90 for row in rows)
+        assert index.decisions(rows[0]['id'])[0]['action'] == 'open_long'
+        index.close()
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            main(['--dir', logs, 'query', '--action', 'open_short', '--where', 'equity>1000',
+                  '--columns', 'ts,actions,equity', '--json', '--limit', '5'])
+        lines = output.getvalue().strip().splitlines()
+        assert len(lines) == 5
+        assert all(json.loads(line)['actions'] == 'open_short' and json.loads(line)['equity'] > 1000
+                   for line in lines)
+
+
+if __name__ == '__main__':
+    print("\n" + "=" * 60)
+    print("🧪 分析日志索引测试")
+    print("=" * 60 + "\n")
+
+    test_ingest_and_query()
+    print("✓ 导入与条件查询\n")
+
+    test_incremental_and_listener()
+    print("✓ 增量导入与写入回调\n")
+
+    test_rotation_reingest()
+    print("✓ 轮转后重新导入\n")
+
+    test_decisions_and_cli()
+    print("✓ 决策查询与命令行\n")
+
+    print("=" * 60)
+    print("✅ 测试完成")
+    print("=" * 60 + "\n")
@@ -0,0 +1,196 @@
+"""
+分析日志写入器测试
+验证缓冲批量写入、按日期和大小轮转、关闭分段压缩、崩溃后截断不完整行、关闭时写完缓冲，
+并对比原来每条记录打开文件 + 同步序列化的写法在调用方的耗时
+"""
+
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from log_sink import LogSink, open_log
+from market_snapshot import to_plain_dict
+from metrics import MetricsRegistry
+from test_helpers import FakeClock, mock_market_data
+
+
+START = datetime(2025, 11, 1, 12, 0).timestamp()
+
+
+def _sink(directory, **kwargs):
+    return LogSink(directory, metrics=MetricsRegistry(), **kwargs)
+
+
+def _read_all(directory):
+    """按 分段编号 → 当前文件 的顺序读取全部记录 {文件名: [记录]}"""
+    result = {}
+    for name in sorted(os.listdir(directory)):
+        with open_log(os.path.join(directory, name)) as f:
+            result[name] = [json.loads(line) for line in f]
+    return result
+
+
+def test_buffered_write():
+    """write() 立即返回；flush 后全部记录按顺序写入当天文件"""
+    with tempfile.TemporaryDirectory() as tmp:
+        sink = _sink(tmp, flush_interval=60)
+        for i in range(1000):
+            sink.write({'i': i, 'text': '分析'})
+        assert os.listdir(tmp) == []        # 仍在缓冲中
+        assert sink.flush(timeout=10)
+
+        files = _read_all(tmp)
+        assert list(files) == [f"{datetime.now():%Y-%m-%d}.jsonl"]
+        assert [record['i'] for record in next(iter(files.values()))] == list(range(1000))
+        assert sink.metrics.summary('log.flush_ms')['count'] == 1
+        sink.close()
+
+
+def test_flush_interval():
+    """缓冲在 flush_interval 后自动写入"""
+    with tempfile.TemporaryDirectory() as tmp:
+        sink = _sink(tmp, flush_interval=0.1)
+        sink.write({'i': 1})
+        time.sleep(0.4)
+        assert sum(len(records) for records in _read_all(tmp).values()) == 1
+        sink.close()
+
+
+def test_date_and_size_rotation():
+    """换日时压缩前一天的文件；超过大小时轮转为编号分段并压缩"""
+    clock = FakeClock(START)
+    with tempfile.TemporaryDirectory() as tmp:
+        sink = LogSink(tmp, max_bytes=2000, clock=clock, metrics=MetricsRegistry(), flush_interval=60)
+        for i in range(100):
+            sink.write({'day': 1, 'i': i, 'padding': 'x' * 50})
+        clock.now += 86400
+        for i in range(10):
+            sink.write({'day': 2, 'i': i})
+        sink.close()
+
+        files = _read_all(tmp)
+        names = list(files)
+        assert '2025-11-01.jsonl.gz' in names and '2025-11-02.jsonl' in names
+        segments = sorted((name for name in names if name.startswith('2025-11-01.') and name.count('.') == 3),
+                          key=lambda name: int(name.split('.')[1]))
+        assert segments and all(name.endswith('.jsonl.gz') for name in segments)
+        assert all(os.path.getsize(os.path.join(tmp, name)) < 2000 for name in segments)
+
+        day1 = [record['i'] for name in segments + ['2025-11-01.jsonl.gz'] for record in files[name]]
+        assert day1 == list(range(100))
+        assert [record['i'] for record in files['2025-11-02.jsonl']] == list(range(10))
+
+
+def test_crash_recovery():
+    """上次崩溃留下的不完整行被截断；目录中已有的之前几天的文件保持原样（不压缩、不删除）"""
+    clock = FakeClock(START)
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, '2025-11-01.jsonl'), 'w') as f:
+            f.write('{"i": 0}\n{"i": 1}\n{"i": 2, "cot": "写了一半')
+        with open(os.path.join(tmp, '2025-10-31.jsonl'), 'w') as f:
+            f.write('{"i": -1}\n')
+
+        sink = LogSink(tmp, clock=clock, metrics=MetricsRegistry())
+        sink.write({'i': 3})
+        sink.close()      # 关闭时写完缓冲
+
+        files = _read_all(tmp)
+        assert [record['i'] for record in files['2025-11-01.jsonl']] == [0, 1, 3]
+        assert [record['i'] for record in files['2025-10-31.jsonl']] == [-1]
+        assert '2025-10-31.jsonl.gz' not in files
+
+        # 换日后只压缩本写入器写过的文件
+        sink = LogSink(tmp, clock=clock, metrics=MetricsRegistry())
+        sink.write({'i': 4})
+        sink.flush()
+        clock.now += 86400
+        sink.write({'i': 5})
+        sink.close()
+        files = _read_all(tmp)
+        assert sorted(files) == ['2025-10-31.jsonl', '2025-11-01.jsonl.gz', '2025-11-02.jsonl']
+
+
+def test_write_retry():
+    """批量写入中途失败：已写入的行不保留在缓冲中，重试时只写剩余的行，不重复、不丢失"""
+    clock = FakeClock(START)
+    with tempfile.TemporaryDirectory() as tmp:
+        sink = LogSink(tmp, max_bytes=2000, clock=clock, metrics=MetricsRegistry(), flush_interval=60)
+        write_chunk = sink._write_chunk
+        calls = []
+
+        def failing_write_chunk(lines):
+            calls.append(len(lines))
+            if len(calls) == 2:
+                raise OSError("模拟磁盘写满")
+            write_chunk(lines)
+
+        sink._write_chunk = failing_write_chunk
+        for i in range(100):
+            sink.write({'i': i, 'padding': 'x' * 50})
+        sink.flush(timeout=10)      # 第二段写入失败，缓冲保留剩余的行
+        assert sink.metrics.counters['log.errors'] == 1
+        assert 0 < len(sink._buffer) < 100
+
+        sink.flush(timeout=10)      # 重试
+        assert sink._buffer == [] and len(calls) > 2
+        assert sink._file_size == os.path.getsize(os.path.join(tmp, '2025-11-01.jsonl'))
+        sink.close()
+
+        files = _read_all(tmp)
+        names = sorted((name for name in files if name.count('.') == 3), key=lambda name: int(name.split('.')[1]))
+        assert [record['i'] for name in names + ['2025-11-01.jsonl'] for record in files[name]] == list(range(100))
+
+
+def test_hot_path_cost(records: int = 200):
+    """调用方耗时：原来每条记录打开文件 + json.dumps，现在只入队"""
+    result = {'market_data': to_plain_dict(mock_market_data()), 'cot_trace': '分析过程' * 300,
+              'json_result': {'market_state': '震荡', 'confidence': 60}}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        for _ in range(records):
+            with open(os.path.join(tmp, 'old.jsonl'), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(result, ensure_ascii=False) + '\n')
+        old_ms = (time.perf_counter() - start) * 1000 / records
+        line_bytes = os.path.getsize(os.path.join(tmp, 'old.jsonl')) / records
+
+        sink = _sink(os.path.join(tmp, 'logs'))
+        start = time.perf_counter()
+        for _ in range(records):
+            sink.write(result)
+        new_ms = (time.perf_counter() - start) * 1000 / records
+        sink.close()
+        assert sum(len(lines) for lines in _read_all(os.path.join(tmp, 'logs')).values()) == records
+
+    assert new_ms < old_ms
+    print(f"  每条记录 {line_bytes / 1024:.1f}KB：同步写入 {old_ms:.3f}ms → 入队 {new_ms:.4f}ms")
+
+
+if __name__ == '__main__':
+    print("\n" + "=" * 60)
+    print("🧪 分析日志写入器测试")
+    print("=" * 60 + "\n")
+
+    test_buffered_write()
+    print("✓ 缓冲批量写入\n")
+
+    test_flush_interval()
+    print("✓ 定时写入\n")
+
+    test_date_and_size_rotation()
+    print("✓ 按日期 / 大小轮转与压缩\n")
+
+    test_crash_recovery()
+    print("✓ 崩溃恢复\n")
+
+    test_write_retry()
+    print("✓ 写入失败后重试不重复\n")
+
+    test_hot_path_cost()
+    print("✓ 调用方耗时\n")
+
+    print("=" * 60)
+    print("✅ 测试完成")
+    print("=" * 60 + "\n")
@@ -0,0 +1,143 @@
+"""
+单交易对并发获取测试
+使用可注入延迟和失败的模拟交易所，验证 MarketData._fetch_all 的部分失败语义：
+持仓量 / 资金费率失败时使用默认值；K 线失败在所有请求结束后统一抛出；顺序模式与并发模式结果一致
+"""
+
+import time
+
+import pandas as pd
+
+from market_data import MarketData, KLINE_LIMITS
+from metrics import get_registry
+from test_helpers import MockExchange, TIMEFRAME_MS
+
+SYMBOL = 'BTC/USDT'
+NOW_MS = 1_760_000_000_000
+
+
+class FaultyExchange(MockExchange):
+    """
+    按请求名称注入延迟和失败的模拟交易所
+
+    请求名称与 MarketData 的任务名称一致：'klines_3m'、'open_interest'、'funding_rate' 等
+    """
+
+    def __init__(self, delays=None, failing=()):
+        super().__init__(latency=0.0)
+        self.delays = delays or {}
+        self.failing = set(failing)
+        self.finished = []
+
+    def _call(self, name):
+        self._request()
+        time.sleep(self.delays.get(name, 0.0))
+        with self._lock:
+            self.finished.append(name)
+        if name in self.failing:
+            raise Exception(f"{name} 模拟请求失败")
+
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=100):
+        self._call(f'klines_{timeframe}')
+        step = TIMEFRAME_MS[timeframe]
+        last = NOW_MS // step * step
+        return [[last - (limit - 1 - i) * step, 100.0 + i, 101.0 + i, 99.0 + i, 100.5 + i, 10.0 * i]
+                for i in range(limit)]
+
+    def fetch_open_interest(self, symbol):
+        self._call('open_interest')
+        return {'openInterestAmount': 1234.0}
+
+    def fetch_funding_rate(self, symbol):
+        self._call('funding_rate')
+        return {'fundingRate': 0.0002}
+
+
+def _market_data(exchange, concurrent=True):
+    market_data = MarketData(concurrent=concurrent, weight_per_minute=100000)
+    market_data.exchange = exchange
+    return market_data
+
+
+def test_fallbacks():
+    """持仓量 / 资金费率失败不影响 K 线，使用默认值并计入失败统计，完整数据照常组装"""
+    exchange = FaultyExchange(delays={'open_interest': 0.05}, failing={'open_interest', 'funding_rate'})
+    market_data = _market_data(exchange)
+    errors_before = get_registry().counters.get('market.fetch_errors', 0)
+    klines, oi_data, funding_rate = market_data._fetch_all(SYMBOL)
+
+    assert set(klines) == set(KLINE_LIMITS)
+    assert all(len(klines[tf]) == limit for tf, limit in KLINE_LIMITS.items())
+    assert oi_data == {'latest': 0.0, 'average': 0.0} and funding_rate == 0.0
+    # 使用默认值的请求同样计入失败统计
+    assert set(market_data.last_fetch_stats['errors']) == {'open_interest', 'funding_rate'}
+    assert get_registry().counters['market.fetch_errors'] - errors_before == 2
+
+    data = market_data.get_btc_complete_data()
+    assert data['open_interest'] == {'latest': 0.0, 'average': 0.0} and data['funding_rate'] == 0.0
+    assert data['current_price'] == klines['3m']['close'].iloc[-1]
+
+
+def test_kline_errors_raised_together():
+    """多个时间框架 K 线失败：等所有请求结束后一次抛出，异常中包含全部失败的时间框架"""
+    delays = {'klines_15m': 0.1, 'klines_1h': 0.1, 'open_interest': 0.15, 'funding_rate': 0.15}
+    exchange = FaultyExchange(delays=delays, failing={'klines_3m', 'klines_4h'})
+    market_data = _market_data(exchange)
+
+    try:
+        market_data._fetch_all(SYMBOL)
+    except Exception as e:
+        message = str(e)
+    else:
+        raise AssertionError("K 线失败时应抛出异常")
+
+    # 失败的请求立即返回，但异常在最慢的请求结束之后才抛出
+    assert exchange.requests == len(KLINE_LIMITS) + 2 and exchange.in_flight == 0
+    assert sorted(exchange.finished) == sorted([f'klines_{tf}' for tf in KLINE_LIMITS]
+                                               + ['open_interest', 'funding_rate'])
+    assert '(2/4)' in message and 'klines_3m' in message and 'klines_4h' in message
+    assert set(market_data.last_fetch_stats['errors']) == {'klines_3m', 'klines_4h'}
+    print(f"  {message}")
+
+
+def test_sequential_matches_concurrent():
+    """concurrent=False 按顺序请求，结果与并发模式相同；并发模式耗时取决于最慢的请求"""
+    delays = {f'klines_{tf}': 0.05 for tf in KLINE_LIMITS}
+    delays.update({'open_interest': 0.05, 'funding_rate': 0.05})
+    results, wall_ms = {}, {}
+    for concurrent in (True, False):
+        market_data = _market_data(FaultyExchange(delays=delays, failing={'funding_rate'}), concurrent)
+        start = time.perf_counter()
+        results[concurrent] = market_data._fetch_all(SYMBOL)
+        elapsed = time.perf_counter() - start
+        assert market_data.last_fetch_stats['mode'] == ('concurrent' if concurrent else 'sequential')
+        wall_ms[concurrent] = market_data.last_fetch_stats['total_ms']
+        print(f"  {market_data.last_fetch_stats['mode']}: {elapsed * 1000:.0f}ms")
+
+    (klines, oi_data, funding_rate), (seq_klines, seq_oi, seq_funding) = results[True], results[False]
+    assert list(klines) == list(seq_klines)
+    for timeframe in KLINE_LIMITS:
+        pd.testing.assert_frame_equal(klines[timeframe], seq_klines[timeframe])
+    assert oi_data == seq_oi == {'latest': 1234.0, 'average': 1234.0}
+    assert funding_rate == seq_funding == 0.0
+    # 6 个请求各 50ms：顺序约 300ms，并发约 50ms
+    assert wall_ms[True] < wall_ms[False] / 2
+
+
+if __name__ == '__main__':
+    print("\n" + "=" * 60)
+    print("🧪 单交易对并发获取测试（模拟交易所，注入延迟和失败）")
+    print("=" * 60 + "\n")
+
+    test_fallbacks()
+    print("✓ 持仓量 / 资金费率失败使用默认值\n")
+
+    test_kline_errors_raised_together()
+    print("✓ K 线失败在所有请求结束后统一抛出\n")
+
+    test_sequential_matches_concurrent()
+    print("✓ 顺序模式与并发模式结果一致\n")
+
+    print("=" * 60)
+    print("✅ 测试完成")
+    print("=" * 60 + "\n")
@@ -0,0 +1,87 @@
+"""
+多币种扫描基准测试
+使用带固定延迟的模拟交易所，测量 MarketData.get_complete_data() 的吞吐量（个/秒），
+并验证并发上限和共享权重预算
+"""
+
+import time
+
+from market_data import MarketData, KLINE_LIMITS
+from rate_limit import TokenBucket
+from test_helpers import MockExchange
+
+
+def _symbols(n):
+    return [f"COIN{i}/USDT" for i in range(n)]
+
+
+def test_scan_throughput(n_symbols: int = 100, max_concurrency: int = 16):
+    """并行扫描：返回每个交易对的完整数据，在途请求数不超过并发上限"""
+    market_data = MarketData(max_concurrency=max_concurrency, weight_per_minute=100000)
+    exchange = MockExchange(latency=0.02)
+    market_data.exchange = exchange
+
+    symbols = _symbols(n_symbols)
+    results = market_data.get_complete_data(symbols)
+    stats = market_data.last_scan_stats
+
+    assert list(results) == symbols
+    for data in results.values():
+        for timeframe in KLINE_LIMITS:
+            assert f'timeframe_{timeframe}' in data
+        assert set(data['price_changes']) == {'15m', '1h', '4h', '24h'}
+    assert exchange.requests == n_symbols * (len(KLINE_LIMITS) + 2)
+    assert exchange.max_in_flight <= max_concurrency
+
+    sequential_seconds = exchange.requests * exchange.latency
+    print(f"  交易对: {n_symbols} | 请求: {exchange.requests} | 最大在途: {exchange.max_in_flight}")
+    print(f"  耗时: {stats['elapsed_seconds']:.2f}s (请求 {stats['fetch_seconds']:.2f}s + "
+          f"计算 {stats['compute_seconds']:.2f}s) | 顺序请求估计 {sequential_seconds:.2f}s")
+    print(f"  吞吐: {stats['symbols_per_second']:.1f} 个/秒")
+
+
+def test_partial_failure():
+    """单个交易对失败不影响其他交易对"""
+    market_data = MarketData(max_concurrency=8, weight_per_minute=100000)
+    market_data.exchange = MockExchange(latency=0.001, failing_symbols={'COIN1/USDT'})
+
+    results = market_data.get_complete_data(_symbols(4))
+
+    assert list(results) == ['COIN0/USDT', 'COIN2/USDT', 'COIN3/USDT']
+    assert 'COIN1/USDT' in market_data.last_scan_stats['failed']
+
+
+def test_shared_rate_budget():
+    """所有请求共享权重预算：超出突发容量的部分按速率等待"""
+    market_data = MarketData(max_concurrency=16)
+    market_data.exchange = MockExchange(latency=0.0)
+    market_data.rate_limiter = TokenBucket(rate=100, capacity=10)
+
+    start = time.perf_counter()
+    market_data.get_complete_data(_symbols(10))
+    elapsed = time.perf_counter() - start
+
+    # 10 个交易对 × 6 个请求 = 60 权重，容量 10，其余 50 按 100/秒 补充 ≈ 0.5 秒
+    assert elapsed >= 0.45, elapsed
+    print(f"  权重预算限速: 60 权重耗时 {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    print("\n" + "=" * 60)
+    print("🧪 多币种扫描基准测试（模拟交易所，单请求延迟 20ms）")
+    print("=" * 60 + "\n")
+
+    for n, concurrency in [(50, 8), (100, 16), (200, 32)]:
+        print(f"▶ {n} 个交易对，并发 {concurrency}")
+        test_scan_throughput(n, concurrency)
+        print()
+
+    test_partial_failure()
+    print("✓ 部分失败不影响其他交易对\n")
+
+    test_shared_rate_budget()
+    print("✓ 共享权重预算生效\n")
+
+    print("=" * 60)
+    print("✅ 测试完成")
+    print("=" * 60 + "\n")
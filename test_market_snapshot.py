@@ -0,0 +1,135 @@
+"""
+MarketSnapshot 测试
+验证紧凑快照与原嵌套字典的数据、prompt 输出完全一致，并对比两者的内存占用和构建耗时
+"""
+
+import time
+import tracemalloc
+
+import numpy as np
+
+import prompts
+import prompts_trading
+from indicators import SERIES_FIELDS, SERIES_POINTS, matrix_to_dict
+from market_data import MarketData, KLINE_LIMITS
+from market_snapshot import MarketSnapshot, TimeframeSeries, to_plain_dict
+from test_helpers import MockExchange
+
+
+def _without_timestamp(data: dict) -> dict:
+    return {key: value for key, value in data.items() if key != 'timestamp'}
+
+
+def _without_time_line(prompt: str) -> str:
+    """去掉首行的当前时间（两次构建可能跨秒）"""
+    return prompt.split('\n', 1)[1]
+
+
+def _fetch_pair(incremental: bool):
+    """同一个模拟交易所分别以字典模式和快照模式获取一次数据"""
+    exchange = MockExchange(latency=0.0)
+    plain = MarketData(concurrent=False, incremental=incremental)
+    compact = MarketData(concurrent=False, incremental=incremental, snapshot=True)
+    plain.exchange = compact.exchange = exchange
+    return plain.get_btc_complete_data(), compact.get_btc_complete_data()
+
+
+def test_snapshot_matches_dict():
+    """快照模式的 to_dict() 与字典模式结果完全一致（TA-Lib 路径和增量引擎路径）"""
+    for incremental in (False, True):
+        data, snapshot = _fetch_pair(incremental)
+
+        assert isinstance(snapshot, MarketSnapshot)
+        assert isinstance(snapshot['timeframe_1h'], TimeframeSeries)
+        assert _without_timestamp(snapshot.to_dict()) == _without_timestamp(data)
+        assert list(snapshot) == list(data)
+        assert snapshot['timeframe_3m']['current'] == data['timeframe_3m']['current']
+        assert to_plain_dict(data) is data
+
+
+def test_prompts_unchanged():
+    """prompt 构建函数直接读取快照，输出与字典完全一致"""
+    data, snapshot = _fetch_pair(incremental=False)
+
+    assert _without_time_line(prompts.build_user_prompt(snapshot, 10, 3)) == \
+        _without_time_line(prompts.build_user_prompt(data, 10, 3))
+    assert _without_time_line(prompts_trading.build_user_prompt(snapshot, 10, 3)) == \
+        _without_time_line(prompts_trading.build_user_prompt(data, 10, 3))
+
+
+def test_batch_scan_snapshot():
+    """多币种批量扫描同样支持快照模式"""
+    market_data = MarketData(max_concurrency=4, weight_per_minute=100000, snapshot=True)
+    market_data.exchange = MockExchange(latency=0.0)
+
+    results = market_data.get_complete_data(['COIN0/USDT', 'COIN1/USDT'])
+
+    for snapshot in results.values():
+        assert isinstance(snapshot, MarketSnapshot)
+        assert snapshot['timeframe_3m']['prices'].shape == (SERIES_POINTS['3m'],)
+        assert snapshot['timeframe_4h'].values.flags['C_CONTIGUOUS']
+
+
+def _random_matrices():
+    """每个时间框架一个随机指标矩阵"""
+    rng = np.random.default_rng(0)
+    return {timeframe: rng.normal(100000, 100, (len(SERIES_FIELDS), SERIES_POINTS[timeframe]))
+            for timeframe in KLINE_LIMITS}
+
+
+def _build(matrices, compact: bool):
+    scalars = dict(symbol='BTCUSDT', current_price=100000.0,
+                   price_changes={'15m': 0.1, '1h': 0.2, '4h': 0.3, '24h': 0.4},
+                   current_ema20=1.0, current_macd=2.0, current_rsi7=3.0,
+                   open_interest={'latest': 1.0, 'average': 1.0}, funding_rate=0.0001)
+    if compact:
+        timeframes = {tf: TimeframeSeries(tf, SERIES_POINTS[tf], m) for tf, m in matrices.items()}
+        return MarketSnapshot(timeframes=timeframes, timestamp='', **scalars)
+    result = dict(scalars)
+    for tf, m in matrices.items():
+        result[f'timeframe_{tf}'] = matrix_to_dict(tf, SERIES_POINTS[tf], m)
+    result['timestamp'] = ''
+    return result
+
+
+def benchmark_snapshot(count: int = 2000):
+    """对比每个快照的内存占用（tracemalloc）和构建耗时（从同一份指标矩阵出发）"""
+    matrices = [_random_matrices() for _ in range(count)]
+
+    for compact, name in ((False, '嵌套字典'), (True, 'MarketSnapshot')):
+        start = time.perf_counter()
+        [_build(m, compact) for m in matrices]
+        elapsed = time.perf_counter() - start
+
+        # 快照直接持有矩阵，计入矩阵本身的大小；字典只计入转换出的列表
+        tracemalloc.start()
+        kept = [_build({tf: m.copy() for tf, m in item.items()} if compact else item, compact)
+                for item in matrices]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del kept
+
+        print(f"  {name:14s} 每个快照内存 {size / count / 1024:.1f} KB | "
+              f"构建耗时 {elapsed / count * 1e6:.1f} µs")
+
+
+if __name__ == '__main__':
+    print("\n" + "=" * 60)
+    print("🧪 MarketSnapshot 测试")
+    print("=" * 60 + "\n")
+
+    test_snapshot_matches_dict()
+    print("✓ 快照与嵌套字典数据一致\n")
+
+    test_prompts_unchanged()
+    print("✓ prompt 输出一致\n")
+
+    test_batch_scan_snapshot()
+    print("✓ 批量扫描支持快照模式\n")
+
+    benchmark_snapshot()
+    print()
+
+    print("=" * 60)
+    print("✅ 测试完成")
+    print("=" * 60 + "\n")
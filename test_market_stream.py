@@ -0,0 +1,181 @@
+"""
+WebSocket 行情推送测试
+启动本地回放 WebSocket 服务，按 Binance 合约推送格式回放 K 线和标记价格消息，
+验证 MarketStream 缓冲区更新以及 MarketData 推送模式下的数据读取
+"""
+
+import asyncio
+import json
+import threading
+import time
+
+from aiohttp import web
+
+from market_data import MarketData, KLINE_LIMITS
+
+
+TIMEFRAME_MS = {'3m': 180_000, '15m': 900_000, '1h': 3_600_000, '4h': 14_400_000}
+
+
+class ReplayServer:
+    """本地回放 WebSocket 服务：客户端连接后依次推送预先录制的消息"""
+
+    def __init__(self, messages, interval: float = 0.01):
+        self.messages = messages
+        self.interval = interval
+        self.port = None
+        self.requested_streams = None
+        self._ready = threading.Event()
+        self._loop = None
+        self._runner = None
+
+    def start(self):
+        threading.Thread(target=self._thread_main, daemon=True).start()
+        self._ready.wait(5)
+
+    def stop(self):
+        if self._loop:
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result(5)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    @property
+    def url(self):
+        return f"ws://127.0.0.1:{self.port}/stream"
+
+    def _thread_main(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._serve())
+        self._ready.set()
+        self._loop.run_forever()
+
+    async def _serve(self):
+        app = web.Application()
+        app.router.add_get('/stream', self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def _handle(self, request):
+        self.requested_streams = request.query.get('streams', '').split('/')
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        for message in self.messages:
+            await ws.send_str(json.dumps(message))
+            await asyncio.sleep(self.interval)
+        # 回放结束后保持连接，模拟持续推送的标记价格
+        try:
+            while not ws.closed:
+                await ws.send_str(json.dumps(_mark_price_message(110000.0, 0.0002)))
+                await asyncio.sleep(0.05)
+        except ConnectionResetError:
+            pass
+        return ws
+
+
+class FakeExchange:
+    """REST 补齐数据用的假交易所"""
+
+    def __init__(self, now_ms):
+        self.markets = {'BTC/USDT': {}}
+        self.now_ms = now_ms
+
+    def load_markets(self):
+        return self.markets
+
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=100):
+        step = TIMEFRAME_MS[timeframe]
+        last = self.now_ms // step * step
+        return [[last - (limit - 1 - i) * step, 100000.0 + i, 100010.0 + i, 99990.0 + i, 100000.0 + i, 10.0]
+                for i in range(limit)]
+
+    def fetch_open_interest(self, symbol):
+        return {'openInterestAmount': 80000.0}
+
+    def fetch_funding_rate(self, symbol):
+        return {'fundingRate': 0.0001}
+
+
+def _kline_message(timeframe, open_time, close, closed):
+    return {
+        'stream': f'btcusdt@kline_{timeframe}',
+        'data': {
+            'e': 'kline', 's': 'BTCUSDT',
+            'k': {'t': open_time, 'i': timeframe, 'o': str(close - 5), 'h': str(close + 10),
+                  'l': str(close - 10), 'c': str(close), 'v': '12.5', 'x': closed}
+        }
+    }
+
+
+def _mark_price_message(price, funding_rate):
+    return {
+        'stream': 'btcusdt@markPrice@1s',
+        'data': {'e': 'markPriceUpdate', 's': 'BTCUSDT', 'p': str(price), 'r': str(funding_rate),
+                 'T': 1700000000000}
+    }
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_stream_replay():
+    """回放推送：实时 K 线覆盖、新 K 线追加、资金费率更新，get_btc_complete_data 直接读本地状态"""
+    now_ms = int(time.time() * 1000)
+    last_3m = now_ms // TIMEFRAME_MS['3m'] * TIMEFRAME_MS['3m']
+
+    messages = [
+        _mark_price_message(110000.0, 0.0002),
+        _kline_message('3m', last_3m, 110100.0, False),            # 实时 K 线跳动（覆盖）
+        _kline_message('3m', last_3m, 110200.0, True),             # 收盘
+        _kline_message('3m', last_3m + 180_000, 110300.0, False),  # 新 K 线（追加）
+    ]
+    server = ReplayServer(messages)
+    server.start()
+
+    market_data = MarketData(concurrent=False)
+    market_data.exchange = FakeExchange(now_ms)
+    stream = market_data.start_stream(url=server.url, use_proxy=False)
+
+    try:
+        assert _wait_for(lambda: stream.message_count >= len(messages) and stream.is_ready()), "推送未就绪"
+        assert "btcusdt@kline_3m" in server.requested_streams
+        assert 'btcusdt@markPrice@1s' in server.requested_streams
+
+        candles = stream.klines('3m')
+        assert len(candles) == KLINE_LIMITS['3m']
+        assert candles[-2][0] == last_3m and candles[-2][4] == 110200.0
+        assert candles[-1][0] == last_3m + 180_000 and candles[-1][4] == 110300.0
+        print(f"  ✓ 3m 缓冲区: {len(candles)} 根，最新收盘 {candles[-1][4]}")
+
+        start = time.perf_counter()
+        data = market_data.get_btc_complete_data()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        assert market_data.last_fetch_stats['mode'] == 'stream'
+        assert data['current_price'] == 110300.0
+        assert data['funding_rate'] == 0.0002
+        assert data['open_interest']['latest'] == 80000.0
+        print(f"  ✓ 推送模式读取完整数据耗时 {elapsed_ms:.1f}ms，价格 {data['current_price']}")
+    finally:
+        market_data.stop_streams()
+        server.stop()
+
+
+if __name__ == '__main__':
+    print("\n" + "=" * 60)
+    print("🧪 WebSocket 行情推送回放测试")
+    print("=" * 60 + "\n")
+
+    test_stream_replay()
+
+    print("\n" + "=" * 60)
+    print("✅ 测试完成")
+    print("=" * 60 + "\n")
@@ -0,0 +1,142 @@
+"""
+指标注册表测试
+验证滚动窗口分位数，以及 DeepSeekClient / AsyncDeepSeekClient 每次调用记录的
+HTTP 状态、首字节 / 总耗时、重试次数和 token 用量
+"""
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from deepseek_client import AsyncDeepSeekClient, DeepSeekClient
+from http_transport import HTTPTransport
+from metrics import MetricsRegistry, RollingHistogram
+
+USAGE = {'prompt_tokens': 1200, 'completion_tokens': 300,
+         'prompt_cache_hit_tokens': 1024, 'prompt_cache_miss_tokens': 176}
+
+
+class UsageHandler(BaseHTTPRequestHandler):
+    """模拟 chat/completions：固定延迟后返回 usage；server.fail 次数内返回 503"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(self.server.latency)
+        if self.server.fail > 0:
+            self.server.fail -= 1
+            self._reply(503, b'Service Unavailable')
+            return
+        body = {'choices': [{'message': {'content': '{"summary": "ok"}'}}], 'usage': USAGE}
+        self._reply(200, json.dumps(body).encode())
+
+    def _reply(self, status: int, payload: bytes):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _start_server(latency: float = 0.02, fail: int = 0):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), UsageHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.fail = fail
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def test_rolling_percentiles():
+    """分位数只统计最近 window 个样本，count / sum 为累计值"""
+    histogram = RollingHistogram(window=100)
+    for value in range(1, 201):
+        histogram.observe(value)
+    summary = histogram.summary()
+    assert summary['count'] == 200 and summary['sum'] == sum(range(1, 201))
+    assert summary['window'] == 100
+    assert abs(summary['p50'] - 150.5) < 1e-9
+    assert 195 <= summary['p95'] <= 196 and 199 <= summary['p99'] <= 200
+    assert summary['max'] == 200 and summary['last'] == 200
+
+    registry = MetricsRegistry()
+    registry.observe('latency_ms', None)
+    assert registry.snapshot()['histograms'] == {}
+    assert registry.summary('latency_ms')['count'] == 0
+
+
+def test_client_instrumentation():
+    """同步客户端：last_call_stats 与注册表记录状态码、耗时和 token 用量"""
+    server, base_url = _start_server(latency=0.02)
+    registry = MetricsRegistry()
+    client = DeepSeekClient(api_key='test', base_url=base_url, transport=HTTPTransport(), metrics=registry)
+    try:
+        for _ in range(5):
+            client.call_with_messages('system', 'user')
+    finally:
+        server.shutdown()
+
+    stats = client.last_call_stats
+    assert stats['status'] == 200 and stats['retries'] == 0
+    assert stats['ttfb_ms'] >= 20 and stats['total_ms'] >= stats['ttfb_ms']
+    assert stats['usage']['cache_hit_tokens'] == 1024
+
+    snapshot = registry.snapshot()
+    assert snapshot['counters'] == {'deepseek.calls': 5, 'deepseek.status.200': 5}
+    latency = snapshot['histograms']['deepseek.total_ms']
+    assert latency['count'] == 5 and latency['p50'] >= 20
+    assert snapshot['histograms']['deepseek.completion_tokens']['p99'] == 300
+    print(f"  总耗时 p50 {latency['p50']:.1f}ms / p95 {latency['p95']:.1f}ms | "
+          f"首字节 p50 {snapshot['histograms']['deepseek.ttfb_ms']['p50']:.1f}ms")
+
+
+def test_retry_and_failure_accounting():
+    """异步客户端：重试次数和最终失败的状态码写入注册表"""
+
+    async def run(fail, max_retries):
+        server, base_url = _start_server(latency=0.0, fail=fail)
+        registry = MetricsRegistry()
+        try:
+            async with AsyncDeepSeekClient('test', base_url=base_url, retry_base_delay=0.01,
+                                           metrics=registry) as client:
+                try:
+                    await client.call_with_messages('s', 'u', max_retries=max_retries)
+                except Exception:
+                    pass
+        finally:
+            server.shutdown()
+        return registry.snapshot()
+
+    recovered = asyncio.run(run(fail=2, max_retries=3))
+    assert recovered['counters'] == {'deepseek.calls': 1, 'deepseek.retries': 2, 'deepseek.status.200': 1}
+    assert recovered['histograms']['deepseek.prompt_tokens']['last'] == 1200
+
+    failed = asyncio.run(run(fail=5, max_retries=2))
+    assert failed['counters'] == {'deepseek.calls': 1, 'deepseek.retries': 1,
+                                  'deepseek.status.503': 1, 'deepseek.failures': 1}
+    assert 'deepseek.total_ms' not in failed['histograms']
+
+
+if __name__ == '__main__':
+    print("\n" + "=" * 60)
+    print("🧪 指标注册表测试")
+    print("=" * 60 + "\n")
+
+    test_rolling_percentiles()
+    print("✓ 滚动窗口分位数\n")
+
+    test_client_instrumentation()
+    print("✓ DeepSeekClient 调用统计\n")
+
+    test_retry_and_failure_accounting()
+    print("✓ 重试与失败统计\n")
+
+    print("=" * 60)
+    print("✅ 测试完成")
+    print("=" * 60 + "\n")
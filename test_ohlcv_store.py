@@ -0,0 +1,136 @@
+"""
+K 线本地缓存与增量获取测试
+使用可控时间的模拟交易所，验证 MarketData._fetch_klines_incremental 的三种情况：
+冷启动全量获取、热启动从最后一根（可能未收盘的）K 线开始补齐、断档超过单次请求上限时退化为全量获取
+"""
+
+import os
+import tempfile
+
+from market_data import MarketData, MAX_FETCH_LIMIT
+from test_helpers import MockExchange, TIMEFRAME_MS
+
+SYMBOL = 'BTC/USDT'
+TIMEFRAME = '15m'
+STEP = TIMEFRAME_MS[TIMEFRAME]
+START_MS = 1_760_000_000_000 // STEP * STEP
+
+
+def _candle(ts, now_ms):
+    """ts 开盘的 K 线；未收盘的 K 线收盘价随当前时间变化，收盘后固定为 ts 的函数"""
+    close = 100000 + (ts - START_MS) / STEP
+    if ts + STEP > now_ms:
+        close += (now_ms - ts) / STEP / 2
+    return [ts, close, close + 10, close - 10, close, 1.0]
+
+
+class ClockExchange(MockExchange):
+    """时间可控的模拟交易所：记录每次 fetch_ohlcv 的 since / limit"""
+
+    def __init__(self, now_ms):
+        super().__init__(latency=0.0)
+        self.now_ms = now_ms
+        self.calls = []
+
+    def parse_timeframe(self, timeframe):
+        return TIMEFRAME_MS[timeframe] // 1000
+
+    def milliseconds(self):
+        return self.now_ms
+
+    def expected(self, limit):
+        """当前时刻最近 limit 根 K 线（全量获取的结果）"""
+        last = self.now_ms // STEP * STEP
+        return [_candle(last - (limit - 1 - i) * STEP, self.now_ms) for i in range(limit)]
+
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=100):
+        self._request()
+        self.calls.append((since, limit))
+        last = self.now_ms // STEP * STEP
+        if since is None:
+            return self.expected(limit)
+        return [_candle(ts, self.now_ms) for ts in range(since, min(since + limit * STEP, last + STEP), STEP)]
+
+
+def _market_data(tmp, now_ms):
+    market_data = MarketData(concurrent=False, store_path=os.path.join(tmp, 'ohlcv.sqlite3'))
+    market_data.exchange = ClockExchange(now_ms)
+    return market_data
+
+
+def _cached(market_data):
+    return market_data.store.load_range(SYMBOL, TIMEFRAME, 0, 2 ** 62)
+
+
+def test_cold_start():
+    """缓存为空：全量获取 limit 根并写入缓存"""
+    with tempfile.TemporaryDirectory() as tmp:
+        market_data = _market_data(tmp, START_MS + STEP // 3)
+        rows = market_data._fetch_klines_incremental(SYMBOL, TIMEFRAME, 40)
+        assert market_data.exchange.calls == [(None, 40)]
+        assert rows == market_data.exchange.expected(40)
+        assert _cached(market_data) == rows
+        market_data.store.close()
+
+
+def test_warm_start():
+    """热启动：从缓存中最后一根 K 线开始获取，写入时未收盘的那根被收盘后的数据覆盖"""
+    with tempfile.TemporaryDirectory() as tmp:
+        market_data = _market_data(tmp, START_MS + STEP // 3)
+        exchange = market_data.exchange
+        first = market_data._fetch_klines_incremental(SYMBOL, TIMEFRAME, 40)
+        open_bar = first[-1]
+
+        # 同一根 K 线内再次获取：只请求最后一根，收盘价更新
+        exchange.now_ms += STEP // 3
+        rows = market_data._fetch_klines_incremental(SYMBOL, TIMEFRAME, 40)
+        assert exchange.calls[-1] == (open_bar[0], 2)
+        assert rows == exchange.expected(40) and rows[-1][4] != open_bar[4]
+
+        # 跨过 3 根 K 线的开盘时间：从原来的最后一根开始补齐 4 根（含新的未收盘 K 线）
+        exchange.now_ms += STEP * 2 + STEP // 2
+        rows = market_data._fetch_klines_incremental(SYMBOL, TIMEFRAME, 40)
+        assert exchange.calls[-1] == (open_bar[0], 4)
+        assert rows == exchange.expected(40)
+        reloaded = {row[0]: row for row in _cached(market_data)}
+        assert reloaded[open_bar[0]] == _candle(open_bar[0], exchange.now_ms) != open_bar
+        assert len(reloaded) == 43
+        market_data.store.close()
+
+
+def test_gap_fallback():
+    """断档超过单次请求上限：退化为全量获取，最近 limit 根与交易所一致"""
+    with tempfile.TemporaryDirectory() as tmp:
+        market_data = _market_data(tmp, START_MS + STEP // 3)
+        exchange = market_data.exchange
+        market_data._fetch_klines_incremental(SYMBOL, TIMEFRAME, 40)
+
+        # 恰好在上限内：仍然增量获取
+        exchange.now_ms += (MAX_FETCH_LIMIT - 1) * STEP
+        market_data._fetch_klines_incremental(SYMBOL, TIMEFRAME, 40)
+        assert exchange.calls[-1] == (START_MS, MAX_FETCH_LIMIT)
+
+        exchange.now_ms += (MAX_FETCH_LIMIT + 5) * STEP
+        rows = market_data._fetch_klines_incremental(SYMBOL, TIMEFRAME, 40)
+        assert exchange.calls[-1] == (None, 40)
+        assert rows == exchange.expected(40)
+        market_data.store.close()
+
+
+if __name__ == '__main__':
+    print("\n" + "=" * 60)
+    print("🧪 K 线本地缓存与增量获取测试")
+    print("=" * 60 + "\n")
+
+    test_cold_start()
+    print("✓ 冷启动全量获取\n")
+
+    test_warm_start()
+    print("✓ 热启动补齐并覆盖未收盘 K 线\n")
+
+    test_gap_fallback()
+    print("✓ 断档超过上限时全量获取\n")
+
+    print("=" * 60)
+    print("✅ 测试完成")
+    print("=" * 60 + "\n")
@@ -0,0 +1,361 @@
+"""
+模拟交易账户测试
+验证开仓校验、止损 / 止盈 / 强平的成交价和盈亏、K 线最高 / 最低价只作用于之前开的仓、手动平仓、
+账户净值一致性，比较向量化盯市与逐个持仓循环的每次更新耗时，
+并用本地模拟的 DeepSeek 接口验证监控器执行决策、下一周期按 K 线触发止损
+"""
+
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from market_stream import MarketStream
+from paper_trading import PaperAccount
+from test_helpers import FakeClock, MockExchange
+
+
+def _open(account, action='open_long', price=100000.0, size=4000, leverage=5, **extra):
+    decision = {'symbol': 'BTCUSDT', 'action': action, 'position_size_usd': size, 'leverage': leverage, **extra}
+    return account.apply_decisions([decision], {'BTCUSDT': price})[0]
+
+
+def test_open_rules():
+    """开仓按杠杆占用保证金并收取手续费；无效参数、错误一侧的止损止盈、重复方向和余额不足被拒绝"""
+    account = PaperAccount(1000.0, fee_rate=0.0004, maintenance_margin_rate=0.004, clock=FakeClock())
+    result = _open(account, stop_loss=98000, take_profit=104000)
+    assert result['status'] == 'opened'
+    assert abs(result['liquidation_price'] - 100000 * (1 - 1 / 5 + 0.004)) < 1e-6
+
+    info = account.account_info()
+    assert abs(info['margin_used'] - 800) < 1e-9 and abs(info['total_equity'] - (1000 - 1.6)) < 1e-9
+    assert info['position_count'] == 1
+
+    assert _open(account)['reason'] == '已有同方向持仓'
+    assert _open(account, 'open_short', size=0)['status'] == 'rejected'
+    assert _open(account, 'open_short', stop_loss=99000)['status'] == 'rejected'
+    assert _open(account, 'open_short', take_profit=101000)['status'] == 'rejected'
+    assert _open(account, 'open_short', size=2000, leverage=2)['reason'].startswith('可用余额不足')
+    assert account.apply_decisions([{'symbol': 'ETHUSDT', 'action': 'open_long', 'position_size_usd': 100}],
+                                   {'BTCUSDT': 100000.0})[0]['status'] == 'rejected'
+    assert account.apply_decisions([{'symbol': 'BTCUSDT', 'action': 'wait'}],
+                                   {'BTCUSDT': 100000.0})[0]['status'] == 'skipped'
+
+    position = account.positions()[0]
+    assert position['side'] == 'long' and position['leverage'] == 5 and position['stop_loss'] == 98000
+    assert position['take_profit'] == 104000 and abs(position['quantity'] - 0.04) < 1e-12
+
+
+def test_exit_triggers():
+    """按触发价成交：止盈、止损、强平（损失全部保证金）；同一根 K 线都触及时按止损计"""
+    clock = FakeClock()
+    account = PaperAccount(1000.0, clock=clock)
+    _open(account, stop_loss=98000, take_profit=104000)
+    _open(account, 'open_short', price=100000, size=1000, leverage=10)
+    clock.now += 600
+
+    # 最高价触及多单止盈；空单止损未设置，强平价 100000 * (1 + 0.1 - 0.004) = 109600 未触及
+    trades = account.mark({'BTCUSDT': 103000}, highs={'BTCUSDT': 104500}, lows={'BTCUSDT': 102000})
+    assert [trade['reason'] for trade in trades] == ['take_profit']
+    take_profit = trades[0]
+    assert take_profit['exit_price'] == 104000 and take_profit['holding_minutes'] == 10
+    expected = 0.04 * 4000 - 104000 * 0.04 * 0.0004
+    assert abs(take_profit['pnl'] - expected) < 1e-9
+    assert abs(take_profit['pnl_pct'] - expected / 800 * 100) < 1e-9
+
+    # 空单强平：按强平价成交，损失全部保证金，不收平仓手续费
+    trades = account.mark({'BTCUSDT': 109000}, highs={'BTCUSDT': 110000}, lows={'BTCUSDT': 108000})
+    assert [trade['reason'] for trade in trades] == ['liquidation']
+    assert abs(trades[0]['exit_price'] - 109600) < 1e-6 and trades[0]['pnl'] == -100 and trades[0]['fee'] == 0
+
+    # 同一根 K 线同时触及止损和止盈：按止损计
+    _open(account, price=100000, size=1000, leverage=2, stop_loss=99000, take_profit=101000)
+    trades = account.mark({'BTCUSDT': 100000}, highs={'BTCUSDT': 101500}, lows={'BTCUSDT': 98500})
+    assert trades[0]['reason'] == 'stop_loss' and trades[0]['exit_price'] == 99000
+
+    # 止损比强平价更远时先强平
+    _open(account, price=100000, size=1000, leverage=20, stop_loss=90000)
+    trades = account.mark({'BTCUSDT': 94000})
+    assert trades[0]['reason'] == 'liquidation'
+
+    # 已实现盈亏和手续费与钱包余额一致；历史交易按平仓顺序记录
+    assert len(account.trade_history) == 4 and account.position_count == 0
+    info = account.account_info()
+    realized = sum(trade['pnl'] for trade in account.trade_history)
+    open_fees = (4000 + 1000 + 1000 + 1000) * 0.0004
+    assert abs(info['total_equity'] - (1000 + realized - open_fees)) < 1e-9
+    assert abs(info['available_balance'] - info['total_equity']) < 1e-9
+
+
+def test_candle_guard():
+    """K 线的最高 / 最低价只检查这根 K 线开始前已开的仓；已处理的 K 线不重复处理"""
+    clock = FakeClock(1_700_000_300.0)
+    account = PaperAccount(1000.0, clock=clock)
+    _open(account, stop_loss=99000)
+
+    # 这根 K 线在开仓前已开始，最低价 98000 是开仓之前的价格，只按收盘价检查
+    candle_ts = int((clock.now - 120) * 1000)
+    assert account.mark_candles('BTCUSDT', [[candle_ts, 100000, 100500, 98000, 100200, 1]]) == []
+
+    # 下一根 K 线开始于开仓之后，最低价触及止损
+    clock.now += 300
+    candles = [[candle_ts, 100000, 100500, 98000, 100200, 1],
+               [candle_ts + 180000, 100200, 100300, 98900, 99500, 1]]
+    trades = account.mark_candles('BTCUSDT', candles)
+    assert [trade['reason'] for trade in trades] == ['stop_loss'] and trades[0]['exit_price'] == 99000
+
+
+def test_manual_close_and_marks():
+    """手动平仓按当前价格成交；未实现盈亏按最新标记价格计算"""
+    clock = FakeClock()
+    account = PaperAccount(1000.0, clock=clock)
+    _open(account, 'open_short', size=2000, leverage=4)
+    account.mark({'BTCUSDT': 95000})
+    position = account.positions()[0]
+    assert abs(position['unrealized_pnl'] - 0.02 * 5000) < 1e-9 and abs(position['unrealized_pnl_pct'] - 20) < 1e-9
+    assert abs(account.account_info()['total_equity'] - (1000 - 0.8 + 100)) < 1e-9
+
+    assert account.apply_decisions([{'symbol': 'BTCUSDT', 'action': 'close_long'}],
+                                   {'BTCUSDT': 95000.0})[0]['status'] == 'rejected'
+    result = account.apply_decisions([{'symbol': 'BTCUSDT', 'action': 'close_short'}], {'BTCUSDT': 96000.0})[0]
+    trade = result['trades'][0]
+    assert result['status'] == 'closed' and trade['reason'] == 'manual' and trade['exit_price'] == 96000
+    assert abs(trade['pnl'] - (0.02 * 4000 - 96000 * 0.02 * 0.0004)) < 1e-9
+    assert account.position_count == 0 and account.positions() == []
+
+
+def _naive_mark(positions, marks):
+    """逐个持仓检查止损 / 止盈 / 强平（对照实现）"""
+    hits = []
+    for i, (symbol, side, stop_loss, take_profit, liquidation) in enumerate(positions):
+        price = marks[symbol]
+        if side > 0:
+            if price <= max(stop_loss, liquidation) or price >= take_profit:
+                hits.append(i)
+        elif price >= min(stop_loss, liquidation) or price <= take_profit:
+            hits.append(i)
+    return hits
+
+
+def test_mark_throughput(n_symbols: int = 2500, batch: int = 50, ticks: int = 400):
+    """
+    2500 个交易对各一个多单和一个空单（共 5000 个持仓），每次价格更新推送 50 个交易对：
+    向量化盯市与逐个持仓循环触发的平仓一致，并比较每次价格更新的耗时
+    """
+    rng = np.random.default_rng(3)
+    symbols = [f"COIN{i}USDT" for i in range(n_symbols)]
+    account = PaperAccount(1e9, capacity=4, clock=FakeClock())
+    positions = []
+    for symbol in symbols:
+        for action, side in (('open_long', 1), ('open_short', -1)):
+            stop_loss = 100 * (1 - side * rng.uniform(0.02, 0.2))
+            take_profit = 100 * (1 + side * rng.uniform(0.02, 0.2))
+            result = account.apply_decisions([{
+                'symbol': symbol, 'action': action, 'position_size_usd': 100, 'leverage': 5,
+                'stop_loss': stop_loss, 'take_profit': take_profit
+            }], {symbol: 100.0})[0]
+            assert result['status'] == 'opened'
+            positions.append((symbol, side, stop_loss, take_profit, result['liquidation_price']))
+    assert account.position_count == 2 * n_symbols
+
+    paths = 100 * np.exp(np.cumsum(rng.normal(0, 0.004, (ticks, n_symbols)), axis=0))
+    updates = []
+    for tick in range(ticks):
+        offset = tick * batch % n_symbols
+        updates.append({symbols[j]: float(paths[tick, j]) for j in range(offset, offset + batch)})
+
+    vectorized_ms = 0.0
+    closed = 0
+    for prices in updates:
+        start = time.perf_counter()
+        closed += len(account.mark(prices))
+        vectorized_ms += (time.perf_counter() - start) * 1000
+
+    marks = dict.fromkeys(symbols, 100.0)
+    naive_ms = 0.0
+    naive_closed = 0
+    for prices in updates:
+        start = time.perf_counter()
+        marks.update(prices)
+        hits = set(_naive_mark(positions, marks))
+        positions = [position for i, position in enumerate(positions) if i not in hits]
+        naive_ms += (time.perf_counter() - start) * 1000
+        naive_closed += len(hits)
+
+    assert closed == naive_closed > 0 and account.position_count == len(positions)
+    print(f"  {2 * n_symbols} 个持仓 × {ticks} 次价格更新：向量化 {vectorized_ms / ticks:.3f}ms/次，"
+          f"逐个循环 {naive_ms / ticks:.3f}ms/次（触发平仓 {closed} 个）")
+
+
+def test_stream_listener():
+    """行情推送的标记价格经回调实时盯市，两次分析之间触发止损"""
+    account = PaperAccount(1000.0, clock=FakeClock())
+    _open(account, stop_loss=99000)
+    stream = MarketStream('BTC/USDT', {'3m': 40})
+    stream.price_listeners.append(lambda symbol, price: account.mark({symbol.replace('/', ''): price}))
+
+    for price in (99800.0, 98700.0):
+        stream._handle_message({'data': {'e': 'markPriceUpdate', 's': 'BTCUSDT', 'p': str(price), 'r': '0.0001'}})
+    trade = account.trade_history[0]
+    assert account.position_count == 0 and trade['reason'] == 'stop_loss' and trade['exit_price'] == 99000
+
+
+def test_concurrent_snapshot(rounds: int = 300):
+    """推送线程反复开仓 / 触发止损时，snapshot() 返回的账户信息和持仓列表始终来自同一时刻"""
+    clock = FakeClock()
+    account = PaperAccount(1e6, clock=clock)
+    done = threading.Event()
+
+    def stream_thread():
+        for _ in range(rounds):
+            _open(account, stop_loss=99500)
+            _open(account, 'open_short', stop_loss=100500)
+            clock.sleep(60)
+            # 开仓之后开始的 K 线：最高 / 最低价同时触发两个方向的止损
+            account.mark_candles('BTCUSDT', [[clock.now * 1000, 100000, 101000, 99000, 100000, 1]])
+        done.set()
+
+    worker = threading.Thread(target=stream_thread)
+    worker.start()
+    checks = 0
+    while not done.is_set() or checks == 0:
+        info, positions = account.snapshot()
+        assert info['position_count'] == len(positions)
+        assert abs(info['margin_used'] - sum(position['margin_used'] for position in positions)) < 1e-6
+        checks += 1
+    worker.join()
+    assert account.position_count == 0 and len(account.trade_history) == 2 * rounds
+
+
+class StubLLM(BaseHTTPRequestHandler):
+    """首次看到 BTC 价格时开多单（止损 -1%，止盈 +2%），之后观望"""
+
+    protocol_version = 'HTTP/1.1'
+    calls = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        prompt = body['messages'][-1]['content']
+        price = float(re.search(r"BTC: \$([\d,.]+)", prompt).group(1).replace(',', ''))
+        StubLLM.calls.append(price)
+        if len(StubLLM.calls) == 1:
+            decision = {'symbol': 'BTCUSDT', 'action': 'open_long', 'leverage': 5, 'position_size_usd': 2000,
+                        'stop_loss': round(price * 0.99, 2), 'take_profit': round(price * 1.02, 2),
+                        'confidence': 80, 'reasoning': '测试开仓'}
+        else:
+            decision = {'symbol': 'BTCUSDT', 'action': 'wait', 'reasoning': '观望'}
+        content = f"测试分析\n\n{json.dumps([decision], ensure_ascii=False)}"
+        payload = json.dumps({'choices': [{'message': {'content': content}}]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ShiftedExchange(MockExchange):
+    """价格整体平移的模拟交易所"""
+
+    def __init__(self):
+        super().__init__(latency=0.0)
+        self.offset = 0.0
+
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=100):
+        return [[ts, o + self.offset, h + self.offset, l + self.offset, c + self.offset, v]
+                for ts, o, h, l, c, v in super().fetch_ohlcv(symbol, timeframe, since, limit)]
+
+
+def test_monitor_integration():
+    """监控器在模拟账户中执行 AI 决策；下一周期价格下跌时按止损价自动平仓，平仓记入日志和夏普比率的交易记录"""
+    from btc_trading_monitor import BTCTradingMonitor
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubLLM)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    StubLLM.calls = []
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        config = {
+            'deepseek_api_key': 'test',
+            'deepseek_base_url': f"http://127.0.0.1:{server.server_address[1]}/v1",
+            'deepseek_stream': False,
+            'response_cache': False,
+            'chart_renderer': 'api',
+            'ohlcv_store_path': None,
+            'initial_balance': 1000.0
+        }
+        config_path = os.path.join(tmp, 'config.json')
+        with open(config_path, 'w') as f:
+            json.dump(config, f)
+
+        os.chdir(tmp)
+        try:
+            monitor = BTCTradingMonitor(config_path)
+            exchange = ShiftedExchange()
+            monitor.market_data.exchange = exchange
+
+            first = monitor.run_analysis()
+            entry = StubLLM.calls[0]
+            exchange.offset = -entry * 0.05
+            second = monitor.run_analysis()
+            monitor._background.shutdown(wait=True)
+            monitor.log_sink.close()
+            if monitor.log_index is not None:
+                monitor.log_index.close()
+        finally:
+            os.chdir(cwd)
+            server.shutdown()
+
+    assert first['success'] and first['executions'][0]['status'] == 'opened'
+    assert first['account']['position_count'] == 1 and abs(first['positions'][0]['entry_price'] - entry) < 0.01
+
+    # 第二个周期构建 prompt 之前已按止损平仓，AI 看到的是空仓
+    assert second['success'] and second['positions'] == [] and second['account']['position_count'] == 0
+    closed = second['closed_trades']
+    assert len(closed) == 1 and closed[0]['reason'] == 'stop_loss'
+    assert closed[0]['exit_price'] == round(entry * 0.99, 2)
+    assert monitor.trade_history[0]['pnl_pct'] == closed[0]['pnl_pct'] < 0
+    assert abs(second['account']['total_equity'] - (1000 - 2000 * 0.0004 + closed[0]['pnl'])) < 1e-6
+    print(f"  入场 ${entry:,.2f} → 止损 ${closed[0]['exit_price']:,.2f}，盈亏 ${closed[0]['pnl']:+,.2f}")
+
+
+if __name__ == '__main__':
+    print("\n" + "=" * 60)
+    print("🧪 模拟交易账户测试")
+    print("=" * 60 + "\n")
+
+    test_open_rules()
+    print("✓ 开仓校验\n")
+
+    test_exit_triggers()
+    print("✓ 止损 / 止盈 / 强平\n")
+
+    test_candle_guard()
+    print("✓ K 线只作用于之前开的仓\n")
+
+    test_manual_close_and_marks()
+    print("✓ 手动平仓与盯市\n")
+
+    test_mark_throughput()
+    print("✓ 向量化盯市\n")
+
+    test_stream_listener()
+    print("✓ 推送价格实时盯市\n")
+
+    test_concurrent_snapshot()
+    print("✓ 并发读取账户快照\n")
+
+    test_monitor_integration()
+    print("✓ 监控器集成\n")
+
+    print("=" * 60)
+    print("✅ 测试完成")
+    print("=" * 60 + "\n")
@@ -0,0 +1,132 @@
+"""
+分析流水线测试
+本地模拟 DeepSeek、Chart API 和 Telegram Bot API（固定延迟），
+验证图表与 AI 调用并行、Telegram 文本和图片经发送队列按顺序后台发送、日志后台写入，以及各阶段耗时统计
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from btc_monitor import BTCMonitor
+from test_helpers import MockExchange
+
+LLM_DELAY = 0.4
+CHART_DELAY = 0.3
+TEXT_DELAY = 0.05
+PHOTO_DELAY = 0.2
+
+
+SENT = []
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """/v1/chat/completions 返回分析结果，/chart 返回 PNG 字节，/bot<token>/send* 模拟 Telegram"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        if self.path.endswith('/chat/completions'):
+            time.sleep(LLM_DELAY)
+            content = '震荡 {"market_state": "震荡", "confidence": 60, "summary": "观望"}'
+            payload = json.dumps({'choices': [{'message': {'content': content}}]}).encode()
+        elif self.path.startswith('/bot'):
+            kind = 'photo' if self.path.endswith('/sendPhoto') else 'text'
+            time.sleep(PHOTO_DELAY if kind == 'photo' else TEXT_DELAY)
+            SENT.append(kind)
+            payload = b'{"ok": true}'
+        else:
+            time.sleep(CHART_DELAY)
+            payload = b'\x89PNG fake chart'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_overlapped_stages():
+    """关键路径 ≈ 行情 + AI + 文本推送；图表与 AI 并行，图片上传和日志写入在后台完成"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        config = {
+            'deepseek_api_key': 'test',
+            'deepseek_base_url': f"{base}/v1",
+            'deepseek_stream': False,
+            'response_cache': False,
+            'telegram_bot_token': 'token',
+            'telegram_chat_id': 'chat',
+            'telegram_api_base': base,
+            'chart_renderer': 'api',
+            'chart_api_key': 'key',
+            'chart_api_url': f"{base}/chart",
+            'ohlcv_store_path': None
+        }
+        config_path = os.path.join(tmp, 'config.json')
+        with open(config_path, 'w') as f:
+            json.dump(config, f)
+
+        os.chdir(tmp)
+        try:
+            monitor = BTCMonitor(config_path)
+            monitor.market_data.exchange = MockExchange(latency=0.0)
+            SENT.clear()
+
+            start = time.perf_counter()
+            result = monitor.run_analysis()
+            returned = time.perf_counter() - start
+            monitor._background.shutdown(wait=True)
+            finished = time.perf_counter() - start
+            monitor.log_sink.close()
+
+            log_name = next(name for name in os.listdir('analysis_logs') if name.endswith('.jsonl'))
+            with open(os.path.join('analysis_logs', log_name), encoding='utf-8') as f:
+                record = json.loads(f.readline())
+            indexed = monitor.log_index.query(columns=['ts', 'market_state'])
+            monitor.log_index.close()
+        finally:
+            os.chdir(cwd)
+            server.shutdown()
+
+    assert result['success'] and SENT == ['text', 'photo']
+    assert record['chart_path'].startswith('btc_chart_')
+    assert record['telegram_sent'] is True and record['telegram_photo_sent'] is True
+    assert indexed == [{'ts': record['timestamp'], 'market_state': '震荡'}]
+
+    stages = record['stage_timings']['stages']
+    critical = record['stage_timings']['critical_path_ms']
+    # 日志阶段的耗时在写入日志之后才结束，不在日志记录中
+    assert set(stages) == {'fetch', 'prompt', 'llm', 'parse', 'chart', 'telegram_text', 'telegram_photo'}
+    # 图表请求与 AI 调用同时开始
+    assert stages['chart']['start_ms'] < stages['llm']['start_ms'] + 50
+    # 关键路径不包含图表和 Telegram 发送
+    sequential = sum(stage['ms'] for stage in stages.values())
+    assert stages['telegram_text']['start_ms'] + stages['telegram_text']['ms'] > critical
+    assert critical < (LLM_DELAY + CHART_DELAY) * 1000
+    assert returned * 1000 < critical + 50 < finished * 1000
+    print(f"  顺序执行约 {sequential:.0f}ms → 关键路径 {critical:.0f}ms（后台任务全部完成 {finished * 1000:.0f}ms）")
+
+
+if __name__ == '__main__':
+    print("\n" + "=" * 60)
+    print("🧪 分析流水线测试")
+    print("=" * 60 + "\n")
+
+    test_overlapped_stages()
+    print("✓ 阶段并行与后台任务\n")
+
+    print("=" * 60)
+    print("✅ 测试完成")
+    print("=" * 60 + "\n")
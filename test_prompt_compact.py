@@ -0,0 +1,192 @@
+"""
+紧凑 prompt 编码测试
+以 MarketData 流水线生成的 BTC 量级行情快照（4 个时间框架，不同的波动和趋势）为输入，
+对比经典格式与紧凑格式的 token 数，验证紧凑编码可还原出原始数值、按 token 预算从低价值段落开始裁剪，
+以及状态行仍能被响应缓存归一化
+"""
+
+import copy
+import time
+from datetime import datetime
+
+import numpy as np
+
+import prompts
+from deepseek_client import estimate_tokens
+from market_data import MarketData
+from prompt_compact import (PromptSection, decimals_for, decode_percent_series, encode_percent_series,
+                            fit_token_budget, macd_decimals, render_sections)
+from response_cache import ResponseCache, normalize_prompt
+from test_helpers import MockExchange, TIMEFRAME_MS
+
+# 各时间框架单根K线的对数收益率标准差（接近 BTC 的实际波动）
+VOLATILITY = {'3m': 0.0012, '15m': 0.0025, '1h': 0.005, '4h': 0.01}
+
+NOW = datetime(2025, 10, 17, 12, 0, 0)
+
+
+class BTCExchange(MockExchange):
+    """BTC 量级的模拟行情：价格约 110000，随机游走带漂移，成交量随机"""
+
+    def __init__(self, seed: int):
+        super().__init__(latency=0.0)
+        self.seed = seed
+
+    def fetch_ohlcv(self, symbol, timeframe, since=None, limit=100):
+        self._request()
+        rng = np.random.default_rng([self.seed, list(TIMEFRAME_MS).index(timeframe)])
+        sigma = VOLATILITY[timeframe]
+        drift = rng.normal(0, sigma / 3)
+        closes = 110000 * np.exp(np.cumsum(rng.normal(drift, sigma, limit)))
+        spread = closes * sigma * rng.uniform(0.3, 1.0, limit)
+        volumes = rng.lognormal(7, 0.5, limit)
+        step = TIMEFRAME_MS[timeframe]
+        last = int(time.time() * 1000) // step * step
+        return [[last - (limit - 1 - i) * step, c, c + s, c - s, c, v]
+                for i, (c, s, v) in enumerate(zip(closes, spread, volumes))]
+
+
+def _snapshots(count: int = 8):
+    snapshots = []
+    for seed in range(count):
+        market_data = MarketData(concurrent=False)
+        market_data.exchange = BTCExchange(seed)
+        snapshots.append(market_data.get_btc_complete_data())
+    return snapshots
+
+
+def _rows(prompt, header_prefix):
+    """prompt 中以 header_prefix 为表头的 CSV 表的各行（已按逗号拆分）"""
+    lines = prompt.splitlines()
+    start = next(i for i, line in enumerate(lines) if line.startswith(header_prefix))
+    rows = []
+    for line in lines[start + 1:]:
+        if ',' not in line:
+            break
+        rows.append(line.split(','))
+    return rows
+
+
+def test_token_report():
+    """经典格式与紧凑格式的 token 数对比（同一组快照）"""
+    print(f"  {'快照':<6}{'经典':>8}{'紧凑':>8}{'节省':>8}")
+    classic_total = compact_total = 0
+    for i, data in enumerate(_snapshots()):
+        classic = estimate_tokens(prompts.build_user_prompt(data, 30, 7, now=NOW))
+        compact = estimate_tokens(prompts.build_user_prompt(data, 30, 7, now=NOW, compact=True))
+        classic_total += classic
+        compact_total += compact
+        print(f"  #{i:<5}{classic:>8}{compact:>8}{(1 - compact / classic) * 100:>7.0f}%")
+        assert compact < classic * 0.6
+    print(f"  {'平均':<6}{classic_total / 8:>8.0f}{compact_total / 8:>8.0f}"
+          f"{(1 - compact_total / classic_total) * 100:>7.0f}%")
+
+
+def test_values_round_trip():
+    """从紧凑 prompt 还原的指标和序列与原始数据一致（误差不超过编码精度）"""
+    for data in _snapshots(4):
+        prompt = prompts.build_user_prompt(data, compact=True, now=NOW)
+        indicators = {cells[0]: cells[1:] for cells in _rows(prompt, 'tf,price')}
+        series = {}
+        for cells in _rows(prompt, 'tf,series'):
+            series.setdefault(cells[0], {})[cells[1]] = cells[2:]
+        for tf in ('3m', '15m', '1h', '4h'):
+            tf_data = data[f'timeframe_{tf}']
+            current = tf_data['current']
+            price, ema20, ema50, macd, rsi7, rsi14, atr14 = map(float, indicators[tf][:7])
+            assert abs(price - current['price']) <= 0.5
+            assert abs(ema20 - current['ema20']) <= 0.5 and abs(ema50 - current['ema50']) <= 0.5
+            assert abs(rsi7 - current['rsi7']) <= 0.05 and abs(rsi14 - current['rsi14']) <= 0.05
+            macd_unit = 10 ** -macd_decimals(tf_data)
+            assert abs(macd - current['macd']) <= macd_unit / 2 + 1e-9
+            assert abs(atr14 - current['atr14']) <= 10 ** -decimals_for(current['atr14'], 3) / 2 + 1e-9
+
+            # 价格序列：逐根涨跌相对解码后的上一个值，误差不随序列累积
+            closes = decode_percent_series(series[tf]['close'])
+            expected = tf_data['prices'][-10:]
+            assert len(closes) == 10
+            for decoded, actual in zip(closes, expected):
+                assert abs(decoded - actual) <= actual * 0.00005 + 0.5
+
+            hist = [float(cell) for cell in series[tf]['macd_hist']]
+            assert np.allclose(hist, tf_data['macd_hist'][-10:], rtol=0, atol=macd_unit / 2 + 1e-9)
+            assert np.allclose([float(cell) for cell in series[tf]['rsi14']], tf_data['rsi14'][-10:], atol=0.5)
+
+    # 编码误差不累积：长序列、小步长
+    values = list(100.0 * np.exp(np.cumsum(np.full(500, 0.00003))))
+    decoded = decode_percent_series(encode_percent_series(values, 2))
+    assert max(abs(a - b) for a, b in zip(decoded, values)) <= 100.0 * 0.00005 + 0.005
+
+
+def test_token_budget():
+    """超出预算时按优先级从低到高裁剪，表格行全部去掉后表头一并去掉；必须保留的内容不裁剪"""
+    data = _snapshots(1)[0]
+    full, stats = prompts.build_compact_user_prompt(data, now=NOW)
+    assert stats['trimmed'] == [] and stats['tokens'] == estimate_tokens(full)
+
+    previous = full
+    for budget in range(stats['tokens'] - 20, 0, -40):
+        prompt, stats = prompts.build_compact_user_prompt(data, now=NOW, token_budget=budget)
+        # 结果是上一次（更宽松预算）的子集
+        assert set(prompt.splitlines()) <= set(previous.splitlines())
+        if stats['tokens'] > budget:
+            break
+        previous = prompt
+
+    # 最先裁剪 RSI 序列（3m 最先），其次 MACD 柱，最后价格序列和资金面
+    assert stats['trimmed'][:4] == ['3m rsi14', '15m rsi14', '1h rsi14', '4h rsi14']
+    assert stats['trimmed'][4:8] == ['3m macd_hist', '15m macd_hist', '1h macd_hist', '4h macd_hist']
+    assert stats['trimmed'][-1] == '资金面'
+    # 预算无法满足：只剩必须保留的内容，序列表头随之去掉，指标表保留
+    assert 'tf,series' not in prompt and 'tf,price' in prompt and '**周期**: #0' in prompt
+    print(f"  全部序列: {estimate_tokens(full)} tokens，裁剪到只剩指标表: {stats['tokens']} tokens")
+
+    sections = [PromptSection('a'), PromptSection('header', table='t', header=True),
+                PromptSection('row1', 1.0, 'r1', table='t'), PromptSection('row2', 2.0, 'r2', table='t')]
+    assert render_sections(sections) == 'a\nheader\nrow1\nrow2'
+    assert fit_token_budget(sections, 100, estimate=len) == ('a\nheader\nrow1\nrow2', [])
+    assert fit_token_budget(sections, 13, estimate=len) == ('a\nheader\nrow2', ['r1'])
+    assert fit_token_budget(sections, 1, estimate=len) == ('a', ['r1', 'r2'])
+
+
+def test_cache_normalization():
+    """紧凑模式保留状态行格式：时间、周期、运行时长不同的 prompt 归一化后相同；CSV 单元格逐个归一化"""
+    data = _snapshots(1)[0]
+    first = prompts.build_user_prompt(data, 5, 1, now=NOW, compact=True)
+    second = prompts.build_user_prompt(data, 65, 13, now=datetime(2025, 10, 17, 13, 0, 0), compact=True)
+    assert first != second
+    assert normalize_prompt(first) == normalize_prompt(second)
+
+    # 表格中任一单元格变化（序列中的一个 RSI、指标表中的 MACD）都得到不同的缓存键
+    cache = ResponseCache()
+    key = cache.make_key('system', first)
+    rsi_changed = copy.deepcopy(data)
+    rsi_changed['timeframe_1h']['rsi14'][-3] = 99.0 if data['timeframe_1h']['rsi14'][-3] < 90 else 10.0
+    macd_changed = copy.deepcopy(data)
+    macd_changed['timeframe_15m']['current']['macd'] += 10 * data['timeframe_15m']['current']['atr14']
+    for changed in (rsi_changed, macd_changed):
+        prompt = prompts.build_user_prompt(changed, 5, 1, now=NOW, compact=True)
+        assert prompt != first
+        assert cache.make_key('system', prompt) != key
+
+
+if __name__ == '__main__':
+    print("\n" + "=" * 60)
+    print("🧪 紧凑 prompt 编码测试")
+    print("=" * 60 + "\n")
+
+    test_token_report()
+    print("✓ token 对比\n")
+
+    test_values_round_trip()
+    print("✓ 数值还原\n")
+
+    test_token_budget()
+    print("✓ token 预算裁剪\n")
+
+    test_cache_normalization()
+    print("✓ 响应缓存归一化\n")
+
+    print("=" * 60)
+    print("✅ 测试完成")
+    print("=" * 60 + "\n")
@@ -0,0 +1,171 @@
+"""
+前缀缓存友好的 Prompt 布局测试
+模拟相邻两个分析周期（只有最新 K 线和时间变化），比较经典布局与缓存友好布局的公共前缀，
+并用本地模拟服务（按 64 token 为单位模拟 DeepSeek 前缀缓存）验证 usage 解析与累计命中率
+"""
+
+import copy
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import prompts_trading
+from deepseek_client import DeepSeekClient, estimate_tokens
+from http_transport import HTTPTransport
+from test_helpers import mock_market_data
+
+
+ACCOUNT = {'total_equity': 1000.0, 'available_balance': 1000.0, 'total_pnl_pct': 0.0,
+           'margin_used_pct': 0.0, 'position_count': 0}
+
+
+def _next_cycle(data):
+    """下一个周期：各时间框架最新（未收盘）K 线的价格和指标变化，已收盘 K 线不变"""
+    data = copy.deepcopy(data)
+    data['current_price'] *= 1.001
+    data['current_rsi7'] += 1.5
+    data['current_macd'] += 0.01
+    for tf in ('3m', '15m', '1h', '4h'):
+        tf_data = data[f'timeframe_{tf}']
+        for field in ('prices', 'macd_hist', 'rsi14', 'bb_upper', 'bb_lower'):
+            tf_data[field][-1] *= 1.001
+        for field in ('price', 'ema20', 'macd', 'rsi7', 'rsi14', 'atr14'):
+            tf_data['current'][field] *= 1.001
+    return data
+
+
+def _prompts(data, call_count, cache_friendly):
+    system_prompt = prompts_trading.build_system_prompt(
+        account_equity=ACCOUNT['total_equity'] * (1 + call_count / 100), cache_friendly=cache_friendly)
+    account = dict(ACCOUNT, total_equity=ACCOUNT['total_equity'] * (1 + call_count / 100))
+    user_prompt = prompts_trading.build_user_prompt(data, call_count * 3, call_count, account_info=account,
+                                                    sharpe_ratio=0.1 * call_count, cache_friendly=cache_friendly)
+    return system_prompt, user_prompt
+
+
+def _shared_prefix_tokens(a: str, b: str) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return estimate_tokens(a[:n]) if n else 0
+
+
+class PrefixCacheHandler(BaseHTTPRequestHandler):
+    """模拟 DeepSeek：与上一次请求相同的前缀（按 64 token 取整）计为缓存命中，响应中返回 usage"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        text = ''.join(message['content'] for message in request['messages'])
+        prompt_tokens = estimate_tokens(text)
+        hit = _shared_prefix_tokens(self.server.previous, text) // 64 * 64 if self.server.previous else 0
+        self.server.previous = text
+        usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': 12,
+                 'prompt_cache_hit_tokens': hit, 'prompt_cache_miss_tokens': prompt_tokens - hit}
+
+        content = '观望 [{"symbol": "BTCUSDT", "action": "wait"}]'
+        if request.get('stream'):
+            assert request['stream_options'] == {'include_usage': True}
+            events = [{'choices': [{'delta': {'content': content}}]}, {'choices': [], 'usage': usage}]
+            payload = ''.join(f"data: {json.dumps(e, ensure_ascii=False)}\n\n" for e in events) + "data: [DONE]\n\n"
+            self._reply(payload.encode('utf-8'), 'text/event-stream')
+        else:
+            body = {'choices': [{'message': {'content': content}}], 'usage': usage}
+            self._reply(json.dumps(body, ensure_ascii=False).encode('utf-8'), 'application/json')
+
+    def _reply(self, payload: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_classic_layout_unchanged():
+    """默认仍为经典布局：时间行在最前，system prompt 中包含按净值换算的仓位金额"""
+    data = mock_market_data()
+    user_prompt = prompts_trading.build_user_prompt(data, 5, 2)
+    assert user_prompt.startswith('时间: ') and '| 周期: #2 | 运行: 5分钟' in user_prompt.splitlines()[0]
+    assert '山寨800-1500 U' in prompts_trading.build_system_prompt(1000.0)
+
+    friendly = prompts_trading.build_user_prompt(data, 5, 2, cache_friendly=True)
+    assert friendly.rstrip().splitlines()[-2].startswith('时间: ')
+    assert prompts_trading.build_system_prompt(1000.0, cache_friendly=True) == \
+        prompts_trading.build_system_prompt(2500.0, cache_friendly=True)
+
+
+def test_shared_prefix():
+    """相邻周期的公共前缀：缓存友好布局远大于经典布局"""
+    first = mock_market_data()
+    second = _next_cycle(first)
+
+    ratios = {}
+    for cache_friendly in (False, True):
+        a = ''.join(_prompts(first, 1, cache_friendly))
+        b = ''.join(_prompts(second, 2, cache_friendly))
+        shared = _shared_prefix_tokens(a, b)
+        ratios[cache_friendly] = shared / estimate_tokens(b)
+        print(f"  {'缓存友好' if cache_friendly else '经典'}布局: 公共前缀 {shared}/{estimate_tokens(b)} tokens "
+              f"({ratios[cache_friendly]:.0%})")
+
+    assert ratios[True] > 0.7
+    assert ratios[True] > ratios[False] + 0.5
+
+
+def test_usage_accounting():
+    """DeepSeekClient 解析 usage（非流式取响应体，流式取最后一个事件）并累计命中率"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PrefixCacheHandler)
+    server.daemon_threads = True
+    server.previous = None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = DeepSeekClient(api_key='test', base_url=f"http://127.0.0.1:{server.server_address[1]}/v1",
+                            transport=HTTPTransport())
+
+    first = mock_market_data()
+    second = _next_cycle(first)
+    try:
+        client.call_with_messages(*_prompts(first, 1, True))
+        assert client.last_call_stats['usage']['cache_hit_tokens'] == 0
+
+        detected = []
+        client.call_with_messages(*_prompts(second, 2, True), stream=True,
+                                  on_json=detected.append, json_opening='[')
+    finally:
+        server.shutdown()
+
+    usage = client.last_call_stats['usage']
+    assert detected == [[{'symbol': 'BTCUSDT', 'action': 'wait'}]]
+    assert usage['cache_hit_tokens'] > 0.7 * usage['prompt_tokens']
+    assert usage['cache_hit_tokens'] + usage['cache_miss_tokens'] == usage['prompt_tokens']
+
+    total = client.usage.snapshot()
+    assert total['calls'] == 2 and total['completion_tokens'] == 24
+    assert 0.3 < total['hit_ratio'] < 0.5
+    print(f"  第二周期命中 {usage['cache_hit_tokens']}/{usage['prompt_tokens']} tokens | "
+          f"累计命中率 {total['hit_ratio']:.0%}")
+
+
+if __name__ == '__main__':
+    print("\n" + "=" * 60)
+    print("🧪 前缀缓存友好的 Prompt 布局测试")
+    print("=" * 60 + "\n")
+
+    test_classic_layout_unchanged()
+    print("✓ 经典布局保持不变\n")
+
+    test_shared_prefix()
+    print("✓ 相邻周期公共前缀\n")
+
+    test_usage_accounting()
+    print("✓ usage 解析与命中率统计\n")
+
+    print("=" * 60)
+    print("✅ 测试完成")
+    print("=" * 60 + "\n")
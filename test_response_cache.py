@@ -0,0 +1,118 @@
+"""
+AI 响应缓存测试
+验证 prompt 归一化（时间 / 周期 / 价格分桶）、LRU + TTL 淘汰、磁盘存储，
+以及 DeepSeekClient 命中缓存时不再发送请求
+"""
+
+import copy
+import os
+import tempfile
+import time
+
+import prompts
+from deepseek_client import DeepSeekClient
+from http_transport import HTTPTransport
+from response_cache import ResponseCache, normalize_prompt
+from test_helpers import mock_market_data, start_stub_server
+
+
+def test_normalized_key():
+    """时间、周期、运行时长不同且价格小幅波动时键相同；价格明显变化时键不同"""
+    data = mock_market_data()
+    data['current_price'] = 110234.56
+    quiet = copy.deepcopy(data)
+    quiet['current_price'] = 110241.10
+    moved = copy.deepcopy(data)
+    moved['current_price'] = 111350.00
+
+    cache = ResponseCache()
+    key = cache.make_key('system', prompts.build_user_prompt(data, 10, 3))
+    assert cache.make_key('system', prompts.build_user_prompt(quiet, 15, 4)) == key
+    assert cache.make_key('system', prompts.build_user_prompt(moved, 15, 4)) != key
+    assert cache.make_key('other system', prompts.build_user_prompt(data, 10, 3)) != key
+
+    assert normalize_prompt('**时间**: 2025-01-02 03:04:05 | **周期**: #12 | **运行**: 55分钟') == \
+        normalize_prompt('**时间**: 2025-01-02 03:09:05 | **周期**: #13 | **运行**: 60分钟')
+
+
+def test_comma_separated_numbers():
+    """逗号分隔的数值列表逐个分桶，不会被当作千分位合并成一个数"""
+    assert normalize_prompt('rsi14,45,47,52,55') != normalize_prompt('rsi14,45,47,99,10')
+    assert normalize_prompt('45,47,52,55') != normalize_prompt('45,47,99,10')
+    assert normalize_prompt('3m,110090,110050,12.3') != normalize_prompt('3m,110090,110050,98.7')
+    assert normalize_prompt('atr14,vol%,210,141,59') != normalize_prompt('atr14,vol%,210,141,97')
+    assert normalize_prompt('45,47,52,55') == '45,47,52,55'
+    # 千分位写法仍按一个数分桶
+    assert normalize_prompt('$110,234.56 | 1,000 BTC') == normalize_prompt('$110,241.10 | 1,000 BTC') == '$1.102e+05 | 1000 BTC'
+
+
+def test_lru_ttl_and_disk():
+    """超出容量淘汰最久未使用的条目；过期条目不命中；磁盘存储在新实例中仍可命中"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'responses.sqlite3')
+
+        cache = ResponseCache(max_entries=2, ttl_seconds=60, db_path=db_path)
+        cache.put('a', 'A')
+        cache.put('b', 'B')
+        assert cache.get('a') == 'A'        # a 变为最近使用
+        cache.put('c', 'C')                 # 淘汰 b
+        assert 'b' not in cache._entries and cache.stats()['evictions'] == 1
+        assert cache.get('b') == 'B'        # 内存已淘汰，从磁盘命中
+        cache.close()
+
+        reopened = ResponseCache(db_path=db_path)
+        assert reopened.get('c') == 'C'
+        assert reopened.stats()['disk_hits'] == 1
+        reopened.close()
+
+    short = ResponseCache(ttl_seconds=0.05)
+    short.put('k', 'v')
+    time.sleep(0.1)
+    assert short.get('k') is None
+    assert short.stats()['misses'] == 1
+
+
+def test_client_cache_hit():
+    """DeepSeekClient 第二次相同（归一化后）的调用直接返回缓存，不再请求服务端"""
+    server = start_stub_server()
+    cache = ResponseCache()
+    client = DeepSeekClient(api_key='test', base_url=f"http://127.0.0.1:{server.server_address[1]}/v1",
+                            transport=HTTPTransport(), cache=cache)
+    detected = []
+
+    try:
+        first = client.call_with_messages('system', '**周期**: #1 | 价格 $110,234.56')
+        requests_after_first = client.transport.stats.snapshot()['requests']
+        second = client.call_with_messages('system', '**周期**: #2 | 价格 $110,236.10', stream=True,
+                                           on_json=detected.append)
+    finally:
+        server.shutdown()
+
+    assert second == first
+    assert client.transport.stats.snapshot()['requests'] == requests_after_first
+    assert client.last_call_stats['cached'] is True
+    assert detected == [{'summary': 'ok'}]
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+    print(f"  缓存命中耗时 {client.last_call_stats['total_ms']:.3f}ms")
+
+
+if __name__ == '__main__':
+    print("\n" + "=" * 60)
+    print("🧪 AI 响应缓存测试")
+    print("=" * 60 + "\n")
+
+    test_normalized_key()
+    print("✓ prompt 归一化\n")
+
+    test_comma_separated_numbers()
+    print("✓ 逗号分隔的数值列表\n")
+
+    test_lru_ttl_and_disk()
+    print("✓ LRU + TTL + 磁盘存储\n")
+
+    test_client_cache_hit()
+    print("✓ DeepSeekClient 命中缓存\n")
+
+    print("=" * 60)
+    print("✅ 测试完成")
+    print("=" * 60 + "\n")
@@ -0,0 +1,205 @@
+"""
+交易绩效增量统计测试
+与逐次全量计算（statistics / NumPy）对照验证夏普、索提诺、胜率、盈亏比、最大回撤，
+验证最近 N 笔 / 最近 T 小时窗口、状态保存后恢复继续统计的结果不变、作为模拟账户平仓回调，
+并比较每个周期的计算耗时
+"""
+
+import math
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from paper_trading import PaperAccount
+from running_stats import PerformanceStats, WindowStats, format_performance
+from test_helpers import FakeClock
+
+
+def _trades(count, seed=5):
+    rng = random.Random(seed)
+    trades = []
+    for _ in range(count):
+        pnl_pct = rng.gauss(0.5, 8.0)
+        trades.append((pnl_pct, pnl_pct * rng.uniform(1, 3)))
+    return trades
+
+
+def _expected(trades, initial_equity):
+    """全量计算（对照实现）"""
+    returns = np.array([ret for ret, _ in trades])
+    pnls = np.array([pnl for _, pnl in trades])
+    equity = initial_equity + np.cumsum(pnls)
+    peaks = np.maximum.accumulate(np.concatenate([[initial_equity], equity]))[1:]
+    std = statistics.stdev(returns) if len(returns) >= 2 else 0.0
+    downside = math.sqrt(np.sum(np.minimum(returns, 0) ** 2) / len(returns))
+    return {
+        'sharpe_ratio': statistics.mean(returns) / std if std else 0.0,
+        'sortino_ratio': returns.mean() / downside if downside else 0.0,
+        'win_rate': (pnls > 0).mean() * 100,
+        'profit_factor': pnls[pnls > 0].sum() / -pnls[pnls < 0].sum(),
+        'max_drawdown_pct': ((peaks - equity) / peaks).max() * 100
+    }
+
+
+def _assert_close(actual, expected):
+    for key, value in expected.items():
+        assert abs(actual[key] - value) < 1e-9 * max(1.0, abs(value)), (key, actual[key], value)
+
+
+def test_matches_full_recompute():
+    """累计统计在每笔交易后都与全量计算一致"""
+    trades = _trades(300)
+    stats = PerformanceStats(1000.0)
+    assert stats.snapshot()['sharpe_ratio'] == 0.0 and stats.snapshot()['profit_factor'] is None
+    for i, (ret, pnl) in enumerate(trades, 1):
+        stats.add(ret, pnl)
+        if i >= 2 and i % 25 == 0:
+            _assert_close(stats.snapshot(), _expected(trades[:i], 1000.0))
+    assert stats.snapshot()['trades'] == 300
+    print(f"  {format_performance(stats.snapshot())}")
+
+
+def test_windows():
+    """最近 N 笔窗口与最近 N 笔交易的全量计算一致；时间窗口按平仓时间移出过期交易"""
+    trades = _trades(200, seed=9)
+    clock = FakeClock()
+    stats = PerformanceStats(1000.0, windows={'last_30': {'max_trades': 30}, '6h': {'max_hours': 6}}, clock=clock)
+    closed_at = []
+    for i, (ret, pnl) in enumerate(trades):
+        clock.now += 600 + (i % 7) * 60
+        stats.add(ret, pnl, clock.now)
+        closed_at.append(clock.now)
+
+        snapshot = stats.snapshot()['windows']
+        window = trades[max(0, i - 29):i + 1]
+        if len(window) >= 2:
+            before = 1000.0 + sum(pnl for _, pnl in trades[:max(0, i - 29)])
+            _assert_close(snapshot['last_30'], _expected(window, before))
+
+        recent = [trade for trade, ts in zip(trades, closed_at) if ts >= clock.now - 6 * 3600]
+        assert snapshot['6h']['trades'] == len(recent)
+
+    # 没有新交易时，时间窗口随时钟推进清空
+    clock.now += 7 * 3600
+    assert stats.snapshot()['windows']['6h']['trades'] == 0
+    assert stats.snapshot()['windows']['last_30']['trades'] == 30
+
+    try:
+        WindowStats()
+        assert False, "窗口需要参数"
+    except ValueError:
+        pass
+
+
+def test_save_and_resume():
+    """保存状态后恢复，继续统计的结果与不中断时一致；新增的窗口从空开始"""
+    trades = _trades(120, seed=13)
+    windows = {'last_20': {'max_trades': 20}, '24h': {'max_hours': 24}}
+    clock = FakeClock()
+    continuous = PerformanceStats(1000.0, windows=windows, clock=clock)
+    for i, (ret, pnl) in enumerate(trades):
+        continuous.add(ret, pnl, clock.now + i * 900)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'state', 'performance.json')
+        first = PerformanceStats.load(path, 1000.0, windows=windows, clock=clock)
+        for i, (ret, pnl) in enumerate(trades[:70]):
+            first.add(ret, pnl, clock.now + i * 900)
+        first.save(path)
+
+        resumed = PerformanceStats.load(path, 1000.0, windows={**windows, 'last_5': {'max_trades': 5}}, clock=clock)
+        for i, (ret, pnl) in enumerate(trades[70:], 70):
+            resumed.add(ret, pnl, clock.now + i * 900)
+
+        with open(path, 'w') as f:
+            f.write('{broken')
+        assert PerformanceStats.load(path, 500.0).equity == 500.0
+
+    clock.now += len(trades) * 900
+    expected = continuous.snapshot()
+    actual = resumed.snapshot()
+    assert actual['windows'].pop('last_5')['trades'] == 5
+    assert actual['trades'] == expected['trades'] == len(trades)
+    for key in ('sharpe_ratio', 'sortino_ratio', 'win_rate', 'profit_factor', 'max_drawdown_pct'):
+        assert abs(actual[key] - expected[key]) < 1e-9
+        for name in windows:
+            assert abs(actual['windows'][name][key] - expected['windows'][name][key]) < 1e-9
+
+
+def test_paper_account_listener():
+    """作为模拟账户的平仓回调：每笔平仓立即计入统计"""
+    clock = FakeClock()
+    stats = PerformanceStats(1000.0, windows={'24h': {'max_hours': 24}}, clock=clock)
+    account = PaperAccount(1000.0, clock=clock, listeners=[stats.add_trades])
+    for exit_price in (101000.0, 99000.0, 102000.0):
+        account.apply_decisions([{'symbol': 'BTCUSDT', 'action': 'open_long', 'position_size_usd': 1000, 'leverage': 5}],
+                                {'BTCUSDT': 100000.0})
+        clock.now += 300
+        account.apply_decisions([{'symbol': 'BTCUSDT', 'action': 'close_long'}], {'BTCUSDT': exit_price})
+
+    snapshot = stats.snapshot()
+    returns = [trade['pnl_pct'] for trade in account.trade_history]
+    assert snapshot['trades'] == 3 and abs(snapshot['win_rate'] - 200 / 3) < 1e-9
+    assert abs(snapshot['sharpe_ratio'] - statistics.mean(returns) / statistics.stdev(returns)) < 1e-9
+    assert snapshot['windows']['24h']['trades'] == 3
+    assert abs(stats.equity - (1000 + sum(trade['pnl'] for trade in account.trade_history))) < 1e-9
+
+
+def test_cycle_cost(history: int = 20000):
+    """每个周期读取统计的耗时不随历史交易数增长（对照：每个周期遍历全部交易重新计算）"""
+    trades = _trades(history, seed=17)
+    stats = PerformanceStats(1000.0, windows={'last_20': {'max_trades': 20}})
+    trade_history = []
+
+    start = time.perf_counter()
+    for ret, pnl in trades:
+        stats.add(ret, pnl)
+    add_us = (time.perf_counter() - start) / history * 1e6
+
+    for ret, pnl in trades:
+        trade_history.append({'pnl_pct': ret, 'pnl': pnl})
+
+    start = time.perf_counter()
+    for _ in range(20):
+        snapshot = stats.snapshot()
+    incremental_ms = (time.perf_counter() - start) / 20 * 1000
+
+    start = time.perf_counter()
+    for _ in range(20):
+        returns = [trade['pnl_pct'] for trade in trade_history if 'pnl_pct' in trade]
+        full = statistics.mean(returns) / statistics.stdev(returns)
+    full_ms = (time.perf_counter() - start) / 20 * 1000
+
+    assert abs(snapshot['sharpe_ratio'] - full) < 1e-9
+    assert incremental_ms < full_ms
+    print(f"  {history} 笔历史交易：每笔平仓更新 {add_us:.1f}µs，每周期读取 {incremental_ms:.3f}ms "
+          f"（全量重算夏普 {full_ms:.1f}ms）")
+
+
+if __name__ == '__main__':
+    print("\n" + "=" * 60)
+    print("🧪 交易绩效增量统计测试")
+    print("=" * 60 + "\n")
+
+    test_matches_full_recompute()
+    print("✓ 与全量计算一致\n")
+
+    test_windows()
+    print("✓ 窗口统计\n")
+
+    test_save_and_resume()
+    print("✓ 保存与恢复\n")
+
+    test_paper_account_listener()
+    print("✓ 模拟账户平仓回调\n")
+
+    test_cycle_cost()
+    print("✓ 每周期耗时\n")
+
+    print("=" * 60)
+    print("✅ 测试完成")
+    print("=" * 60 + "\n")
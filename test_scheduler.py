@@ -0,0 +1,108 @@
+"""
+K 线收盘对齐调度器测试
+使用可控的模拟时钟（sleep 直接推进时间）验证：边界对齐、交易所时钟偏差校正、
+分析耗时不累积漂移、超时周期的 skip / coalesce 策略，以及延迟指标
+"""
+
+from metrics import MetricsRegistry
+from scheduler import CandleScheduler
+from test_helpers import FakeClock
+
+
+def _scheduler(clock, server_skew=0.0, **kwargs):
+    registry = MetricsRegistry()
+    scheduler = CandleScheduler(
+        clock=clock.time, sleep=clock.sleep, metrics=registry,
+        time_source=lambda: int((clock.now + server_skew) * 1000), **kwargs
+    )
+    return scheduler, registry
+
+
+def test_aligned_without_drift():
+    """每次唤醒都落在 3m 收盘后 300ms（交易所时间），分析耗时不影响下一次运行时间"""
+    start = 1_700_000_000.0 + 17.4         # 某根 3m K 线中间
+    clock = FakeClock(start)
+    scheduler, registry = _scheduler(clock, server_skew=-2.5, timeframe='3m', offset_ms=300)
+
+    runs = []
+    for analysis_seconds in (40, 12, 95, 3, 60):
+        tick = scheduler.wait_next()
+        exchange_now = clock.now - 2.5
+        runs.append(exchange_now)
+        assert tick['skipped'] == 0
+        assert abs(tick['lag_ms']) < 1
+        clock.now += analysis_seconds        # 模拟分析耗时
+
+    assert abs(scheduler.clock_offset + 2.5) < 1e-6
+    for t in runs:
+        assert abs(t % 180 - 0.3) < 1e-6
+    assert [round(b - a) for a, b in zip(runs, runs[1:])] == [180, 180, 180, 180]
+    assert registry.summary('scheduler.lag_ms')['count'] == 5
+
+
+def test_overrun_policies():
+    """分析耗时超过一个周期：skip 跳到下一个边界，coalesce 立即补跑一次，均不堆积"""
+    start = 1_700_000_000.0
+    for overrun, expected_skipped, expect_aligned in (('skip', 2, True), ('coalesce', 1, False)):
+        clock = FakeClock(start)
+        scheduler, registry = _scheduler(clock, timeframe='3m', offset_ms=300, overrun=overrun)
+        scheduler.wait_next()
+        clock.now += 400                     # 跨过两个 3m 边界
+
+        tick = scheduler.wait_next()
+        assert tick['skipped'] == expected_skipped
+        assert (abs(clock.now % 180 - 0.3) < 1e-6) == expect_aligned
+        assert registry.snapshot()['counters']['scheduler.skipped'] == expected_skipped
+
+        # 之后恢复对齐
+        scheduler.wait_next()
+        assert abs(clock.now % 180 - 0.3) < 1e-6
+
+
+def test_lag_and_resync():
+    """唤醒延迟计入 lag 指标；时钟同步失败时沿用上次偏差；超过 resync_seconds 后重新同步"""
+    clock = FakeClock(1_700_000_000.0, wake_delay=0.05)
+    skew = {'value': 1.0, 'fail': False}
+
+    def server_time():
+        if skew['fail']:
+            raise TimeoutError('fetch_time timeout')
+        return int((clock.now + skew['value']) * 1000)
+
+    registry = MetricsRegistry()
+    scheduler = CandleScheduler(timeframe='60s', offset_ms=200, time_source=server_time, resync_seconds=120,
+                                clock=clock.time, sleep=clock.sleep, metrics=registry)
+    tick = scheduler.wait_next()
+    assert 45 < tick['lag_ms'] < 55
+    assert abs(scheduler.clock_offset - 1.0) < 1e-3
+
+    skew['fail'] = True
+    for _ in range(3):
+        scheduler.wait_next()
+    assert abs(scheduler.clock_offset - 1.0) < 1e-3
+
+    skew.update(value=-0.5, fail=False)
+    for _ in range(3):
+        scheduler.wait_next()
+    assert abs(scheduler.clock_offset + 0.5) < 1e-3
+    lag = registry.summary('scheduler.lag_ms')
+    print(f"  唤醒延迟 p50 {lag['p50']:.1f}ms / p99 {lag['p99']:.1f}ms | 时钟偏差 {scheduler.clock_offset * 1000:+.0f}ms")
+
+
+if __name__ == '__main__':
+    print("\n" + "=" * 60)
+    print("🧪 K 线收盘对齐调度器测试")
+    print("=" * 60 + "\n")
+
+    test_aligned_without_drift()
+    print("✓ 边界对齐，无漂移\n")
+
+    test_overrun_policies()
+    print("✓ 超时周期 skip / coalesce\n")
+
+    test_lag_and_resync()
+    print("✓ 延迟指标与时钟同步\n")
+
+    print("=" * 60)
+    print("✅ 测试完成")
+    print("=" * 60 + "\n")
@@ -0,0 +1,259 @@
+"""
+Telegram 发送队列测试
+本地模拟 Bot API（可配置延迟、429 限流、HTML 解析失败），验证入队不阻塞、按顺序送达、
+超长消息安全拆分、令牌桶限速和 retry_after 重试
+"""
+
+import json
+import random
+import re
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from http_transport import HTTPTransport
+from metrics import MetricsRegistry
+from rate_limit import TokenBucket
+from telegram_outbox import TELEGRAM_MAX_LENGTH, TelegramOutbox, html_to_plain, split_html
+from test_helpers import FakeClock
+
+
+class StubBotAPI(BaseHTTPRequestHandler):
+    """记录收到的消息；server.rate_limit_first 个请求返回 429，包含 <bad> 的 HTML 消息返回 400"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        server = self.server
+        time.sleep(server.delay)
+
+        with server.lock:
+            server.requests += 1
+            limited = server.requests <= server.rate_limit_first
+
+        if limited:
+            status, payload = 429, {'ok': False, 'error_code': 429, 'description': 'Too Many Requests',
+                                    'parameters': {'retry_after': server.retry_after}}
+        elif self.path.endswith('/sendPhoto'):
+            server.received.append(('photo', len(body), time.perf_counter()))
+            status, payload = 200, {'ok': True}
+        else:
+            message = json.loads(body)
+            if message.get('parse_mode') == 'HTML' and '<bad>' in message['text']:
+                status, payload = 400, {'ok': False, 'description': "Bad Request: can't parse entities"}
+            else:
+                server.received.append((message['text'], message.get('parse_mode'), time.perf_counter()))
+                status, payload = 200, {'ok': True}
+
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _start_server(delay=0.0, rate_limit_first=0, retry_after=1):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubBotAPI)
+    server.daemon_threads = True
+    server.delay = delay
+    server.rate_limit_first = rate_limit_first
+    server.retry_after = retry_after
+    server.requests = 0
+    server.received = []
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def _outbox(base, **kwargs):
+    kwargs.setdefault('chat_rate', 1000)
+    kwargs.setdefault('chat_burst', 1000)
+    return TelegramOutbox('token', 'chat', http=HTTPTransport(), api_base=base,
+                          metrics=MetricsRegistry(), **kwargs)
+
+
+def _balanced(chunk):
+    stack = []
+    for tag in re.findall(r'<(/?)(\w+)[^>]*>', chunk):
+        if tag[0]:
+            if not stack or stack.pop() != tag[1]:
+                return False
+        else:
+            stack.append(tag[1])
+    return not stack
+
+
+def test_split_html(rounds: int = 200, seed: int = 3):
+    """拆分后每段不超长、标签配对、实体完整，去掉标签后的文本与原文一致"""
+    rng = random.Random(seed)
+    words = ['BTC', '价格', '突破', 'EMA20', '&lt;', '&amp;', '→', '支撑位', '96,500', '做多']
+    for _ in range(rounds):
+        limit = rng.choice([80, 200, 4096])
+        parts = []
+        for _ in range(rng.randint(1, 400)):
+            piece = ' '.join(rng.choice(words) for _ in range(rng.randint(1, 12)))
+            wrap = rng.choice(['', 'b', 'i', 'pre', 'code'])
+            parts.append(f"<{wrap}>{piece}</{wrap}>" if wrap else piece)
+            parts.append(rng.choice(['\n', '\n\n', ' ', '']))
+        # 一整段无空格的长文本也要能切开
+        parts.append('<pre>' + '无空格长文本' * rng.randint(0, 200) + '</pre>')
+        text = ''.join(parts)
+
+        chunks = split_html(text, limit)
+        assert all(len(chunk) <= limit for chunk in chunks)
+        assert all(_balanced(chunk) for chunk in chunks)
+        # 实体不会被切断
+        assert not any(re.search(r'&#?\w*$', re.sub(r'<[^>]*>', '', chunk)) for chunk in chunks)
+        assert ''.join(html_to_plain(chunk) for chunk in chunks).strip() == html_to_plain(text).strip()
+
+
+def test_order_and_non_blocking():
+    """入队立即返回，消息按入队顺序送达，图片排在之前的文本之后"""
+    server, base = _start_server(delay=0.05)
+    outbox = _outbox(base)
+    try:
+        with tempfile.NamedTemporaryFile(suffix='.png') as photo:
+            photo.write(b'\x89PNG' + b'0' * 1000)
+            photo.flush()
+
+            start = time.perf_counter()
+            futures = [outbox.send_message(f"<b>消息 {i}</b>") for i in range(5)]
+            futures.append(outbox.send_photo(photo.name))
+            futures.append(outbox.send_message("最后一条"))
+            enqueue_ms = (time.perf_counter() - start) * 1000
+
+            assert all(future.result(timeout=10) for future in futures)
+            delivered_ms = (time.perf_counter() - start) * 1000
+    finally:
+        outbox.close()
+        server.shutdown()
+
+    kinds = [text for text, _, _ in server.received]
+    assert kinds == [f"<b>消息 {i}</b>" for i in range(5)] + ['photo', '最后一条']
+    assert enqueue_ms < 20 < delivered_ms
+    print(f"  7 条入队 {enqueue_ms:.2f}ms，全部送达 {delivered_ms:.0f}ms")
+
+
+def test_long_message_split():
+    """超过 4096 字符的消息拆分为多条发送"""
+    server, base = _start_server()
+    outbox = _outbox(base)
+    text = "🤖 <b>BTC 交易决策报告</b>\n<pre>" + "\n".join(f"第 {i} 行分析：价格在 EMA20 上方" for i in range(600)) + "</pre>"
+    try:
+        assert outbox.send_message(text).result(timeout=10)
+    finally:
+        outbox.close()
+        server.shutdown()
+
+    texts = [text for text, _, _ in server.received]
+    assert len(texts) > 1 and all(len(part) <= TELEGRAM_MAX_LENGTH for part in texts)
+    assert all(part.startswith('<pre>') or part.startswith('🤖') for part in texts)
+    assert ''.join(html_to_plain(part) for part in texts) == html_to_plain(text)
+    print(f"  {len(text)} 字符 → {len(texts)} 条消息")
+
+
+def _record_sends(outbox, clock):
+    """记录每次请求发出时模拟时钟的时间"""
+    sent_at = []
+    post = outbox.http.post
+
+    def recording_post(*args, **kwargs):
+        sent_at.append(clock.now)
+        return post(*args, **kwargs)
+
+    outbox.http.post = recording_post
+    return sent_at
+
+
+def test_token_bucket():
+    """共享的令牌桶：注入时钟，delay_for 预留令牌并顺延等待时间，pause 在指定时间内不再发放令牌"""
+    clock = FakeClock(0.0)
+    bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+    assert [bucket.delay_for() for _ in range(4)] == [0.0, 0.0, 0.5, 1.0]
+    clock.sleep(1.0)
+    assert bucket.delay_for() == 0.5
+
+    clock.sleep(10)
+    bucket.pause(3)
+    assert bucket.delay_for() == 3.0
+
+
+def test_rate_limit_and_retry_after():
+    """单聊天令牌桶限速（按注入的时钟检查每次发送的间隔）；429 按 retry_after 等待后重发"""
+    server, base = _start_server()
+    clock = FakeClock(0.0)
+    outbox = _outbox(base, chat_rate=20, chat_burst=1, clock=clock, sleep=clock.sleep)
+    sent_at = _record_sends(outbox, clock)
+    try:
+        futures = [outbox.send_message(f"m{i}") for i in range(10)]
+        assert all(future.result(timeout=10) for future in futures)
+    finally:
+        outbox.close()
+        server.shutdown()
+    # 每秒 20 条、不允许突发：相邻两次发送至少间隔 1/20 秒
+    gaps = [b - a for a, b in zip(sent_at, sent_at[1:])]
+    assert len(sent_at) == 10 and min(gaps) >= 1 / 20 - 1e-9
+    elapsed = sent_at[-1] - sent_at[0]
+    assert [text for text, _, _ in server.received] == [f"m{i}" for i in range(10)]
+
+    server, base = _start_server(rate_limit_first=1, retry_after=1)
+    clock = FakeClock(0.0)
+    outbox = _outbox(base, clock=clock, sleep=clock.sleep)
+    sent_at = _record_sends(outbox, clock)
+    try:
+        assert outbox.send_message("限流后重发").result(timeout=10)
+        stats = outbox.metrics.snapshot()['counters']
+    finally:
+        outbox.close()
+        server.shutdown()
+    assert sent_at[1] - sent_at[0] >= 1.0
+    assert stats['telegram.rate_limited'] == 1 and stats['telegram.sent'] == 1
+    print(f"  限速 10 条用时 {elapsed:.2f}s（模拟时钟），429 retry_after=1 后 "
+          f"{sent_at[1] - sent_at[0]:.2f}s 重发")
+
+
+def test_html_fallback():
+    """HTML 解析失败时去掉标签以纯文本重发"""
+    server, base = _start_server()
+    outbox = _outbox(base)
+    try:
+        assert outbox.send_message("<b>价格</b> &lt; 支撑 <bad>").result(timeout=10)
+    finally:
+        outbox.close()
+        server.shutdown()
+    assert [(text, mode) for text, mode, _ in server.received] == [("价格 < 支撑 ", None)]
+
+
+if __name__ == '__main__':
+    print("\n" + "=" * 60)
+    print("🧪 Telegram 发送队列测试")
+    print("=" * 60 + "\n")
+
+    test_split_html()
+    print("✓ HTML 安全拆分\n")
+
+    test_order_and_non_blocking()
+    print("✓ 入队不阻塞、按顺序送达\n")
+
+    test_long_message_split()
+    print("✓ 超长消息拆分发送\n")
+
+    test_token_bucket()
+    print("✓ 令牌桶\n")
+
+    test_rate_limit_and_retry_after()
+    print("✓ 限速与 429 重试\n")
+
+    test_html_fallback()
+    print("✓ HTML 解析失败退回纯文本\n")
+
+    print("=" * 60)
+    print("✅ 测试完成")
+    print("=" * 60 + "\n")
@@ -0,0 +1,113 @@
+"""
+事件触发引擎测试
+在模拟行情上验证各触发条件（ATR 价格变动、RSI 区间、MACD 柱翻转、布林带突破、最长间隔），
+并用随机游走行情统计相对固定间隔调用能省去多少次 LLM 分析
+"""
+
+import copy
+
+import numpy as np
+
+from test_helpers import FakeClock, mock_market_data
+from triggers import TriggerEngine
+
+
+def _quiet(data):
+    """让各时间框架处于中性状态：RSI 50，MACD 柱为正，价格在布林带内"""
+    data = copy.deepcopy(data)
+    for tf in ('3m', '15m', '1h', '4h'):
+        tf_data = data[f'timeframe_{tf}']
+        price = data['current_price']
+        tf_data['current'].update(price=price, rsi14=50.0, atr14=100.0)
+        tf_data['macd_hist'][-1] = 1.0
+        tf_data['bb_upper'][-1] = price + 500
+        tf_data['bb_lower'][-1] = price - 500
+    return data
+
+
+def _engine(clock):
+    return TriggerEngine(atr_multiple=1.5, max_staleness_minutes=60, clock=clock)
+
+
+def test_conditions():
+    """每个条件单独触发；无变化时不触发"""
+    clock = FakeClock()
+    base = _quiet(mock_market_data())
+    base['current_price'] = 100000.0
+    base = _quiet(base)
+
+    engine = _engine(clock)
+    assert engine.evaluate(base) == ["首次分析"]
+    engine.mark_analyzed(base)
+
+    clock.now += 300
+    assert engine.evaluate(base) == []
+
+    moved = copy.deepcopy(base)
+    moved['current_price'] += 160       # 1.6 × ATR(15m)
+    assert engine.evaluate(moved) == ["价格上涨 160.00（1.6×ATR15m）"]
+
+    rsi = copy.deepcopy(base)
+    rsi['timeframe_1h']['current']['rsi14'] = 72.0
+    assert engine.evaluate(rsi) == ["1h RSI 中性 → 超买 (72.0)"]
+
+    macd = copy.deepcopy(base)
+    macd['timeframe_15m']['macd_hist'][-1] = -0.5
+    assert engine.evaluate(macd) == ["15m MACD柱翻绿"]
+
+    breakout = copy.deepcopy(base)
+    breakout['timeframe_1h']['current']['price'] = base['current_price'] - 600
+    assert engine.evaluate(breakout) == ["1h 突破布林带下轨"]
+
+    # 3m 不在评估范围内
+    ignored = copy.deepcopy(base)
+    ignored['timeframe_3m']['macd_hist'][-1] = -5.0
+    assert engine.evaluate(ignored) == []
+
+    clock.now += 3600
+    assert engine.evaluate(base) == ["距上次分析 65 分钟"]
+
+    engine.mark_analyzed(base)
+    assert engine.evaluate(base) == []
+    assert engine.stats()['evaluations'] == 9 and engine.stats()['fired'] == 6
+
+
+def test_call_reduction(polls: int = 288, seed: int = 7):
+    """随机游走行情（24 小时，每 5 分钟评估一次）：触发模式的 LLM 调用次数远少于固定间隔"""
+    rng = np.random.default_rng(seed)
+    clock = FakeClock()
+    engine = _engine(clock)
+    base = _quiet(mock_market_data())
+
+    price = 100000.0
+    calls = 0
+    for _ in range(polls):
+        price += rng.normal(0, 40)
+        data = copy.deepcopy(base)
+        data['current_price'] = price
+        data = _quiet(data)
+        data['timeframe_1h']['current']['rsi14'] = 50 + rng.normal(0, 8)
+        if engine.evaluate(data):
+            calls += 1
+            engine.mark_analyzed(data)
+        clock.now += 300
+
+    assert calls < polls / 3
+    assert calls >= 24   # 最长间隔兜底：每小时至少一次
+    print(f"  {polls} 轮评估 → {calls} 次 LLM 调用（固定间隔 {polls} 次，减少 {polls / calls:.1f} 倍）")
+
+
+if __name__ == '__main__':
+    print("\n" + "=" * 60)
+    print("🧪 事件触发引擎测试")
+    print("=" * 60 + "\n")
+
+    test_conditions()
+    print("✓ 各触发条件\n")
+
+    test_call_reduction()
+    print("✓ LLM 调用次数\n")
+
+    print("=" * 60)
+    print("✅ 测试完成")
+    print("=" * 60 + "\n")
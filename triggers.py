@@ -0,0 +1,164 @@
+"""
+事件触发引擎
+在两次 LLM 分析之间用本地行情数据评估廉价的触发条件，只有条件触发（或距上次分析超过最长间隔）时
+才调用 DeepSeek 并推送 Telegram，大部分没有变化的周期直接跳过
+
+触发条件均相对于上次分析时的行情状态：
+- 价格变动超过 N × ATR(14)
+- RSI(14) 进入 / 离开超买超卖区间
+- MACD 柱状图正负翻转
+- 价格突破布林带上轨 / 下轨
+- 距上次分析超过最长间隔（兜底）
+"""
+
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+
+class TriggerEngine:
+    """对比上次分析时的行情状态，判断本轮是否需要调用 LLM"""
+
+    def __init__(self, atr_multiple: float = 1.5, atr_timeframe: str = '15m',
+                 rsi_oversold: float = 30, rsi_overbought: float = 70,
+                 timeframes: Sequence[str] = ('15m', '1h'),
+                 max_staleness_minutes: float = 60,
+                 clock: Callable[[], float] = time.time):
+        """
+        Args:
+            atr_multiple: 价格变动阈值（ATR 倍数）
+            atr_timeframe: 计算价格变动阈值所用的 ATR 时间框架
+            rsi_oversold: RSI 超卖阈值
+            rsi_overbought: RSI 超买阈值
+            timeframes: 评估 RSI / MACD / 布林带条件的时间框架
+            max_staleness_minutes: 最长分析间隔（分钟），超过后无论行情如何都触发
+            clock: 时间函数（秒），测试时可替换
+        """
+        self.atr_multiple = atr_multiple
+        self.atr_timeframe = atr_timeframe
+        self.rsi_oversold = rsi_oversold
+        self.rsi_overbought = rsi_overbought
+        self.timeframes = tuple(timeframes)
+        self.max_staleness_seconds = max_staleness_minutes * 60
+        self.clock = clock
+
+        # 上次分析时的行情状态（None 表示尚未分析过）
+        self.reference = None
+        self.last_analyzed_at = None
+
+        # 累计统计
+        self.evaluations = 0
+        self.fired = 0
+
+    @classmethod
+    def from_config(cls, config: Dict) -> 'TriggerEngine':
+        """从监控器配置创建（未配置的项使用默认值）"""
+        return cls(
+            atr_multiple=config.get('trigger_atr_multiple', 1.5),
+            atr_timeframe=config.get('trigger_atr_timeframe', '15m'),
+            rsi_oversold=config.get('trigger_rsi_oversold', 30),
+            rsi_overbought=config.get('trigger_rsi_overbought', 70),
+            timeframes=config.get('trigger_timeframes', ['15m', '1h']),
+            max_staleness_minutes=config.get('trigger_max_staleness_minutes', 60)
+        )
+
+    def evaluate(self, market_data: Dict) -> List[str]:
+        """
+        评估触发条件
+
+        Args:
+            market_data: 完整市场数据（get_btc_complete_data() 的返回值）
+
+        Returns:
+            触发原因列表，为空表示本轮无需分析
+        """
+        self.evaluations += 1
+        reasons = self._check(market_data)
+        if reasons:
+            self.fired += 1
+        return reasons
+
+    def _check(self, market_data: Dict) -> List[str]:
+        if self.reference is None:
+            return ["首次分析"]
+
+        reasons = []
+        reference = self.reference
+        price = market_data['current_price']
+
+        # 价格变动超过 N × ATR
+        atr = market_data[f'timeframe_{self.atr_timeframe}']['current']['atr14']
+        move = price - reference['price']
+        if atr > 0 and abs(move) >= self.atr_multiple * atr:
+            reasons.append(f"价格{'上涨' if move > 0 else '下跌'} {abs(move):,.2f}"
+                           f"（{abs(move) / atr:.1f}×ATR{self.atr_timeframe}）")
+
+        for tf, state in self._timeframe_states(market_data).items():
+            previous = reference['timeframes'].get(tf)
+            if previous is None:
+                continue
+            if state['rsi_zone'] != previous['rsi_zone']:
+                reasons.append(f"{tf} RSI {previous['rsi_zone']} → {state['rsi_zone']} ({state['rsi']:.1f})")
+            if state['macd_sign'] != previous['macd_sign'] and state['macd_sign'] != 0:
+                reasons.append(f"{tf} MACD柱{'翻红' if state['macd_sign'] > 0 else '翻绿'}")
+            if state['bb_side'] != previous['bb_side'] and state['bb_side'] != '带内':
+                reasons.append(f"{tf} 突破布林带{state['bb_side']}")
+
+        # 兜底：距上次分析太久
+        elapsed = self.clock() - self.last_analyzed_at
+        if elapsed >= self.max_staleness_seconds:
+            reasons.append(f"距上次分析 {elapsed / 60:.0f} 分钟")
+
+        return reasons
+
+    def mark_analyzed(self, market_data: Dict):
+        """记录本次分析时的行情状态，之后的触发条件相对该状态评估"""
+        self.reference = {
+            'price': market_data['current_price'],
+            'timeframes': self._timeframe_states(market_data)
+        }
+        self.last_analyzed_at = self.clock()
+
+    def seconds_since_analysis(self) -> Optional[float]:
+        """距上次分析的秒数（尚未分析过时为 None）"""
+        return None if self.last_analyzed_at is None else self.clock() - self.last_analyzed_at
+
+    def _timeframe_states(self, market_data: Dict) -> Dict:
+        """各时间框架的离散状态：RSI 区间、MACD 柱符号、价格相对布林带的位置"""
+        states = {}
+        for tf in self.timeframes:
+            tf_data = market_data[f'timeframe_{tf}']
+            current = tf_data['current']
+            rsi = current['rsi14']
+            macd_hist = tf_data['macd_hist'][-1]
+            price = current['price']
+
+            if rsi >= self.rsi_overbought:
+                rsi_zone = '超买'
+            elif rsi <= self.rsi_oversold:
+                rsi_zone = '超卖'
+            else:
+                rsi_zone = '中性'
+
+            if price > tf_data['bb_upper'][-1]:
+                bb_side = '上轨'
+            elif price < tf_data['bb_lower'][-1]:
+                bb_side = '下轨'
+            else:
+                bb_side = '带内'
+
+            states[tf] = {
+                'rsi': rsi,
+                'rsi_zone': rsi_zone,
+                'macd_sign': (macd_hist > 0) - (macd_hist < 0),
+                'bb_side': bb_side
+            }
+        return states
+
+    def stats(self) -> Dict:
+        """评估次数和触发率"""
+        return {
+            'evaluations': self.evaluations,
+            'fired': self.fired,
+            'skipped': self.evaluations - self.fired,
+            'fire_ratio': self.fired / self.evaluations if self.evaluations else 0.0
+        }